@@ -148,6 +148,35 @@ class Type(object):
             return self.type[7:];
         return None;
 
+def split_component(name):
+    """Return tuple(attribute,index) for the component mask name *name*.
+    serviceData arrays have a component for each element."""
+    m = re.match(r"^(serviceData\d+)_(\d+)$",name);
+    if m:
+        return (m.group(1),int(m.group(2)));
+    return (name,None);
+
+def component_getter(name):
+    """Return the python expression for a function that returns the value of
+    the component *name*. Components that are not compared are `None`."""
+    if name.startswith("reserved") or name.endswith("Selector"):
+        return "None";
+    attr,idx = split_component(name);
+    if idx is not None:
+        return "lambda x:x.%s[%u]"%(attr,idx);
+    return "operator.attrgetter(%r)"%(attr);
+
+def component_setter(name):
+    """Return the python expression for a function that stores a value
+    in the component *name*."""
+    attr,idx = split_component(name);
+    if idx is not None:
+        return "lambda x,v:x.%s.__setitem__(%u,v)"%(attr,idx);
+    obj,_,attr = attr.rpartition(".");
+    if obj:
+        return "lambda x,v:setattr(x.%s,%r,v)"%(obj,attr);
+    return "lambda x,v:setattr(x,%r,v)"%(attr);
+
 class Struct(object):
     '''Holds the a single structure'''
     def __init__(self,xml,fn):
@@ -235,6 +264,11 @@ class Struct(object):
                     res.append(name)
         return res;
 
+    def has_component_mask(self):
+        return (self.methods and not self.is_format and
+                any(I.startswith("SubnAdm") for I in self.methods) and
+                bool(self.gen_component_mask()));
+
     def groupMB(self):
         """Take the member list and group it into struct format characters. We
         try to have 1 format character for each member, but if that doesn't
@@ -403,6 +437,8 @@ class Struct(object):
                 cm = self.gen_component_mask();
                 if cm:
                     yield "COMPONENT_MASK","{%s}"%(", ".join("%r:%u"%(name,I) for I,name in enumerate(cm)));
+                    yield "COMPONENT_GETTERS","(%s)"%(", ".join(component_getter(I) for I in cm));
+                    yield "COMPONENT_SETTERS","(%s)"%(", ".join(component_setter(I) for I in cm));
         yield "MEMBERS","[%s]"%(", ".join("(%r,%r,%r)"%(name,ty.bits,ty.count) for name,ty in self.mb if ty.bits != 0));
 
     def asPython(self,F):
@@ -462,6 +498,8 @@ class Struct(object):
         print >> F,"   ",self.desc
         print >> F,""
         for name,value in self.get_properties():
+            if name in ("COMPONENT_GETTERS","COMPONENT_SETTERS"):
+                continue;
             print >> F, "    .. attribute:: %s = %s"%(name,value);
         print >> F,""
 
@@ -516,6 +554,8 @@ for I in structs:
 
 with safeUpdateCtx(options.struct_out) as F:
     to_import = set(("struct","rdma.binstruct"));
+    if any(I.has_component_mask() for I in structs):
+        to_import.add("operator");
     for I in structs:
         if I.format is not None:
             p = I.format.rpartition('.');
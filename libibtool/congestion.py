@@ -0,0 +1,289 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+from __future__ import with_statement;
+import time;
+import array;
+import rdma;
+import rdma.tools;
+import rdma.subnet;
+import rdma.IBA as IBA;
+import rdma.IBA_describe as IBA_describe;
+from libibtool import *;
+from libibtool.libibopts import *;
+from libibtool.linkhealth import port_desc,resolve_gmp_paths;
+
+def data_rate(pinf):
+    """Return the payload data rate of the link described by *pinf* in bits/sec.
+    This is the IBA rate of the link less the line encoding overhead."""
+    bps = IBA_describe.rate(IBA_describe.link_rate(pinf));
+    if pinf.linkSpeedExtActive != 0:
+        return bps*64/66;
+    return bps*8/10;
+
+def counter_deltas(cur,last,bits=32):
+    """Return an :class:`array.array` of the difference between the counter
+    values in the sequences *cur* and *last*. Counters that went backwards
+    have been cleared, their delta is the current value. *bits* is the width
+    of the counters or a sequence with the width of each counter, saturated
+    counters are returned as -1."""
+    if isinstance(bits,int):
+        sats = [(1 << bits) - 1]*len(cur);
+    else:
+        sats = [(1 << I) - 1 for I in bits];
+    return array.array('d',[-1 if c >= sat else
+                            c - l if c >= l else
+                            c
+                            for c,l,sat in zip(cur,last,sats)]);
+
+def normalise(dtime,dwait,ddata,bps):
+    """Convert the XmitWait and XmitData deltas in *dwait* and *ddata* collected
+    over *dtime* seconds into fractions of the link capacity in *bps*. All
+    arguments except *dtime* are equal length sequences.
+
+    Each XmitWait tick is treated as one 32 bit word time at the active link
+    rate so the wait fraction is comparable across link speeds. Ports without
+    a rate and saturated counters are -1, a saturated counter says nothing
+    about the interval until it is cleared.
+
+    :returns: tuple(wait,util) of :class:`array.array`"""
+    words = [dtime*b/32.0 if b else 0 for b in bps];
+    wait = array.array('d',[min(w/n,1.0) if n and w >= 0 else -1
+                            for w,n in zip(dwait,words)]);
+    util = array.array('d',[min(d/n,1.0) if n and d >= 0 else -1
+                            for d,n in zip(ddata,words)]);
+    return (wait,util);
+
+class CongestionMap(object):
+    """Hold the switch ports in a fabric along with the last XmitWait and
+    XmitData samples for each. The per port state is stored in parallel
+    arrays indexed the same as :attr:`ports` so a whole sweep can be
+    processed at once."""
+    #: :func:`rdma.tools.clock_monotonic` time of the last sweep.
+    last_time = None;
+    #: Seconds between the last two sweeps.
+    dtime = None;
+    #: :class:`array.array` of XmitWait fractions from the last delta.
+    wait = None;
+    #: :class:`array.array` of XmitData utilisation from the last delta.
+    util = None;
+    #: :class:`list` of per VL XmitWait deltas from the last delta.
+    dvl = None;
+    #: :class:`list` of `True` for ports whose XmitWait counter saturated
+    #: in the last delta.
+    saturated = None;
+
+    def __init__(self,sbn):
+        #: :class:`list` of tuple(:class:`rdma.subnet.Port`, peer port)
+        self.ports = [];
+        for sw in sbn.iterswitches():
+            for port,idx in sw.iterports():
+                peer = sbn.topology.get(port);
+                if peer is None or port.pinf is None:
+                    continue;
+                if port.pinf.portState != IBA.PORT_STATE_ACTIVE:
+                    continue;
+                self.ports.append((port,peer));
+        self.bps = array.array('d',[data_rate(I[0].pinf) for I in self.ports]);
+        self.cur_wait = array.array('d',[0]*len(self.ports));
+        self.cur_data = array.array('d',[0]*len(self.ports));
+        self.last_wait = None;
+        self.last_data = None;
+        #: Per port VL XmitWait counts, only filled in when VLs are sampled.
+        self.cur_vl = [None]*len(self.ports);
+        self.last_vl = None;
+        #: :class:`list` of the exception raised for ports that failed.
+        self.errors = [None]*len(self.ports);
+        #: :class:`list` of `True` for ports whose PMA supports
+        #: :class:`rdma.IBA.PMPortCountersExt`, XmitData is read from it.
+        self.ext = [False]*len(self.ports);
+
+    def sweep(self,sched,paths,vl=False):
+        """Coroutine to sample every port. *paths* is a :class:`dict` of end
+        port to GMP path."""
+        def get_port(idx):
+            port = self.ports[idx][0];
+            path = paths.get(port.to_end_port());
+            if path is None or self.errors[idx] is not None:
+                return;
+            cnts = IBA.PMPortCounters();
+            cnts.portSelect = port.port_id;
+            try:
+                cnts = yield sched.PerformanceGet(cnts,path);
+                self.cur_wait[idx] = cnts.portXmitWait;
+                if self.ext[idx]:
+                    ecnts = IBA.PMPortCountersExt();
+                    ecnts.portSelect = port.port_id;
+                    ecnts = yield sched.PerformanceGet(ecnts,path);
+                    self.cur_data[idx] = ecnts.portXmitData;
+                else:
+                    self.cur_data[idx] = cnts.portXmitData;
+                if vl:
+                    vcnts = IBA.PMPortVLXmitWaitCounters();
+                    vcnts.portSelect = port.port_id;
+                    vcnts = yield sched.PerformanceGet(vcnts,path);
+                    self.cur_vl[idx] = vcnts.portVLXmitWait;
+            except rdma.RDMAError, e:
+                self.errors[idx] = e;
+
+        yield sched.mqueue(get_port(I) for I in range(len(self.ports)));
+
+    def update(self,now):
+        """Finish a sweep made at :func:`rdma.tools.clock_monotonic` time
+        *now* by computing the deltas against the prior sweep."""
+        if self.last_time is not None:
+            self.dtime = now - self.last_time;
+            dwait = counter_deltas(self.cur_wait,self.last_wait);
+            ddata = counter_deltas(self.cur_data,self.last_data,
+                                   [64 if I else 32 for I in self.ext]);
+            self.wait,self.util = normalise(self.dtime,dwait,ddata,self.bps);
+            self.saturated = [I < 0 for I in dwait];
+            self.dvl = [None if c is None or l is None else
+                        counter_deltas(c,l,16) for c,l in
+                        zip(self.cur_vl,self.last_vl)];
+        self.last_time = now;
+        self.last_wait = self.cur_wait;
+        self.last_data = self.cur_data;
+        self.last_vl = self.cur_vl;
+        self.cur_wait = array.array('d',self.last_wait);
+        self.cur_data = array.array('d',self.last_data);
+        self.cur_vl = list(self.last_vl);
+
+    def ranked(self):
+        """Return the indexes of the ports that have valid data, worst
+        XmitWait first. Ports with a saturated XmitWait counter are left
+        out, see :meth:`saturated_ports`."""
+        wait = self.wait;
+        util = self.util;
+        idxs = [I for I in range(len(self.ports))
+                if self.errors[I] is None and wait[I] >= 0];
+        idxs.sort(key=lambda I:(wait[I],util[I]),reverse=True);
+        return idxs;
+
+    def saturated_ports(self):
+        """Return the indexes of the ports whose XmitWait counter is
+        saturated. Their congestion is unknown until the counters are
+        cleared."""
+        return [I for I in range(len(self.ports))
+                if self.errors[I] is None and self.saturated[I]];
+
+    def switch_summary(self,threshold):
+        """Return a :class:`list` of tuple(switch,ports,max wait,mean wait,
+        hot ports) ordered worst first. Ports are hot if their wait fraction
+        is at least *threshold*, ports without valid data are not counted."""
+        res = {};
+        for I,(port,peer) in enumerate(self.ports):
+            w = self.wait[I];
+            if self.errors[I] is not None or w < 0:
+                continue;
+            ent = res.get(port.parent);
+            if ent is None:
+                ent = res[port.parent] = [0,0.0,0.0,0];
+            ent[0] = ent[0] + 1;
+            ent[1] = max(ent[1],w);
+            ent[2] = ent[2] + w;
+            if w >= threshold:
+                ent[3] = ent[3] + 1;
+        res = [(k,v[0],v[1],v[2]/v[0],v[3]) for k,v in res.iteritems()];
+        res.sort(key=lambda x:(x[2],x[3]),reverse=True);
+        return res;
+
+def cmd_ibcongestion(argv,o):
+    """Sample XmitWait and XmitData on every switch port and show the links
+       with the most congestion.
+       Usage: %prog
+
+       Congestion is reported as the fraction of the measurement interval the
+       port spent waiting to transmit, normalised by the active link rate so
+       ports of different speeds can be compared."""
+    o.add_option("-p",action="store",dest="sleep",default=1,
+                 type=float,
+                 help="Time between the two sweeps.");
+    o.add_option("--top",action="store",dest="top",type=int,default=20,
+                 help="Number of links to show, default is 20.");
+    o.add_option("--threshold",action="store",dest="threshold",type=float,
+                 default=0.01,
+                 help="Wait fraction at which a port is counted as hot, default is 0.01.");
+    o.add_option("--vl",action="store_true",dest="vl",
+                 help="Also sample PMPortVLXmitWaitCounters to find the worst VL.");
+    LibIBOpts.setup(o,address=False,discovery=True);
+    (args,values) = o.parse_args(argv,expected_values=0);
+    lib = LibIBOpts(o,args,values);
+
+    with lib.get_umad() as umad:
+        sched = lib.get_sched(umad);
+        sbn = lib.get_subnet(sched,("all_NodeInfo","all_PortInfo",
+                                    "all_NodeDescription","all_topology"));
+        cmap = CongestionMap(sbn);
+        paths = {};
+        errors = {};
+        sched.run(queue=resolve_gmp_paths(sched,sbn,
+                                          set(I[0].to_end_port()
+                                              for I in cmap.ports),
+                                          paths,errors));
+
+        # Drop switches that do not count XmitWait.
+        cpinfs = {};
+        def get_cpinf(ep):
+            try:
+                cpinfs[ep] = yield sbn.get_pma_cpinf(sched,ep.parent,paths[ep]);
+            except rdma.RDMAError, e:
+                errors[ep] = e;
+        sched.run(mqueue=(get_cpinf(I) for I in paths));
+        for I,(port,peer) in enumerate(cmap.ports):
+            ep = port.to_end_port();
+            if ep in errors:
+                cmap.errors[I] = errors[ep];
+            elif not cpinfs[ep].capabilityMask & IBA.portCountersXmitWaitSupported:
+                cmap.errors[I] = CmdError("PMA does not support portXmitWait");
+            else:
+                cmap.ext[I] = bool(cpinfs[ep].capabilityMask &
+                                   (IBA.extendedWidthSupported |
+                                    IBA.extendedWidthSupportedNoIETF));
+
+        start = rdma.tools.clock_monotonic();
+        sched.run(queue=cmap.sweep(sched,paths,args.vl));
+        cmap.update(rdma.tools.clock_monotonic());
+        to_sleep = (start + args.sleep) - rdma.tools.clock_monotonic();
+        if to_sleep > 0:
+            time.sleep(to_sleep);
+        sched.run(queue=cmap.sweep(sched,paths,args.vl));
+        cmap.update(rdma.tools.clock_monotonic());
+
+    print "# Congestion hotspots: %u switch ports sampled over %.3fs"%(
+        len(cmap.ports),cmap.dtime);
+    print "# %7s %7s %-5s %s"%("wait","util","rate","link");
+    for I in cmap.ranked()[:args.top]:
+        port,peer = cmap.ports[I];
+        s = "%8.2f%% %7s %-5s %s -> %s"%(
+            cmap.wait[I]*100,
+            "%6.2f%%"%(cmap.util[I]*100) if cmap.util[I] >= 0 else "sat",
+            "%uG"%(IBA_describe.rate(IBA_describe.link_rate(port.pinf))/1000000000),
+            port_desc(port),port_desc(peer));
+        if args.vl and cmap.dvl[I] is not None:
+            dvl = cmap.dvl[I];
+            worst = max(range(len(dvl)),key=lambda x:dvl[x]);
+            if dvl[worst] > 0:
+                s = s + " (worst VL%u)"%(worst);
+        print s;
+
+    sat = cmap.saturated_ports();
+    if sat:
+        print "# XmitWait saturated, clear the counters to measure these ports";
+        for I in sat:
+            port,peer = cmap.ports[I];
+            print "%8s %7s %-5s %s -> %s"%(
+                "sat",
+                "%6.2f%%"%(cmap.util[I]*100) if cmap.util[I] >= 0 else "sat",
+                "%uG"%(IBA_describe.rate(IBA_describe.link_rate(port.pinf))/1000000000),
+                port_desc(port),port_desc(peer));
+
+    print "# Per switch summary";
+    print "# %7s %7s %5s %5s %s"%("max","mean","hot","ports","switch");
+    for sw,nports,wmax,wmean,hot in cmap.switch_summary(args.threshold):
+        print "%8.2f%% %6.2f%% %5u %5u %s %s"%(
+            wmax*100,wmean*100,hot,nports,sw.ninf.nodeGUID,
+            IBA_describe.dstr(sw.desc));
+
+    failed = sum(1 for I in cmap.errors if I is not None);
+    if failed:
+        print "## %u switch ports could not be sampled"%(failed);
+    return lib.done();
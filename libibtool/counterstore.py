@@ -0,0 +1,201 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+from __future__ import with_statement;
+import os;
+import struct;
+import time;
+import rdma;
+import rdma.IBA as IBA;
+from libibtool import *;
+
+def counter_fields(cls):
+    """Return a :class:`list` of tuple(name,bits) for the scalar counters in
+    the PM attribute *cls*."""
+    try:
+        return cls._counter_fields;
+    except AttributeError:
+        pass;
+    res = [(name,bits) for name,bits,count in cls.MEMBERS
+           if count == 1 and not (name.startswith("reserved_") or
+                                  name.startswith("portSelect") or
+                                  name.startswith("counterSelect"))];
+    cls._counter_fields = res;
+    return res;
+
+#: PM attributes whose counters wrap instead of saturating. IBA requires the
+#: 16 and 32 bit counters in :class:`rdma.IBA.PMPortCounters` to stop at
+#: their maximum value.
+WRAPPING = set((IBA.PMPortCountersExt,));
+
+class CounterDelta(object):
+    """The increment of each counter since the prior reading. The counters
+    can be accessed as attributes, like the original PM attribute."""
+    #: `True` if there was no baseline, the deltas are the absolute values.
+    first = False;
+    #: Seconds since the baseline was taken, or `None`.
+    elapsed = None;
+
+    def __init__(self,cnts):
+        #: The PM attribute that was just read.
+        self.cnts = cnts;
+        #: :class:`dict` of counter name to increment.
+        self.values = {};
+        #: :class:`set` of counter names that are at their maximum value.
+        self.saturated = set();
+        #: :class:`set` of counter names that wrapped since the baseline.
+        self.wrapped = set();
+        #: :class:`set` of counter names that were cleared since the baseline.
+        #: Their delta is a lower bound.
+        self.reset = set();
+
+    def __getattr__(self,name):
+        try:
+            return self.__dict__["values"][name];
+        except KeyError:
+            raise AttributeError(name);
+
+class CounterStore(object):
+    """Persistent baseline of PM counter readings keyed by
+    (portGUID, portNum, attribute ID). Instead of clearing counters with
+    `PerformanceSet` the caller reads them and uses :meth:`update` to compute
+    the increment since the last stored reading.
+
+    The file is a header followed by fixed format records. New readings are
+    appended by :meth:`save` and the last record for a key wins, the file is
+    rewritten when it holds too many stale records. This is a context
+    manager that saves on exit."""
+    MAGIC = "RDMACNT1";
+    _hdr = struct.Struct(">QBHdB");
+
+    #: Filename of the store, or `None` for a memory only store.
+    fn = None;
+
+    def __init__(self,fn=None):
+        self.fn = fn;
+        self._baselines = {};
+        self._dirty = set();
+        self._records = 0;
+        # The file ends in a partial record that must not be appended to.
+        self._truncated = False;
+        if fn is not None and os.path.exists(fn):
+            self._load();
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        self.save();
+
+    def _load(self):
+        with open(self.fn,"rb") as F:
+            buf = F.read();
+        if buf[:len(self.MAGIC)] != self.MAGIC:
+            raise CmdError("The file %r is not a counter baseline file"%(self.fn));
+        off = len(self.MAGIC);
+        hdr = self._hdr;
+        while off + hdr.size <= len(buf):
+            guid,portNum,attr,when,count = hdr.unpack_from(buf,off);
+            off = off + hdr.size;
+            if off + count*8 > len(buf):
+                # Truncated by a crashed writer, drop it.
+                break;
+            values = struct.unpack_from(">%uQ"%(count),buf,off);
+            off = off + count*8;
+            self._baselines[(IBA.GUID(guid),portNum,attr)] = (when,values);
+            self._records = self._records + 1;
+        if off != len(buf):
+            self._truncated = True;
+
+    def _pack(self,key):
+        when,values = self._baselines[key];
+        return (self._hdr.pack(int(key[0]),key[1],key[2],when,len(values)) +
+                struct.pack(">%uQ"%(len(values)),*values));
+
+    def save(self):
+        """Write the readings taken since the last :meth:`save` to the file."""
+        if self.fn is None or not self._dirty:
+            return;
+        if (not os.path.exists(self.fn) or self._truncated or
+            self._records + len(self._dirty) > 2*len(self._baselines) + 64):
+            self.compact();
+            return;
+        with open(self.fn,"ab") as F:
+            F.write("".join(self._pack(I) for I in self._dirty));
+        self._records = self._records + len(self._dirty);
+        self._dirty.clear();
+
+    def compact(self):
+        """Rewrite the file so it only contains the latest reading for each
+        key."""
+        if self.fn is None:
+            return;
+        fn_tmp = self.fn + ".new";
+        with open(fn_tmp,"wb") as F:
+            F.write(self.MAGIC);
+            F.write("".join(self._pack(I) for I in self._baselines));
+        os.rename(fn_tmp,self.fn);
+        self._records = len(self._baselines);
+        self._dirty.clear();
+        self._truncated = False;
+
+    def get(self,portGUID,portNum,attr):
+        """Return the stored reading for the key as tuple(time,values), or
+        `None`. *attr* is the PM attribute class."""
+        return self._baselines.get((portGUID,portNum,attr.MAD_ATTRIBUTE_ID));
+
+    def update(self,portGUID,portNum,cnts,now=None):
+        """Store the PM attribute *cnts* read from *portNum* of the end port
+        *portGUID* as the new baseline and return the increment since the
+        prior baseline.
+
+        :rtype: :class:`CounterDelta`"""
+        if now is None:
+            now = time.time();
+        cls = cnts.__class__;
+        fields = counter_fields(cls);
+        key = (portGUID,portNum,cls.MAD_ATTRIBUTE_ID);
+        values = tuple(getattr(cnts,I[0]) for I in fields);
+
+        res = CounterDelta(cnts);
+        last = self._baselines.get(key);
+        if last is not None and len(last[1]) != len(values):
+            last = None;
+        if last is None:
+            res.first = True;
+        else:
+            res.elapsed = now - last[0];
+        wraps = cls in WRAPPING;
+        for I,(name,bits) in enumerate(fields):
+            cur = values[I];
+            if cur >= (1 << bits) - 1 and not wraps:
+                res.saturated.add(name);
+            if last is None:
+                res.values[name] = cur;
+                continue;
+            prior = last[1][I];
+            if cur >= prior:
+                res.values[name] = cur - prior;
+            elif wraps:
+                res.values[name] = cur - prior + (1 << bits);
+                res.wrapped.add(name);
+            else:
+                # Saturating counters only go backwards if they are cleared.
+                res.values[name] = cur;
+                res.reset.add(name);
+
+        self._baselines[key] = (now,values);
+        self._dirty.add(key);
+        return res;
+
+def get_counters(sched,path,portSelect,cpinf=None):
+    """Coroutine to read :class:`rdma.IBA.PMPortCounters` and, if *cpinf*
+    says the PMA supports it, :class:`rdma.IBA.PMPortCountersExt` from
+    *portSelect*. Returns a :class:`list` of the attributes read."""
+    cnts = IBA.PMPortCounters();
+    cnts.portSelect = portSelect;
+    res = [(yield sched.PerformanceGet(cnts,path))];
+    if cpinf is not None and cpinf.capabilityMask & (IBA.extendedWidthSupported |
+                                                     IBA.extendedWidthSupportedNoIETF):
+        ext = IBA.PMPortCountersExt();
+        ext.portSelect = portSelect;
+        res.append((yield sched.PerformanceGet(ext,path)));
+    sched.result = res;
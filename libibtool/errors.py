@@ -1,10 +1,19 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 from __future__ import with_statement;
+import sys;
+import json;
 import rdma.IBA as IBA;
 import rdma.IBA_describe as IBA_describe;
 from libibtool import *;
 from libibtool.libibopts import *;
 from libibtool.perfquery import sum_result;
+from libibtool.counterstore import CounterStore,CounterDelta,counter_fields,\
+     get_counters;
+
+#: :class:`libibtool.counterstore.CounterStore` when --baseline is used.
+baseline = None;
+#: :class:`JSONLineWriter` when --json is used.
+output = None;
 
 class CheckError(CmdError):
     pass
@@ -95,6 +104,55 @@ def get_max(v):
         I = I + 1;
     return 1<<I;
 
+class JSONLineWriter(object):
+    """Write one JSON object per line to the file *F*. Lines are buffered
+    until *limit* bytes are pending, then written out. This avoids a write
+    per record on large fabrics while keeping memory use bounded. This is a
+    context manager that flushes on exit."""
+    def __init__(self,F,limit=64*1024):
+        self.F = F;
+        self.limit = limit;
+        self._buf = [];
+        self._pending = 0;
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        self.flush();
+
+    def write(self,obj):
+        """Encode *obj* and queue it for output. Values json does not know
+        are written as their string form. :class:`rdma.IBA.GUID` is a
+        :class:`str` so it must be converted by the caller."""
+        s = json.dumps(obj,separators=(',',':'),default=str) + "\n";
+        self._buf.append(s);
+        self._pending = self._pending + len(s);
+        if self._pending >= self.limit:
+            self.flush();
+
+    def flush(self):
+        """Write out all the queued lines."""
+        if self._buf:
+            self.F.write("".join(self._buf));
+            del self._buf[:];
+            self._pending = 0;
+        self.F.flush();
+
+def record_counters(record,ret):
+    """Store the counter values from *ret* in the output *record*. If *ret*
+    is a :class:`libibtool.counterstore.CounterDelta` the increments are
+    stored as well."""
+    if isinstance(ret,CounterDelta):
+        record["deltas"] = dict(ret.values);
+        if ret.elapsed is not None:
+            record["elapsed"] = ret.elapsed;
+        if ret.saturated:
+            record["saturated"] = sorted(ret.saturated);
+        ret = ret.cnts;
+    record["counters"] = dict((I[0],getattr(ret,I[0]))
+                              for I in counter_fields(ret.__class__));
+
 def link_configured(pinf):
     """True if the port info is in a configured state such that speed and width
     can be considered valid."""
@@ -120,20 +178,26 @@ def clear_check(func):
     func.kind = KIND_CLEAR;
     return func;
 
-def get_perf(sched,path,ninf,portIdx,reset=False,select=0xFFFF):
-    """Coroutine to get port counters."""
+def perf_port_select(ninf,portIdx):
+    """Return the PMA portSelect value to use for *portIdx*."""
+    if portIdx is not None:
+        return portIdx;
+    if ninf.nodeType == IBA.NODE_SWITCH and ninf.localPortNum == 0:
+        return 1;
+    return ninf.localPortNum;
+
+def get_perf(sched,path,ninf,portIdx,reset=False,select=0xFFFF,cpinf=None):
+    """Coroutine to get port counters. *cpinf* is the PMA's
+    :class:`rdma.IBA.MADClassPortInfo`, if it is `None` and is needed then
+    it is fetched."""
     cnts = IBA.PMPortCounters();
-    if portIdx is None:
-        cnts.portSelect = ninf.localPortNum;
-        if ninf.nodeType == IBA.NODE_SWITCH and cnts.portSelect == 0:
-            cnts.portSelect = 1;
-    else:
-        cnts.portSelect = portIdx;
+    cnts.portSelect = perf_port_select(ninf,portIdx);
 
     accumulate = False;
     if cnts.portSelect == 0xFF:
-        cpinf = yield sched.PerformanceGet(IBA.MADClassPortInfo,path);
-        path.resp_time = cpinf.respTimeValue;
+        if cpinf is None:
+            cpinf = yield sched.PerformanceGet(IBA.MADClassPortInfo,path);
+            path.resp_time = cpinf.respTimeValue;
         accumulate = not (cpinf.capabilityMask & IBA.allPortSelect);
         if accumulate and ninf.nodeType == IBA.NODE_CA:
             raise CmdError("Can't iterate over all ports on a CA.");
@@ -164,6 +228,23 @@ def get_perf(sched,path,ninf,portIdx,reset=False,select=0xFFFF):
     res.portSelect = cnts.portSelect;
     sched.result = res;
 
+def get_baseline_perf(sched,path,ninf,portIdx,portGUID,cpinf=None):
+    """Coroutine to read the counters for a port and update the baseline
+    store. Every command that uses the store reads the counters with this so
+    they all leave the same baselines behind. :class:`rdma.IBA.PMPortCounters`
+    is always read, :class:`rdma.IBA.PMPortCountersExt` is also read if the
+    PMA supports it for the port. Returns a :class:`list` of
+    :class:`libibtool.counterstore.CounterDelta` in that order."""
+    if cpinf is None:
+        cpinf = yield sched.PerformanceGet(IBA.MADClassPortInfo,path);
+    portSelect = perf_port_select(ninf,portIdx);
+    if portSelect == 0xFF and not cpinf.capabilityMask & IBA.allPortSelect:
+        # get_perf sums PMPortCounters over the ports.
+        res = [(yield get_perf(sched,path,ninf,portIdx,cpinf=cpinf))];
+    else:
+        res = yield get_counters(sched,path,portSelect,cpinf);
+    sched.result = [baseline.update(portGUID,portSelect,I) for I in res];
+
 @node_check
 def do_check_node(sched,path,portGUID,ninf,**kwargs):
     """Coroutine to do the checknode action"""
@@ -271,23 +352,50 @@ def do_check_duplicates(sched,path,desc,pinf,port,sbn,**kwargs):
                 port.portGUID,desc));
 
 @perf_check
-def do_check_errors(sched,path,gpath,ninf,pinf,portGUID,portIdx,**kwargs):
+def do_check_errors(sched,path,gpath,ninf,pinf,portGUID,portIdx,cpinf=None,
+                    record=None,**kwargs):
     """Coroutine to check the performance counters for a port."""
-    ret = yield get_perf(sched,gpath,ninf,portIdx);
+    if baseline is not None:
+        ret = (yield get_baseline_perf(sched,gpath,ninf,portIdx,portGUID,
+                                       cpinf))[0];
+    else:
+        ret = yield get_perf(sched,gpath,ninf,portIdx,cpinf=cpinf);
 
     if portIdx == 255:
         desc = "lid %u all ports"%(pinf.LID);
     else:
-        desc = "lid %u port %u"%(pinf.LID,ret.portSelect);
+        desc = "lid %u port %u"%(pinf.LID,perf_port_select(ninf,portIdx));
+
+    if baseline is not None:
+        for k in sorted(ret.saturated):
+            if k in thresh:
+                warnings.append("%s has saturated: %s"%(k,desc));
 
     for k,v in thresh.iteritems():
         if v > 0 and hasattr(ret,k):
             checkLTE(ret,k,v,desc=desc);
 
+    if record is not None:
+        record_counters(record,ret);
+        record["thresholds"] = dict(
+            (k,{"limit":v,"value":getattr(ret,k),"ok":getattr(ret,k) <= v})
+            for k,v in thresh.iteritems() if v > 0 and hasattr(ret,k));
+
 @perf_check
-def do_show_counts(sched,path,gpath,ninf,pinf,portGUID,portIdx,**kwargs):
+def do_show_counts(sched,path,gpath,ninf,pinf,portGUID,portIdx,cpinf=None,
+                   record=None,**kwargs):
     """Coroutine to display the performance counters for a port."""
-    ret = yield get_perf(sched,gpath,ninf,portIdx);
+    if baseline is not None:
+        # Prefer the 64 bit data counters if the PMA has them.
+        ret = (yield get_baseline_perf(sched,gpath,ninf,portIdx,portGUID,
+                                       cpinf))[-1];
+        portSelect = ret.cnts.portSelect;
+    else:
+        ret = yield get_perf(sched,gpath,ninf,portIdx,cpinf=cpinf);
+        portSelect = ret.portSelect;
+    if record is not None:
+        record_counters(record,ret);
+        return;
     def do_print(field):
         n = field[0].upper() + field[1:];
         if not getattr(lib.args,"int_names",True):
@@ -296,21 +404,41 @@ def do_show_counts(sched,path,gpath,ninf,pinf,portGUID,portIdx,**kwargs):
     if portIdx == 255:
         print "# Port counters: Lid %u all ports"%(pinf.LID);
     else:
-        print "# Port counters: Lid %u port %u"%(pinf.LID,ret.portSelect);
+        print "# Port counters: Lid %u port %u"%(pinf.LID,portSelect);
     do_print("portXmitData");
     do_print("portRcvData");
     do_print("portXmitPkts");
     do_print("portRcvPkts");
 
 @clear_check
-def do_clear_counters(sched,path,gpath,ninf,pinf,portIdx,**kwargs):
-    """Coroutine to clear the performance counters for a port."""
-    yield get_perf(sched,gpath,ninf,portIdx,True);
+def do_clear_counters(sched,path,gpath,ninf,pinf,portGUID,portIdx,cpinf=None,
+                      record=None,**kwargs):
+    """Coroutine to clear the performance counters for a port. With a
+    baseline store the counters are read and recorded instead."""
+    if baseline is not None:
+        ret = (yield get_baseline_perf(sched,gpath,ninf,portIdx,portGUID,
+                                       cpinf))[-1];
+        if record is not None:
+            record_counters(record,ret);
+        return;
+    yield get_perf(sched,gpath,ninf,portIdx,True,cpinf=cpinf);
+    if record is not None:
+        record["cleared"] = 0xFFFF;
 
 @clear_check
-def do_clear_error_counters(sched,path,gpath,ninf,portIdx,**kwargs):
-    """Coroutine to clear the error performance counters for a port."""
-    yield get_perf(sched,gpath,ninf,portIdx,True,0xFFF);
+def do_clear_error_counters(sched,path,gpath,ninf,portGUID,portIdx,cpinf=None,
+                            record=None,**kwargs):
+    """Coroutine to clear the error performance counters for a port. With a
+    baseline store the counters are read and recorded instead."""
+    if baseline is not None:
+        ret = (yield get_baseline_perf(sched,gpath,ninf,portIdx,portGUID,
+                                       cpinf))[0];
+        if record is not None:
+            record_counters(record,ret);
+        return;
+    yield get_perf(sched,gpath,ninf,portIdx,True,0xFFF,cpinf=cpinf);
+    if record is not None:
+        record["cleared"] = 0xFFF;
 
 def print_header(ninf,pinf,desc,portIdx,failed,kind):
     if lib.args.verbosity >= 1 or failed or warnings:
@@ -348,6 +476,21 @@ def print_header(ninf,pinf,desc,portIdx,failed,kind):
         print blue("#warn: %s"%(I));
     return not (failed or warnings);
 
+KIND_NAMES = {KIND_NODE: "node",
+              KIND_PORT: "port",
+              KIND_PERF: "perf",
+              KIND_CLEAR: "clear"};
+def write_record(record,failed,kind):
+    """The :func:`print_header` equivalent for --json, finish *record* and
+    send it to :data:`output`."""
+    record["status"] = ("failed" if failed else
+                        "warning" if warnings else
+                        "ok");
+    if warnings:
+        record["warnings"] = list(warnings);
+    output.write(record);
+    return not (failed or warnings);
+
 def perform_single_check(argv,o,funcs):
     o.add_option("-N","--nocolor",action="store_false",dest="colour",
                  default=True,
@@ -356,6 +499,9 @@ def perform_single_check(argv,o,funcs):
         funcs = [funcs];
     funcs.sort(key=lambda x:x.kind);
     kinds = reduce(lambda x,y:x | y,(I.kind for I in funcs));
+    if kinds & (KIND_PERF|KIND_CLEAR):
+        o.add_option("--baseline",action="store",dest="baseline",metavar="FILE",
+                     help="Compute deltas against the counter baselines in this file instead of resetting counters.");
     if kinds & KIND_PERF:
         o.add_option("-s","--show_thresholds",action="store_true",dest="show_thresh",
                      default=False,
@@ -384,6 +530,11 @@ def perform_single_check(argv,o,funcs):
         (args,values) = o.parse_args(argv,expected_values=1);
         lib = LibIBOpts(o,args,values,1,(tmpl_target,));
 
+    global baseline
+    baseline = None;
+    if getattr(args,"baseline",None) is not None:
+        baseline = CounterStore(args.baseline);
+
     with lib.get_umad_for_target(values[0]) as umad:
         sched = lib.get_sched(umad);
         path = lib.path
@@ -451,6 +602,8 @@ def perform_single_check(argv,o,funcs):
             done_checks(last_kind,True);
             raise
         done_checks(last_kind);
+    if baseline is not None:
+        baseline.save();
     return lib.done();
 
 def cmd_ibchecknode(argv,o):
@@ -495,9 +648,14 @@ def perform_topo_check(argv,o,funcs):
         funcs = [funcs];
     funcs.sort(key=lambda x:x.kind);
     kinds = reduce(lambda x,y:x | y,(I.kind for I in funcs));
+    if kinds & (KIND_PERF|KIND_CLEAR):
+        o.add_option("--baseline",action="store",dest="baseline",metavar="FILE",
+                     help="Compute deltas against the counter baselines in this file instead of resetting counters.");
     if kinds & KIND_PERF:
         o.add_option("-T",action="store",dest="load_thresh",metavar="FILE",
                      help="Load threshold values from this file.");
+    o.add_option("--json",action="store_true",dest="json",
+                 help="Output one JSON object per line for each check as it completes.");
     LibIBOpts.setup(o,address=False,discovery=True);
     global lib
     (args,values) = o.parse_args(argv,expected_values=0);
@@ -506,6 +664,14 @@ def perform_topo_check(argv,o,funcs):
     if kinds & KIND_PERF:
         global thresh
         thresh = load_thresholds(args.load_thresh);
+    global baseline
+    baseline = None;
+    if getattr(args,"baseline",None) is not None:
+        baseline = CounterStore(args.baseline);
+    global output
+    output = None;
+    if args.json:
+        output = JSONLineWriter(sys.stdout);
 
     def run(path,port,portIdx,kind):
         node = port.parent
@@ -524,29 +690,40 @@ def perform_topo_check(argv,o,funcs):
         kwargs["portIdx"] = portIdx;
         kwargs["desc"] = "lid %u port %s"%(ep.LID,portIdx);
         kwargs["portGUID"] = portGUID = ep.portGUID;
+        record = None;
+        if output is not None:
+            kwargs["record"] = record = {"type": KIND_NAMES[kind],
+                                         "nodeGUID": str(node.ninf.nodeGUID),
+                                         "nodeType": IBA_describe.node_type(node.ninf.nodeType),
+                                         "desc": IBA_describe.dstr(node.desc) if node.desc else None,
+                                         "portGUID": str(portGUID),
+                                         "lid": ep.LID,
+                                         "port": portIdx};
 
         if (args.only_up and
             (port.pinf.portPhysicalState == IBA.PHYS_PORT_STATE_POLLING or
              port.pinf.portPhysicalState == IBA.PHYS_PORT_STATE_DISABLED)):
             return
 
-        if kind & (KIND_PERF|KIND_CLEAR):
-            kwargs["gpath"] = gpath = getattr(path,"_cached_gmp_path",None);
-            if gpath is None:
-                gpath = yield rdma.path.get_mad_path(sched,portGUID,
-                                                     dqpn=1,
-                                                     qkey=IBA.IB_DEFAULT_QP1_QKEY);
-                path._cached_gmp_path = gpath;
-                kwargs["gpath"] = gpath;
-
         del warnings[:]
         try:
             counts[cidx] = counts[cidx] + 1;
+            if kind & (KIND_PERF|KIND_CLEAR):
+                # The path and ClassPortInfo are cached in the subnet, so
+                # these only cost MADs the first time a node is seen.
+                kwargs["gpath"] = gpath = yield sbn.get_gmp_path(sched,ep);
+                if portIdx == 0xFF or baseline is not None:
+                    kwargs["cpinf"] = yield sbn.get_pma_cpinf(sched,node,gpath);
+
             for func in funcs:
                 if func.kind & kind:
                     yield func(sched,path,**kwargs);
         except (CmdError,rdma.RDMAError), e:
             counts[cidx+1] = counts[cidx+1] + 1;
+            if record is not None:
+                record["error"] = str(e);
+                sched.result = write_record(record,True,kind);
+                return;
             sched.result = print_header(node.ninf,ep.pinf,node.desc,portIdx,True,kind);
             print red("#error: %s"%(e));
         else:
@@ -555,45 +732,72 @@ def perform_topo_check(argv,o,funcs):
                 if portIdx != 0xFF:
                     counts[cidx+1] = counts[cidx+1] + 1;
                 failed = True;
+            if record is not None:
+                sched.result = write_record(record,failed,kind);
+                return;
             sched.result = print_header(node.ninf,ep.pinf,node.desc,portIdx,failed,kind);
 
     counts = [0]*8;
-    with lib.get_umad() as umad:
-        sched = lib.get_sched(umad);
-        sbn = lib.get_subnet(sched,("all_NodeInfo","all_PortInfo",
-                                    "all_NodeDescription"));
-        def do(port):
-            """This is a coroutine that does the checks for one end port."""
-            path = sbn.get_path_smp(sched,port);
-            if kinds & KIND_NODE:
-                yield run(path,port,port.port_id,KIND_NODE);
-            kind = KIND_NODE*2;
-            while kind <= kinds:
-                if not kinds & kind:
+    try:
+        with lib.get_umad() as umad:
+            sched = lib.get_sched(umad);
+            sbn = lib.get_subnet(sched,("all_NodeInfo","all_PortInfo",
+                                        "all_NodeDescription"));
+            if kinds & (KIND_PERF|KIND_CLEAR):
+                sched.run(queue=sbn.prefetch_gmp_paths(sched,sbn.iterend_ports()));
+            def do(port):
+                """This is a coroutine that does the checks for one end port."""
+                path = sbn.get_path_smp(sched,port);
+                if kinds & KIND_NODE:
+                    yield run(path,port,port.port_id,KIND_NODE);
+                kind = KIND_NODE*2;
+                while kind <= kinds:
+                    if not kinds & kind:
+                        kind = kind*2;
+                        continue
+                    if isinstance(port.parent,rdma.subnet.Switch):
+                        # Use all port select on switches, if that
+                        # has threshold errors then scan each port for
+                        # better diagnostics.
+                        ret = False;
+                        if kind & (KIND_PERF|KIND_CLEAR):
+                            ret = yield run(path,port,0xFF,kind);
+                        if ret == False:
+                            for I,idx in port.parent.iterports():
+                                if not (kind & (KIND_PERF|KIND_CLEAR) and idx == 0):
+                                    yield run(path,I,idx,kind);
+                    else:
+                        yield run(path,port,port.port_id,kind);
                     kind = kind*2;
-                    continue
-                if isinstance(port.parent,rdma.subnet.Switch):
-                    # Use all port select on switches, if that
-                    # has threshold errors then scan each port for
-                    # better diagnostics.
-                    ret = False;
-                    if kind & (KIND_PERF|KIND_CLEAR):
-                        ret = yield run(path,port,0xFF,kind);
-                    if ret == False:
-                        for I,idx in port.parent.iterports():
-                            if not (kind & (KIND_PERF|KIND_CLEAR) and idx == 0):
-                                yield run(path,I,idx,kind);
-                else:
-                    yield run(path,port,port.port_id,kind);
-                kind = kind*2;
-        sched.run(mqueue=(do(I) for I in sbn.iterend_ports()));
-    print "## Summary: %u nodes checked, %u bad nodes found"%(counts[0],counts[1]);
-    if kinds & KIND_PORT:
-        print "##          %u ports checked, %u ports with bad state found"%(counts[2],counts[3]);
-    if kinds & KIND_PERF:
-        print "##          %u ports checked, %u ports have errors beyond threshold"%(counts[4],counts[5]);
-    if kinds & KIND_CLEAR:
-        print "##          %u port counters cleared."%(counts[6]);
+            sched.run(mqueue=(do(I) for I in sbn.iterend_ports()));
+    finally:
+        # Do not lose the records already produced if the sweep fails.
+        if output is not None:
+            output.flush();
+    if output is not None:
+        summary = {"type": "summary",
+                   "nodes": counts[0],
+                   "bad_nodes": counts[1]};
+        if kinds & KIND_PORT:
+            summary["ports"] = counts[2];
+            summary["bad_ports"] = counts[3];
+        if kinds & KIND_PERF:
+            summary["perf_ports"] = counts[4];
+            summary["perf_errors"] = counts[5];
+        if kinds & KIND_CLEAR:
+            summary["cleared"] = counts[6];
+        output.write(summary);
+        output.flush();
+    else:
+        print "## Summary: %u nodes checked, %u bad nodes found"%(counts[0],counts[1]);
+        if kinds & KIND_PORT:
+            print "##          %u ports checked, %u ports with bad state found"%(counts[2],counts[3]);
+        if kinds & KIND_PERF:
+            print "##          %u ports checked, %u ports have errors beyond threshold"%(counts[4],counts[5]);
+        if kinds & KIND_CLEAR:
+            print "##          %u port counters cleared."%(counts[6]);
+    if baseline is not None:
+        baseline.save();
     return lib.done();
 
 def cmd_ibcheckstate(argv,o):
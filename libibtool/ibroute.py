@@ -6,6 +6,7 @@ import rdma.satransactor;
 import rdma.IBA as IBA;
 import rdma.IBA_describe as IBA_describe;
 import rdma.discovery;
+import rdma.sharding;
 import rdma.subnet;
 from libibtool import *;
 from libibtool.libibopts import *;
@@ -154,6 +155,25 @@ def get_switch_incr(sched,sbn,switch,args):
         display_LFDB(switch,sbn,path,args.all);
         switch.lfdb = None;
 
+def get_switches_sharded(lib,sbn,args):
+    """Fetch the forwarding tables of every switch with *args.shards* worker
+    processes using :func:`rdma.sharding.run_sharded`, then display them."""
+    task = rdma.sharding.SwitchFDBTask(args.do_lfdb,args.do_mfdb);
+    errors = rdma.sharding.run_sharded(lib.end_port,sbn,task,
+                                       workers=args.shards);
+    for I in errors:
+        print "E:",I;
+    for switch in sbn.iterswitches():
+        # get_path_smp only needs the end_port attribute of the task
+        path = sbn.get_path_smp(task,switch.ports[0]);
+        switch.path = path;
+        if args.do_mfdb and switch.mfdb is not None:
+            display_MFDB(switch,path,args.all);
+            switch.mfdb = None;
+        if args.do_lfdb and switch.lfdb is not None:
+            display_LFDB(switch,sbn,path,args.all);
+            switch.lfdb = None;
+
 def cmd_dump_lfts(argv,o):
     """Display switch forwarding tables from all switches.
        Usage: %prog"""
@@ -163,6 +183,9 @@ def cmd_dump_lfts(argv,o):
     o.add_option("-D",action="store_const",dest="discovery",
                  const="DR",
                  help="Perform discovery using directed routing.");
+    o.add_option("--shards",action="store",dest="shards",type="int",
+                 metavar="N",
+                 help="Fetch the tables using N worker processes.");
     (args,values) = o.parse_args(argv,expected_values=0);
     lib = LibIBOpts(o,args,values);
 
@@ -175,8 +198,11 @@ def cmd_dump_lfts(argv,o):
                              ["all_LIDs",
                               "all_NodeDescription",
                               "all_SwitchInfo"]);
-        sched.run(mqueue=(get_switch_incr(sched,sbn,I,args) for I in
-                          sbn.iterswitches()));
+        if args.shards is not None:
+            get_switches_sharded(lib,sbn,args);
+        else:
+            sched.run(mqueue=(get_switch_incr(sched,sbn,I,args) for I in
+                              sbn.iterswitches()));
     return lib.done();
 
 def cmd_dump_mfts(argv,o):
@@ -187,6 +213,9 @@ def cmd_dump_mfts(argv,o):
                  help="Display all ports");
     o.add_option("-D",action="store_true",dest="direct",
                  help="Perform discovery using directed routing.");
+    o.add_option("--shards",action="store",dest="shards",type="int",
+                 metavar="N",
+                 help="Fetch the tables using N worker processes.");
     (args,values) = o.parse_args(argv,expected_values=0);
     lib = LibIBOpts(o,args,values);
 
@@ -198,8 +227,11 @@ def cmd_dump_mfts(argv,o):
         sched = lib.get_sched(umad);
         sbn = lib.get_subnet(sched,
                              ["all_SwitchInfo"]);
-        sched.run(mqueue=(get_switch_incr(sched,sbn,I,args) for I in
-                          sbn.iterswitches()));
+        if args.shards is not None:
+            get_switches_sharded(lib,sbn,args);
+        else:
+            sched.run(mqueue=(get_switch_incr(sched,sbn,I,args) for I in
+                              sbn.iterswitches()));
     return lib.done();
 
 def cmd_ibfindnodesusing(argv,o):
@@ -493,6 +493,12 @@ def cmd_decode_mad(argv,o):
     if args.lrh:
         bytes = decode_link(o,bytes);
 
+    if not print_mad(o,bytes):
+        raise CmdError("Don't know what this mgmtClass/classVersion is.")
+
+def print_mad(o,bytes):
+    """Pretty print the MAD in *bytes*, return False if the class is not
+    known."""
     hdr = IBA.MADHeader(bytes);
     if o.verbosity >= 1:
         hdr.printer(sys.stdout);
@@ -500,10 +506,38 @@ def cmd_decode_mad(argv,o):
     if kind[0] is None:
         if o.verbosity == 0:
             hdr.printer(sys.stdout);
-        raise CmdError("Don't know what this mgmtClass/classVersion is.")
+        return False;
     fmt = kind[0](bytes);
     print fmt.__class__.__name__,fmt.describe();
     fmt.printer(sys.stdout,header=False);
+    return True;
+
+def cmd_decode_capture(argv,o):
+    """Pretty print the MADs recorded with --capture.
+       Usage: %prog [-v] FILE
+
+       The oldest MAD still in the ring file is printed first. With -v each
+       MAD is fully decoded, otherwise a one line summary is printed."""
+    import time;
+    import rdma.madcapture;
+    import libibtool.vendstruct
+    libibtool.vendstruct.install_vend();
+    o.add_option("-v","--verbosity",dest="verbosity",action="count",default=0,
+                 help="Increase the verbosity level of diagnostic messages, each -v increases by 1.")
+    (args,values) = o.parse_args(argv,expected_values = 1);
+    o.verbosity = args.verbosity;
+
+    for rec in rdma.madcapture.read_capture(values[0]):
+        ts = time.strftime("%H:%M:%S",time.localtime(rec.timestamp));
+        fmt = rdma.madcapture.decode_record(rec);
+        print "%s.%06u %-10s LID %u %s"%(
+            ts,int((rec.timestamp % 1)*1000000),
+            rdma.madcapture.DIRECTION_NAMES[rec.direction],
+            rdma.madcapture.addr_lid(rec.addr),
+            "??" if fmt is None else fmt.describe());
+        if o.verbosity >= 1:
+            print_mad(o,rec.mad);
+    return True;
 
 def cmd_set_nodedesc(argv,o):
     """Set or display the node description for CAs.
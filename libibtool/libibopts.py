@@ -31,12 +31,41 @@ def _set_sa_path(option,opt,value,parser):
     except ValueError:
         parser.error("invalid path: %s" % value)
 
+def _set_offline_sa(option,opt,value,parser):
+    parser.values.offline_sa = value
+    parser.values.use_sa = True
+
+def load_subnet(fn):
+    """Return the :class:`rdma.subnet.Subnet` saved in the discovery cache
+    file *fn*."""
+    import rdma.subnet;
+    try:
+        import cPickle as pickle
+    except ImportError:
+        import pickle;
+
+    with open(fn,"rb") as F:
+        try:
+            sbn = pickle.load(F);
+        except:
+            e = sys.exc_info()[1]
+            raise CmdError("The file %r is not a valid cache file, could not unpickle - %s: %s"%(
+                fn,type(e).__name__,e));
+    if not isinstance(sbn,rdma.subnet.Subnet):
+        raise CmdError("The file %r is not a valid cache file, wrong object returned: %r"%(fn,sbn));
+    return sbn;
+
 class LibIBOpts(object):
     """Emulate the commandline parsing of legacy tools."""
     debug = 0;
     sbn = None;
     sbn_loaded = None;
     end_port = None;
+    sa_cache = None;
+    offline_sbn = None;
+    mad_stats = None;
+    capture = None;
+    replay = None;
 
     def __init__(self,o,args,values=None,max_values=0,template=None):
         self.args = args;
@@ -169,6 +198,18 @@ class LibIBOpts(object):
                      help="Instead of issuing SMPs, use corresponding record queries to the SA.");
         o.add_option("--sa-path",action="callback",callback=_set_sa_path,type=str,dest="sa_path",
                      help="Specify the path to the SA, implies --sa.");
+        o.add_option("--sa-cache",action="store",dest="sa_cache",type=float,
+                     metavar="SECONDS",
+                     help="With --sa, reuse SA query replies for this many seconds.");
+        o.add_option("--offline-sa",action="callback",callback=_set_offline_sa,
+                     type=str,dest="offline_sa",metavar="FILE",
+                     help="Answer SA record queries from the discovery cache FILE instead of the SA, implies --sa.");
+        o.add_option("--mad-stats",action="store_true",dest="mad_stats",
+                     help="Print the RTT, retry and timeout statistics of every MAD RPC when done.");
+        o.add_option("--capture",action="store",dest="capture",metavar="FILE",
+                     help="Record every MAD into the ring file FILE, see decode_capture.");
+        o.add_option("--replay",action="store",dest="replay",metavar="FILE",
+                     help="Answer MADs from the capture FILE instead of the fabric.");
 
         if address:
             try:
@@ -273,12 +314,29 @@ class LibIBOpts(object):
         """
         if path:
             assert(path.end_port == self.end_port);
-        umad = rdma.get_umad(self.end_port);
+        if getattr(self.args,"replay",None) is not None:
+            import rdma.madcapture;
+            if self.replay is None:
+                self.replay = list(rdma.madcapture.read_capture(self.args.replay));
+            umad = rdma.madcapture.ReplayTransactor(self.end_port,self.replay);
+        else:
+            umad = rdma.get_umad(self.end_port);
         try:
             if self.debug >= 1:
                 umad.trace_func = rdma.madtransactor.simple_tracer;
             if self.debug >= 2:
                 umad.trace_func = rdma.madtransactor.dumper_tracer;
+            if getattr(self.args,"capture",None) is not None:
+                import rdma.madcapture;
+                if self.capture is None:
+                    self.capture = rdma.madcapture.MADCapture(self.args.capture);
+                self.capture.trace_func = umad.trace_func;
+                umad.trace_func = self.capture;
+            if getattr(self.args,"mad_stats",False):
+                import rdma.madstats;
+                if self.mad_stats is None:
+                    self.mad_stats = rdma.madstats.MADStats();
+                umad.stats = self.mad_stats;
 
             if self.args.use_sa:
                 __import__("rdma.satransactor");
@@ -288,7 +346,21 @@ class LibIBOpts(object):
                 else:
                     sa_path = self.args.sa_path
                     rdma.path.resolve_path(umad, sa_path)
-                umad = sys.modules["rdma.satransactor"].SATransactor(umad,sa_path);
+                if self.args.sa_cache and self.sa_cache is None:
+                    self.sa_cache = sys.modules["rdma.satransactor"].SACache(
+                        self.args.sa_cache);
+                if getattr(self.args,"offline_sa",None) is not None:
+                    import rdma.offlinesa;
+                    if self.offline_sbn is None:
+                        if self.o.verbosity >= 1:
+                            print "D: Loading offline SA data from %r"%(
+                                self.args.offline_sa);
+                        self.offline_sbn = load_subnet(self.args.offline_sa);
+                    umad = rdma.offlinesa.OfflineSATransactor(umad,self.offline_sbn,
+                                                              sa_path);
+                else:
+                    umad = sys.modules["rdma.satransactor"].SATransactor(umad,sa_path,
+                                                                         self.sa_cache);
 
             if path is False:
                 self.path = None;
@@ -308,7 +380,10 @@ class LibIBOpts(object):
         if self.args.use_sa:
             if path is not None:
                 umad.get_path_lid(path);
-            return umad.__class__(rdma.sched.MADSchedule(umad._parent), self.args.sa_path);
+            if getattr(self.args,"offline_sa",None) is not None:
+                return umad.with_parent(rdma.sched.MADSchedule(umad._parent));
+            return umad.__class__(rdma.sched.MADSchedule(umad._parent),
+                                  self.args.sa_path,umad.cache);
         return rdma.sched.MADSchedule(umad);
 
     def get_end_port(self):
@@ -365,25 +440,13 @@ class LibIBOpts(object):
         topology discovery is completed before returning."""
         import rdma.subnet;
         import rdma.discovery;
-        try:
-            import cPickle as pickle
-        except ImportError:
-            import pickle;
 
         fn = self.cache_fn;
         if not self.args.drop_cache and fn is not None and os.path.exists(fn):
-            with open(fn,"rb") as F:
-                if self.o.verbosity >= 1:
-                    print "D: Loading discovery cache from %r"%(fn);
-                try:
-                    sbn = pickle.load(F);
-                    self.sbn_loaded = set(sbn.loaded)
-                except:
-                    e = sys.exc_info()[1]
-                    raise CmdError("The file %r is not a valid cache file, could not unpickle - %s: %s"%(
-                        fn,type(e).__name__,e));
-            if not isinstance(sbn,rdma.subnet.Subnet):
-                raise CmdError("The file %r is not a valid cache file, wrong object returned: %r"%(fn,sbn));
+            if self.o.verbosity >= 1:
+                print "D: Loading discovery cache from %r"%(fn);
+            sbn = load_subnet(fn);
+            self.sbn_loaded = set(sbn.loaded)
         else:
             sbn = rdma.subnet.Subnet();
 
@@ -396,6 +459,13 @@ class LibIBOpts(object):
         return sbn;
 
     def done(self):
+        if self.sa_cache is not None and self.o.verbosity >= 1:
+            print "D: SA cache %u hits, %u misses"%(self.sa_cache.hits,
+                                                    self.sa_cache.misses);
+        if self.mad_stats is not None:
+            self.mad_stats.dump(sys.stdout);
+        if self.capture is not None:
+            self.capture.close();
         if self.sbn is None:
             return True;
 
@@ -406,7 +476,8 @@ class LibIBOpts(object):
         if self.o.verbosity >= 1:
             print "D: Discovered: %r"%(", ".join(sorted(self.sbn.loaded)))
         fn = self.cache_fn;
-        if fn is not None and self.sbn_loaded != self.sbn.loaded:
+        if fn is not None and (self.sbn_loaded != self.sbn.loaded or
+                               self.sbn.cache_dirty):
             fn_tmp = fn + ".new";
             with open(fn_tmp,"wb") as F:
                 if self.o.verbosity >= 1:
@@ -0,0 +1,268 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+from __future__ import with_statement;
+import time;
+import rdma;
+import rdma.tools;
+import rdma.IBA as IBA;
+import rdma.IBA_describe as IBA_describe;
+from libibtool import *;
+from libibtool.libibopts import *;
+from libibtool.errors import get_perf;
+
+#: Counters that count damage seen by the receiver side of a port.
+RCV_ERRORS = ("symbolErrorCounter","portRcvErrors",
+              "portRcvRemotePhysicalErrors","localLinkIntegrityErrors",
+              "excessiveBufferOverrunErrors");
+#: Counters that count link retraining, both ends should see these.
+LINK_EVENTS = ("linkDownedCounter","linkErrorRecoveryCounter");
+ALL_COUNTERS = RCV_ERRORS + LINK_EVENTS;
+
+_saturate = dict((I[0],(1 << I[1]) - 1) for I in IBA.PMPortCounters.MEMBERS);
+
+def iterlinks(sbn):
+    """Iterate over every link in :attr:`rdma.subnet.Subnet.topology`
+    exactly once.
+
+    :rtype: generator of tuple(:class:`rdma.subnet.Port`,:class:`rdma.subnet.Port`)"""
+    seen = set();
+    for port,peer in sbn.topology.iteritems():
+        if port in seen:
+            continue;
+        seen.add(port);
+        seen.add(peer);
+        yield (port,peer);
+
+def port_desc(port):
+    """Return a short string describing *port* for display."""
+    ep = port.to_end_port();
+    desc = port.parent.desc;
+    if desc:
+        return "lid %s port %u (%s)"%(ep.LID,port.port_id,
+                                      IBA_describe.dstr(desc));
+    return "lid %s port %u"%(ep.LID,port.port_id);
+
+class LinkHealth(object):
+    """Accumulate :class:`rdma.IBA.PMPortCounters` samples taken from both
+    ends of a link and correlate them. Index 0 and 1 of the per-end lists
+    refer to the two entries in :attr:`ports`.
+
+    The first sample is a baseline, following samples add their delta to
+    :attr:`errors`. Until a second sample is taken the absolute counter values
+    are used instead."""
+    #: Number of seconds covered by :attr:`errors`.
+    elapsed = 0;
+    #: Number of times :meth:`update` has been called.
+    sweeps = 0;
+    #: `True` if any counter on either end has saturated.
+    saturated = False;
+    #: The exception raised while sampling, if any.
+    error = None;
+
+    def __init__(self,port,peer):
+        self.ports = (port,peer);
+        self.last = [None,None];
+        self.errors = [dict.fromkeys(ALL_COUNTERS,0),
+                       dict.fromkeys(ALL_COUNTERS,0)];
+        self._last_time = None;
+
+    def update(self,cnts,now):
+        """Add a new sample. *cnts* is a pair of
+        :class:`rdma.IBA.PMPortCounters`, one for each end, captured at
+        :func:`rdma.tools.clock_monotonic` time *now*."""
+        for I in (0,1):
+            cur = cnts[I];
+            last = self.last[I];
+            errors = self.errors[I];
+            for name in ALL_COUNTERS:
+                v = getattr(cur,name);
+                if v >= _saturate[name]:
+                    self.saturated = True;
+                if last is not None:
+                    delta = v - getattr(last,name);
+                    if delta < 0:
+                        # Someone cleared the counter between samples.
+                        delta = v;
+                    errors[name] = errors[name] + delta;
+            self.last[I] = cur;
+        if self._last_time is not None:
+            self.elapsed = self.elapsed + (now - self._last_time);
+        self._last_time = now;
+        self.sweeps = self.sweeps + 1;
+
+    def counts(self,idx):
+        """Return a :class:`dict` of counter name to the number of events seen
+        at end *idx*."""
+        if self.sweeps < 2:
+            if self.last[idx] is None:
+                return dict.fromkeys(ALL_COUNTERS,0);
+            return dict((I,getattr(self.last[idx],I)) for I in ALL_COUNTERS);
+        return self.errors[idx];
+
+    @property
+    def total(self):
+        """The number of error events counted at both ends."""
+        return sum(sum(I.itervalues()) for I in (self.counts(0),self.counts(1)));
+
+    @property
+    def rate(self):
+        """The number of error events per second at both ends, or `None` if
+        only one sample has been taken."""
+        if not self.elapsed:
+            return None;
+        return self.total/self.elapsed;
+
+    def diagnose(self):
+        """Correlate the counters from both ends of the link.
+
+        :returns: A :class:`list` of strings describing the likely fault."""
+        res = [];
+        cnts = (self.counts(0),self.counts(1));
+        names = (port_desc(self.ports[0]),port_desc(self.ports[1]));
+        rcv = [sum(c[I] for I in RCV_ERRORS) for c in cnts];
+        phys = [c["symbolErrorCounter"] + c["linkDownedCounter"] for c in cnts];
+        downs = [c["linkDownedCounter"] for c in cnts];
+
+        if downs[0] and downs[1]:
+            res.append("link retrained, %u/%u link downs seen by both ends"%(
+                downs[0],downs[1]));
+        elif downs[0] or downs[1]:
+            idx = 0 if downs[0] else 1;
+            res.append("%u link downs seen only by %s"%(downs[idx],names[idx]));
+
+        if ((phys[0] and cnts[1]["portRcvErrors"]) or
+            (phys[1] and cnts[0]["portRcvErrors"])):
+            res.append("physical errors on one end match receive errors on the peer, suspect the cable or connectors");
+        elif rcv[0] and rcv[1]:
+            res.append("receive errors in both directions");
+        elif rcv[0] or rcv[1]:
+            idx = 0 if rcv[0] else 1;
+            res.append("receive errors only in the direction %s -> %s, suspect the transmitter or receiver"%(
+                names[idx ^ 1],names[idx]));
+        if self.saturated:
+            res.append("counters have saturated, clear them to see new errors");
+        return res;
+
+def sample_links(sched,links,paths):
+    """Coroutine to take one sample from every :class:`LinkHealth` in
+    *links*. *paths* is a :class:`dict` of end port to GMP path. Both ends of
+    a link are fetched in the same scheduling wave so their sample times
+    line up."""
+    def get_end(link,cnts,idx):
+        port = link.ports[idx];
+        try:
+            cnts[idx] = yield get_perf(sched,paths[port.to_end_port()],
+                                       port.parent.ninf,port.port_id);
+        except (CmdError,rdma.RDMAError), e:
+            link.error = e;
+
+    def sample(link):
+        cnts = [None,None];
+        yield sched.mqueue(get_end(link,cnts,I) for I in (0,1));
+        if link.error is None:
+            link.update(cnts,rdma.tools.clock_monotonic());
+
+    yield sched.mqueue(sample(I) for I in links);
+
+def resolve_gmp_paths(sched,sbn,end_ports,paths,errors):
+    """Coroutine to fill *paths* with a GMP path to the PMA of every end port
+    in *end_ports*. Each end port is only resolved once, end ports that cannot
+    be resolved have their exception stored in the *errors* :class:`dict`."""
+    end_ports = [I for I in end_ports if I not in paths];
+    yield sbn.prefetch_gmp_paths(sched,end_ports);
+    def resolve(ep):
+        try:
+            paths[ep] = yield sbn.get_gmp_path(sched,ep);
+        except rdma.RDMAError, e:
+            errors[ep] = e;
+    yield sched.mqueue(resolve(I) for I in end_ports);
+
+def cmd_iblinkhealth(argv,o):
+    """Correlate the error counters from both ends of every link and rank
+       the links by error rate.
+       Usage: %prog
+
+       The first sweep is a baseline and later sweeps accumulate the counter
+       deltas. With a single sweep the absolute counter values are ranked."""
+    o.add_option("-n","--count",action="store",dest="count",
+                 type=int,default=2,
+                 help="Number of sweeps, default is 2.");
+    o.add_option("-p",action="store",dest="sleep",default=10,
+                 type=float,
+                 help="Time between sweeps.");
+    o.add_option("--top",action="store",dest="top",type=int,
+                 help="Only show this many of the worst links.");
+    o.add_option("--all",action="store_true",dest="all",
+                 help="Show links that have no errors.");
+    o.add_option("--up", action="store_true", dest="only_up",
+                 help="Only check links that are not POLLING/DISABLED")
+    LibIBOpts.setup(o,address=False,discovery=True);
+    (args,values) = o.parse_args(argv,expected_values=0);
+    lib = LibIBOpts(o,args,values);
+    if args.count < 1:
+        raise CmdError("The number of sweeps must be at least 1");
+
+    with lib.get_umad() as umad:
+        sched = lib.get_sched(umad);
+        sbn = lib.get_subnet(sched,("all_NodeInfo","all_PortInfo",
+                                    "all_NodeDescription","all_topology"));
+        links = [];
+        for port,peer in iterlinks(sbn):
+            if args.only_up and any(
+                I.pinf is not None and
+                (I.pinf.portPhysicalState == IBA.PHYS_PORT_STATE_POLLING or
+                 I.pinf.portPhysicalState == IBA.PHYS_PORT_STATE_DISABLED)
+                for I in (port,peer)):
+                continue;
+            links.append(LinkHealth(port,peer));
+
+        paths = {};
+        errors = {};
+        sched.run(queue=resolve_gmp_paths(sched,sbn,
+                                          set(J.to_end_port() for I in links
+                                              for J in I.ports),
+                                          paths,errors));
+        for I in links:
+            for J in I.ports:
+                if J.to_end_port() in errors:
+                    I.error = errors[J.to_end_port()];
+
+        start = rdma.tools.clock_monotonic();
+        for count in range(args.count):
+            if count != 0:
+                # Try and hit the target interval from the starting time.
+                to_sleep = (start + count*args.sleep) - rdma.tools.clock_monotonic();
+                if to_sleep > 0:
+                    time.sleep(to_sleep);
+            sched.run(queue=sample_links(sched,
+                                         [I for I in links if I.error is None],
+                                         paths));
+
+    bad = [I for I in links if I.error is None and (args.all or I.total)];
+    bad.sort(key=lambda x:(x.rate if x.rate is not None else x.total),
+             reverse=True);
+    if args.top is not None:
+        bad = bad[:args.top];
+    for I in bad:
+        if I.rate is not None:
+            print "%u errors (%.3f/s) %s <-> %s"%(I.total,I.rate,
+                                                  port_desc(I.ports[0]),
+                                                  port_desc(I.ports[1]));
+        else:
+            print "%u errors %s <-> %s"%(I.total,port_desc(I.ports[0]),
+                                         port_desc(I.ports[1]));
+        for idx in (0,1):
+            cnts = I.counts(idx);
+            print "    %s: %s"%(port_desc(I.ports[idx]),
+                                " ".join("%s=%u"%(k,cnts[k])
+                                         for k in ALL_COUNTERS if cnts[k]));
+        for J in I.diagnose():
+            print "    #warn: %s"%(J);
+    for I in links:
+        if I.error is not None:
+            print "#error: %s <-> %s: %s"%(port_desc(I.ports[0]),
+                                           port_desc(I.ports[1]),I.error);
+
+    print "## Summary: %u links checked, %u links with errors, %u links failed"%(
+        len(links),sum(1 for I in links if I.error is None and I.total),
+        sum(1 for I in links if I.error is not None));
+    return lib.done();
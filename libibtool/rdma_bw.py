@@ -3,8 +3,13 @@ import optparse
 import pickle
 import socket
 import contextlib
+import struct
 import sys
-from mmap import mmap
+import math
+import threading
+import traceback
+import multiprocessing
+from array import array
 from collections import namedtuple
 import rdma.ibverbs as ibv;
 from rdma.tools import clock_monotonic
@@ -13,32 +18,101 @@ import rdma.vtools
 from libibtool import *;
 from libibtool.libibopts import *;
 
-infotype = namedtuple('infotype', 'path addr rkey size iters')
+infotype = namedtuple('infotype', 'paths addr rkey slot params')
+# The test parameters the client sends to the server
+paramtype = namedtuple('paramtype',
+                       'test size sizes iters qps latency bidirectional procs inline num_sge')
+
+#: Work request opcode for each test
+TESTS = {
+    "write": ibv.IBV_WR_RDMA_WRITE,
+    "read": ibv.IBV_WR_RDMA_READ,
+    "send": ibv.IBV_WR_SEND,
+    "fetch_add": ibv.IBV_WR_ATOMIC_FETCH_AND_ADD,
+    "cmp_swap": ibv.IBV_WR_ATOMIC_CMP_AND_SWP,
+};
+ATOMIC_TESTS = ("fetch_add","cmp_swap");
+ACCESS = (ibv.IBV_ACCESS_LOCAL_WRITE|ibv.IBV_ACCESS_REMOTE_WRITE|
+          ibv.IBV_ACCESS_REMOTE_READ|ibv.IBV_ACCESS_REMOTE_ATOMIC);
+PERCENTILES = (50,90,99,99.9);
+
+def send_obj(sock,obj):
+    """Send a length prefixed pickle of *obj* over *sock*."""
+    buf = pickle.dumps(obj);
+    sock.sendall(struct.pack(">I",len(buf)) + buf);
+
+def recv_obj(sock):
+    """Receive an object sent by :func:`send_obj`."""
+    buf = "";
+    hdr = None;
+    while hdr is None or len(buf) < hdr:
+        if hdr is None and len(buf) >= 4:
+            hdr = struct.unpack(">I",buf[:4])[0];
+            buf = buf[4:];
+            continue;
+        tmp = sock.recv(65536);
+        if not tmp:
+            raise CmdError("Peer closed the connection");
+        buf = buf + tmp;
+    return pickle.loads(buf);
+
+def get_rd_atomic(opt):
+    """The number of RDMA READ and ATOMIC resources a QP needs."""
+    if opt.test == "read" or opt.test in ATOMIC_TESTS:
+        return opt.tx_depth;
+    return 0;
+
+def get_sizes(opt):
+    """Return the list of message sizes to test."""
+    if opt.test in ATOMIC_TESTS:
+        return [8];
+    if not opt.all:
+        return [opt.size];
+    sizes = [];
+    size = 2;
+    while size <= opt.size:
+        sizes.append(size);
+        size = size*2;
+    if not sizes or sizes[-1] != opt.size:
+        sizes.append(opt.size);
+    return sizes;
 
 class Endpoint(object):
+    """The verbs resources for one side of the test. There are *qps* RC
+    QPs, the QPs are spread over one CQ per thread and every QP uses its
+    own *slot* sized region of the MR."""
     ctx = None;
     pd = None;
-    cq = None;
     mr = None;
     peerinfo = None;
 
     def __init__(self,opt,dev):
         self.opt = opt
         self.ctx = rdma.get_verbs(dev)
-        self.cc = self.ctx.comp_channel();
-        self.cq = self.ctx.cq(2*opt.tx_depth,self.cc)
-        self.poller = rdma.vtools.CQPoller(self.cq);
         self.pd = self.ctx.pd()
-        self.qp = self.pd.qp(ibv.IBV_QPT_RC,
-                             opt.tx_depth,
-                             self.cq,
-                             opt.tx_depth,
-                             self.cq,
-                             max_send_sge=opt.num_sge,
-                             max_recv_sge=1);
-        self.mem = mmap(-1, opt.size)
-        self.mr = self.pd.mr(self.mem,
-                             ibv.IBV_ACCESS_LOCAL_WRITE|ibv.IBV_ACCESS_REMOTE_WRITE)
+        self.nthreads = max(1,min(opt.threads,opt.qps))
+        per_cq = (opt.qps + self.nthreads - 1)//self.nthreads
+        self.cqs = []
+        self.pollers = []
+        self.wcs = []
+        for I in range(self.nthreads):
+            cq = self.ctx.cq(2*opt.tx_depth*per_cq,self.ctx.comp_channel())
+            self.cqs.append(cq)
+            self.pollers.append(rdma.vtools.CQPoller(cq,async_events=(I == 0)))
+            self.wcs.append(ibv.WCList(64))
+        self.qps = [self.pd.qp(ibv.IBV_QPT_RC,
+                               opt.tx_depth,
+                               self.cqs[I % self.nthreads],
+                               opt.tx_depth,
+                               self.cqs[I % self.nthreads],
+                               max_send_sge=opt.num_sge,
+                               max_recv_sge=1,
+                               max_inline_data=opt.inline)
+                    for I in range(opt.qps)]
+        self.slot = (max(opt.size,8) + 7) & ~7
+        self.mem,self.page_size,self.numa_node = rdma.vtools.alloc_mem(
+            self.slot*opt.qps,opt.hugepages,self.ctx.node.numa_node)
+        self.mr = self.pd.mr(self.mem,ACCESS)
 
     def __enter__(self):
         return self;
@@ -49,59 +123,213 @@ class Endpoint(object):
     def close(self):
         if self.ctx is not None:
             self.ctx.close();
+            self.ctx = None;
 
     def connect(self, peerinfo):
         self.peerinfo = peerinfo
-        self.qp.establish(self.path.forward_path,ibv.IBV_ACCESS_REMOTE_WRITE);
-
-    def rdma(self):
-        if self.opt.num_sge > 1:
-            block = self.opt.size / self.opt.num_sge + 1
-            sg_list = []
-            offset = 0
-            while offset < self.opt.size:
-                if offset + block > self.opt.size:
-                    block = self.opt.size - offset
-                sg_list.append( self.mr.sge( block, offset ) )
-                offset += block
+        for qp,path in zip(self.qps,self.paths):
+            qp.establish(path.forward_path,ACCESS);
+
+    def make_sges(self,idx,size):
+        """Return the SGEs for *size* bytes of the slot of QP *idx*."""
+        base = idx*self.slot
+        if self.opt.num_sge <= 1:
+            return self.mr.sge(size,base)
+        block = size / self.opt.num_sge + 1
+        sg_list = []
+        offset = 0
+        while offset < size:
+            if offset + block > size:
+                block = size - offset
+            sg_list.append( self.mr.sge( block, base + offset ) )
+            offset += block
+        return sg_list
+
+    def make_wr(self,idx,size):
+        """Return a :class:`rdma.ibverbs.PreparedSendWR` for the test
+        operation on QP *idx*, the *wr_id* is the QP index."""
+        opcode = TESTS[self.opt.test]
+        flags = ibv.IBV_SEND_SIGNALED
+        if (size <= self.opt.inline and
+            (opcode == ibv.IBV_WR_RDMA_WRITE or opcode == ibv.IBV_WR_SEND)):
+            flags = flags | ibv.IBV_SEND_INLINE
+        return ibv.PreparedSendWR(ibv.send_wr(wr_id=idx,
+                                              remote_addr=self.peerinfo.addr + idx*self.peerinfo.slot,
+                                              rkey=self.peerinfo.rkey,
+                                              compare_add=1,
+                                              swap=0,
+                                              sg_list=self.make_sges(idx,size),
+                                              opcode=opcode,
+                                              send_flags=flags))
+
+    def thread_qps(self,tidx):
+        return range(tidx,len(self.qps),self.nthreads)
+
+    def run_initiator(self,tidx,res,size):
+        """Issue *iters* operations of *size* bytes on every QP of thread
+        *tidx*. In latency mode each QP has one operation outstanding and
+        the time from post to completion of every operation is recorded."""
+        opt = self.opt
+        qps = self.qps
+        idxs = self.thread_qps(tidx)
+        wrs = dict((I,self.make_wr(I,size)) for I in idxs)
+        n = opt.iters
+        if opt.latency:
+            depth = 1
         else:
-            sg_list = self.mr.sge()
-
-        swr = ibv.send_wr(wr_id=0,
-                          remote_addr=self.peerinfo.addr,
-                          rkey=self.peerinfo.rkey,
-                          sg_list=sg_list,
-                          opcode=ibv.IBV_WR_RDMA_WRITE,
-                          send_flags=ibv.IBV_SEND_SIGNALED)
-
-        n = self.opt.iters
-        depth = min(self.opt.tx_depth, n, self.qp.max_send_wr)
+            depth = min(opt.tx_depth, n, min(qps[I].max_send_wr for I in idxs))
+        lat = array('d')
+        posted = {}
+        posts = {}
 
         tpost = clock_monotonic()
-        for i in xrange(depth):
-            self.qp.post_send(swr)
-
-        completions = 0
-        posts = depth
-        for wc in self.poller.iterwc(timeout=1):
-            if wc.status != ibv.IBV_WC_SUCCESS:
-                raise ibv.WCError(wc,self.cq,obj=self.qp);
-            completions += 1
-            if posts < n:
-                self.qp.post_send(swr)
-                posts += 1
-                self.poller.wakeat = rdma.tools.clock_monotonic() + 1;
-            if completions == n:
+        for I in idxs:
+            posted[I] = clock_monotonic()
+            for J in xrange(depth):
+                qps[I].post_send(wrs[I])
+            posts[I] = depth
+
+        remaining = n*len(idxs)
+        poller = self.pollers[tidx]
+        for wcs in poller.iterbatch(self.wcs[tidx],timeout=opt.timeout):
+            now = clock_monotonic()
+            for J in xrange(len(wcs)):
+                I = wcs.wr_id(J)
+                if wcs.status(J) != ibv.IBV_WC_SUCCESS:
+                    raise ibv.WCError(wcs.wc(J),self.cqs[tidx],obj=qps[I]);
+                if opt.latency:
+                    lat.append(now - posted[I])
+                if posts[I] < n:
+                    if opt.latency:
+                        posted[I] = clock_monotonic()
+                    qps[I].post_send(wrs[I])
+                    posts[I] += 1
+            remaining -= len(wcs)
+            if remaining == 0:
                 break;
+            poller.wakeat = clock_monotonic() + opt.timeout;
         else:
             raise rdma.RDMAError("CQ timed out");
 
-        tcomp = clock_monotonic()
+        res[tidx] = (n*len(idxs),tpost,clock_monotonic(),lat)
+
+    def post_recvs(self):
+        """Fill the receive queue of every QP for the send test."""
+        self.recv_wrs = [ibv.PreparedRecvWR(ibv.recv_wr(wr_id=I,
+                                                        sg_list=self.mr.sge(self.slot,I*self.slot)))
+                         for I in range(len(self.qps))]
+        for I,qp in enumerate(self.qps):
+            for J in xrange(min(self.opt.tx_depth,qp.max_recv_wr)):
+                qp.post_recv(self.recv_wrs[I])
+
+    def run_receiver(self,tidx,res,count):
+        """Receive *count* messages on every QP of thread *tidx*, re-posting
+        each receive buffer."""
+        remaining = count*len(self.thread_qps(tidx))
+        poller = self.pollers[tidx]
+        for wcs in poller.iterbatch(self.wcs[tidx],timeout=self.opt.timeout):
+            for J in xrange(len(wcs)):
+                I = wcs.wr_id(J)
+                if wcs.status(J) != ibv.IBV_WC_SUCCESS:
+                    raise ibv.WCError(wcs.wc(J),self.cqs[tidx],obj=self.qps[I]);
+                self.qps[I].post_recv(self.recv_wrs[I])
+            remaining -= len(wcs)
+            if remaining == 0:
+                break;
+            poller.wakeat = clock_monotonic() + self.opt.timeout;
+        else:
+            raise rdma.RDMAError("CQ timed out");
 
-        rate = self.opt.size*self.opt.iters/1e6/(tcomp-tpost)
-        print "%.1f MB/sec" % rate
+    def run(self,func,*args):
+        """Call *func* once for each thread index, in parallel threads if
+        there is more than one CQ. Returns the list of per thread results."""
+        res = [None]*self.nthreads
+        if self.nthreads == 1:
+            func(0,res,*args)
+            return res
+        errors = []
+        def do(tidx):
+            try:
+                func(tidx,res,*args)
+            except:
+                errors.append(sys.exc_info())
+        threads = [threading.Thread(target=do,args=(I,))
+                   for I in range(self.nthreads)]
+        for I in threads:
+            I.start()
+        for I in threads:
+            I.join()
+        if errors:
+            raise errors[0][0],errors[0][1],errors[0][2]
+        return res
+
+    def run_sizes(self):
+        """Run the test for every size, returns a list of tuple(size,list of
+        tuple(count,start,end,latencies))."""
+        return [(size,self.run(self.run_initiator,size))
+                for size in self.opt.sizes]
+
+def percentile(lat,pct):
+    """Return the *pct* percentile of the sorted list *lat*."""
+    return lat[max(0,min(len(lat) - 1,
+                         int(math.ceil(pct/100.0*len(lat))) - 1))]
+
+def print_results(opt,results):
+    """Print one line for each size in *results*, see
+    :meth:`Endpoint.run_sizes`. Returns a list of tuple(MB/sec,99th
+    percentile latency in usec) for each size."""
+    if opt.latency:
+        print "%-8s %-11s %-11s %-11s %s %-11s"%(
+            "#bytes","#iterations","t_min[usec]","t_avg[usec]",
+            " ".join("t_%-9s"%(I) for I in PERCENTILES),"t_max[usec]");
+    else:
+        print "%-8s %-11s %-19s %s"%("#bytes","#iterations",
+                                     "BW average[MB/sec]","MsgRate[Mpps]");
+    ret = []
+    for size,res in results:
+        count = sum(I[0] for I in res)
+        elapsed = max(I[2] for I in res) - min(I[1] for I in res)
+        rate = size*count/1e6/elapsed
+        if not opt.latency:
+            print "%-8u %-11u %-19.2f %.6f"%(size,count,rate,count/1e6/elapsed)
+            ret.append((rate,None))
+            continue
+
+        lat = sorted(J*1e6 for I in res for J in I[3])
+        print "%-8u %-11u %-11.2f %-11.2f %s %-11.2f"%(
+            size,count,lat[0],sum(lat)/len(lat),
+            " ".join("%-11.2f"%(percentile(lat,I)) for I in PERCENTILES),
+            lat[-1])
+        if opt.histogram:
+            print_histogram(lat)
+        ret.append((rate,percentile(lat,99)))
+    return ret
+
+def print_histogram(lat):
+    """Print a power of 2 histogram of the sorted latencies *lat* in usec."""
+    hist = {}
+    for I in lat:
+        bucket = int(math.log(I,2)) if I >= 1 else 0
+        hist[bucket] = hist.get(bucket,0) + 1
+    total = 0
+    for bucket in range(min(hist),max(hist) + 1):
+        count = hist.get(bucket,0)
+        total += count
+        print "  %8u - %-8u usec %10u %6.2f%%"%(
+            1 << bucket if bucket else 0,1 << (bucket + 1),count,
+            100.0*total/len(lat))
+
+def get_params(opt):
+    return paramtype(**dict((I,getattr(opt,I)) for I in paramtype._fields))
+
+def apply_params(opt,params):
+    """Set the test parameters sent by the client into *opt*."""
+    for k,v in params._asdict().iteritems():
+        setattr(opt,k,v);
 
 def client_mode(hostname,opt,dev):
+    """Connect to the server and run the test, returns the results of
+    :meth:`Endpoint.run_sizes`."""
     with Endpoint(opt,dev) as end:
         ret = socket.getaddrinfo(hostname,str(opt.ip_port),opt.af,
                                  socket.SOCK_STREAM);
@@ -111,35 +339,138 @@ def client_mode(hostname,opt,dev):
                 print "Connecting to %r %r"%(ret[4][0],ret[4][1]);
             sock.connect(ret[4]);
 
-            path = rdma.path.IBPath(dev,SGID=end.ctx.end_port.default_gid);
-            rdma.path.fill_path(end.qp,path,max_rd_atomic=0);
-            path.reverse(for_reply=False);
-
-            sock.send(pickle.dumps(infotype(path=path,
-                                            addr=end.mr.addr,
-                                            rkey=end.mr.rkey,
-                                            size=opt.size,
-                                            iters=opt.iters)))
-            buf = sock.recv(1024)
-            peerinfo = pickle.loads(buf)
-
-            end.path = peerinfo.path;
-            end.path.reverse(for_reply=False);
-            end.path.set_end_port(end.ctx.node);
-
-            print "path to peer %r\nMR peer raddr=%x peer rkey=%x"%(
-                end.path.forward_path,peerinfo.addr,peerinfo.rkey);
-            print "%u iterations of %u is %u bytes"%(opt.iters,opt.size,
-                                                     opt.iters*opt.size);
+            paths = []
+            for qp in end.qps:
+                path = rdma.path.IBPath(dev,SGID=end.ctx.end_port.default_gid);
+                rdma.path.fill_path(qp,path,max_rd_atomic=get_rd_atomic(opt));
+                path.reverse(for_reply=False);
+                paths.append(path)
+
+            send_obj(sock,infotype(paths=paths,
+                                   addr=end.mr.addr,
+                                   rkey=end.mr.rkey,
+                                   slot=end.slot,
+                                   params=get_params(opt)))
+            peerinfo = recv_obj(sock)
+
+            end.paths = peerinfo.paths;
+            for path in end.paths:
+                path.reverse(for_reply=False);
+                path.set_end_port(end.ctx.node);
+
+            if opt.procs == 1 or opt.debug >= 1:
+                print "path to peer %r\nMR peer raddr=%x peer rkey=%x"%(
+                    end.paths[0].forward_path,peerinfo.addr,peerinfo.rkey);
+                print "%s test, %u QPs, %u iterations per QP"%(
+                    opt.test,opt.qps,opt.iters);
+                print "buffer page size %u, NUMA node %s"%(
+                    end.page_size,end.numa_node);
 
             end.connect(peerinfo)
             # Synchronize the transition to RTS
-            sock.send("Ready");
-            sock.recv(1024);
-            end.rdma()
+            send_obj(sock,"ready");
+            recv_obj(sock);
+            results = end.run_sizes()
 
             sock.shutdown(socket.SHUT_WR);
             sock.recv(1024);
+            return results
+
+def client_proc(conn,hostname,opt,dev):
+    try:
+        conn.send((client_mode(hostname,opt,dev),None));
+    except:
+        conn.send((None,"".join(traceback.format_exception(*sys.exc_info()))));
+    conn.close();
+
+def run_procs(target,args,count):
+    """Run *target* in *count* processes, each is passed a pipe to send
+    tuple(result,error string) back on followed by *args*. Returns the list
+    of results."""
+    procs = []
+    for I in range(count):
+        rconn,wconn = multiprocessing.Pipe(False);
+        proc = multiprocessing.Process(target=target,args=(wconn,) + args);
+        proc.start();
+        wconn.close();
+        procs.append((proc,rconn));
+    ret = []
+    failed = None
+    for proc,rconn in procs:
+        try:
+            res,exc = rconn.recv();
+        except EOFError:
+            res,exc = None,"Process %u exited"%(proc.pid);
+        rconn.close();
+        proc.join();
+        if exc is not None:
+            failed = exc;
+        ret.append(res);
+    if failed is not None:
+        raise CmdError("Benchmark process failed:\n%s"%(failed));
+    return ret
+
+def client(hostname,opt,dev):
+    """Run *opt.procs* clients and print the combined results."""
+    if opt.procs == 1:
+        results = client_mode(hostname,opt,dev)
+    else:
+        # Every process has its own connection and QPs, the results of
+        # each size are combined.
+        allres = run_procs(client_proc,(hostname,opt,dev),opt.procs)
+        results = [(size,[J for I in allres for J in I[idx][1]])
+                   for idx,size in enumerate(opt.sizes)]
+    return print_results(opt,results)
+
+def serve(s,peerinfo,opt,dev):
+    """Serve one client connection *s* that sent *peerinfo*."""
+    with contextlib.closing(s):
+        apply_params(opt,peerinfo.params)
+
+        with Endpoint(opt,dev) as end:
+            end.paths = peerinfo.paths;
+            with rdma.get_gmp_mad(end.ctx.end_port,verbs=end.ctx) as umad:
+                for qp,path in zip(end.qps,end.paths):
+                    path.end_port = end.ctx.end_port;
+                    rdma.path.fill_path(qp,path,max_rd_atomic=get_rd_atomic(opt));
+                    rdma.path.resolve_path(umad,path);
+
+            send_obj(s,infotype(paths=end.paths,
+                                addr=end.mr.addr,
+                                rkey=end.mr.rkey,
+                                slot=end.slot,
+                                params=None))
+
+            if opt.procs == 1 or opt.debug >= 1:
+                print "path to peer %r\nMR peer raddr=%x peer rkey=%x"%(
+                    end.paths[0].forward_path,peerinfo.addr,peerinfo.rkey);
+                print "%s test, %u QPs, %u iterations per QP"%(
+                    opt.test,opt.qps,opt.iters);
+                print "buffer page size %u, NUMA node %s"%(
+                    end.page_size,end.numa_node);
+
+            end.connect(peerinfo)
+            if opt.test == "send":
+                end.post_recvs()
+            # Synchronize the transition to RTS
+            send_obj(s,"ready");
+            recv_obj(s);
+            results = None
+            if opt.test == "send":
+                end.run(end.run_receiver,opt.iters*len(opt.sizes))
+            elif opt.bidirectional:
+                results = end.run_sizes()
+
+            s.shutdown(socket.SHUT_WR);
+            s.recv(1024);
+            return results
+
+def serve_proc(conn,s,peerinfo,opt,dev):
+    try:
+        conn.send((serve(s,peerinfo,opt,dev),None));
+    except:
+        conn.send((None,"".join(traceback.format_exception(*sys.exc_info()))));
+    conn.close();
 
 def server_mode(opt,dev):
     ret = socket.getaddrinfo(None,str(opt.ip_port),opt.af,
@@ -151,52 +482,68 @@ def server_mode(opt,dev):
         sock.bind(ret[4]);
         if opt.debug >= 1:
             print "Listening on %r %r"%(ret[4][0],ret[4][1]);
-        sock.listen(1)
+        sock.listen(16)
 
         s,addr = sock.accept()
-        with contextlib.closing(s):
-            buf = s.recv(1024)
-            peerinfo = pickle.loads(buf)
-
-            opt.size = peerinfo.size;
-            opt.iters = peerinfo.iters;
-
-            with Endpoint(opt,dev) as end:
-                with rdma.get_gmp_mad(end.ctx.end_port,verbs=end.ctx) as umad:
-                    end.path = peerinfo.path;
-                    end.path.end_port = end.ctx.end_port;
-                    rdma.path.fill_path(end.qp,end.path);
-                    rdma.path.resolve_path(umad,end.path);
-
-                s.send(pickle.dumps(infotype(path=end.path,
-                                             addr=end.mr.addr,
-                                             rkey=end.mr.rkey,
-                                             size=None,
-                                             iters=None)))
-
-                print "path to peer %r\nMR peer raddr=%x peer rkey=%x"%(
-                    end.path.forward_path,peerinfo.addr,peerinfo.rkey);
-                print "%u iterations of %u is %u bytes"%(opt.iters,opt.size,
-                                                         opt.iters*opt.size);
-
-                end.connect(peerinfo)
-                # Synchronize the transition to RTS
-                s.send("ready");
-                s.recv(1024);
-                if opt.bidirectional:
-                    end.rdma()
-
-                s.shutdown(socket.SHUT_WR);
-                s.recv(1024);
+        peerinfo = recv_obj(s)
+        apply_params(opt,peerinfo.params)
+        if opt.procs == 1:
+            results = serve(s,peerinfo,opt,dev)
+            if results is not None:
+                print_results(opt,results)
+            return
+
+        # One server process for each client process
+        conns = [(s,peerinfo)]
+        for I in range(1,opt.procs):
+            s,addr = sock.accept()
+            conns.append((s,recv_obj(s)))
+        procs = []
+        for s,peerinfo in conns:
+            rconn,wconn = multiprocessing.Pipe(False);
+            proc = multiprocessing.Process(target=serve_proc,
+                                           args=(wconn,s,peerinfo,opt,dev));
+            proc.start();
+            wconn.close();
+            s.close();
+            procs.append((proc,rconn));
+        allres = []
+        failed = None
+        for proc,rconn in procs:
+            try:
+                res,exc = rconn.recv();
+            except EOFError:
+                res,exc = None,"Process %u exited"%(proc.pid);
+            rconn.close();
+            proc.join();
+            if exc is not None:
+                failed = exc;
+            allres.append(res);
+        if failed is not None:
+            raise CmdError("Benchmark process failed:\n%s"%(failed));
+        if allres[0] is not None:
+            print_results(opt,[(size,[J for I in allres for J in I[idx][1]])
+                               for idx,size in enumerate(opt.sizes)])
 
 def cmd_rdma_bw(argv,o):
-    """Perform a RDMA bandwidth test over a RC QP.
+    """Perform a RDMA bandwidth or latency test over RC QPs.
        Usage: %prog [SERVER]
 
        If SERVER is not specified then a server instance is started. A
        connection is made using TCP/IP sockets between the client and server
        process. This connection is used to exchange the connection
-       information."""
+       information. The test parameters are given to the client, the server
+       follows them.
+
+       The test is one of write, read, send, fetch_add or cmp_swap. In
+       latency mode each QP has one operation outstanding and the time from
+       post to completion is reported as percentiles, otherwise the
+       bandwidth and message rate are reported. Several QPs can be spread
+       over several threads, each with its own CQ, and over several
+       processes, each with its own connection and verbs context.
+
+       --min-bw and --max-lat make the command fail if the result is worse,
+       for use as an acceptance test."""
 
     o.add_option("-C","--Ca",dest="CA",
                  help="RDMA device to use. Specify a device name or node GUID");
@@ -213,21 +560,62 @@ def cmd_rdma_bw(argv,o):
                  help="use IB device DEV")
     o.add_option('-i', '--ib-port', type="int", metavar="PORT", dest="port",
                  help="use port PORT of IB device")
+    o.add_option('-T', '--test', default="write", type="choice",
+                 choices=sorted(TESTS),
+                 help="operation to test, one of %s (client only)"%(
+                     ", ".join(sorted(TESTS))))
+    o.add_option('-l', '--latency', default=False, action="store_true",
+                 help="measure latency instead of bandwidth (client only)")
     o.add_option('-s', '--size', default=1024*1024, type="int", metavar="BYTES",
                  help="exchange messages of size BYTES,(client only)")
+    o.add_option('-a', '--all', default=False, action="store_true",
+                 help="test all power of 2 sizes up to --size (client only)")
     o.add_option('-e', '--num-sge', default=1, type="int", metavar="NUM",
                  help="Number of sges to use.")
+    o.add_option('-I', '--inline', default=0, type="int", metavar="BYTES",
+                 help="send messages up to BYTES inline (client only)")
     o.add_option('-t', '--tx-depth', default=100, type="int", help="number of exchanges")
     o.add_option('-n', '--iters', default=1000, type="int",
-                 help="number of exchanges (client only)")
+                 help="number of exchanges per QP (client only)")
+    o.add_option('--hugepages', default=False, action="store_true",
+                 help="allocate the buffers from huge pages if possible")
+    o.add_option('-q', '--qps', default=1, type="int", metavar="NUM",
+                 help="number of QPs per process (client only)")
+    o.add_option('--threads', default=1, type="int", metavar="NUM",
+                 help="number of threads and CQs driving the QPs")
+    o.add_option('--procs', default=1, type="int", metavar="NUM",
+                 help="number of processes, each with its own QPs (client only)")
+    o.add_option('--timeout', default=5, type="float", metavar="SECS",
+                 help="fail if no work completes for SECS seconds")
+    o.add_option('--histogram', default=False, action="store_true",
+                 help="print a latency histogram")
+    o.add_option('--min-bw', type="float", metavar="MB",
+                 help="fail if the bandwidth is below MB MB/sec")
+    o.add_option('--max-lat', type="float", metavar="USEC",
+                 help="fail if the 99th percentile latency is above USEC")
     o.add_option("--debug",dest="debug",action="count",default=0,
                  help="Increase the debug level, each -d increases by 1.")
 
     (args,values) = o.parse_args(argv);
     lib = LibIBOpts(o,args,1,(str,));
 
+    if args.test in ATOMIC_TESTS:
+        args.size = 8;
+        args.num_sge = 1;
+    if args.bidirectional and args.test == "send":
+        raise CmdError("--bidirectional is not supported by the send test");
+    args.sizes = get_sizes(args);
+
     if len(values) == 1:
-        client_mode(values[0],args,lib.get_end_port())
+        res = client(values[0],args,lib.get_end_port())
+        for size,(rate,lat) in zip(args.sizes,res):
+            if args.min_bw is not None and rate < args.min_bw:
+                raise CmdError("Bandwidth %.1f MB/sec for size %u is below %.1f"%(
+                    rate,size,args.min_bw));
+            if (args.max_lat is not None and lat is not None and
+                lat > args.max_lat):
+                raise CmdError("Latency %.2f usec for size %u is above %.2f"%(
+                    lat,size,args.max_lat));
     else:
         server_mode(args,lib.get_end_port())
     return True;
@@ -161,6 +161,8 @@ implementsNotice = 1<<1;
 
 #: PMA ClassPortInfo capabilityMask Constants
 allPortSelect = 1<<8;
+extendedWidthSupported = 1<<9;
+extendedWidthSupportedNoIETF = 1<<10;
 portCountersXmitWaitSupported = 1<<12;
 
 #: PortInfo capabilityMask Constants
@@ -245,6 +247,8 @@ class GUID(bytes):
             raw = True;
         if raw:
             assert(len(s) == 8);
+            if isinstance(s,memoryview):
+                s = s.tobytes();
             return bytes.__new__(self,s);
 
         v = ''.join(I.zfill(4) for I in s.strip().split(':'));
@@ -307,6 +311,8 @@ class GID(bytes):
             return s;
         if raw:
             assert(len(s) == 16);
+            if isinstance(s,memoryview):
+                s = s.tobytes();
             return bytes.__new__(self,s);
         try:
             return bytes.__new__(self,socket.inet_pton(socket.AF_INET6,s.strip()));
@@ -377,6 +383,25 @@ class ComponentMask(object):
         object.__setattr__(self,"component_mask",mask);
         object.__setattr__(self,"_obj",obj);
 
+    @classmethod
+    def build(cls,obj,values):
+        """Return a new instance wrappering *obj* with each component in
+        *values* set. *values* is a :class:`dict` or a sequence of
+        tuple(name,value), names are keys of *obj*'s `COMPONENT_MASK`. This is
+        much faster than setting the attributes through the wrapper.
+
+        :raises KeyError: If a name is not a valid component name"""
+        mask = 0;
+        cm = obj.COMPONENT_MASK;
+        setters = obj.COMPONENT_SETTERS;
+        if isinstance(values,dict):
+            values = values.iteritems();
+        for name,value in values:
+            bit = cm[name];
+            setters[bit](obj,value);
+            mask = mask | (1<<bit);
+        return cls(obj,mask);
+
     @property
     def payload(self):
         """The original object that is wrappered."""
@@ -430,7 +455,7 @@ class ComponentMask(object):
         def __getattr__(self,name):
             res = getattr(self._obj,name);
             if isinstance(res,rdma.binstruct.BinStruct):
-                return _Proxy(self._parent,"%s.%s"%(self._name,name),res);
+                return ComponentMask._Proxy(self._parent,"%s.%s"%(self._name,name),res);
             if isinstance(res,bytearray) or isinstance(res,list):
                 # It is an array of some sort, just reading from those
                 # flips the bit because I am lazy.
@@ -101,77 +101,93 @@ def rate(value):
     if value == IBA.PR_RATE_2Gb5:
         return 2500000000;
     if value == IBA.PR_RATE_5Gb0:
-        return 500000000;
+        return 5000000000;
     if value == IBA.PR_RATE_10Gb0:
-        return 1000000000;
+        return 10000000000;
     if value == IBA.PR_RATE_14Gb0:
-        return 1400000000;
+        return 14000000000;
     if value == IBA.PR_RATE_20Gb0:
-        return 2000000000;
+        return 20000000000;
     if value == IBA.PR_RATE_25Gb0:
-        return 2500000000;
+        return 25000000000;
     if value == IBA.PR_RATE_30Gb0:
-        return 3000000000;
+        return 30000000000;
     if value == IBA.PR_RATE_40Gb0:
-        return 4000000000;
+        return 40000000000;
     if value == IBA.PR_RATE_56Gb0:
-        return 5600000000;
+        return 56000000000;
     if value == IBA.PR_RATE_60Gb0:
-        return 6000000000;
+        return 60000000000;
     if value == IBA.PR_RATE_80Gb0:
-        return 8000000000;
+        return 80000000000;
     if value == IBA.PR_RATE_100Gb0:
-        return 10000000000;
+        return 100000000000;
     if value == IBA.PR_RATE_112Gb0:
-        return 11200000000;
+        return 112000000000;
     if value == IBA.PR_RATE_120Gb0:
-        return 12000000000;
+        return 120000000000;
     if value == IBA.PR_RATE_168Gb0:
-        return 16800000000;
+        return 168000000000;
     if value == IBA.PR_RATE_200Gb0:
-        return 20000000000;
+        return 200000000000;
     if value == IBA.PR_RATE_300Gb0:
-        return 30000000000;
+        return 300000000000;
     return 2499999999; # ???
 
 def to_rate(value):
     """Convert a rate in integer bits/sec to an IBA rate (eg a
     :attr:`rdma.IBA.SAPathRecord.rate`). The lowest matching rate constant
     is returned."""
-    if value >= 30000000000:
+    if value >= 300000000000:
         return IBA.PR_RATE_300Gb0
-    if value >= 20000000000:
+    if value >= 200000000000:
         return IBA.PR_RATE_200Gb0
-    if value >= 16800000000:
+    if value >= 168000000000:
         return IBA.PR_RATE_168Gb0
-    if value >= 12000000000:
+    if value >= 120000000000:
         return IBA.PR_RATE_120Gb0
-    if value >= 11200000000:
+    if value >= 112000000000:
         return IBA.PR_RATE_112Gb0
-    if value >= 10000000000:
+    if value >= 100000000000:
         return IBA.PR_RATE_100Gb0
-    if value >= 8000000000:
+    if value >= 80000000000:
         return IBA.PR_RATE_80Gb0
-    if value >= 6000000000:
+    if value >= 60000000000:
         return IBA.PR_RATE_60Gb0
-    if value >= 5600000000:
+    if value >= 56000000000:
         return IBA.PR_RATE_56Gb0
-    if value >= 4000000000:
+    if value >= 40000000000:
         return IBA.PR_RATE_40Gb0
-    if value >= 3000000000:
+    if value >= 30000000000:
         return IBA.PR_RATE_30Gb0
-    if value >= 2500000000:
+    if value >= 25000000000:
         return IBA.PR_RATE_25Gb0
-    if value >= 2000000000:
+    if value >= 20000000000:
         return IBA.PR_RATE_20Gb0
-    if value >= 1400000000:
+    if value >= 14000000000:
         return IBA.PR_RATE_14Gb0
-    if value >= 1000000000:
+    if value >= 10000000000:
         return IBA.PR_RATE_10Gb0
-    if value >= 500000000:
+    if value >= 5000000000:
         return IBA.PR_RATE_5Gb0
     return IBA.PR_RATE_2Gb5
 
+def link_rate(pinf):
+    """Return the IBA rate (eg a :attr:`rdma.IBA.SAPathRecord.rate`) that the
+    link described by the :class:`rdma.IBA.SMPPortInfo` *pinf* is running
+    at, based on linkWidthActive, linkSpeedActive and linkSpeedExtActive."""
+    if pinf.linkSpeedExtActive & IBA.LINK_SPEED_EXT_25Gb7:
+        lane = 25000000000;
+    elif pinf.linkSpeedExtActive & IBA.LINK_SPEED_EXT_14Gb0:
+        lane = 14000000000;
+    elif pinf.linkSpeedActive & IBA.LINK_SPEED_10Gb0:
+        lane = 10000000000;
+    elif pinf.linkSpeedActive & IBA.LINK_SPEED_5Gb0:
+        lane = 5000000000;
+    else:
+        lane = 2500000000;
+    return to_rate(link_width(pinf.linkWidthActive)*lane);
+
 def description(value):
     """Decodes a fixed length string from a IBA MAD (such as
     :class:`rdma.IBA.SMPNodeDescription`) These strings are considered to be
@@ -1,4 +1,4 @@
-import rdma.binstruct,struct
+import operator,rdma.binstruct,struct
 class HdrLRH(rdma.binstruct.BinStruct):
     '''Local Route Header (section 7.7)'''
     __slots__ = ('VL','LVer','SL','reserved_12','LNH','DLID','reserved_32','pktLen','SLID');
@@ -990,6 +990,8 @@ class MADClassPortInfo(rdma.binstruct.BinStruct):
     MAD_SNMPGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     COMPONENT_MASK = {'baseVersion':0, 'classVersion':1, 'capabilityMask':2, 'capabilityMask2':3, 'respTimeValue':4, 'redirectGID':5, 'redirectTC':6, 'redirectSL':7, 'redirectFL':8, 'redirectLID':9, 'redirectPKey':10, 'reserved_256':11, 'redirectQP':12, 'redirectQKey':13, 'trapGID':14, 'trapTC':15, 'trapSL':16, 'trapFL':17, 'trapLID':18, 'trapPKey':19, 'trapHL':20, 'trapQP':21, 'trapQKey':22}
+    COMPONENT_GETTERS = (operator.attrgetter('baseVersion'), operator.attrgetter('classVersion'), operator.attrgetter('capabilityMask'), operator.attrgetter('capabilityMask2'), operator.attrgetter('respTimeValue'), operator.attrgetter('redirectGID'), operator.attrgetter('redirectTC'), operator.attrgetter('redirectSL'), operator.attrgetter('redirectFL'), operator.attrgetter('redirectLID'), operator.attrgetter('redirectPKey'), None, operator.attrgetter('redirectQP'), operator.attrgetter('redirectQKey'), operator.attrgetter('trapGID'), operator.attrgetter('trapTC'), operator.attrgetter('trapSL'), operator.attrgetter('trapFL'), operator.attrgetter('trapLID'), operator.attrgetter('trapPKey'), operator.attrgetter('trapHL'), operator.attrgetter('trapQP'), operator.attrgetter('trapQKey'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'baseVersion',v), lambda x,v:setattr(x,'classVersion',v), lambda x,v:setattr(x,'capabilityMask',v), lambda x,v:setattr(x,'capabilityMask2',v), lambda x,v:setattr(x,'respTimeValue',v), lambda x,v:setattr(x,'redirectGID',v), lambda x,v:setattr(x,'redirectTC',v), lambda x,v:setattr(x,'redirectSL',v), lambda x,v:setattr(x,'redirectFL',v), lambda x,v:setattr(x,'redirectLID',v), lambda x,v:setattr(x,'redirectPKey',v), lambda x,v:setattr(x,'reserved_256',v), lambda x,v:setattr(x,'redirectQP',v), lambda x,v:setattr(x,'redirectQKey',v), lambda x,v:setattr(x,'trapGID',v), lambda x,v:setattr(x,'trapTC',v), lambda x,v:setattr(x,'trapSL',v), lambda x,v:setattr(x,'trapFL',v), lambda x,v:setattr(x,'trapLID',v), lambda x,v:setattr(x,'trapPKey',v), lambda x,v:setattr(x,'trapHL',v), lambda x,v:setattr(x,'trapQP',v), lambda x,v:setattr(x,'trapQKey',v))
     MEMBERS = [('baseVersion',8,1), ('classVersion',8,1), ('capabilityMask',16,1), ('capabilityMask2',27,1), ('respTimeValue',5,1), ('redirectGID',128,1), ('redirectTC',8,1), ('redirectSL',4,1), ('redirectFL',20,1), ('redirectLID',16,1), ('redirectPKey',16,1), ('reserved_256',8,1), ('redirectQP',24,1), ('redirectQKey',32,1), ('trapGID',128,1), ('trapTC',8,1), ('trapSL',4,1), ('trapFL',20,1), ('trapLID',16,1), ('trapPKey',16,1), ('trapHL',8,1), ('trapQP',24,1), ('trapQKey',32,1)]
     def zero(self):
         self.baseVersion = 0;
@@ -1084,6 +1086,8 @@ class MADInformInfo(rdma.binstruct.BinStruct):
     MAD_ATTRIBUTE_ID = 0x3
     MAD_SUBNADMSET = 0x2 # MAD_METHOD_SET
     COMPONENT_MASK = {'GID':0, 'LIDRangeBegin':1, 'LIDRangeEnd':2, 'reserved_160':3, 'isGeneric':4, 'subscribe':5, 'type':6, 'trapNumber':7, 'QPN':8, 'reserved_248':9, 'respTimeValue':10, 'reserved_256':11, 'producerType':12}
+    COMPONENT_GETTERS = (operator.attrgetter('GID'), operator.attrgetter('LIDRangeBegin'), operator.attrgetter('LIDRangeEnd'), None, operator.attrgetter('isGeneric'), operator.attrgetter('subscribe'), operator.attrgetter('type'), operator.attrgetter('trapNumber'), operator.attrgetter('QPN'), None, operator.attrgetter('respTimeValue'), None, operator.attrgetter('producerType'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'GID',v), lambda x,v:setattr(x,'LIDRangeBegin',v), lambda x,v:setattr(x,'LIDRangeEnd',v), lambda x,v:setattr(x,'reserved_160',v), lambda x,v:setattr(x,'isGeneric',v), lambda x,v:setattr(x,'subscribe',v), lambda x,v:setattr(x,'type',v), lambda x,v:setattr(x,'trapNumber',v), lambda x,v:setattr(x,'QPN',v), lambda x,v:setattr(x,'reserved_248',v), lambda x,v:setattr(x,'respTimeValue',v), lambda x,v:setattr(x,'reserved_256',v), lambda x,v:setattr(x,'producerType',v))
     MEMBERS = [('GID',128,1), ('LIDRangeBegin',16,1), ('LIDRangeEnd',16,1), ('reserved_160',16,1), ('isGeneric',8,1), ('subscribe',8,1), ('type',16,1), ('trapNumber',16,1), ('QPN',24,1), ('reserved_248',3,1), ('respTimeValue',5,1), ('reserved_256',8,1), ('producerType',24,1)]
     def zero(self):
         self.GID = IBA.GID();
@@ -2144,6 +2148,8 @@ class SANodeRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'reserved_16':1, 'nodeInfo.baseVersion':2, 'nodeInfo.classVersion':3, 'nodeInfo.nodeType':4, 'nodeInfo.numPorts':5, 'nodeInfo.systemImageGUID':6, 'nodeInfo.nodeGUID':7, 'nodeInfo.portGUID':8, 'nodeInfo.partitionCap':9, 'nodeInfo.deviceID':10, 'nodeInfo.revision':11, 'nodeInfo.localPortNum':12, 'nodeInfo.vendorID':13, 'nodeDescription.nodeString':14}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), None, operator.attrgetter('nodeInfo.baseVersion'), operator.attrgetter('nodeInfo.classVersion'), operator.attrgetter('nodeInfo.nodeType'), operator.attrgetter('nodeInfo.numPorts'), operator.attrgetter('nodeInfo.systemImageGUID'), operator.attrgetter('nodeInfo.nodeGUID'), operator.attrgetter('nodeInfo.portGUID'), operator.attrgetter('nodeInfo.partitionCap'), operator.attrgetter('nodeInfo.deviceID'), operator.attrgetter('nodeInfo.revision'), operator.attrgetter('nodeInfo.localPortNum'), operator.attrgetter('nodeInfo.vendorID'), operator.attrgetter('nodeDescription.nodeString'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'reserved_16',v), lambda x,v:setattr(x.nodeInfo,'baseVersion',v), lambda x,v:setattr(x.nodeInfo,'classVersion',v), lambda x,v:setattr(x.nodeInfo,'nodeType',v), lambda x,v:setattr(x.nodeInfo,'numPorts',v), lambda x,v:setattr(x.nodeInfo,'systemImageGUID',v), lambda x,v:setattr(x.nodeInfo,'nodeGUID',v), lambda x,v:setattr(x.nodeInfo,'portGUID',v), lambda x,v:setattr(x.nodeInfo,'partitionCap',v), lambda x,v:setattr(x.nodeInfo,'deviceID',v), lambda x,v:setattr(x.nodeInfo,'revision',v), lambda x,v:setattr(x.nodeInfo,'localPortNum',v), lambda x,v:setattr(x.nodeInfo,'vendorID',v), lambda x,v:setattr(x.nodeDescription,'nodeString',v))
     MEMBERS = [('LID',16,1), ('reserved_16',16,1), ('nodeInfo',320,1), ('nodeDescription',512,1)]
     def __init__(self,*args):
         self.nodeInfo = SMPNodeInfo();
@@ -2174,6 +2180,8 @@ class SAPortInfoRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'endportLID':0, 'portNum':1, 'reserved_24':2, 'portInfo.MKey':3, 'portInfo.GIDPrefix':4, 'portInfo.LID':5, 'portInfo.masterSMLID':6, 'portInfo.capabilityMask':7, 'portInfo.diagCode':8, 'portInfo.MKeyLeasePeriod':9, 'portInfo.localPortNum':10, 'portInfo.linkWidthEnabled':11, 'portInfo.linkWidthSupported':12, 'portInfo.linkWidthActive':13, 'portInfo.linkSpeedSupported':14, 'portInfo.portState':15, 'portInfo.portPhysicalState':16, 'portInfo.linkDownDefaultState':17, 'portInfo.MKeyProtectBits':18, 'portInfo.reserved_274':19, 'portInfo.LMC':20, 'portInfo.linkSpeedActive':21, 'portInfo.linkSpeedEnabled':22, 'portInfo.neighborMTU':23, 'portInfo.masterSMSL':24, 'portInfo.VLCap':25, 'portInfo.initType':26, 'portInfo.VLHighLimit':27, 'portInfo.VLArbitrationHighCap':28, 'portInfo.VLArbitrationLowCap':29, 'portInfo.initTypeReply':30, 'portInfo.MTUCap':31, 'portInfo.VLStallCount':32, 'portInfo.HOQLife':33, 'portInfo.operationalVLs':34, 'portInfo.partitionEnforcementInbound':35, 'portInfo.partitionEnforcementOutbound':36, 'portInfo.filterRawInbound':37, 'portInfo.filterRawOutbound':38, 'portInfo.MKeyViolations':39, 'portInfo.PKeyViolations':40, 'portInfo.QKeyViolations':41, 'portInfo.GUIDCap':42, 'portInfo.clientReregister':43, 'portInfo.multicastPKeyTrapSuppressionEnabled':44, 'portInfo.subnetTimeOut':45, 'portInfo.reserved_416':46, 'portInfo.respTimeValue':47, 'portInfo.localPhyErrors':48, 'portInfo.overrunErrors':49, 'portInfo.maxCreditHint':50, 'portInfo.reserved_448':51, 'portInfo.linkRoundTripLatency':52, 'portInfo.capabilityMask2':53, 'portInfo.linkSpeedExtActive':54, 'portInfo.linkSpeedExtSupported':55, 'portInfo.reserved_504':56, 'portInfo.linkSpeedExtEnabled':57}
+    COMPONENT_GETTERS = (operator.attrgetter('endportLID'), operator.attrgetter('portNum'), None, operator.attrgetter('portInfo.MKey'), operator.attrgetter('portInfo.GIDPrefix'), operator.attrgetter('portInfo.LID'), operator.attrgetter('portInfo.masterSMLID'), operator.attrgetter('portInfo.capabilityMask'), operator.attrgetter('portInfo.diagCode'), operator.attrgetter('portInfo.MKeyLeasePeriod'), operator.attrgetter('portInfo.localPortNum'), operator.attrgetter('portInfo.linkWidthEnabled'), operator.attrgetter('portInfo.linkWidthSupported'), operator.attrgetter('portInfo.linkWidthActive'), operator.attrgetter('portInfo.linkSpeedSupported'), operator.attrgetter('portInfo.portState'), operator.attrgetter('portInfo.portPhysicalState'), operator.attrgetter('portInfo.linkDownDefaultState'), operator.attrgetter('portInfo.MKeyProtectBits'), operator.attrgetter('portInfo.reserved_274'), operator.attrgetter('portInfo.LMC'), operator.attrgetter('portInfo.linkSpeedActive'), operator.attrgetter('portInfo.linkSpeedEnabled'), operator.attrgetter('portInfo.neighborMTU'), operator.attrgetter('portInfo.masterSMSL'), operator.attrgetter('portInfo.VLCap'), operator.attrgetter('portInfo.initType'), operator.attrgetter('portInfo.VLHighLimit'), operator.attrgetter('portInfo.VLArbitrationHighCap'), operator.attrgetter('portInfo.VLArbitrationLowCap'), operator.attrgetter('portInfo.initTypeReply'), operator.attrgetter('portInfo.MTUCap'), operator.attrgetter('portInfo.VLStallCount'), operator.attrgetter('portInfo.HOQLife'), operator.attrgetter('portInfo.operationalVLs'), operator.attrgetter('portInfo.partitionEnforcementInbound'), operator.attrgetter('portInfo.partitionEnforcementOutbound'), operator.attrgetter('portInfo.filterRawInbound'), operator.attrgetter('portInfo.filterRawOutbound'), operator.attrgetter('portInfo.MKeyViolations'), operator.attrgetter('portInfo.PKeyViolations'), operator.attrgetter('portInfo.QKeyViolations'), operator.attrgetter('portInfo.GUIDCap'), operator.attrgetter('portInfo.clientReregister'), operator.attrgetter('portInfo.multicastPKeyTrapSuppressionEnabled'), operator.attrgetter('portInfo.subnetTimeOut'), operator.attrgetter('portInfo.reserved_416'), operator.attrgetter('portInfo.respTimeValue'), operator.attrgetter('portInfo.localPhyErrors'), operator.attrgetter('portInfo.overrunErrors'), operator.attrgetter('portInfo.maxCreditHint'), operator.attrgetter('portInfo.reserved_448'), operator.attrgetter('portInfo.linkRoundTripLatency'), operator.attrgetter('portInfo.capabilityMask2'), operator.attrgetter('portInfo.linkSpeedExtActive'), operator.attrgetter('portInfo.linkSpeedExtSupported'), operator.attrgetter('portInfo.reserved_504'), operator.attrgetter('portInfo.linkSpeedExtEnabled'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'endportLID',v), lambda x,v:setattr(x,'portNum',v), lambda x,v:setattr(x,'reserved_24',v), lambda x,v:setattr(x.portInfo,'MKey',v), lambda x,v:setattr(x.portInfo,'GIDPrefix',v), lambda x,v:setattr(x.portInfo,'LID',v), lambda x,v:setattr(x.portInfo,'masterSMLID',v), lambda x,v:setattr(x.portInfo,'capabilityMask',v), lambda x,v:setattr(x.portInfo,'diagCode',v), lambda x,v:setattr(x.portInfo,'MKeyLeasePeriod',v), lambda x,v:setattr(x.portInfo,'localPortNum',v), lambda x,v:setattr(x.portInfo,'linkWidthEnabled',v), lambda x,v:setattr(x.portInfo,'linkWidthSupported',v), lambda x,v:setattr(x.portInfo,'linkWidthActive',v), lambda x,v:setattr(x.portInfo,'linkSpeedSupported',v), lambda x,v:setattr(x.portInfo,'portState',v), lambda x,v:setattr(x.portInfo,'portPhysicalState',v), lambda x,v:setattr(x.portInfo,'linkDownDefaultState',v), lambda x,v:setattr(x.portInfo,'MKeyProtectBits',v), lambda x,v:setattr(x.portInfo,'reserved_274',v), lambda x,v:setattr(x.portInfo,'LMC',v), lambda x,v:setattr(x.portInfo,'linkSpeedActive',v), lambda x,v:setattr(x.portInfo,'linkSpeedEnabled',v), lambda x,v:setattr(x.portInfo,'neighborMTU',v), lambda x,v:setattr(x.portInfo,'masterSMSL',v), lambda x,v:setattr(x.portInfo,'VLCap',v), lambda x,v:setattr(x.portInfo,'initType',v), lambda x,v:setattr(x.portInfo,'VLHighLimit',v), lambda x,v:setattr(x.portInfo,'VLArbitrationHighCap',v), lambda x,v:setattr(x.portInfo,'VLArbitrationLowCap',v), lambda x,v:setattr(x.portInfo,'initTypeReply',v), lambda x,v:setattr(x.portInfo,'MTUCap',v), lambda x,v:setattr(x.portInfo,'VLStallCount',v), lambda x,v:setattr(x.portInfo,'HOQLife',v), lambda x,v:setattr(x.portInfo,'operationalVLs',v), lambda x,v:setattr(x.portInfo,'partitionEnforcementInbound',v), lambda x,v:setattr(x.portInfo,'partitionEnforcementOutbound',v), lambda x,v:setattr(x.portInfo,'filterRawInbound',v), lambda x,v:setattr(x.portInfo,'filterRawOutbound',v), lambda x,v:setattr(x.portInfo,'MKeyViolations',v), lambda x,v:setattr(x.portInfo,'PKeyViolations',v), lambda x,v:setattr(x.portInfo,'QKeyViolations',v), lambda x,v:setattr(x.portInfo,'GUIDCap',v), lambda x,v:setattr(x.portInfo,'clientReregister',v), lambda x,v:setattr(x.portInfo,'multicastPKeyTrapSuppressionEnabled',v), lambda x,v:setattr(x.portInfo,'subnetTimeOut',v), lambda x,v:setattr(x.portInfo,'reserved_416',v), lambda x,v:setattr(x.portInfo,'respTimeValue',v), lambda x,v:setattr(x.portInfo,'localPhyErrors',v), lambda x,v:setattr(x.portInfo,'overrunErrors',v), lambda x,v:setattr(x.portInfo,'maxCreditHint',v), lambda x,v:setattr(x.portInfo,'reserved_448',v), lambda x,v:setattr(x.portInfo,'linkRoundTripLatency',v), lambda x,v:setattr(x.portInfo,'capabilityMask2',v), lambda x,v:setattr(x.portInfo,'linkSpeedExtActive',v), lambda x,v:setattr(x.portInfo,'linkSpeedExtSupported',v), lambda x,v:setattr(x.portInfo,'reserved_504',v), lambda x,v:setattr(x.portInfo,'linkSpeedExtEnabled',v))
     MEMBERS = [('endportLID',16,1), ('portNum',8,1), ('reserved_24',8,1), ('portInfo',512,1)]
     def __init__(self,*args):
         self.portInfo = SMPPortInfo();
@@ -2201,6 +2209,8 @@ class SASLToVLMappingTableRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'inputPortNum':1, 'outputPortNum':2, 'reserved_32':3, 'SLToVLMappingTable.SLtoVL':4}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), operator.attrgetter('inputPortNum'), operator.attrgetter('outputPortNum'), None, operator.attrgetter('SLToVLMappingTable.SLtoVL'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'inputPortNum',v), lambda x,v:setattr(x,'outputPortNum',v), lambda x,v:setattr(x,'reserved_32',v), lambda x,v:setattr(x.SLToVLMappingTable,'SLtoVL',v))
     MEMBERS = [('LID',16,1), ('inputPortNum',8,1), ('outputPortNum',8,1), ('reserved_32',32,1), ('SLToVLMappingTable',64,1)]
     def __init__(self,*args):
         self.SLToVLMappingTable = SMPSLToVLMappingTable();
@@ -2229,6 +2239,8 @@ class SASwitchInfoRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'reserved_16':1, 'switchInfo.linearFDBCap':2, 'switchInfo.randomFDBCap':3, 'switchInfo.multicastFDBCap':4, 'switchInfo.linearFDBTop':5, 'switchInfo.defaultPort':6, 'switchInfo.defaultMulticastPrimaryPort':7, 'switchInfo.defaultMulticastNotPrimaryPort':8, 'switchInfo.lifeTimeValue':9, 'switchInfo.portStateChange':10, 'switchInfo.optimizedSLtoVLMappingProgramming':11, 'switchInfo.LIDsPerPort':12, 'switchInfo.partitionEnforcementCap':13, 'switchInfo.inboundEnforcementCap':14, 'switchInfo.outboundEnforcementCap':15, 'switchInfo.filterRawInboundCap':16, 'switchInfo.filterRawOutboundCap':17, 'switchInfo.enhancedPort0':18, 'switchInfo.reserved_133':19, 'switchInfo.reserved_136':20, 'switchInfo.multicastFDBTop':21}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), None, operator.attrgetter('switchInfo.linearFDBCap'), operator.attrgetter('switchInfo.randomFDBCap'), operator.attrgetter('switchInfo.multicastFDBCap'), operator.attrgetter('switchInfo.linearFDBTop'), operator.attrgetter('switchInfo.defaultPort'), operator.attrgetter('switchInfo.defaultMulticastPrimaryPort'), operator.attrgetter('switchInfo.defaultMulticastNotPrimaryPort'), operator.attrgetter('switchInfo.lifeTimeValue'), operator.attrgetter('switchInfo.portStateChange'), operator.attrgetter('switchInfo.optimizedSLtoVLMappingProgramming'), operator.attrgetter('switchInfo.LIDsPerPort'), operator.attrgetter('switchInfo.partitionEnforcementCap'), operator.attrgetter('switchInfo.inboundEnforcementCap'), operator.attrgetter('switchInfo.outboundEnforcementCap'), operator.attrgetter('switchInfo.filterRawInboundCap'), operator.attrgetter('switchInfo.filterRawOutboundCap'), operator.attrgetter('switchInfo.enhancedPort0'), operator.attrgetter('switchInfo.reserved_133'), operator.attrgetter('switchInfo.reserved_136'), operator.attrgetter('switchInfo.multicastFDBTop'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'reserved_16',v), lambda x,v:setattr(x.switchInfo,'linearFDBCap',v), lambda x,v:setattr(x.switchInfo,'randomFDBCap',v), lambda x,v:setattr(x.switchInfo,'multicastFDBCap',v), lambda x,v:setattr(x.switchInfo,'linearFDBTop',v), lambda x,v:setattr(x.switchInfo,'defaultPort',v), lambda x,v:setattr(x.switchInfo,'defaultMulticastPrimaryPort',v), lambda x,v:setattr(x.switchInfo,'defaultMulticastNotPrimaryPort',v), lambda x,v:setattr(x.switchInfo,'lifeTimeValue',v), lambda x,v:setattr(x.switchInfo,'portStateChange',v), lambda x,v:setattr(x.switchInfo,'optimizedSLtoVLMappingProgramming',v), lambda x,v:setattr(x.switchInfo,'LIDsPerPort',v), lambda x,v:setattr(x.switchInfo,'partitionEnforcementCap',v), lambda x,v:setattr(x.switchInfo,'inboundEnforcementCap',v), lambda x,v:setattr(x.switchInfo,'outboundEnforcementCap',v), lambda x,v:setattr(x.switchInfo,'filterRawInboundCap',v), lambda x,v:setattr(x.switchInfo,'filterRawOutboundCap',v), lambda x,v:setattr(x.switchInfo,'enhancedPort0',v), lambda x,v:setattr(x.switchInfo,'reserved_133',v), lambda x,v:setattr(x.switchInfo,'reserved_136',v), lambda x,v:setattr(x.switchInfo,'multicastFDBTop',v))
     MEMBERS = [('LID',16,1), ('reserved_16',16,1), ('switchInfo',160,1)]
     def __init__(self,*args):
         self.switchInfo = SMPSwitchInfo();
@@ -2255,6 +2267,8 @@ class SALinearForwardingTableRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'blockNum':1, 'reserved_32':2, 'linearForwardingTable.portBlock':3}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), operator.attrgetter('blockNum'), None, operator.attrgetter('linearForwardingTable.portBlock'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'blockNum',v), lambda x,v:setattr(x,'reserved_32',v), lambda x,v:setattr(x.linearForwardingTable,'portBlock',v))
     MEMBERS = [('LID',16,1), ('blockNum',16,1), ('reserved_32',32,1), ('linearForwardingTable',512,1)]
     def __init__(self,*args):
         self.linearForwardingTable = SMPLinearForwardingTable();
@@ -2282,6 +2296,8 @@ class SARandomForwardingTableRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'blockNum':1, 'reserved_32':2, 'randomForwardingTable.LIDPortBlock':3}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), operator.attrgetter('blockNum'), None, operator.attrgetter('randomForwardingTable.LIDPortBlock'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'blockNum',v), lambda x,v:setattr(x,'reserved_32',v), lambda x,v:setattr(x.randomForwardingTable,'LIDPortBlock',v))
     MEMBERS = [('LID',16,1), ('blockNum',16,1), ('reserved_32',32,1), ('randomForwardingTable',512,1)]
     def __init__(self,*args):
         self.randomForwardingTable = SMPRandomForwardingTable();
@@ -2309,6 +2325,8 @@ class SAMulticastForwardingTableRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'reserved_16':1, 'position':2, 'blockNum':3, 'reserved_32':4, 'multicastForwardingTable.portMaskBlock':5}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), None, operator.attrgetter('position'), operator.attrgetter('blockNum'), None, operator.attrgetter('multicastForwardingTable.portMaskBlock'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'reserved_16',v), lambda x,v:setattr(x,'position',v), lambda x,v:setattr(x,'blockNum',v), lambda x,v:setattr(x,'reserved_32',v), lambda x,v:setattr(x.multicastForwardingTable,'portMaskBlock',v))
     MEMBERS = [('LID',16,1), ('reserved_16',2,1), ('position',4,1), ('blockNum',10,1), ('reserved_32',32,1), ('multicastForwardingTable',512,1)]
     def __init__(self,*args):
         self.multicastForwardingTable = SMPMulticastForwardingTable();
@@ -2349,6 +2367,8 @@ class SAVLArbitrationTableRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'outputPortNum':1, 'blockNum':2, 'reserved_32':3, 'VLArbitrationTable.VLWeightBlock':4}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), operator.attrgetter('outputPortNum'), operator.attrgetter('blockNum'), None, operator.attrgetter('VLArbitrationTable.VLWeightBlock'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'outputPortNum',v), lambda x,v:setattr(x,'blockNum',v), lambda x,v:setattr(x,'reserved_32',v), lambda x,v:setattr(x.VLArbitrationTable,'VLWeightBlock',v))
     MEMBERS = [('LID',16,1), ('outputPortNum',8,1), ('blockNum',8,1), ('reserved_32',32,1), ('VLArbitrationTable',512,1)]
     def __init__(self,*args):
         self.VLArbitrationTable = SMPVLArbitrationTable();
@@ -2377,6 +2397,8 @@ class SASMInfoRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'reserved_16':1, 'SMInfo.GUID':2, 'SMInfo.SMKey':3, 'SMInfo.actCount':4, 'SMInfo.priority':5, 'SMInfo.SMState':6, 'SMInfo.reserved_168':7}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), None, operator.attrgetter('SMInfo.GUID'), operator.attrgetter('SMInfo.SMKey'), operator.attrgetter('SMInfo.actCount'), operator.attrgetter('SMInfo.priority'), operator.attrgetter('SMInfo.SMState'), operator.attrgetter('SMInfo.reserved_168'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'reserved_16',v), lambda x,v:setattr(x.SMInfo,'GUID',v), lambda x,v:setattr(x.SMInfo,'SMKey',v), lambda x,v:setattr(x.SMInfo,'actCount',v), lambda x,v:setattr(x.SMInfo,'priority',v), lambda x,v:setattr(x.SMInfo,'SMState',v), lambda x,v:setattr(x.SMInfo,'reserved_168',v))
     MEMBERS = [('LID',16,1), ('reserved_16',16,1), ('SMInfo',192,1)]
     def __init__(self,*args):
         self.SMInfo = SMPSMInfo();
@@ -2403,6 +2425,8 @@ class SAInformInfoRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'subscriberGID':0, 'enumeration':1, 'reserved_144':2, 'informInfo.GID':3, 'informInfo.LIDRangeBegin':4, 'informInfo.LIDRangeEnd':5, 'informInfo.reserved_160':6, 'informInfo.isGeneric':7, 'informInfo.subscribe':8, 'informInfo.type':9, 'informInfo.trapNumber':10, 'informInfo.QPN':11, 'informInfo.reserved_248':12, 'informInfo.respTimeValue':13, 'informInfo.reserved_256':14, 'informInfo.producerType':15, 'reserved_480':16}
+    COMPONENT_GETTERS = (operator.attrgetter('subscriberGID'), operator.attrgetter('enumeration'), None, operator.attrgetter('informInfo.GID'), operator.attrgetter('informInfo.LIDRangeBegin'), operator.attrgetter('informInfo.LIDRangeEnd'), operator.attrgetter('informInfo.reserved_160'), operator.attrgetter('informInfo.isGeneric'), operator.attrgetter('informInfo.subscribe'), operator.attrgetter('informInfo.type'), operator.attrgetter('informInfo.trapNumber'), operator.attrgetter('informInfo.QPN'), operator.attrgetter('informInfo.reserved_248'), operator.attrgetter('informInfo.respTimeValue'), operator.attrgetter('informInfo.reserved_256'), operator.attrgetter('informInfo.producerType'), None)
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'subscriberGID',v), lambda x,v:setattr(x,'enumeration',v), lambda x,v:setattr(x,'reserved_144',v), lambda x,v:setattr(x.informInfo,'GID',v), lambda x,v:setattr(x.informInfo,'LIDRangeBegin',v), lambda x,v:setattr(x.informInfo,'LIDRangeEnd',v), lambda x,v:setattr(x.informInfo,'reserved_160',v), lambda x,v:setattr(x.informInfo,'isGeneric',v), lambda x,v:setattr(x.informInfo,'subscribe',v), lambda x,v:setattr(x.informInfo,'type',v), lambda x,v:setattr(x.informInfo,'trapNumber',v), lambda x,v:setattr(x.informInfo,'QPN',v), lambda x,v:setattr(x.informInfo,'reserved_248',v), lambda x,v:setattr(x.informInfo,'respTimeValue',v), lambda x,v:setattr(x.informInfo,'reserved_256',v), lambda x,v:setattr(x.informInfo,'producerType',v), lambda x,v:setattr(x,'reserved_480',v))
     MEMBERS = [('subscriberGID',128,1), ('enumeration',16,1), ('reserved_144',16,1), ('reserved_160',32,1), ('informInfo',288,1), ('reserved_480',160,1)]
     def __init__(self,*args):
         self.informInfo = MADInformInfo();
@@ -2436,6 +2460,8 @@ class SALinkRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'fromLID':0, 'fromPort':1, 'toPort':2, 'toLID':3, 'reserved_48':4}
+    COMPONENT_GETTERS = (operator.attrgetter('fromLID'), operator.attrgetter('fromPort'), operator.attrgetter('toPort'), operator.attrgetter('toLID'), None)
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'fromLID',v), lambda x,v:setattr(x,'fromPort',v), lambda x,v:setattr(x,'toPort',v), lambda x,v:setattr(x,'toLID',v), lambda x,v:setattr(x,'reserved_48',v))
     MEMBERS = [('fromLID',16,1), ('fromPort',8,1), ('toPort',8,1), ('toLID',16,1), ('reserved_48',16,1)]
     def zero(self):
         self.fromLID = 0;
@@ -2460,6 +2486,8 @@ class SAGUIDInfoRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     MAD_SUBNADMSET = 0x2 # MAD_METHOD_SET
     COMPONENT_MASK = {'LID':0, 'blockNum':1, 'reserved_24':2, 'reserved_32':3, 'GUIDInfo.GUIDBlock':4}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), operator.attrgetter('blockNum'), None, None, operator.attrgetter('GUIDInfo.GUIDBlock'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'blockNum',v), lambda x,v:setattr(x,'reserved_24',v), lambda x,v:setattr(x,'reserved_32',v), lambda x,v:setattr(x.GUIDInfo,'GUIDBlock',v))
     MEMBERS = [('LID',16,1), ('blockNum',8,1), ('reserved_24',8,1), ('reserved_32',32,1), ('GUIDInfo',512,1)]
     def __init__(self,*args):
         self.GUIDInfo = SMPGUIDInfo();
@@ -2490,6 +2518,8 @@ class SAServiceRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     MAD_SUBNADMSET = 0x2 # MAD_METHOD_SET
     COMPONENT_MASK = {'serviceID':0, 'serviceGID':1, 'servicePKey':2, 'reserved_208':3, 'serviceLease':4, 'serviceKey':5, 'serviceName':6, 'serviceData8_0':7, 'serviceData8_1':8, 'serviceData8_2':9, 'serviceData8_3':10, 'serviceData8_4':11, 'serviceData8_5':12, 'serviceData8_6':13, 'serviceData8_7':14, 'serviceData8_8':15, 'serviceData8_9':16, 'serviceData8_10':17, 'serviceData8_11':18, 'serviceData8_12':19, 'serviceData8_13':20, 'serviceData8_14':21, 'serviceData8_15':22, 'serviceData16_0':23, 'serviceData16_1':24, 'serviceData16_2':25, 'serviceData16_3':26, 'serviceData16_4':27, 'serviceData16_5':28, 'serviceData16_6':29, 'serviceData16_7':30, 'serviceData32_0':31, 'serviceData32_1':32, 'serviceData32_2':33, 'serviceData32_3':34, 'serviceData64_0':35, 'serviceData64_1':36}
+    COMPONENT_GETTERS = (operator.attrgetter('serviceID'), operator.attrgetter('serviceGID'), operator.attrgetter('servicePKey'), None, operator.attrgetter('serviceLease'), operator.attrgetter('serviceKey'), operator.attrgetter('serviceName'), lambda x:x.serviceData8[0], lambda x:x.serviceData8[1], lambda x:x.serviceData8[2], lambda x:x.serviceData8[3], lambda x:x.serviceData8[4], lambda x:x.serviceData8[5], lambda x:x.serviceData8[6], lambda x:x.serviceData8[7], lambda x:x.serviceData8[8], lambda x:x.serviceData8[9], lambda x:x.serviceData8[10], lambda x:x.serviceData8[11], lambda x:x.serviceData8[12], lambda x:x.serviceData8[13], lambda x:x.serviceData8[14], lambda x:x.serviceData8[15], lambda x:x.serviceData16[0], lambda x:x.serviceData16[1], lambda x:x.serviceData16[2], lambda x:x.serviceData16[3], lambda x:x.serviceData16[4], lambda x:x.serviceData16[5], lambda x:x.serviceData16[6], lambda x:x.serviceData16[7], lambda x:x.serviceData32[0], lambda x:x.serviceData32[1], lambda x:x.serviceData32[2], lambda x:x.serviceData32[3], lambda x:x.serviceData64[0], lambda x:x.serviceData64[1])
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'serviceID',v), lambda x,v:setattr(x,'serviceGID',v), lambda x,v:setattr(x,'servicePKey',v), lambda x,v:setattr(x,'reserved_208',v), lambda x,v:setattr(x,'serviceLease',v), lambda x,v:setattr(x,'serviceKey',v), lambda x,v:setattr(x,'serviceName',v), lambda x,v:x.serviceData8.__setitem__(0,v), lambda x,v:x.serviceData8.__setitem__(1,v), lambda x,v:x.serviceData8.__setitem__(2,v), lambda x,v:x.serviceData8.__setitem__(3,v), lambda x,v:x.serviceData8.__setitem__(4,v), lambda x,v:x.serviceData8.__setitem__(5,v), lambda x,v:x.serviceData8.__setitem__(6,v), lambda x,v:x.serviceData8.__setitem__(7,v), lambda x,v:x.serviceData8.__setitem__(8,v), lambda x,v:x.serviceData8.__setitem__(9,v), lambda x,v:x.serviceData8.__setitem__(10,v), lambda x,v:x.serviceData8.__setitem__(11,v), lambda x,v:x.serviceData8.__setitem__(12,v), lambda x,v:x.serviceData8.__setitem__(13,v), lambda x,v:x.serviceData8.__setitem__(14,v), lambda x,v:x.serviceData8.__setitem__(15,v), lambda x,v:x.serviceData16.__setitem__(0,v), lambda x,v:x.serviceData16.__setitem__(1,v), lambda x,v:x.serviceData16.__setitem__(2,v), lambda x,v:x.serviceData16.__setitem__(3,v), lambda x,v:x.serviceData16.__setitem__(4,v), lambda x,v:x.serviceData16.__setitem__(5,v), lambda x,v:x.serviceData16.__setitem__(6,v), lambda x,v:x.serviceData16.__setitem__(7,v), lambda x,v:x.serviceData32.__setitem__(0,v), lambda x,v:x.serviceData32.__setitem__(1,v), lambda x,v:x.serviceData32.__setitem__(2,v), lambda x,v:x.serviceData32.__setitem__(3,v), lambda x,v:x.serviceData64.__setitem__(0,v), lambda x,v:x.serviceData64.__setitem__(1,v))
     MEMBERS = [('serviceID',64,1), ('serviceGID',128,1), ('servicePKey',16,1), ('reserved_208',16,1), ('serviceLease',32,1), ('serviceKey',128,1), ('serviceName',8,64), ('serviceData8',8,16), ('serviceData16',16,8), ('serviceData32',32,4), ('serviceData64',64,2)]
     def __init__(self,*args):
         self.serviceName = bytearray(64);
@@ -2540,6 +2570,8 @@ class SAPKeyTableRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'LID':0, 'blockNum':1, 'portNum':2, 'reserved_40':3, 'PKeyTable.PKeyBlock':4}
+    COMPONENT_GETTERS = (operator.attrgetter('LID'), operator.attrgetter('blockNum'), operator.attrgetter('portNum'), None, operator.attrgetter('PKeyTable.PKeyBlock'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'LID',v), lambda x,v:setattr(x,'blockNum',v), lambda x,v:setattr(x,'portNum',v), lambda x,v:setattr(x,'reserved_40',v), lambda x,v:setattr(x.PKeyTable,'PKeyBlock',v))
     MEMBERS = [('LID',16,1), ('blockNum',16,1), ('portNum',8,1), ('reserved_40',24,1), ('PKeyTable',512,1)]
     def __init__(self,*args):
         self.PKeyTable = SMPPKeyTable();
@@ -2577,6 +2609,8 @@ class SAPathRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'serviceID':0, 'serviceID56LSB':1, 'DGID':2, 'SGID':3, 'DLID':4, 'SLID':5, 'rawTraffic':6, 'reserved_353':7, 'flowLabel':8, 'hopLimit':9, 'TClass':10, 'reversible':11, 'numbPath':12, 'PKey':13, 'QOSClass':14, 'SL':15, 'MTUSelector':16, 'MTU':17, 'rateSelector':18, 'rate':19, 'packetLifeTimeSelector':20, 'packetLifeTime':21, 'preference':22, 'reversePathPKeyMemberBit':23, 'reserved_466':24, 'reserved_480':25}
+    COMPONENT_GETTERS = (operator.attrgetter('serviceID'), operator.attrgetter('serviceID56LSB'), operator.attrgetter('DGID'), operator.attrgetter('SGID'), operator.attrgetter('DLID'), operator.attrgetter('SLID'), operator.attrgetter('rawTraffic'), None, operator.attrgetter('flowLabel'), operator.attrgetter('hopLimit'), operator.attrgetter('TClass'), operator.attrgetter('reversible'), operator.attrgetter('numbPath'), operator.attrgetter('PKey'), operator.attrgetter('QOSClass'), operator.attrgetter('SL'), None, operator.attrgetter('MTU'), None, operator.attrgetter('rate'), None, operator.attrgetter('packetLifeTime'), operator.attrgetter('preference'), operator.attrgetter('reversePathPKeyMemberBit'), None, None)
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'serviceID',v), lambda x,v:setattr(x,'serviceID56LSB',v), lambda x,v:setattr(x,'DGID',v), lambda x,v:setattr(x,'SGID',v), lambda x,v:setattr(x,'DLID',v), lambda x,v:setattr(x,'SLID',v), lambda x,v:setattr(x,'rawTraffic',v), lambda x,v:setattr(x,'reserved_353',v), lambda x,v:setattr(x,'flowLabel',v), lambda x,v:setattr(x,'hopLimit',v), lambda x,v:setattr(x,'TClass',v), lambda x,v:setattr(x,'reversible',v), lambda x,v:setattr(x,'numbPath',v), lambda x,v:setattr(x,'PKey',v), lambda x,v:setattr(x,'QOSClass',v), lambda x,v:setattr(x,'SL',v), lambda x,v:setattr(x,'MTUSelector',v), lambda x,v:setattr(x,'MTU',v), lambda x,v:setattr(x,'rateSelector',v), lambda x,v:setattr(x,'rate',v), lambda x,v:setattr(x,'packetLifeTimeSelector',v), lambda x,v:setattr(x,'packetLifeTime',v), lambda x,v:setattr(x,'preference',v), lambda x,v:setattr(x,'reversePathPKeyMemberBit',v), lambda x,v:setattr(x,'reserved_466',v), lambda x,v:setattr(x,'reserved_480',v))
     MEMBERS = [('serviceID',64,1), ('DGID',128,1), ('SGID',128,1), ('DLID',16,1), ('SLID',16,1), ('rawTraffic',1,1), ('reserved_353',3,1), ('flowLabel',20,1), ('hopLimit',8,1), ('TClass',8,1), ('reversible',1,1), ('numbPath',7,1), ('PKey',16,1), ('QOSClass',12,1), ('SL',4,1), ('MTUSelector',2,1), ('MTU',6,1), ('rateSelector',2,1), ('rate',6,1), ('packetLifeTimeSelector',2,1), ('packetLifeTime',6,1), ('preference',8,1), ('reversePathPKeyMemberBit',2,1), ('reserved_466',14,1), ('reserved_480',32,1)]
     def zero(self):
         self.serviceID = 0;
@@ -2674,6 +2708,8 @@ class SAMCMemberRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     MAD_SUBNADMSET = 0x2 # MAD_METHOD_SET
     COMPONENT_MASK = {'MGID':0, 'portGID':1, 'QKey':2, 'MLID':3, 'MTUSelector':4, 'MTU':5, 'TClass':6, 'PKey':7, 'rateSelector':8, 'rate':9, 'packetLifeTimeSelector':10, 'packetLifeTime':11, 'SL':12, 'flowLabel':13, 'hopLimit':14, 'scope':15, 'joinState':16, 'proxyJoin':17, 'reserved_393':18}
+    COMPONENT_GETTERS = (operator.attrgetter('MGID'), operator.attrgetter('portGID'), operator.attrgetter('QKey'), operator.attrgetter('MLID'), None, operator.attrgetter('MTU'), operator.attrgetter('TClass'), operator.attrgetter('PKey'), None, operator.attrgetter('rate'), None, operator.attrgetter('packetLifeTime'), operator.attrgetter('SL'), operator.attrgetter('flowLabel'), operator.attrgetter('hopLimit'), operator.attrgetter('scope'), operator.attrgetter('joinState'), operator.attrgetter('proxyJoin'), None)
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'MGID',v), lambda x,v:setattr(x,'portGID',v), lambda x,v:setattr(x,'QKey',v), lambda x,v:setattr(x,'MLID',v), lambda x,v:setattr(x,'MTUSelector',v), lambda x,v:setattr(x,'MTU',v), lambda x,v:setattr(x,'TClass',v), lambda x,v:setattr(x,'PKey',v), lambda x,v:setattr(x,'rateSelector',v), lambda x,v:setattr(x,'rate',v), lambda x,v:setattr(x,'packetLifeTimeSelector',v), lambda x,v:setattr(x,'packetLifeTime',v), lambda x,v:setattr(x,'SL',v), lambda x,v:setattr(x,'flowLabel',v), lambda x,v:setattr(x,'hopLimit',v), lambda x,v:setattr(x,'scope',v), lambda x,v:setattr(x,'joinState',v), lambda x,v:setattr(x,'proxyJoin',v), lambda x,v:setattr(x,'reserved_393',v))
     MEMBERS = [('MGID',128,1), ('portGID',128,1), ('QKey',32,1), ('MLID',16,1), ('MTUSelector',2,1), ('MTU',6,1), ('TClass',8,1), ('PKey',16,1), ('rateSelector',2,1), ('rate',6,1), ('packetLifeTimeSelector',2,1), ('packetLifeTime',6,1), ('SL',4,1), ('flowLabel',20,1), ('hopLimit',8,1), ('scope',4,1), ('joinState',4,1), ('proxyJoin',1,1), ('reserved_393',23,1)]
     def zero(self):
         self.MGID = IBA.GID();
@@ -2757,6 +2793,8 @@ class SATraceRecord(rdma.binstruct.BinStruct):
     MAD_ATTRIBUTE_ID = 0x39
     MAD_SUBNADMGETTRACETABLE = 0x13 # MAD_METHOD_GET_TRACE_TABLE
     COMPONENT_MASK = {'GIDPrefix':0, 'IDGeneration':1, 'reserved_80':2, 'nodeType':3, 'nodeID':4, 'chassisID':5, 'entryPortID':6, 'exitPortID':7, 'entryPort':8, 'exitPort':9, 'reserved_368':10}
+    COMPONENT_GETTERS = (operator.attrgetter('GIDPrefix'), operator.attrgetter('IDGeneration'), None, operator.attrgetter('nodeType'), operator.attrgetter('nodeID'), operator.attrgetter('chassisID'), operator.attrgetter('entryPortID'), operator.attrgetter('exitPortID'), operator.attrgetter('entryPort'), operator.attrgetter('exitPort'), None)
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'GIDPrefix',v), lambda x,v:setattr(x,'IDGeneration',v), lambda x,v:setattr(x,'reserved_80',v), lambda x,v:setattr(x,'nodeType',v), lambda x,v:setattr(x,'nodeID',v), lambda x,v:setattr(x,'chassisID',v), lambda x,v:setattr(x,'entryPortID',v), lambda x,v:setattr(x,'exitPortID',v), lambda x,v:setattr(x,'entryPort',v), lambda x,v:setattr(x,'exitPort',v), lambda x,v:setattr(x,'reserved_368',v))
     MEMBERS = [('GIDPrefix',64,1), ('IDGeneration',16,1), ('reserved_80',8,1), ('nodeType',8,1), ('nodeID',64,1), ('chassisID',64,1), ('entryPortID',64,1), ('exitPortID',64,1), ('entryPort',8,1), ('exitPort',8,1), ('reserved_368',16,1)]
     def zero(self):
         self.GIDPrefix = 0;
@@ -2784,6 +2822,8 @@ class SAMultiPathRecord(rdma.binstruct.BinStruct):
     MAD_ATTRIBUTE_ID = 0x3a
     MAD_SUBNADMGETMULTI = 0x14 # MAD_METHOD_GET_MULTI
     COMPONENT_MASK = {'rawTraffic':0, 'reserved_1':1, 'flowLabel':2, 'hopLimit':3, 'TClass':4, 'reversible':5, 'numbPath':6, 'PKey':7, 'reserved_64':8, 'SL':9, 'MTUSelector':10, 'MTU':11, 'rateSelector':12, 'rate':13, 'packetLifeTimeSelector':14, 'packetLifeTime':15, 'reserved_104':16, 'independenceSelector':17, 'reserved_114':18, 'SGIDCount':19, 'DGIDCount':20, 'reserved_136':21, 'reserved_160':22, 'SDGID':23}
+    COMPONENT_GETTERS = (operator.attrgetter('rawTraffic'), None, operator.attrgetter('flowLabel'), operator.attrgetter('hopLimit'), operator.attrgetter('TClass'), operator.attrgetter('reversible'), operator.attrgetter('numbPath'), operator.attrgetter('PKey'), None, operator.attrgetter('SL'), None, operator.attrgetter('MTU'), None, operator.attrgetter('rate'), None, operator.attrgetter('packetLifeTime'), None, None, None, operator.attrgetter('SGIDCount'), operator.attrgetter('DGIDCount'), None, None, operator.attrgetter('SDGID'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'rawTraffic',v), lambda x,v:setattr(x,'reserved_1',v), lambda x,v:setattr(x,'flowLabel',v), lambda x,v:setattr(x,'hopLimit',v), lambda x,v:setattr(x,'TClass',v), lambda x,v:setattr(x,'reversible',v), lambda x,v:setattr(x,'numbPath',v), lambda x,v:setattr(x,'PKey',v), lambda x,v:setattr(x,'reserved_64',v), lambda x,v:setattr(x,'SL',v), lambda x,v:setattr(x,'MTUSelector',v), lambda x,v:setattr(x,'MTU',v), lambda x,v:setattr(x,'rateSelector',v), lambda x,v:setattr(x,'rate',v), lambda x,v:setattr(x,'packetLifeTimeSelector',v), lambda x,v:setattr(x,'packetLifeTime',v), lambda x,v:setattr(x,'reserved_104',v), lambda x,v:setattr(x,'independenceSelector',v), lambda x,v:setattr(x,'reserved_114',v), lambda x,v:setattr(x,'SGIDCount',v), lambda x,v:setattr(x,'DGIDCount',v), lambda x,v:setattr(x,'reserved_136',v), lambda x,v:setattr(x,'reserved_160',v), lambda x,v:setattr(x,'SDGID',v))
     MEMBERS = [('rawTraffic',1,1), ('reserved_1',3,1), ('flowLabel',20,1), ('hopLimit',8,1), ('TClass',8,1), ('reversible',1,1), ('numbPath',7,1), ('PKey',16,1), ('reserved_64',12,1), ('SL',4,1), ('MTUSelector',2,1), ('MTU',6,1), ('rateSelector',2,1), ('rate',6,1), ('packetLifeTimeSelector',2,1), ('packetLifeTime',6,1), ('reserved_104',8,1), ('independenceSelector',2,1), ('reserved_114',6,1), ('SGIDCount',8,1), ('DGIDCount',8,1), ('reserved_136',24,1), ('reserved_160',32,1), ('SDGID',128,1)]
     def zero(self):
         self.rawTraffic = 0;
@@ -2884,6 +2924,8 @@ class SAServiceAssociationRecord(rdma.binstruct.BinStruct):
     MAD_SUBNADMGET = 0x1 # MAD_METHOD_GET
     MAD_SUBNADMGETTABLE = 0x12 # MAD_METHOD_GET_TABLE
     COMPONENT_MASK = {'serviceKey':0, 'serviceName':1}
+    COMPONENT_GETTERS = (operator.attrgetter('serviceKey'), operator.attrgetter('serviceName'))
+    COMPONENT_SETTERS = (lambda x,v:setattr(x,'serviceKey',v), lambda x,v:setattr(x,'serviceName',v))
     MEMBERS = [('serviceKey',128,1), ('serviceName',8,64)]
     def __init__(self,*args):
         self.serviceName = bytearray(64);
@@ -47,6 +47,10 @@ class MADError(RDMAError):
                 self.message(v);
             else:
                 setattr(self,k,v);
+        if isinstance(self.rep_buf,memoryview):
+            # Views of receive buffers are only valid until the buffer is
+            # reused.
+            self.rep_buf = bytearray(self.rep_buf);
 
         if self.messages is None:
             if self.req is not None and self.status is not None:
@@ -125,6 +129,17 @@ class MADTimeoutError(MADError):
                           msg="RPC %s timed out to '%s'"%(
                               req.describe(),path));
 
+class MADBusyError(MADError):
+    '''Thrown when a MAD RPC still gets a BUSY reply after it has been resent
+    :attr:`rdma.madtransactor.MADTransactor.busy_retries` times.'''
+
+class MADRedirectError(MADError):
+    '''Thrown when a MAD RPC gets a redirect reply that cannot be followed,
+    because :attr:`rdma.madtransactor.MADTransactor.max_redirects` is
+    exceeded.'''
+    #: :class:`rdma.path.IBPath` the reply redirected to
+    redirect = None;
+
 class MADClassError(MADError):
     '''Thrown when a MAD RPC returns with a class specific error code.'''
     #: Decoded error code
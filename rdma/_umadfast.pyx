@@ -0,0 +1,172 @@
+# -*- Python -*-
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+"""Compiled versions of the per MAD work done by :class:`rdma.umad.UMAD`
+and :class:`rdma.madtransactor.MADTransactor`. This module is optional, the
+pure Python code is used if it is not built."""
+import errno as mod_errno
+import os
+
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+from cpython.bytearray cimport PyByteArray_AS_STRING, PyByteArray_GET_SIZE, \
+     PyByteArray_Resize, PyByteArray_FromStringAndSize
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from libc.stdint cimport uint8_t, uint32_t
+from libc.string cimport memcpy
+
+cdef extern from 'unistd.h':
+    ssize_t read(int fd, void *buf, size_t count)
+    ssize_t write(int fd, const void *buf, size_t count)
+
+cdef extern from 'errno.h':
+    int errno
+    enum: EINTR
+    enum: EAGAIN
+    enum: ENOSPC
+
+# struct ib_user_mad from the kernel, the address is struct ib_mad_addr
+# which is only ever handled in its packed form.
+cdef struct ib_user_mad:
+    uint32_t agent_id
+    uint32_t status
+    uint32_t timeout_ms
+    uint32_t retries
+    uint32_t length
+    uint8_t addr[44]
+
+DEF UMAD_HDR = 64
+DEF UMAD_ADDR = 44
+# Enough for a header and any MAD that is not RMPP.
+DEF SEND_STACK = 320
+
+cdef raise_errno(int err):
+    raise IOError(err,os.strerror(err))
+
+cdef inline const uint8_t *get_buf(object buf,Py_buffer *view,
+                                   Py_ssize_t need) except NULL:
+    PyObject_GetBuffer(buf,view,PyBUF_SIMPLE)
+    if view.len < need:
+        PyBuffer_Release(view)
+        raise IndexError("MAD is too short")
+    return <const uint8_t *>view.buf
+
+def get_match_key(buf):
+    """Return an integer that represents the 'key' for MAD buf.
+    If two keys match then they are the same transaction.
+    The result is mgmtClass || transactionID[31:0], see
+    C13-19.1.1. *buf* can be any object supporting the buffer protocol."""
+    cdef Py_buffer view
+    cdef const uint8_t *p = get_buf(buf,&view,16)
+    cdef unsigned long long res = ((<unsigned long long>p[1] << 32) |
+                                   (<unsigned long long>p[12] << 24) |
+                                   (p[13] << 16) | (p[14] << 8) | p[15])
+    PyBuffer_Release(&view)
+    return res
+
+def get_request_match_key(buf):
+    """Return a :class:`tuple` for matching a request MAD buf. The :class:`tuple`
+    is `((oui << 8) | mgmtClass,(baseVersion << 8) | classVersion,attributeID)`. Where *oui* is 0
+    if this is not a vendor OUI MAD. *buf* can be any object supporting the
+    buffer protocol."""
+    cdef Py_buffer view
+    cdef const uint8_t *p = get_buf(buf,&view,18)
+    cdef unsigned int mgmt_class = p[1]
+    cdef unsigned int class_version = (p[0] << 8) | p[2]
+    cdef unsigned int attr = (p[16] << 8) | p[17]
+    cdef unsigned int oui = 0
+    if mgmt_class >= 0x30 and mgmt_class <= 0x4F:
+        if view.len < 40:
+            PyBuffer_Release(&view)
+            raise IndexError("MAD is too short")
+        oui = (p[37] << 16) | (p[38] << 8) | p[39]
+    PyBuffer_Release(&view)
+    return ((oui << 8) | mgmt_class,class_version,attr)
+
+def send(int fd,uint32_t agent_id,uint32_t timeout_ms,addr,buf):
+    """Write the MAD *buf* to the umad file descriptor *fd* with a
+    `struct ib_user_mad` header built from *agent_id*, *timeout_ms* and the
+    packed `struct ib_mad_addr` *addr*. The header and MAD are assembled in
+    a single buffer and written with one system call.
+
+    :raises IOError: If the write fails."""
+    cdef Py_buffer view
+    cdef Py_buffer aview
+    cdef uint8_t stack[SEND_STACK]
+    cdef uint8_t *out = stack
+    cdef ib_user_mad *hdr
+    cdef ssize_t rc
+    cdef int err = 0
+
+    get_buf(addr,&aview,UMAD_ADDR)
+    try:
+        PyObject_GetBuffer(buf,&view,PyBUF_SIMPLE)
+    except:
+        PyBuffer_Release(&aview)
+        raise
+    try:
+        if UMAD_HDR + view.len > SEND_STACK:
+            out = <uint8_t *>PyMem_Malloc(UMAD_HDR + view.len)
+            if out == NULL:
+                raise MemoryError()
+        hdr = <ib_user_mad *>out
+        hdr.agent_id = agent_id
+        hdr.status = 0
+        hdr.timeout_ms = timeout_ms
+        hdr.retries = 0
+        hdr.length = view.len
+        memcpy(hdr.addr,aview.buf,UMAD_ADDR)
+        memcpy(out + UMAD_HDR,view.buf,view.len)
+        while True:
+            rc = write(fd,out,UMAD_HDR + view.len)
+            if rc >= 0 or errno != EINTR:
+                break
+        if rc < 0:
+            err = errno
+    finally:
+        if out != stack:
+            PyMem_Free(out)
+        PyBuffer_Release(&view)
+        PyBuffer_Release(&aview)
+    if err != 0:
+        raise_errno(err)
+
+def recv(int fd,bytearray buf):
+    """Read one MAD from the non-blocking umad file descriptor *fd* using
+    *buf* as the scratch buffer. If the kernel reports that an RMPP reply
+    does not fit then *buf* is grown and the read is retried.
+
+    :returns: `None` if there is nothing to read, otherwise
+       tuple(mad,agent_id,status,addr) where *mad* is a :class:`bytearray`
+       copy of the MAD and *addr* is the packed `struct ib_mad_addr`.
+    :raises IOError: If the read fails."""
+    cdef ib_user_mad *hdr
+    cdef Py_ssize_t length
+    cdef ssize_t rc
+    cdef char *p
+
+    while True:
+        p = PyByteArray_AS_STRING(buf)
+        length = PyByteArray_GET_SIZE(buf)
+        rc = read(fd,p,length)
+        if rc >= 0:
+            break
+        if errno == EINTR:
+            continue
+        if errno == EAGAIN:
+            return None
+        if errno == ENOSPC and length >= UMAD_HDR:
+            # The kernel returns the header with the length of the
+            # reassembled MAD, resize the buffer to fit it.
+            hdr = <ib_user_mad *>p
+            if hdr.length <= length:
+                PyByteArray_Resize(buf,length*2)
+            else:
+                PyByteArray_Resize(buf,hdr.length)
+            continue
+        raise_errno(errno)
+
+    if rc < UMAD_HDR:
+        raise IOError(mod_errno.EIO,"Short umad read of %d bytes"%(rc))
+    hdr = <ib_user_mad *>p
+    return (PyByteArray_FromStringAndSize(p + UMAD_HDR,rc - UMAD_HDR),
+            hdr.agent_id,hdr.status,
+            (<char *>hdr.addr)[:UMAD_ADDR])
@@ -1,6 +1,7 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 import rdma;
 import abc;
+import binascii;
 import struct
 
 uint32_t = struct.Struct('>L')
@@ -27,11 +28,16 @@ def unpack_array8(buf,offset,mlen,count,inp):
     """Starting at *offset* in *buf* assign *count* entries each *mlen* bits
     wide to indexes in *inp*."""
     # Sigh, so much overhead..
-    val = int(buf[offset:offset+(mlen*count)/8].encode("hex"),16);
+    val = int(binascii.hexlify(buf[offset:offset+(mlen*count)/8]),16);
     for I in range(count):
         inp[I] = (val >> ((count - 1 - I)*mlen)) & ((1 << mlen) - 1);
     return
 
+#: Memoized results of :meth:`BinStruct.component_key`
+_component_keys = {};
+#: Memoized results of :meth:`BinStruct.get_comparator`
+_comparators = {};
+
 class BinStruct(object):
     '''Base class for all binary structure objects (MADs, etc). When pickled
     this class re-packs the structure and stores it as a `bytes` value. This
@@ -41,9 +47,10 @@ class BinStruct(object):
     __slots__ = ();
 
     def __init__(self,buf = None,offset = 0):
-        """*buf* is either an instance of :class:`BinStruct` or a :class:`bytes`
-        representing the data to unpack into the instance. *offset* is the
-        starting offset in *buf* for unpacking. If no arguments are given then
+        """*buf* is either an instance of :class:`BinStruct` or a :class:`bytes`,
+        :class:`bytearray` or :class:`memoryview` representing the data to
+        unpack into the instance. *offset* is the starting offset in *buf* for
+        unpacking. If no arguments are given then
         all attributes are set to 0."""
         if buf is not None:
             if isinstance(buf,BinStruct):
@@ -85,18 +92,43 @@ class BinStruct(object):
     def compare(self,lhs,mask):
         """Compare *self* and *lhs* using the rules for component mask
         matching."""
-        for k,v in self.COMPONENT_MASK.iteritems():
-            if not (mask & (1<<v)):
-                continue;
-
-            # FIXME: something smarter with selector
-            if k.startswith("reserved") or k.endswith("Selector"):
-                continue;
-
-            res = cmp(eval("self.%s"%(k)),eval("lhs.%s"%(k)));
-            if res != 0:
-                return res;
-        return 0;
+        return self.get_comparator(mask)(self,lhs);
+
+    @classmethod
+    def component_key(cls,mask):
+        """Return a function that returns a value built from the components
+        in *mask*. Two instances match under *mask* if their keys are equal.
+        This is faster than :meth:`compare` when one value is matched against
+        many. The functions are memoized per *mask*."""
+        try:
+            return _component_keys[cls,mask];
+        except KeyError:
+            pass;
+
+        # FIXME: something smarter with selector
+        getters = tuple(fn for I,fn in enumerate(cls.COMPONENT_GETTERS)
+                        if fn is not None and mask & (1<<I));
+        if len(getters) == 0:
+            key = lambda x:None;
+        elif len(getters) == 1:
+            key = getters[0];
+        else:
+            key = lambda x:tuple([fn(x) for fn in getters]);
+        _component_keys[cls,mask] = key;
+        return key;
+
+    @classmethod
+    def get_comparator(cls,mask):
+        """Return a function taking two instances that compares them using
+        the rules for component mask matching. The functions are memoized per
+        *mask*."""
+        try:
+            return _comparators[cls,mask];
+        except KeyError:
+            pass;
+        key = cls.component_key(mask);
+        res = _comparators[cls,mask] = lambda rhs,lhs:cmp(key(rhs),key(lhs));
+        return res;
 
     # 'pure virtual' functions
     def zero(self):
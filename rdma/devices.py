@@ -4,6 +4,8 @@ from __future__ import with_statement;
 
 import rdma;
 import rdma.IBA as IBA;
+import rdma.path;
+import rdma.madtransactor;
 import os,re,collections
 
 SYS_INFINIBAND = "/sys/class/infiniband/";
@@ -254,6 +256,8 @@ class EndPort(SysFSCache):
         """Called if the port's SM has changed. Generally from
         :meth:`rdma.ibverbs.Context.handle_async_event`."""
         self._drop(("sm_lid","sm_sl"))
+        rdma.path.path_cache.invalidate(self);
+        rdma.madtransactor.invalidate_redirects(self);
         try:
             path = self._cached_sa_path
 
@@ -353,6 +357,16 @@ class RDMADevice(SysFSCache):
     def hca_type(self):
         "HCA type string."
         return self._cached_sysfs("hca_type");
+    @property
+    def numa_node(self):
+        "NUMA node the device is attached to, or `None` if unknown."
+        try:
+            node = self._cached_sysfs("device/numa_node",int);
+        except IOError:
+            node = self._cache["device/numa_node"] = -1;
+        if node < 0:
+            return None;
+        return node;
 
     def __str__(self):
         return self.name;
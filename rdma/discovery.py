@@ -25,12 +25,12 @@ def subnet_ninf_SA(sched,sbn,node_type=None):
     req = IBA.ComponentMask(IBA.SANodeRecord());
     if node_type is not None:
         req.nodeInfo.nodeType = node_type;
-    res = yield sched.SubnAdmGetTable(IBA.SANodeRecord());
-    if res:
-        sbn.set_max_lid(max(I.LID for I in res));
-    for I in res:
-        np = sbn.get_node_ninf(I.nodeInfo,LID=I.LID);
-        np[0].set_desc(I.nodeDescription.nodeString);
+    res = yield sched.SubnAdmGetTableIter(IBA.SANodeRecord());
+    for recs in res:
+        sbn.set_max_lid(max(I.LID for I in recs));
+        for I in recs:
+            np = sbn.get_node_ninf(I.nodeInfo,LID=I.LID);
+            np[0].set_desc(I.nodeDescription.nodeString);
     if node_type is None:
         sbn.loaded.add("all_NodeInfo");
         sbn.loaded.add("all_NodeDescription");
@@ -41,12 +41,12 @@ def subnet_ninf_SA(sched,sbn,node_type=None):
 def subnet_swinf_SA(sched,sbn):
     """Coroutine to fetch all :class:`~rdma.IBA.SMPSwitchInfo` records
     from the SA and store them in *sbn*."""
-    res = yield sched.SubnAdmGetTable(IBA.SASwitchInfoRecord());
-    if res:
-        sbn.set_max_lid(max(I.LID for I in res));
-    for I in res:
-        np = sbn.get_node(type_=rdma.subnet.Switch,portIdx=0,LID=I.LID);
-        np[0].swinf = I.switchInfo;
+    res = yield sched.SubnAdmGetTableIter(IBA.SASwitchInfoRecord());
+    for recs in res:
+        sbn.set_max_lid(max(I.LID for I in recs));
+        for I in recs:
+            np = sbn.get_node(type_=rdma.subnet.Switch,portIdx=0,LID=I.LID);
+            np[0].swinf = I.switchInfo;
     sbn.loaded.add("all_SwitchInfo");
 
 def _subnet_fill_LIDs_SA(sched,sbn,LMC):
@@ -75,10 +75,10 @@ def subnet_fill_LIDs_SA(sched,sbn):
 def subnet_topology_SA(sched,sbn):
     """Coroutine to fill in the topology in *sbn*."""
     assert "all_NodeInfo" in sbn.loaded;
-    res = yield sched.SubnAdmGetTable(IBA.SALinkRecord);
+    res = yield sched.SubnAdmGetTableIter(IBA.SALinkRecord);
 
     sbn.topology = {};
-    for I in res:
+    for I in res.records():
         # The fromPort/toPort is reserved if the node is not a switch,
         # don't use it.
         fn,f = sbn.get_node(rdma.subnet.Node,LID=I.fromLID);
@@ -96,8 +96,8 @@ def subnet_pinf_SA(sched,sbn):
     """Coroutine to ask the SA for all :class:`~rdma.IBA.SMPPortInfo`."""
     assert "all_NodeInfo" in sbn.loaded;
 
-    res = yield sched.SubnAdmGetTable(IBA.SAPortInfoRecord);
-    for I in res:
+    res = yield sched.SubnAdmGetTableIter(IBA.SAPortInfoRecord);
+    for I in res.records():
         sbn.get_port_pinf(I.portInfo,portIdx=I.portNum,LID=I.endportLID);
     sbn.loaded.add("all_PortInfo");
     sbn.loaded.add("all_LIDs");
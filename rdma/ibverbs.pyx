@@ -6,6 +6,7 @@ import errno as mod_errno
 import rdma.tools as tools;
 import struct;
 import weakref;
+import functools;
 import sys
 import rdma.devices
 import rdma.IBA as IBA;
@@ -41,6 +42,7 @@ cdef extern from 'Python.h':
     int PyObject_AsReadBuffer(object o, void **buffer, Py_ssize_t *len)
     int PyObject_AsWriteBuffer(object o, void **buffer, Py_ssize_t *len)
     void Py_INCREF(object o)
+    void PyErr_Clear()
     void Py_DECREF(object o)
 
 cdef extern from 'arpa/inet.h':
@@ -59,6 +61,9 @@ cdef class CQ
 cdef class MR
 cdef class QP
 cdef class SRQ
+cdef class WCList
+cdef class PreparedSendWR
+cdef class PreparedRecvWR
 
 cdef CQ get_cq(c.ibv_cq *v):
     """Go from a C struct ibv_cq to a CQ object."""
@@ -142,6 +147,39 @@ cdef to_ah_attr(c.ibv_ah_attr *cattr, object attr):
     else:
         raise TypeError("attr must be an rdma.ibverbs.ah_attr or rdma.path.IBPath.")
 
+cdef int get_buf_range(object buf, int access, void **addr,
+                       Py_ssize_t *length) except -1:
+    """Return the memory range of *buf* in *addr* and *length*. *buf* must
+    be writable if *access* allows writing."""
+    if access & (c.IBV_ACCESS_LOCAL_WRITE | c.IBV_ACCESS_REMOTE_WRITE) != 0:
+        if PyObject_AsWriteBuffer(buf, addr, length) != 0:
+            raise TypeError("Expected mutable buffer")
+    else:
+        if PyObject_AsReadBuffer(buf, <const_void_ptr_ptr>addr, length) != 0:
+            raise TypeError("Expected buffer")
+    return 0
+
+cdef object ah_key(object attr):
+    """Return a hashable tuple of the address vector described by *attr*, a
+    :class:`rdma.ibverbs.ah_attr` or :class:`rdma.path.IBPath`. Equal
+    tuples produce identical AHs."""
+    if isinstance(attr, rdma.path.IBPath):
+        if attr.has_grh:
+            return (attr.end_port.port_id,attr.DLID,attr.SL,attr.SLID_bits,
+                    attr.rate,attr.DGID,attr.SGID_index,attr.flow_label,
+                    attr.hop_limit,attr.traffic_class);
+        return (attr.end_port.port_id,attr.DLID,attr.SL,attr.SLID_bits,
+                attr.rate);
+    elif isinstance(attr, ah_attr):
+        if attr.is_global:
+            return (attr.port_num,attr.dlid,attr.sl,attr.src_path_bits,
+                    attr.static_rate,attr.grh.dgid,attr.grh.sgid_index,
+                    attr.grh.flow_label,attr.grh.hop_limit,
+                    attr.grh.traffic_class);
+        return (attr.port_num,attr.dlid,attr.sl,attr.src_path_bits,
+                attr.static_rate);
+    raise TypeError("attr must be an rdma.ibverbs.ah_attr or rdma.path.IBPath.")
+
 cdef object from_ah_attr(c.ibv_ah_attr *cattr):
     """Return a :class:`rdma.ibverbs.ah_attr` filled in from *cattr."""
     return ah_attr(grh=global_route(dgid=IBA.GID(PyBytes_FromStringAndSize(<char *>cattr.grh.dgid.raw,16),True),
@@ -192,6 +230,285 @@ cdef _post_check(object arg, object wrtype, int max_sge, int *numsge):
     numsge[0] = sgec
     return wrlist
 
+cdef c.ibv_sge *_fill_sges(c.ibv_sge *csge, object sg_list, int *num_sge):
+    """Copy *sg_list* into the array starting at *csge*, return the next free
+    entry."""
+    num_sge[0] = 0
+    if isinstance(sg_list, list) or isinstance(sg_list, tuple):
+        num_sge[0] = len(sg_list)
+        for I in sg_list:
+            csge.addr = I.addr
+            csge.length = I.length
+            csge.lkey = I.lkey
+            csge += 1
+    elif sg_list is not None:
+        num_sge[0] = 1
+        csge.addr = sg_list.addr
+        csge.length = sg_list.length
+        csge.lkey = sg_list.lkey
+        csge += 1
+    return csge
+
+cdef inline int _uses_ud(int opcode):
+    """True if a send work request with *opcode* uses the UD fields."""
+    return not (opcode == c.IBV_WR_RDMA_WRITE or
+                opcode == c.IBV_WR_RDMA_WRITE_WITH_IMM or
+                opcode == c.IBV_WR_RDMA_READ or
+                opcode == c.IBV_WR_ATOMIC_FETCH_AND_ADD or
+                opcode == c.IBV_WR_ATOMIC_CMP_AND_SWP)
+
+cdef c.ibv_sge *_fill_send_wr(c.ibv_send_wr *cwr, c.ibv_sge *csge, object wr,
+                              int ud) except NULL:
+    """Marshal the :class:`rdma.ibverbs.send_wr` *wr* into *cwr* using SGEs
+    starting at *csge*. *ud* is true if the UD fields are used. Returns the
+    next free SGE."""
+    cdef int wr_id
+    cdef int num_sge
+    cdef AH ah
+
+    wr_id = wr.wr_id;
+    cwr.wr_id = <uintptr_t>wr_id
+    cwr.sg_list = csge
+    csge = _fill_sges(csge, wr.sg_list, &num_sge)
+    cwr.num_sge = num_sge
+
+    cwr.opcode = wr.opcode
+    if (cwr.opcode == c.IBV_WR_RDMA_WRITE or
+        cwr.opcode == c.IBV_WR_RDMA_WRITE_WITH_IMM or
+        cwr.opcode == c.IBV_WR_RDMA_READ):
+        cwr.wr.rdma.remote_addr = wr.remote_addr
+        cwr.wr.rdma.rkey = wr.rkey
+    elif (cwr.opcode == c.IBV_WR_ATOMIC_FETCH_AND_ADD or
+          cwr.opcode == c.IBV_WR_ATOMIC_CMP_AND_SWP):
+        cwr.wr.atomic.remote_addr = wr.remote_addr
+        cwr.wr.atomic.compare_add = wr.compare_add
+        cwr.wr.atomic.swap = wr.swap
+        cwr.wr.atomic.rkey = wr.rkey
+    elif ud:
+        if not isinstance(wr.ah,AH):
+            raise TypeError("AH must be a AH")
+        ah = wr.ah;
+        cwr.wr.ud.ah = ah._ah
+        cwr.wr.ud.remote_qpn = wr.remote_qpn
+        cwr.wr.ud.remote_qkey = wr.remote_qkey
+
+    cwr.send_flags = wr.send_flags
+    cwr.imm_data = wr.imm_data
+    return csge
+
+cdef c.ibv_sge *_fill_recv_wr(c.ibv_recv_wr *cwr, c.ibv_sge *csge,
+                              object wr) except NULL:
+    """Marshal the :class:`rdma.ibverbs.recv_wr` *wr* into *cwr* using SGEs
+    starting at *csge*. Returns the next free SGE."""
+    cdef int wr_id
+    cdef int num_sge
+
+    wr_id = wr.wr_id;
+    cwr.wr_id = <uintptr_t>wr_id
+    cwr.sg_list = csge
+    csge = _fill_sges(csge, wr.sg_list, &num_sge)
+    cwr.num_sge = num_sge
+    return csge
+
+cdef class PreparedSendWR:
+    """A chain of send work requests that is checked and converted to the
+    verbs format once, then posted any number of times by passing it to
+    :meth:`rdma.ibverbs.QP.post_send`, without any per post allocation or
+    marshalling. It is created from a :class:`rdma.ibverbs.send_wr` or a
+    list of them, the setters change fields of entry *i* in place.
+
+    The fields are copied when this object is created, later changes to the
+    source work requests are not seen. A UD work request must have an
+    :class:`rdma.ibverbs.AH`, which is held until the entry is changed. Posting
+    to a UD QP fails if an entry has no AH."""
+    cdef c.ibv_send_wr *_wrs
+    cdef c.ibv_sge *_sges
+    cdef int _n
+    cdef int _count
+    cdef unsigned int _max_sge
+    cdef list _ahs
+
+    def __cinit__(self, arg):
+        cdef list wrlist
+        cdef c.ibv_sge *csge
+        cdef int i, num_sge
+
+        wrlist = _post_check(arg, send_wr, 0x7FFFFFFF, &num_sge)
+        self._n = len(wrlist)
+        self._wrs = <c.ibv_send_wr *>calloc(self._n,sizeof(c.ibv_send_wr))
+        self._sges = <c.ibv_sge *>calloc(num_sge + 1,sizeof(c.ibv_sge))
+        if self._wrs == NULL or self._sges == NULL:
+            raise MemoryError()
+        self._ahs = [None]*self._n
+        csge = self._sges
+        for 0 <= i < self._n:
+            wr = wrlist[i]
+            csge = _fill_send_wr(&self._wrs[i], csge, wr, wr.ah is not None)
+            self._ahs[i] = wr.ah
+            if self._wrs[i].num_sge > self._max_sge:
+                self._max_sge = self._wrs[i].num_sge
+        self.count = self._n
+
+    def __dealloc__(self):
+        free(self._wrs)
+        free(self._sges)
+        self._wrs = NULL
+        self._sges = NULL
+
+    cdef c.ibv_send_wr *_get(self,int i) except NULL:
+        if i < 0 or i >= self._n:
+            raise IndexError("WR index %r out of range"%(i));
+        return &self._wrs[i]
+
+    cdef c.ibv_sge *_get_sge(self,int i,int j) except NULL:
+        cdef c.ibv_send_wr *cwr
+        cwr = self._get(i)
+        if j < 0 or j >= cwr.num_sge:
+            raise IndexError("SGE index %r out of range"%(j));
+        return &cwr.sg_list[j]
+
+    def __len__(self):
+        return self._n;
+
+    property count:
+        """The number of leading work requests that are posted, initially
+        all of them."""
+        def __get__(self):
+            return self._count;
+        def __set__(self,int count):
+            cdef int i
+            if count < 1 or count > self._n:
+                raise ValueError("count %r out of range"%(count));
+            for 0 <= i < self._n - 1:
+                self._wrs[i].next = &self._wrs[i+1]
+            self._wrs[count-1].next = NULL
+            self._count = count
+
+    def set_wr_id(self,int i,unsigned long wr_id):
+        self._get(i).wr_id = wr_id
+    def set_imm_data(self,int i,unsigned int imm_data):
+        self._get(i).imm_data = imm_data
+    def set_send_flags(self,int i,unsigned int send_flags):
+        self._get(i).send_flags = send_flags
+    def set_remote_addr(self,int i,unsigned long remote_addr):
+        """Set the remote address of a RDMA or atomic work request."""
+        cdef c.ibv_send_wr *cwr
+        cwr = self._get(i)
+        if (cwr.opcode == c.IBV_WR_ATOMIC_FETCH_AND_ADD or
+            cwr.opcode == c.IBV_WR_ATOMIC_CMP_AND_SWP):
+            cwr.wr.atomic.remote_addr = remote_addr
+        else:
+            cwr.wr.rdma.remote_addr = remote_addr
+    def set_addr(self,int i,unsigned long addr,int j=0):
+        """Set the address of SGE *j*."""
+        self._get_sge(i,j).addr = addr
+    def set_length(self,int i,unsigned int length,int j=0):
+        """Set the length of SGE *j*."""
+        self._get_sge(i,j).length = length
+    def set_ud(self,int i,AH ah not None,unsigned int remote_qpn,
+               unsigned int remote_qkey):
+        """Set the UD destination."""
+        cdef c.ibv_send_wr *cwr
+        cwr = self._get(i)
+        cwr.wr.ud.ah = ah._ah
+        cwr.wr.ud.remote_qpn = remote_qpn
+        cwr.wr.ud.remote_qkey = remote_qkey
+        self._ahs[i] = ah
+
+    cdef int _check_ud(self) except -1:
+        """Raise if a posted entry that uses the UD fields has no AH."""
+        cdef int i
+        for 0 <= i < self._count:
+            if self._ahs[i] is None and _uses_ud(self._wrs[i].opcode):
+                raise TypeError("AH must be a AH")
+        return 0
+
+    def __repr__(self):
+        return "PreparedSendWR(%u/%u)"%(self._count,self._n);
+
+cdef class PreparedRecvWR:
+    """The receive version of :class:`rdma.ibverbs.PreparedSendWR`. This is
+    posted with :meth:`rdma.ibverbs.QP.post_recv` or
+    :meth:`rdma.ibverbs.SRQ.post_recv`."""
+    cdef c.ibv_recv_wr *_wrs
+    cdef c.ibv_sge *_sges
+    cdef int _n
+    cdef int _count
+    cdef unsigned int _max_sge
+
+    def __cinit__(self, arg):
+        cdef list wrlist
+        cdef c.ibv_sge *csge
+        cdef int i, num_sge
+
+        wrlist = _post_check(arg, recv_wr, 0x7FFFFFFF, &num_sge)
+        self._n = len(wrlist)
+        self._wrs = <c.ibv_recv_wr *>calloc(self._n,sizeof(c.ibv_recv_wr))
+        self._sges = <c.ibv_sge *>calloc(num_sge + 1,sizeof(c.ibv_sge))
+        if self._wrs == NULL or self._sges == NULL:
+            raise MemoryError()
+        csge = self._sges
+        for 0 <= i < self._n:
+            csge = _fill_recv_wr(&self._wrs[i], csge, wrlist[i])
+            if self._wrs[i].num_sge > self._max_sge:
+                self._max_sge = self._wrs[i].num_sge
+        self.count = self._n
+
+    def __dealloc__(self):
+        free(self._wrs)
+        free(self._sges)
+        self._wrs = NULL
+        self._sges = NULL
+
+    cdef c.ibv_recv_wr *_get(self,int i) except NULL:
+        if i < 0 or i >= self._n:
+            raise IndexError("WR index %r out of range"%(i));
+        return &self._wrs[i]
+
+    cdef c.ibv_sge *_get_sge(self,int i,int j) except NULL:
+        cdef c.ibv_recv_wr *cwr
+        cwr = self._get(i)
+        if j < 0 or j >= cwr.num_sge:
+            raise IndexError("SGE index %r out of range"%(j));
+        return &cwr.sg_list[j]
+
+    def __len__(self):
+        return self._n;
+
+    property count:
+        """The number of leading work requests that are posted, initially
+        all of them."""
+        def __get__(self):
+            return self._count;
+        def __set__(self,int count):
+            cdef int i
+            if count < 1 or count > self._n:
+                raise ValueError("count %r out of range"%(count));
+            for 0 <= i < self._n - 1:
+                self._wrs[i].next = &self._wrs[i+1]
+            self._wrs[count-1].next = NULL
+            self._count = count
+
+    def set_wr_id(self,int i,unsigned long wr_id):
+        self._get(i).wr_id = wr_id
+    def set_addr(self,int i,unsigned long addr,int j=0):
+        """Set the address of SGE *j*."""
+        self._get_sge(i,j).addr = addr
+    def set_length(self,int i,unsigned int length,int j=0):
+        """Set the length of SGE *j*."""
+        self._get_sge(i,j).length = length
+
+    def __repr__(self):
+        return "PreparedRecvWR(%u/%u)"%(self._count,self._n);
+
+cdef _bad_index(void *wrs, void *bad_wr, int size, int n):
+    """Return the index of *bad_wr* in the array *wrs*."""
+    cdef int i
+    for 0 <= i < n:
+        if <char *>wrs + i*size == <char *>bad_wr:
+            return i
+    return n
+
 class WCError(rdma.RDMAError):
     """Raised when a WC is completed with error. Note: Not all adaptors
     support returning the `opcode` and `qp_num` in an error WC. For those that
@@ -296,6 +613,86 @@ def WCPath(end_port,wc,buf=None,int off=0,**kwargs):
         path.flow_label = flow_class & 0xFFFFF
     return path;
 
+cdef object make_wc(c.ibv_wc *lwc):
+    """Return a :class:`rdma.ibverbs.wc` filled in from *lwc*."""
+    return wc(wr_id = lwc.wr_id,
+              status = lwc.status,
+              opcode = lwc.opcode,
+              vendor_err = lwc.vendor_err,
+              byte_len = lwc.byte_len,
+              imm_data = lwc.imm_data,
+              qp_num = lwc.qp_num,
+              src_qp = lwc.src_qp,
+              wc_flags = lwc.wc_flags,
+              pkey_index = lwc.pkey_index,
+              slid = lwc.slid,
+              sl = lwc.sl,
+              dlid_path_bits = lwc.dlid_path_bits)
+
+cdef class WCList:
+    """A reusable array of work completions filled in by
+    :meth:`rdma.ibverbs.CQ.poll_batch`. The fields of each completion are read
+    with the accessor methods, eg `wcs.status(i)`, which do not create a
+    :class:`rdma.ibverbs.wc` object. :meth:`wc` or indexing creates the full
+    object when it is needed, eg for :func:`rdma.ibverbs.WCPath` or
+    :exc:`rdma.ibverbs.WCError`."""
+    cdef c.ibv_wc *_wcs
+    cdef int _size
+    cdef int _count
+
+    property size:
+        def __get__(self):
+            return self._size;
+
+    def __cinit__(self,int size=64):
+        if size <= 0:
+            raise ValueError("size %r must be positive"%(size));
+        self._wcs = <c.ibv_wc *>calloc(size,sizeof(c.ibv_wc));
+        if self._wcs == NULL:
+            raise MemoryError();
+        self._size = size;
+        self._count = 0;
+
+    def __dealloc__(self):
+        free(self._wcs);
+        self._wcs = NULL;
+
+    cdef c.ibv_wc *_get(self,int i) except NULL:
+        if i < 0 or i >= self._count:
+            raise IndexError("WC index %r out of range"%(i));
+        return &self._wcs[i];
+
+    def __len__(self):
+        return self._count;
+
+    def __getitem__(self,int i):
+        return make_wc(self._get(i));
+
+    def __iter__(self):
+        cdef int i
+        for 0 <= i < self._count:
+            yield make_wc(&self._wcs[i]);
+
+    def wc(self,int i):
+        """Return entry *i* as a :class:`rdma.ibverbs.wc`."""
+        return make_wc(self._get(i));
+
+    def wr_id(self,int i):
+        return self._get(i).wr_id;
+    def status(self,int i):
+        return self._get(i).status;
+    def opcode(self,int i):
+        return self._get(i).opcode;
+    def byte_len(self,int i):
+        return self._get(i).byte_len;
+    def imm_data(self,int i):
+        return self._get(i).imm_data;
+    def qp_num(self,int i):
+        return self._get(i).qp_num;
+
+    def __repr__(self):
+        return "WCList(%u/%u)"%(self._count,self._size);
+
 cdef class Context:
     """Verbs context handle, this is a context manager. Call :func:`rdma.get_verbs` to get
     an instance of this."""
@@ -477,9 +874,12 @@ cdef class Context:
                 return ret;
         return None;
 
-    def pd(self):
-        """Create a new :class:`rdma.ibverbs.PD` for this context."""
-        ret = PD(self);
+    def pd(self,int ah_cache_size=256,long long mr_cache_bytes=64*1024*1024):
+        """Create a new :class:`rdma.ibverbs.PD` for this context.
+        *ah_cache_size* is the number of AHs cached by
+        :meth:`rdma.ibverbs.PD.ah`, *mr_cache_bytes* is the pinned memory
+        budget of :meth:`rdma.ibverbs.PD.cached_mr`."""
+        ret = PD(self,ah_cache_size,mr_cache_bytes);
         self._children_pd.add(ret);
         return ret;
 
@@ -604,12 +1004,25 @@ cdef class PD:
     cdef object _children_mr
     cdef object _children_ah
     cdef object _path_ah # FIXME: should be str
+    cdef object _ah_cache
+    #: Maximum number of AHs held by the cache in :meth:`ah`
+    cdef public int ah_cache_size
+    cdef object _mr_cache
+    #: Bytes of idle registrations :meth:`cached_mr` may keep pinned
+    cdef public long long mr_cache_bytes
+    #: Bytes currently registered by :meth:`cached_mr`
+    cdef readonly long long mr_cache_pinned
+    #: Number of :meth:`cached_mr` calls that reused a registration
+    cdef readonly int mr_cache_hits
+    #: Number of :meth:`cached_mr` calls that registered memory
+    cdef readonly int mr_cache_misses
 
     property ctx:
         def __get__(self):
             return self._context;
 
-    def __cinit__(self, Context ctx not None):
+    def __cinit__(self, Context ctx not None, int ah_cache_size=256,
+                  long long mr_cache_bytes=64*1024*1024):
         self._context = ctx
         self._pd = c.ibv_alloc_pd(ctx._ctx)
         if self._pd == NULL:
@@ -620,6 +1033,10 @@ cdef class PD:
         self._children_mr = WeakSet();
         self._children_ah = WeakSet();
         self._path_ah = "_cached_pd%x_ah"%(id(self));
+        self._ah_cache = collections.OrderedDict();
+        self.ah_cache_size = ah_cache_size;
+        self._mr_cache = collections.OrderedDict();
+        self.mr_cache_bytes = mr_cache_bytes;
 
     def __dealloc__(self):
         self._close();
@@ -638,10 +1055,17 @@ cdef class PD:
         cdef int rc
         while self._children_qp:
             self._children_qp.pop().close();
+        self._ah_cache.clear();
         while self._children_ah:
             self._children_ah.pop().close();
         while self._children_srq:
             self._children_srq.pop().close();
+        # Views from cached_mr go before the registrations they share
+        for I in list(self._children_mr):
+            if (<MR>I)._base is not None:
+                I.close();
+        self._mr_cache.clear();
+        self.mr_cache_pinned = 0;
         while self._children_mr:
             self._children_mr.pop().close();
         if self._pd != NULL:
@@ -713,33 +1137,192 @@ cdef class PD:
         self._children_mr.add(ret);
         return ret;
 
+    def cached_mr(self,buf,int access=0):
+        """Return a :class:`rdma.ibverbs.MR` for *buf* using the registration
+        cache of this protection domain. A cached registration with at least
+        the *access* flags that covers the address range of *buf* is reused,
+        otherwise *buf* is registered and added to the cache. The returned
+        MR describes *buf* but shares the lkey and rkey of the cached
+        registration.
+
+        Closing the returned MR drops its reference on the registration. Idle
+        registrations stay pinned, the least recently used ones are
+        deregistered once more than :attr:`mr_cache_bytes` is registered.
+        A registration is dropped when its buffer no longer has the same
+        address and length, eg a closed :class:`mmap.mmap` or a resized
+        :class:`bytearray`, and, if the buffer supports weak references,
+        when the buffer is freed. Otherwise the cache keeps idle buffers
+        alive, use :meth:`invalidate_mr` to release them."""
+        cdef void *addr
+        cdef Py_ssize_t length
+        cdef uintptr_t start
+        cdef MR base
+        cdef MR ret
+
+        get_buf_range(buf,access,&addr,&length);
+        start = <uintptr_t>addr;
+        base = self._mr_cache.get((start,length,access));
+        if base is not None and not self._mr_valid(base):
+            base = None;
+        if base is None:
+            # Most recently used first
+            for I in reversed(self._mr_cache.values()):
+                base = I;
+                if (base._addr <= start and
+                    start + length <= base._addr + base._length and
+                    base._access & access == access and
+                    self._mr_valid(base)):
+                    break;
+                base = None;
+
+        if base is None:
+            self.mr_cache_misses += 1;
+            base = MR(self,buf,access);
+            self._children_mr.add(base);
+            base._key = (base._addr,base._length,access);
+            self.mr_cache_pinned += base._length;
+        else:
+            self.mr_cache_hits += 1;
+            del self._mr_cache[base._key];
+        self._mr_cache[base._key] = base;
+
+        if base._buf is None:
+            base._buf = base._wbuf();
+            base._wbuf = None;
+        base._refs += 1;
+        ret = MR(self,buf,access,base);
+        self._children_mr.add(ret);
+        self._mr_evict();
+        return ret;
+
+    def invalidate_mr(self,buf=None):
+        """Deregister the idle cached registrations of *buf*, or of every
+        buffer if *buf* is `None`. Registrations that are in use are removed
+        from the cache and deregistered when their last
+        :class:`~rdma.ibverbs.MR` is closed."""
+        for I in list(self._mr_cache.values()):
+            if (buf is None or (<MR>I)._buf is buf or
+                ((<MR>I)._wbuf is not None and (<MR>I)._wbuf() is buf)):
+                self._mr_drop(I);
+
+    cdef bint _mr_valid(self,MR base):
+        """Check that the buffer of *base* still has the registered address
+        range, drop *base* from the cache if it does not."""
+        cdef void *addr
+        cdef Py_ssize_t length
+        buf = base._buf;
+        if buf is None:
+            buf = base._wbuf();
+        if (buf is not None and
+            PyObject_AsReadBuffer(buf,<const_void_ptr_ptr>&addr,&length) == 0 and
+            <uintptr_t>addr == base._addr and length == base._length):
+            return True;
+        PyErr_Clear();
+        self._mr_drop(base);
+        return False;
+
+    cdef _mr_drop(self,MR base):
+        """Remove *base* from the cache and deregister it once idle."""
+        if base._key is None:
+            return;
+        del self._mr_cache[base._key];
+        base._key = None;
+        self.mr_cache_pinned -= base._length;
+        if base._refs == 0:
+            base.close();
+
+    cdef _mr_release(self,MR base):
+        """Drop a reference taken by :meth:`cached_mr` on *base*."""
+        base._refs -= 1;
+        if base._refs != 0:
+            return;
+        if base._key is None:
+            base.close();
+            return;
+        # Idle registrations only weakly refer to their buffer if possible
+        if type(base._buf).__weakrefoffset__ != 0:
+            base._wbuf = weakref.ref(base._buf,functools.partial(
+                _mr_buf_freed,weakref.ref(self),base._key));
+            base._buf = None;
+        self._mr_evict();
+
+    cdef _mr_evict(self):
+        """Deregister idle registrations in LRU order until the cache is
+        within :attr:`mr_cache_bytes`."""
+        if self.mr_cache_pinned <= self.mr_cache_bytes:
+            return;
+        for I in self._mr_cache.values():
+            if self.mr_cache_pinned <= self.mr_cache_bytes:
+                break;
+            if (<MR>I)._refs == 0:
+                self._mr_drop(I);
+
     def ah(self,attr):
-        """Create a new :class:`rdma.ibverbs.AH` for this protection domain.
+        """Return a :class:`rdma.ibverbs.AH` for this protection domain.
         *attr* may be a :class:`rdma.ibverbs.ah_attr` or
-        :class:`rdma.path.IBPath`. When used with a :class:`~rdma.path.IBPath`
-        this function will cache the AH in the
+        :class:`rdma.path.IBPath`.
+
+        AHs are cached in the PD keyed by the address vector, so every path
+        object for the same destination shares one AH. The cache holds at
+        most :attr:`ah_cache_size` AHs, the least recently used one is
+        dropped from the cache when it is full and is destroyed once nothing
+        else refers to it. When used with a :class:`~rdma.path.IBPath` this
+        function also caches the AH in the
         `IBPath`. :meth:`rdma.path.Path.drop_cache` must be called to release
         all references to the AH."""
         cdef AH ret
         if isinstance(attr,rdma.path.IBPath):
-            # We cache the AH in the  onto the AH in the path
             # FIXME: should be getattr but the 3 argument version won't compile
             ret = attr.__dict__.get(self._path_ah);
-            if ret is None or ret._ah == NULL:
-                ret = AH(self,attr);
-                setattr(attr,self._path_ah,ret);
-                self._children_ah.add(ret);
-            return ret;
-        else:
+            if ret is not None and ret._ah != NULL:
+                return ret;
+
+        key = ah_key(attr);
+        ret = self._ah_cache.pop(key,None);
+        if ret is None or ret._ah == NULL:
             ret = AH(self,attr);
             self._children_ah.add(ret);
+            while self._ah_cache and len(self._ah_cache) >= self.ah_cache_size:
+                self._ah_cache.popitem(False);
+        if self.ah_cache_size > 0:
+            self._ah_cache[key] = ret;
+
+        if isinstance(attr,rdma.path.IBPath):
+            setattr(attr,self._path_ah,ret);
         return ret;
 
+    def invalidate_ah(self,attr=None):
+        """Destroy the cached AH for the address vector of *attr*, or every
+        cached AH if *attr* is `None`. This must be used when the route to a
+        destination changes, eg after a LID or SL reassignment. Paths holding
+        an invalidated AH will get a new one from :meth:`ah`. The caller
+        must ensure no posted work request uses the AHs."""
+        if attr is None:
+            ahs = self._ah_cache.values();
+            self._ah_cache.clear();
+        else:
+            ahs = [self._ah_cache.pop(ah_key(attr),None)];
+            if isinstance(attr,rdma.path.IBPath):
+                ahs.append(attr.__dict__.pop(self._path_ah,None));
+        for I in ahs:
+            if I is not None:
+                I.close();
+
     def __str__(self):
         return "pd:%X:%s"%(self._pd.handle,self.ctx.node);
     def __repr__(self):
         return "PD(%r,0x%x)"%(self._context,self._pd.handle);
 
+def _mr_buf_freed(wpd,key,wbuf):
+    """Weak reference callback for the buffer of an idle cached MR."""
+    cdef PD pd = wpd();
+    cdef MR base
+    if pd is None:
+        return;
+    base = pd._mr_cache.get(key);
+    if base is not None and base._wbuf is wbuf:
+        pd._mr_drop(base);
+
 cdef class AH:
     """Address handle, this is a context manager."""
     cdef object __weakref__
@@ -942,34 +1525,39 @@ cdef class CQ:
 
     def poll(self,int limit=-1):
         """Perform the poll_cq operation, return a list of work requests."""
-        cdef c.ibv_wc lwc
-        cdef int n
+        cdef c.ibv_wc lwc[16]
+        cdef int i, n, want
         cdef list L
         L = []
         while limit != 0:
-            n = c.ibv_poll_cq(self._cq, 1, &lwc)
-            if n == 0:
-                break
-            elif n < 0:
+            want = 16
+            if limit > 0 and limit < want:
+                want = limit
+            n = c.ibv_poll_cq(self._cq, want, lwc)
+            if n < 0:
                 raise rdma.SysError(errno,"ibv_poll_cq");
-            else:
-                L.append(wc(wr_id = lwc.wr_id,
-                            status = lwc.status,
-                            opcode = lwc.opcode,
-                            vendor_err = lwc.vendor_err,
-                            byte_len = lwc.byte_len,
-                            imm_data = lwc.imm_data,
-                            qp_num = lwc.qp_num,
-                            src_qp = lwc.src_qp,
-                            wc_flags = lwc.wc_flags,
-                            pkey_index = lwc.pkey_index,
-                            slid = lwc.slid,
-                            sl = lwc.sl,
-                            dlid_path_bits = lwc.dlid_path_bits))
-                if limit > 0:
-                    limit = limit - 1;
+            for 0 <= i < n:
+                L.append(make_wc(&lwc[i]))
+            if limit > 0:
+                limit = limit - n;
+            if n < want:
+                break
         return L
 
+    def poll_batch(self,WCList wcs not None):
+        """Poll up to `wcs.size` work completions into *wcs*, a
+        :class:`rdma.ibverbs.WCList`, with a single ibv_poll_cq call. The
+        prior contents of *wcs* are replaced.
+
+        :returns: The number of completions stored in *wcs*."""
+        cdef int n
+        n = c.ibv_poll_cq(self._cq, wcs._size, wcs._wcs)
+        if n < 0:
+            wcs._count = 0
+            raise rdma.SysError(errno,"ibv_poll_cq");
+        wcs._count = n
+        return n
+
     def __str__(self):
         return "cq:%X:%s"%(self._cq.handle,self.ctx.node);
     def __repr__(self):
@@ -1061,64 +1649,46 @@ cdef class SRQ:
                         srq_limit=cattr.srq_limit);
 
     def post_recv(self, arg):
-        """*wrlist* may be a single :class:`rdma.ibverbs.recv_wr` or
-        a list of them."""
+        """*wrlist* may be a single :class:`rdma.ibverbs.recv_wr`, a list of
+        them or a :class:`rdma.ibverbs.PreparedRecvWR`."""
         cdef list wrlist
         cdef unsigned char *mem
-        cdef c.ibv_recv_wr dummy_wr
         cdef c.ibv_recv_wr *cwr
         cdef c.ibv_recv_wr *cbad_wr
-        cdef c.ibv_sge dummy_sge
         cdef c.ibv_sge *csge
-        cdef int i, j, n, rc
-        cdef int wr_id
+        cdef PreparedRecvWR pwr
+        cdef int i, n, rc
         cdef int num_sge
 
-        # NOTE: A copy of this is in QP.post_recv
+        if isinstance(arg, PreparedRecvWR):
+            pwr = arg
+            if pwr._max_sge > self._max_sge:
+                raise ValueError("Too many scatter/gather entries in work request")
+            rc = c.ibv_post_srq_recv(self._srq, pwr._wrs, &cbad_wr)
+            if rc != 0:
+                raise WRError(rc,"ibv_post_srq_recv","Failed to post work request",
+                              _bad_index(pwr._wrs,cbad_wr,sizeof(c.ibv_recv_wr),
+                                         pwr._count));
+            return
+
         wrlist = _post_check(arg, recv_wr, self._max_sge, &num_sge)
 
         n = len(wrlist)
-        mem = <unsigned char *>calloc(1,sizeof(dummy_wr)*n + sizeof(dummy_sge)*num_sge);
+        mem = <unsigned char *>calloc(1,sizeof(c.ibv_recv_wr)*n + sizeof(c.ibv_sge)*num_sge);
         if mem == NULL:
             raise MemoryError()
         try:
             cwr = <c.ibv_recv_wr *>(mem);
             csge = <c.ibv_sge *>(cwr + n);
             for 0 <= i < n:
-                wr = wrlist[i]
-                wr_id = wr.wr_id;
-                cwr.wr_id = <uintptr_t>wr_id
-                if i == n - 1:
-                    cwr.next = NULL
-                else:
-                    cwr.next = cwr + 1
-
-                cwr.sg_list = csge
-                if isinstance(wr.sg_list, list) or isinstance(wr.sg_list, tuple):
-                    cwr.num_sge = len(wr.sg_list)
-                    for 0 <= j < cwr.num_sge:
-                        sge = wr.sg_list[j]
-                        csge.addr = sge.addr
-                        csge.length = sge.length
-                        csge.lkey = sge.lkey
-                        csge += 1
-                elif wr.sg_list is not None:
-                    cwr.num_sge = 1
-                    sge = wr.sg_list;
-                    csge.addr = sge.addr
-                    csge.length = sge.length
-                    csge.lkey = sge.lkey
-                    csge += 1
-                cwr = cwr + 1;
+                csge = _fill_recv_wr(cwr + i, csge, wrlist[i])
+                if i != n - 1:
+                    cwr[i].next = cwr + i + 1
 
-            cwr = <c.ibv_recv_wr *>(mem);
-            rc = c.ibv_post_srq_recv(self._srq, <c.ibv_recv_wr *>mem, &cbad_wr)
+            rc = c.ibv_post_srq_recv(self._srq, cwr, &cbad_wr)
             if rc != 0:
-                cwr = <c.ibv_recv_wr *>(mem);
-                for 0 <= i < n:
-                    if cwr+i == cbad_wr:
-                        break;
-                raise WRError(rc,"ibv_post_srq_recv","Failed to post work request",n);
+                raise WRError(rc,"ibv_post_srq_recv","Failed to post work request",
+                              _bad_index(cwr,cbad_wr,sizeof(c.ibv_recv_wr),n));
         finally:
             free(mem)
 
@@ -1133,6 +1703,15 @@ cdef class MR:
     cdef PD _pd
     cdef c.ibv_mr *_mr
     cdef object _buf
+    cdef uintptr_t _addr
+    cdef Py_ssize_t _length
+    cdef int _access
+    # Cache state, see PD.cached_mr. _base is the shared registration of a
+    # cached MR, the others are for the registrations held by the cache.
+    cdef MR _base
+    cdef int _refs
+    cdef object _key
+    cdef object _wbuf
 
     property pd:
         def __get__(self):
@@ -1144,11 +1723,11 @@ cdef class MR:
 
     property addr:
         def __get__(self):
-            return <uintptr_t>self._mr.addr
+            return self._addr
 
     property length:
         def __get__(self):
-            return self._mr.length
+            return self._length
 
     property lkey:
         def __get__(self):
@@ -1158,22 +1737,23 @@ cdef class MR:
         def __get__(self):
             return self._mr.rkey
 
-    def __cinit__(self, PD pd not None, buf, int access=0):
+    def __cinit__(self, PD pd not None, buf, int access=0, MR base=None):
+        """*base* is used by :meth:`rdma.ibverbs.PD.cached_mr` to share an
+        existing registration that covers *buf*."""
         cdef void *addr
         cdef Py_ssize_t length
-        cdef int rc
-
-        if access & (c.IBV_ACCESS_LOCAL_WRITE | c.IBV_ACCESS_REMOTE_WRITE) != 0:
-            rc = PyObject_AsWriteBuffer(buf, &addr, &length)
-            if rc != 0:
-                raise TypeError("Expected mutable buffer")
-        else:
-            rc = PyObject_AsReadBuffer(buf, <const_void_ptr_ptr>&addr, &length)
-            if rc != 0:
-                raise TypeError("Expected buffer")
 
+        get_buf_range(buf, access, &addr, &length)
         self._pd = pd
         self._buf = buf
+        self._access = access
+        self._addr = <uintptr_t>addr
+        self._length = length
+        if base is not None:
+            self._base = base
+            self._mr = base._mr
+            return
+
         self._mr = c.ibv_reg_mr(pd._pd, addr, length, access)
         if self._mr == NULL:
             raise rdma.SysError(errno,"ibv_reg_mr",
@@ -1194,6 +1774,13 @@ cdef class MR:
 
     cdef _close(self):
         cdef int rc
+        cdef MR base
+        if self._base is not None:
+            base = self._base
+            self._base = None
+            self._mr = NULL
+            self._pd._mr_release(base)
+            return
         if self._mr != NULL:
             rc = c.ibv_dereg_mr(self._mr)
             if rc != 0:
@@ -1213,11 +1800,11 @@ cdef class MR:
         if _off < 0:
             raise ValueError("off %r cannot be negative"%off);
         if _length == -1:
-            _length = self._mr.length - _off;
-        if _length + _off > self._mr.length:
+            _length = self._length - _off;
+        if _length + _off > self._length:
             raise ValueError("Length is too long %u > %u"%(_length + _off,
-                                                           self._mr.length));
-        return sge(addr=<uintptr_t>(self._mr.addr + _off),
+                                                           self._length));
+        return sge(addr=self._addr + _off,
                    lkey=self._mr.lkey,
                    length=_length);
 
@@ -1404,148 +1991,93 @@ cdef class QP:
             self._cap = cattr.cap
 
     def post_send(self, arg):
-        """*wrlist* may be a single :class:`rdma.ibverbs.send_wr` or
-        a list of them."""
-        cdef list sglist, wrlist
+        """*wrlist* may be a single :class:`rdma.ibverbs.send_wr`, a list of
+        them or a :class:`rdma.ibverbs.PreparedSendWR`."""
+        cdef list wrlist
         cdef unsigned char *mem
-        cdef c.ibv_send_wr dummy_wr
         cdef c.ibv_send_wr *cwr
         cdef c.ibv_send_wr *cbad_wr
-        cdef c.ibv_sge dummy_sge
         cdef c.ibv_sge *csge
-        cdef c.ibv_ah dummy_ah
-        cdef c.ibv_ah *cah
-        cdef int i, j, n, rc,
-        cdef int wr_id
-        cdef AH ah
+        cdef PreparedSendWR pwr
+        cdef int i, n, rc
         cdef int num_sge
 
+        if isinstance(arg, PreparedSendWR):
+            pwr = arg
+            if pwr._max_sge > self._cap.max_send_sge:
+                raise ValueError("Too many scatter/gather entries in work request")
+            if self._qp_type == c.IBV_QPT_UD:
+                pwr._check_ud()
+            rc = c.ibv_post_send(self._qp, pwr._wrs, &cbad_wr)
+            if rc != 0:
+                raise WRError(rc,"ibv_post_send","Failed to post work request",
+                              _bad_index(pwr._wrs,cbad_wr,sizeof(c.ibv_send_wr),
+                                         pwr._count));
+            return
+
         wrlist = _post_check(arg, send_wr, self._cap.max_send_sge, &num_sge)
 
         n = len(wrlist)
-        mem = <unsigned char *>calloc(1,sizeof(dummy_wr)*n + sizeof(dummy_sge)*num_sge);
+        mem = <unsigned char *>calloc(1,sizeof(c.ibv_send_wr)*n + sizeof(c.ibv_sge)*num_sge);
         if mem == NULL:
             raise MemoryError()
         try:
             cwr = <c.ibv_send_wr *>(mem);
             csge = <c.ibv_sge *>(cwr + n);
             for 0 <= i < n:
-                wr = wrlist[i]
-                wr_id = wr.wr_id;
-                cwr.wr_id = <uintptr_t>wr_id
-                if i == n - 1:
-                    cwr.next = NULL
-                else:
-                    cwr.next = cwr + 1
-
-                cwr.sg_list = csge
-                if isinstance(wr.sg_list, list) or isinstance(wr.sg_list, tuple):
-                    cwr.num_sge = len(wr.sg_list)
-                    for 0 <= j < cwr.num_sge:
-                        sge = wr.sg_list[j]
-                        csge.addr = sge.addr
-                        csge.length = sge.length
-                        csge.lkey = sge.lkey
-                        csge += 1
-                elif wr.sg_list is not None:
-                    cwr.num_sge = 1
-                    csge.addr = wr.sg_list.addr
-                    csge.length = wr.sg_list.length
-                    csge.lkey = wr.sg_list.lkey
-                    csge += 1
-
-                cwr.opcode = wr.opcode
-                if (cwr.opcode == c.IBV_WR_RDMA_WRITE or
-                    cwr.opcode == c.IBV_WR_RDMA_WRITE_WITH_IMM or
-                    cwr.opcode == c.IBV_WR_RDMA_READ):
-                    cwr.wr.rdma.remote_addr = wr.remote_addr
-                    cwr.wr.rdma.rkey = wr.rkey
-                elif (cwr.opcode == c.IBV_WR_ATOMIC_FETCH_AND_ADD or
-                      cwr.opcode == c.IBV_WR_ATOMIC_CMP_AND_SWP):
-                    cwr.wr.atomic.remote_addr = wr.remote_addr
-                    cwr.wr.atomic.compare_add = wr.compare_add
-                    cwr.wr.atomic.swap = wr.swap
-                    cwr.wr.atomic.rkey = wr.rkey
-                elif self._qp_type == c.IBV_QPT_UD:
-                    if not isinstance(wr.ah,AH):
-                        raise TypeError("AH must be a AH")
-                    ah = wr.ah;
-                    cwr.wr.ud.ah = ah._ah
-                    cwr.wr.ud.remote_qpn = wr.remote_qpn
-                    cwr.wr.ud.remote_qkey = wr.remote_qkey
-
-                cwr.send_flags = wr.send_flags
-                cwr.imm_data = wr.imm_data
-                cwr = cwr + 1;
-
-            rc = c.ibv_post_send(self._qp, <c.ibv_send_wr *>mem, &cbad_wr)
+                csge = _fill_send_wr(cwr + i, csge, wrlist[i],
+                                     self._qp_type == c.IBV_QPT_UD)
+                if i != n - 1:
+                    cwr[i].next = cwr + i + 1
+
+            rc = c.ibv_post_send(self._qp, cwr, &cbad_wr)
             if rc != 0:
-                cwr = <c.ibv_send_wr *>(mem);
-                for 0 <= i < n:
-                    if cwr+i == cbad_wr:
-                        break;
-                raise WRError(rc,"ibv_post_send","Failed to post work request",n);
+                raise WRError(rc,"ibv_post_send","Failed to post work request",
+                              _bad_index(cwr,cbad_wr,sizeof(c.ibv_send_wr),n));
         finally:
             free(mem)
 
     def post_recv(self, arg):
-        """*wrlist* may be a single :class:`rdma.ibverbs.recv_wr` or
-        a list of them."""
+        """*wrlist* may be a single :class:`rdma.ibverbs.recv_wr`, a list of
+        them or a :class:`rdma.ibverbs.PreparedRecvWR`."""
         cdef list wrlist
         cdef unsigned char *mem
-        cdef c.ibv_recv_wr dummy_wr
         cdef c.ibv_recv_wr *cwr
         cdef c.ibv_recv_wr *cbad_wr
-        cdef c.ibv_sge dummy_sge
         cdef c.ibv_sge *csge
-        cdef int i, j, n, rc
-        cdef int wr_id
+        cdef PreparedRecvWR pwr
+        cdef int i, n, rc
         cdef int num_sge
 
-        # NOTE: A copy of this is in SRQ.post_recv
+        if isinstance(arg, PreparedRecvWR):
+            pwr = arg
+            if pwr._max_sge > self._cap.max_recv_sge:
+                raise ValueError("Too many scatter/gather entries in work request")
+            rc = c.ibv_post_recv(self._qp, pwr._wrs, &cbad_wr)
+            if rc != 0:
+                raise WRError(rc,"ibv_post_recv","Failed to post work request",
+                              _bad_index(pwr._wrs,cbad_wr,sizeof(c.ibv_recv_wr),
+                                         pwr._count));
+            return
+
         wrlist = _post_check(arg, recv_wr, self._cap.max_recv_sge, &num_sge)
 
         n = len(wrlist)
-        mem = <unsigned char *>calloc(1,sizeof(dummy_wr)*n + sizeof(dummy_sge)*num_sge);
+        mem = <unsigned char *>calloc(1,sizeof(c.ibv_recv_wr)*n + sizeof(c.ibv_sge)*num_sge);
         if mem == NULL:
             raise MemoryError()
         try:
             cwr = <c.ibv_recv_wr *>(mem);
             csge = <c.ibv_sge *>(cwr + n);
             for 0 <= i < n:
-                wr = wrlist[i]
-                wr_id = wr.wr_id;
-                cwr.wr_id = <uintptr_t>wr_id
-                if i == n - 1:
-                    cwr.next = NULL
-                else:
-                    cwr.next = cwr + 1
-
-                cwr.sg_list = csge
-                if isinstance(wr.sg_list, list) or isinstance(wr.sg_list, tuple):
-                    cwr.num_sge = len(wr.sg_list)
-                    for 0 <= j < cwr.num_sge:
-                        sge = wr.sg_list[j]
-                        csge.addr = sge.addr
-                        csge.length = sge.length
-                        csge.lkey = sge.lkey
-                        csge += 1
-                elif wr.sg_list is not None:
-                    cwr.num_sge = 1
-                    sge = wr.sg_list;
-                    csge.addr = sge.addr
-                    csge.length = sge.length
-                    csge.lkey = sge.lkey
-                    csge += 1
-                cwr = cwr + 1;
-
-            rc = c.ibv_post_recv(self._qp, <c.ibv_recv_wr *>mem, &cbad_wr)
+                csge = _fill_recv_wr(cwr + i, csge, wrlist[i])
+                if i != n - 1:
+                    cwr[i].next = cwr + i + 1
+
+            rc = c.ibv_post_recv(self._qp, cwr, &cbad_wr)
             if rc != 0:
-                cwr = <c.ibv_recv_wr *>(mem);
-                for 0 <= i < n:
-                    if cwr+i == cbad_wr:
-                        break;
-                raise WRError(rc,"ibv_post_recv","Failed to post work request",n);
+                raise WRError(rc,"ibv_post_recv","Failed to post work request",
+                              _bad_index(cwr,cbad_wr,sizeof(c.ibv_recv_wr),n));
         finally:
             free(mem)
 
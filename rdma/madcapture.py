@@ -0,0 +1,340 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+"""Capture MADs into a memory mapped ring file and replay them later."""
+import collections;
+import ctypes;
+import mmap;
+import os;
+import struct;
+import time;
+import rdma;
+import rdma.madtransactor;
+import rdma.tools;
+import rdma.umad;
+import rdma.IBA as IBA;
+from socket import htonl as cpu_to_be32;
+from socket import htons as cpu_to_be16;
+
+#: A request MAD sent by the transactor
+CAPTURE_SEND = 0;
+#: The reply to a request
+CAPTURE_RECV = 1;
+#: A request that never got a reply, the MAD is the request
+CAPTURE_TIMEOUT = 2;
+#: A request that was resent
+CAPTURE_RETRY = 3;
+#: A MAD that did not match any request
+CAPTURE_UNEXPECTED = 4;
+#: A request received by an agent
+CAPTURE_INCOMING = 5;
+#: A reply sent by an agent
+CAPTURE_REPLY = 6;
+_CAPTURE_WRAP = 0xFF;
+
+DIRECTION_NAMES = ("send","recv","timeout","retry","unexpected","incoming",
+                   "reply");
+
+#: The record returned by :func:`read_capture`. *addr* is a
+#: :attr:`rdma.umad.UMAD.ib_mad_addr_t`, for received MADs it is in the
+#: format the kernel returns.
+CaptureRecord = collections.namedtuple("CaptureRecord",
+                                       "timestamp direction addr mad");
+
+_MAGIC = "RDMACAP\0";
+_VERSION = 1;
+# magic, version, header length, data size, head, tail, count, dropped
+_file_hdr = struct.Struct("<8sIIQQQQQ");
+_FILE_HDR_LEN = 64;
+# timestamp, direction, flags, addr length, mad length
+_rec_hdr = struct.Struct("<dBBHI");
+_REC_HDR_LEN = _rec_hdr.size;
+_ah = rdma.umad.UMAD.ib_mad_addr_t;
+
+def make_addr(path):
+    """Return the :attr:`rdma.umad.UMAD.ib_mad_addr_t` for *path*. Paths
+    that have been used with :class:`rdma.umad.UMAD` already carry one,
+    otherwise one is built, without the pkey index."""
+    try:
+        return path._cached_umad_ah;
+    except AttributeError:
+        pass;
+    try:
+        return path._cached_capture_ah;
+    except AttributeError:
+        pass;
+    if path.has_grh:
+        res = _ah.pack(cpu_to_be32(path.dqpn or 0),cpu_to_be32(path.qkey or 0),
+                       cpu_to_be16(path.DLID),path.SL,path.SLID & 0x7F,1,
+                       path.SGID_index,path.hop_limit,path.traffic_class,
+                       path.DGID,cpu_to_be32(path.flow_label),0);
+    else:
+        res = _ah.pack(cpu_to_be32(path.dqpn or 0),cpu_to_be32(path.qkey or 0),
+                       cpu_to_be16(path.DLID or 0),path.SL,
+                       (path.SLID or 0) & 0x7F,0,0,0,0,"\0"*16,0,0);
+    path._cached_capture_ah = res;
+    return res;
+
+def addr_lid(addr):
+    """Return the LID from *addr*. This is the DLID for sent MADs and the
+    SLID for received MADs."""
+    return cpu_to_be16(_ah.unpack(addr)[2]);
+
+class MADCapture(object):
+    """A :attr:`rdma.madtransactor.MADTransactor.trace_func` that appends the
+    raw MADs to a fixed size memory mapped ring file. When the file is full
+    the oldest records are overwritten, so the file always holds the most
+    recent traffic. Unlike :func:`rdma.madtransactor.dumper_tracer` nothing is
+    decoded while capturing, the file is read back with :func:`read_capture`
+    and replayed with :class:`ReplayTransactor`.
+
+    This class supports the context manager protocol. The position of the
+    ring is only recorded in the file header every :attr:`sync_every`
+    records and by :meth:`flush`, :meth:`close` must be called to record the
+    final position."""
+
+    #: Number of records written since the file was opened
+    records = 0;
+    #: The file header is updated after this many records
+    sync_every = 256;
+
+    def __init__(self,fn,size=16*1024*1024,trace_func=None):
+        """*size* is the size of the ring in bytes. *trace_func* is another
+        trace function to call for every event, eg
+        :func:`rdma.madtransactor.simple_tracer`."""
+        self.trace_func = trace_func;
+        size = max(size,4096) & ~7;
+        fd = os.open(fn,os.O_RDWR | os.O_CREAT | os.O_TRUNC,0644);
+        try:
+            os.ftruncate(fd,_FILE_HDR_LEN + size);
+            self._mm = mmap.mmap(fd,_FILE_HDR_LEN + size);
+        finally:
+            os.close(fd);
+        # mmap slice assignment only takes str, write through a view
+        self._view = memoryview((ctypes.c_char*len(self._mm)).from_buffer(
+            self._mm));
+        self._size = size;
+        self._head = 0;
+        self._tail = 0;
+        self._count = 0;
+        self._dropped = 0;
+        self._sync_hdr();
+
+    def _sync_hdr(self):
+        _file_hdr.pack_into(self._mm,0,_MAGIC,_VERSION,_FILE_HDR_LEN,
+                            self._size,self._head,self._tail,self._count,
+                            self._dropped);
+
+    def _expire(self,start,end):
+        """Drop the oldest records until nothing starts in [start,end)."""
+        mm = self._mm;
+        while self._count and start <= self._tail < end:
+            off = _FILE_HDR_LEN + self._tail;
+            ts,direction,flags,alen,mlen = _rec_hdr.unpack_from(mm,off);
+            tail = self._tail + ((_REC_HDR_LEN + alen + mlen + 7) & ~7);
+            if (tail + _REC_HDR_LEN > self._size or
+                ord(mm[_FILE_HDR_LEN + tail + 8]) == _CAPTURE_WRAP):
+                tail = 0;
+            self._tail = tail;
+            self._count = self._count - 1;
+
+    def write(self,direction,addr,mad):
+        """Append a record to the ring. *addr* is a
+        :attr:`rdma.umad.UMAD.ib_mad_addr_t` and *mad* the raw MAD, which
+        may be any buffer."""
+        size = (_REC_HDR_LEN + len(addr) + len(mad) + 7) & ~7;
+        if size > self._size:
+            self._dropped = self._dropped + 1;
+            return;
+        mm = self._mm;
+        head = self._head;
+        if head + size > self._size:
+            self._expire(head,self._size);
+            if head + _REC_HDR_LEN <= self._size:
+                _rec_hdr.pack_into(mm,_FILE_HDR_LEN + head,0,_CAPTURE_WRAP,
+                                   0,0,0);
+            head = 0;
+        self._expire(head,head + size);
+        if self._count == 0:
+            self._tail = head;
+
+        off = _FILE_HDR_LEN + head;
+        _rec_hdr.pack_into(mm,off,time.time(),direction,0,len(addr),len(mad));
+        off = off + _REC_HDR_LEN;
+        view = self._view;
+        view[off:off + len(addr)] = addr;
+        off = off + len(addr);
+        view[off:off + len(mad)] = mad;
+
+        head = head + size;
+        if head + _REC_HDR_LEN > self._size:
+            head = 0;
+        self._head = head;
+        self._count = self._count + 1;
+        self.records = self.records + 1;
+        if self.records % self.sync_every == 0:
+            self._sync_hdr();
+
+    def _write_fmt(self,direction,fmt,path):
+        buf = bytearray(fmt.MAD_LENGTH);
+        fmt.pack_into(buf);
+        self.write(direction,make_addr(path),buf);
+
+    def __call__(self,mt,kind,fmt=None,path=None,ret=None):
+        if kind == rdma.madtransactor.TRACE_SEND:
+            self.write(CAPTURE_SEND,make_addr(path),ret[0]);
+        elif kind == rdma.madtransactor.TRACE_COMPLETE:
+            if ret is None:
+                self._write_fmt(CAPTURE_TIMEOUT,fmt,path);
+            else:
+                self.write(CAPTURE_RECV,make_addr(ret[1]),ret[0]);
+        elif kind == rdma.madtransactor.TRACE_RECEIVE:
+            if ret is None:
+                self._write_fmt(CAPTURE_RETRY,fmt,path);
+            elif fmt is not None:
+                self.write(CAPTURE_INCOMING,make_addr(ret[1]),ret[0]);
+        elif kind == rdma.madtransactor.TRACE_UNEXPECTED:
+            self.write(CAPTURE_UNEXPECTED,make_addr(ret[1]),ret[0]);
+        elif kind == rdma.madtransactor.TRACE_REPLY:
+            self.write(CAPTURE_REPLY,make_addr(path),ret[0]);
+        if self.trace_func is not None:
+            self.trace_func(mt,kind,fmt=fmt,path=path,ret=ret);
+
+    def flush(self):
+        """Record the current position of the ring in the file header."""
+        if self._mm is not None:
+            self._sync_hdr();
+
+    def close(self):
+        """Flush and unmap the ring file."""
+        if self._mm is not None:
+            self._sync_hdr();
+            self._view = None;
+            self._mm.close();
+            self._mm = None;
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        self.close();
+
+def read_capture(fn):
+    """Generator that returns the :class:`CaptureRecord`\ s in the ring file
+    *fn*, oldest first."""
+    with open(fn,"rb") as F:
+        data = F.read();
+    if len(data) < _FILE_HDR_LEN:
+        raise rdma.RDMAError("%r is not a MAD capture file"%(fn));
+    magic,version,hlen,size,head,tail,count,dropped = \
+        _file_hdr.unpack_from(data,0);
+    if magic != _MAGIC or version != _VERSION:
+        raise rdma.RDMAError("%r is not a MAD capture file"%(fn));
+    off = tail;
+    for I in range(count):
+        if (off + _REC_HDR_LEN > size or
+            ord(data[hlen + off + 8]) == _CAPTURE_WRAP):
+            off = 0;
+        ts,direction,flags,alen,mlen = _rec_hdr.unpack_from(data,hlen + off);
+        start = hlen + off + _REC_HDR_LEN;
+        yield CaptureRecord(ts,direction,data[start:start + alen],
+                            data[start + alen:start + alen + mlen]);
+        off = off + ((_REC_HDR_LEN + alen + mlen + 7) & ~7);
+
+def decode_record(rec):
+    """Return the :class:`rdma.binstruct.BinFormat` for the MAD in the
+    :class:`CaptureRecord` *rec*, or `None` if the class is not known."""
+    kind = IBA.get_fmt_payload(
+        *rdma.madtransactor.MADTransactor.get_request_match_key(rec.mad));
+    if kind[0] is None:
+        return None;
+    return kind[0](rec.mad);
+
+def _replay_key(lid,buf):
+    """The key used to match a request during replay, the request without
+    its transaction ID."""
+    buf = bytes(buf);
+    return (lid,buf[:8],buf[16:]);
+
+class ReplayTransactor(rdma.madtransactor.MADTransactor):
+    """A :class:`~rdma.madtransactor.MADTransactor` that answers requests with
+    the replies recorded in a capture file, without sending anything. A
+    request is matched to the capture by its destination LID and its
+    contents other than the transaction ID, so the same sequence of calls, for
+    instance a :mod:`rdma.discovery` run, produces the same results. If a
+    request was captured several times its replies are returned in capture
+    order, the last one repeating. Requests that timed out in the capture, or
+    were never captured, time out. Synchronous calls raise
+    :exc:`rdma.MADTimeoutError` immediately, :class:`rdma.sched.MADSchedule`
+    still waits for the path's timeout.
+
+    This can be passed to :class:`rdma.sched.MADSchedule` in place of a
+    :class:`rdma.umad.UMAD`."""
+
+    def __init__(self,end_port,records):
+        """*records* is an iterable of :class:`CaptureRecord`, eg from
+        :func:`read_capture`."""
+        rdma.madtransactor.MADTransactor.__init__(self);
+        self.end_port = end_port;
+        self._tid = 0;
+        self.replies = {};
+        self._pos = {};
+        self._queue = collections.deque();
+
+        pending = {};
+        for I in records:
+            if I.direction == CAPTURE_SEND:
+                pending[self._get_match_key(I.mad)] = _replay_key(
+                    addr_lid(I.addr),I.mad);
+            elif (I.direction == CAPTURE_RECV or
+                  I.direction == CAPTURE_TIMEOUT):
+                key = pending.pop(self._get_match_key(I.mad),None);
+                if key is None:
+                    continue;
+                self.replies.setdefault(key,[]).append(
+                    I.mad if I.direction == CAPTURE_RECV else None);
+
+    def _get_new_TID(self):
+        self._tid = (self._tid + 1) & 0xFFFFFFFF;
+        return self._tid;
+
+    def _lookup(self,buf,path):
+        key = _replay_key(path.DLID,buf);
+        lst = self.replies.get(key);
+        if lst is None:
+            return None;
+        idx = self._pos.get(key,0);
+        if idx + 1 < len(lst):
+            self._pos[key] = idx + 1;
+        rep = lst[idx];
+        if rep is None:
+            return None;
+        rep = bytearray(rep);
+        rep[8:16] = buf[8:16];
+        path = path.copy();
+        path.reverse();
+        return (rep,path);
+
+    def sendto(self,buf,path):
+        ret = self._lookup(buf,path);
+        if ret is not None:
+            self._queue.append(ret);
+
+    def recvfrom(self,wakeat):
+        if self._queue:
+            return self._queue.popleft();
+        if wakeat is not None:
+            timeout = wakeat - rdma.tools.clock_monotonic();
+            if timeout > 0:
+                time.sleep(timeout);
+        return None;
+
+    def _execute(self,buf,path,sendOnly=False):
+        return self._lookup(buf,path);
+
+    def close(self):
+        pass;
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        pass;
@@ -0,0 +1,190 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import copy;
+import math;
+import struct;
+import rdma.tools;
+import rdma.IBA as IBA;
+
+#: Number of RTT histogram buckets. Bucket *N* counts replies that took
+#: less than 2**N microseconds, the last bucket counts everything slower.
+BUCKETS = 24;
+
+class MADStatEntry(object):
+    """Statistics for one (mgmtClass,attributeID,DLID) key."""
+    __slots__ = ("count","retries","timeouts","errors","rtt_total",
+                 "rtt_min","rtt_max","hist");
+
+    def __init__(self):
+        #: Number of replies received
+        self.count = 0;
+        #: Number of times a request was resent
+        self.retries = 0;
+        #: Number of requests that never got a reply
+        self.timeouts = 0;
+        #: Number of replies with a non-zero status
+        self.errors = 0;
+        #: Sum of the RTT of every reply in seconds
+        self.rtt_total = 0.0;
+        self.rtt_min = None;
+        self.rtt_max = None;
+        #: :class:`list` of :data:`BUCKETS` counts
+        self.hist = [0]*BUCKETS;
+
+    def __copy__(self):
+        res = MADStatEntry();
+        for I in self.__slots__:
+            setattr(res,I,getattr(self,I));
+        res.hist = list(self.hist);
+        return res;
+
+    @property
+    def rtt_mean(self):
+        """Average RTT in seconds, or `None`."""
+        if self.count == 0:
+            return None;
+        return self.rtt_total/self.count;
+
+    def percentile(self,pct):
+        """Return the upper bound in seconds of the histogram bucket that
+        holds the *pct* percentile RTT, or `None`."""
+        if self.count == 0:
+            return None;
+        want = self.count*pct/100.0;
+        total = 0;
+        for I,v in enumerate(self.hist):
+            total = total + v;
+            if total >= want:
+                return (1 << I)/1000000.0;
+        return (1 << (BUCKETS - 1))/1000000.0;
+
+class MADStats(object):
+    """Collect per RPC statistics from a
+    :class:`~rdma.madtransactor.MADTransactor`. Assign an instance to
+    :attr:`rdma.madtransactor.MADTransactor.stats`, the same instance can be
+    shared by several transactors. A :class:`rdma.sched.MADSchedule` uses
+    the stats of the *umad* it was created with.
+
+    Replies are keyed by tuple(mgmtClass,attributeID,DLID). Directed route
+    SMPs usually have a DLID of :data:`rdma.IBA.LID_PERMISSIVE`. The RTT is
+    measured from the first send of a request to the reply, including any
+    retries."""
+    #: Number of replies that did not match an outstanding request
+    unexpected = 0;
+
+    def __init__(self):
+        #: :class:`dict` of key to :class:`MADStatEntry`
+        self.entries = {};
+        self._pending = {};
+
+    def _get(self,key):
+        try:
+            return self.entries[key];
+        except KeyError:
+            ent = self.entries[key] = MADStatEntry();
+            return ent;
+
+    def start(self,rmatch,now):
+        """Called when the request with the reply match key *rmatch* is first
+        sent. *now* is the :func:`rdma.tools.clock_monotonic` time of the
+        send."""
+        self._pending[rmatch] = now;
+
+    def discard(self,rmatch):
+        """Called when the request with the reply match key *rmatch* is
+        abandoned without completing."""
+        self._pending.pop(rmatch,None);
+
+    def retry(self,buf,path):
+        """Called when the request MAD *buf* is resent to *path*."""
+        self._get((buf[1],(buf[16] << 8) | buf[17],path.DLID)).retries += 1;
+
+    def complete(self,rmatch,fmt,path,ret):
+        """Called when the request *fmt* with the reply match key *rmatch*
+        sent to *path* finishes. *ret* is the reply tuple(buf,path) or `None`
+        if it timed out."""
+        start = self._pending.pop(rmatch,None);
+        ent = self._get((fmt.mgmtClass,fmt.attributeID,path.DLID));
+        if ret is None:
+            ent.timeouts += 1;
+            return;
+        if struct.unpack_from(">H",ret[0],4)[0]:
+            ent.errors += 1;
+        ent.count += 1;
+        if start is None:
+            return;
+        rtt = rdma.tools.clock_monotonic() - start;
+        ent.rtt_total += rtt;
+        if ent.rtt_min is None or rtt < ent.rtt_min:
+            ent.rtt_min = rtt;
+        if ent.rtt_max is None or rtt > ent.rtt_max:
+            ent.rtt_max = rtt;
+        idx = math.frexp(rtt*1000000)[1];
+        if idx < 0:
+            idx = 0;
+        elif idx >= BUCKETS:
+            idx = BUCKETS - 1;
+        ent.hist[idx] += 1;
+
+    def snapshot(self,reset=False):
+        """Return a copy of :attr:`entries`. If *reset* is `True` then the
+        statistics are cleared.
+
+        :rtype: :class:`dict`"""
+        res = dict((k,copy.copy(v)) for k,v in self.entries.iteritems());
+        if reset:
+            self.reset();
+        return res;
+
+    def reset(self):
+        """Clear all the statistics. Outstanding requests are still timed."""
+        self.entries = {};
+        self.unexpected = 0;
+
+    def totals(self):
+        """Return a :class:`MADStatEntry` that sums every entry."""
+        res = MADStatEntry();
+        for I in self.entries.itervalues():
+            res.count += I.count;
+            res.retries += I.retries;
+            res.timeouts += I.timeouts;
+            res.errors += I.errors;
+            res.rtt_total += I.rtt_total;
+            if I.rtt_min is not None and (res.rtt_min is None or
+                                          I.rtt_min < res.rtt_min):
+                res.rtt_min = I.rtt_min;
+            if I.rtt_max is not None and (res.rtt_max is None or
+                                          I.rtt_max > res.rtt_max):
+                res.rtt_max = I.rtt_max;
+            for J,v in enumerate(I.hist):
+                res.hist[J] += v;
+        return res;
+
+    def dump(self,F,sort="rtt"):
+        """Print a table of the statistics to *F*. *sort* is `rtt` to show the
+        slowest destinations first, `timeouts` or `key`."""
+        if sort == "rtt":
+            key = lambda x:x[1].rtt_mean or 0;
+        elif sort == "timeouts":
+            key = lambda x:(x[1].timeouts,x[1].retries);
+        else:
+            key = lambda x:x[0];
+        lst = sorted(self.entries.iteritems(),key=key,reverse=(sort != "key"));
+
+        fmts = dict((k[0],v) for k,v in IBA.CLASS_TO_STRUCT.iteritems());
+        def ms(v):
+            if v is None:
+                return "-";
+            return "%.3f"%(v*1000);
+        print >> F,"# %-6s %-28s %6s %7s %7s %7s %5s %5s %5s %5s"%(
+            "class","attribute","lid","count","mean","p99","max","retry",
+            "tmo","err");
+        for (mgmtClass,attributeID,DLID),ent in lst:
+            attr = IBA.ATTR_TO_STRUCT.get((fmts.get(mgmtClass),attributeID));
+            attr = attr.__name__ if attr is not None else "0x%x"%(attributeID);
+            print >> F,"  0x%-4x %-28s %6u %7u %7s %7s %5s %5u %5u %5u"%(
+                mgmtClass,attr,DLID,ent.count,ms(ent.rtt_mean),
+                ms(ent.percentile(99)),ms(ent.rtt_max),ent.retries,
+                ent.timeouts,ent.errors);
+        tot = self.totals();
+        print >> F,"# Total %u replies, %u retries, %u timeouts, %u errors, %u unexpected, times in ms"%(
+            tot.count,tot.retries,tot.timeouts,tot.errors,self.unexpected);
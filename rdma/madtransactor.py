@@ -1,13 +1,32 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
-import rdma,rdma.path,sys;
+import rdma,rdma.path,rdma.tools,sys,random,time;
 import rdma.IBA as IBA;
+try:
+    import rdma._umadfast as _umadfast;
+except ImportError:
+    _umadfast = None;
 
+# For TRACE_SEND, TRACE_REPLY and incoming TRACE_RECEIVE events *ret* is
+# tuple(buf,path) holding the raw MAD.
 TRACE_SEND = 0;
 TRACE_COMPLETE = 1;
 TRACE_UNEXPECTED = 2;
 TRACE_RECEIVE = 3;
 TRACE_REPLY = 4;
 
+# dict of end port to a dict of tuple(mgmtClass,DLID) to the redirected
+# IBPath, shared by every MADTransactor on the end port.
+_redirect_tables = {};
+
+def invalidate_redirects(end_port=None):
+    """Forget the redirects followed from *end_port*, or from every end port
+    if *end_port* is `None`. :meth:`rdma.devices.EndPort.sm_change` calls
+    this since redirected agents may move when the SM changes."""
+    if end_port is None:
+        _redirect_tables.clear();
+    else:
+        _redirect_tables.pop(end_port,None);
+
 class _MADFormat(rdma.binstruct.BinFormat,IBA.MADHeader):
     """Support clase to let us trace error MADs."""
     def __init__(self,buf):
@@ -53,12 +72,12 @@ def dumper_tracer(mt,kind,fmt=None,path=None,ret=None):
         print "D: Request",fmt.describe();
         fmt.printer(sys.stdout,header=False);
         if ret is not None:
-            res = fmt.__class__(bytes(ret[0]));
+            res = fmt.__class__(bytearray(ret[0]));
             print "D: Reply",res.describe()
             res.printer(sys.stdout,header=False);
     if kind == TRACE_UNEXPECTED:
         simple_tracer(mt,kind,fmt=fmt,path=path,ret=ret);
-        IBA.MADHeader(bytes(ret[0])).printer(sys.stdout);
+        IBA.MADHeader(bytearray(ret[0])).printer(sys.stdout);
     if kind == TRACE_RECEIVE:
         simple_tracer(mt,kind,fmt=fmt,path=path,ret=ret);
         if fmt is not None:
@@ -70,6 +89,73 @@ def dumper_tracer(mt,kind,fmt=None,path=None,ret=None):
             print "D: Outgoing reply",fmt.describe();
             fmt.printer(sys.stdout,header=False);
 
+class RecordTable(object):
+    """The records returned by :meth:`MADTransactor.SubnAdmGetTableIter`.
+    Iterating over this returns :class:`list`\ s of up to :attr:`batch`
+    records. When the records come from an RMPP reply they are decoded
+    directly from the reassembled reply as they are iterated, so the caller
+    can start using the first records before the rest are decoded."""
+    #: Number of records in each batch
+    batch = 64;
+
+    def __init__(self,records=None,buf=None,start=0,step=0,count=0,
+                 newer=None,fmt=None,path=None):
+        """Either *records* is a :class:`list` of records or *buf* is a
+        :class:`bytes` holding *count* records of type *newer* every *step*
+        bytes, starting at *start*."""
+        self._records = records;
+        self._buf = buf;
+        self._start = start;
+        self._step = step;
+        if records is not None:
+            count = len(records);
+        self._count = count;
+        self._newer = newer;
+        self._fmt = fmt;
+        self._path = path;
+
+    def __len__(self):
+        return self._count;
+
+    def __iter__(self):
+        batch = self.batch;
+        if self._records is not None:
+            for I in range(0,self._count,batch):
+                yield self._records[I:I+batch];
+            return;
+
+        buf = self._buf;
+        newer = self._newer;
+        step = self._step;
+        for I in range(0,self._count,batch):
+            off = self._start + I*step;
+            try:
+                res = [newer(buf,off + J*step)
+                       for J in range(min(batch,self._count - I))];
+            except:
+                e = rdma.MADError(req=self._fmt,rep_buf=buf,path=self._path,
+                                  exc_info=sys.exc_info());
+                raise rdma.MADError,e,e.exc_info[2]
+            yield res;
+
+    def records(self):
+        """Iterate over all the records.
+
+        :rtype: generator of :class:`~rdma.binstruct.BinStruct`"""
+        for I in self:
+            for J in I:
+                yield J;
+
+def _complete_table(rpayload):
+    """Completer for :meth:`MADTransactor.SubnAdmGetTableIter`.
+    :meth:`MADTransactor._completeMAD` returns a :class:`RecordTable` directly
+    for RMPP replies, other transactors produce a :class:`list`."""
+    if isinstance(rpayload,RecordTable):
+        return rpayload;
+    if not isinstance(rpayload,list):
+        rpayload = [rpayload];
+    return RecordTable(rpayload);
+
 class MADTransactor(object):
     """This class is a mixin for everything that implements a MAD RPC
     transaction interface. Derived classes must provide the :meth:`_execute`
@@ -90,8 +176,20 @@ class MADTransactor(object):
     reply_fmt = None;
     #: A function to call for tracing.
     trace_func = None;
+    #: A :class:`rdma.madstats.MADStats` to collect RPC statistics.
+    stats = None;
     #: The end_port this is associated with
     end_port = None;
+    #: Delay in seconds before resending a request that got a BUSY reply,
+    #: doubled for each further BUSY reply to the same request. The actual
+    #: delay is randomly reduced by up to half.
+    busy_delay = 0.01;
+    #: Upper limit for :attr:`busy_delay`
+    busy_delay_max = 1.0;
+    #: Number of times a request is resent after BUSY replies
+    busy_retries = 8;
+    #: Number of redirects followed for a single request
+    max_redirects = 3;
 
     # Used when emulating an async interface in do_async
     result = None;
@@ -129,8 +227,104 @@ class MADTransactor(object):
                 (ord(buf[14]) << 8) |
                 (ord(buf[15]) << 0));
 
+    if _umadfast is not None:
+        _get_match_key = staticmethod(_umadfast.get_match_key);
     _get_reply_match_key = _get_match_key;
 
+    def _get_busy_delay(self,attempt):
+        """Return the delay in seconds before resending a request that got
+        its *attempt* th BUSY reply, or `None` if it should not be resent."""
+        if attempt >= self.busy_retries:
+            return None;
+        return random.uniform(0.5,1)*min(self.busy_delay_max,
+                                         self.busy_delay*(1 << attempt));
+
+    @property
+    def _redirects(self):
+        """:class:`dict` of tuple(mgmtClass,DLID,DGID) to the redirect target
+        from :meth:`_redirect_target` for :attr:`end_port`, or `None`."""
+        return _redirect_tables.get(self.end_port);
+
+    @staticmethod
+    def _redirect_key(mgmtClass,path):
+        if path.has_grh:
+            return (mgmtClass,path.DLID,path.DGID);
+        return (mgmtClass,path.DLID,None);
+
+    def _get_redirect(self,mgmtClass,path):
+        """Return the path to use for a *mgmtClass* request to *path*, taking
+        into account previous redirects."""
+        redirects = self._redirects;
+        if not redirects:
+            return path;
+        key = self._redirect_key(mgmtClass,path);
+        for I in range(self.max_redirects):
+            target = redirects.get(key);
+            if target is None:
+                break;
+            path = self._apply_redirect(path,target);
+            nkey = self._redirect_key(mgmtClass,path);
+            if nkey == key:
+                break;
+            key = nkey;
+        return path;
+
+    def _follow_redirect(self,err,attempt):
+        """Record the redirect in the :exc:`rdma.MADRedirectError` *err* and
+        return the path to resend to, or `None` if it should not be
+        followed."""
+        if attempt >= self.max_redirects:
+            return None;
+        redirects = _redirect_tables.setdefault(self.end_port,{});
+        redirects[self._redirect_key(err.req.mgmtClass,err.path)] = \
+            self._redirect_target(IBA.MADClassPortInfo(err.rep.data));
+        return err.redirect;
+
+    def _drop_redirect(self,path):
+        """Forget any redirect to *path*, the agent no longer answers
+        there."""
+        redirects = self._redirects;
+        if not redirects:
+            return;
+        for k,v in redirects.items():
+            if all(getattr(path,I,None) == J for I,J in v.iteritems()):
+                redirects.pop(k,None);
+
+    @staticmethod
+    def _redirect_target(cpi):
+        """Return a :class:`dict` of the :class:`rdma.path.IBPath` attributes
+        set by the redirect in the :class:`rdma.IBA.MADClassPortInfo` *cpi*.
+        See IBA 13.5.3.3."""
+        target = {"SL": cpi.redirectSL,
+                  "dqpn": cpi.redirectQP,
+                  "qkey": cpi.redirectQKey};
+        if cpi.redirectLID != 0:
+            target["DLID"] = cpi.redirectLID;
+        if cpi.redirectGID != IBA.ZERO_GID:
+            target["DGID"] = cpi.redirectGID;
+            target["traffic_class"] = cpi.redirectTC;
+            target["flow_label"] = cpi.redirectFL;
+        if cpi.redirectPKey != 0:
+            target["pkey"] = cpi.redirectPKey;
+        return target;
+
+    @staticmethod
+    def _apply_redirect(path,target):
+        """Return a copy of *path* with the redirect *target* from
+        :meth:`_redirect_target` applied. The other fields of *path* are
+        kept."""
+        npath = path.copy(**target);
+        if "DGID" in target and not path.has_grh:
+            npath.has_grh = True;
+            npath.hop_limit = 0xFF;
+        return npath;
+
+    @classmethod
+    def _make_redirect_path(cls,path,cpi):
+        """Return a copy of *path* redirected as described by the
+        :class:`rdma.IBA.MADClassPortInfo` *cpi*."""
+        return cls._apply_redirect(path,cls._redirect_target(cpi));
+
     @staticmethod
     def get_request_match_key(buf):
         """Return a :class:`tuple` for matching a request MAD buf. The :class:`tuple`
@@ -153,8 +347,12 @@ class MADTransactor(object):
             else:
                 oui = 0;
         return ((oui << 8) | mgmtClass,classVersion,attr);
+    if _umadfast is not None:
+        get_request_match_key = staticmethod(_umadfast.get_request_match_key);
 
-    def _prepareMAD(self,fmt,payload,attributeModifier,method,path):
+    def _fillMAD(self,fmt,payload,attributeModifier,method):
+        """Fill in the MAD header of *fmt* and pack *payload* into its
+        data."""
         fmt.baseVersion = IBA.MAD_BASE_VERSION;
         fmt.mgmtClass = fmt.MAD_CLASS;
         fmt.classVersion = fmt.MAD_CLASS_VERSION;
@@ -168,26 +366,36 @@ class MADTransactor(object):
         # inputs.
         if not isinstance(payload,type):
             payload.pack_into(fmt.data);
+
+    def _prepareMAD(self,fmt,payload,attributeModifier,method,path):
+        self._fillMAD(fmt,payload,attributeModifier,method);
         buf = bytearray(fmt.MAD_LENGTH);
         fmt.pack_into(buf);
 
         if self.trace_func is not None:
-            self.trace_func(self,TRACE_SEND,fmt=fmt,path=path);
+            self.trace_func(self,TRACE_SEND,fmt=fmt,path=path,
+                            ret=(buf,path));
         return buf
 
-    def _completeMAD(self,ret,fmt,path,newer,completer):
+    def _completeMAD(self,ret,fmt,path,newer,completer,rmatch=None):
         if self.trace_func is not None:
             self.trace_func(self,TRACE_COMPLETE,ret=ret,fmt=fmt,path=path);
+        if self.stats is not None:
+            self.stats.complete(rmatch,fmt,path,ret);
 
         if ret is None:
+            self._drop_redirect(path);
             raise rdma.MADTimeoutError(req=fmt,path=path);
         rbuf,self.reply_path = ret;
 
         rmpp = False;
         nfmt = fmt.__class__;
         if getattr(fmt,"RMPPVersion",None) is not None:
-            # Quick check if RMPP was used
-            if (rbuf[26] & IBA.RMPP_ACTIVE):
+            # Quick check if RMPP was used, rbuf may be a memoryview
+            rflags = rbuf[26];
+            if not isinstance(rflags,int):
+                rflags = ord(rflags);
+            if (rflags & IBA.RMPP_ACTIVE):
                 nfmt = IBA.SAHeader; # FIXME, should be class specific
                 rmpp = True;
 
@@ -207,10 +415,22 @@ class MADTransactor(object):
         # Note that everything in get_reply_match_key has already been
         # checked
 
-        # FIXME: Handle BUSY
-        # FIXME: Handle redirect
+        # BUSY and redirect replies are raised as their own exceptions so the
+        # caller can resend the request.
         status = self.reply_fmt.status;
         if status & 0x1F != 0:
+            if status & IBA.MAD_STATUS_BUSY:
+                raise rdma.MADBusyError(req=fmt,rep=self.reply_fmt,path=path,
+                                        rep_buf=rbuf,status=status);
+            if (status & IBA.MAD_STATUS_REDIRECT and not rmpp and
+                fmt.mgmtClass != IBA.MAD_SUBNET and
+                fmt.mgmtClass != IBA.MAD_SUBNET_DIRECTED):
+                cpi = IBA.MADClassPortInfo(self.reply_fmt.data);
+                if cpi.redirectQP != 0:
+                    raise rdma.MADRedirectError(
+                        req=fmt,rep=self.reply_fmt,path=path,rep_buf=rbuf,
+                        status=status,
+                        redirect=self._make_redirect_path(path,cpi));
             raise rdma.MADError(req=fmt,rep=self.reply_fmt,path=path,
                                 rep_buf=rbuf,status=self.reply_fmt.status);
 
@@ -256,8 +476,23 @@ class MADTransactor(object):
                         raise rdma.MADError(req=fmt,rep=self.reply_fmt,path=path,
                                             status=self.reply_fmt.status,
                                             msg="RMPP complete packet was too short.");
-                    rpayload = [newer(rbuf[start + step*I:start + step*(I+1)])
-                                for I in range(count)];
+                    # Records are unpacked directly from a single copy of
+                    # the reply, slicing each one out is very slow for
+                    # large tables.
+                    if isinstance(rbuf,memoryview):
+                        # A loaned receive buffer is only valid until the
+                        # next recvfrom, decode straight out of it now.
+                        rpayload = [newer(rbuf,start + step*I)
+                                    for I in range(count)];
+                    else:
+                        rbuf = bytes(rbuf);
+                        if completer is _complete_table:
+                            return RecordTable(buf=rbuf,start=start,
+                                               step=step,count=count,
+                                               newer=newer,fmt=fmt,
+                                               path=path);
+                        rpayload = [newer(rbuf,start + step*I)
+                                    for I in range(count)];
             else:
                 rpayload = newer(self.reply_fmt.data);
         except rdma.MADError:
@@ -284,10 +519,35 @@ class MADTransactor(object):
         caller must always return _doMAD(). If for some reason there is some
         post-processing work to do then a completer function must be specified
         to do it."""
+        path = self._get_redirect(fmt.MAD_CLASS,path);
         buf = self._prepareMAD(fmt,payload,attributeModifier,method,path);
-        ret = self._execute(buf,path);
         newer = payload if isinstance(payload,type) else payload.__class__;
-        return self._completeMAD(ret,fmt,path,newer,completer);
+        stats = self.stats;
+        rmatch = None if stats is None else self._get_reply_match_key(buf);
+        busy = 0;
+        redirects = 0;
+        try:
+            while True:
+                if stats is not None:
+                    stats.start(rmatch,rdma.tools.clock_monotonic());
+                ret = self._execute(buf,path);
+                try:
+                    return self._completeMAD(ret,fmt,path,newer,completer,
+                                             rmatch);
+                except rdma.MADBusyError:
+                    delay = self._get_busy_delay(busy);
+                    if delay is None:
+                        raise;
+                    busy = busy + 1;
+                    time.sleep(delay);
+                except rdma.MADRedirectError, err:
+                    path = self._follow_redirect(err,redirects);
+                    if path is None:
+                        raise;
+                    redirects = redirects + 1;
+        finally:
+            if stats is not None:
+                stats.discard(rmatch);
 
     def _subn_do(self,payload,path,attributeModifier,method):
         if isinstance(path,rdma.path.IBDRPath):
@@ -331,6 +591,13 @@ class MADTransactor(object):
     def SubnAdmGetTable(self,payload,path=None,attributeModifier=0):
         return self._subn_adm_do(payload,path,attributeModifier,
                                  payload.MAD_SUBNADMGETTABLE);
+    def SubnAdmGetTableIter(self,payload,path=None,attributeModifier=0):
+        """Like :meth:`SubnAdmGetTable` but the result is a
+        :class:`RecordTable`. Iterating over it decodes the records in
+        batches, which avoids decoding a large table before any of it can be
+        used."""
+        return self._subn_adm_do(payload,path,attributeModifier,
+                                 payload.MAD_SUBNADMGETTABLE,_complete_table);
     def SubnAdmSet(self,payload,path=None,attributeModifier=0):
         return self._subn_adm_do(payload,path,attributeModifier,
                            payload.MAD_SUBNADMSET);
@@ -423,7 +690,8 @@ class MADTransactor(object):
 
         path.reverse();
         if self.trace_func is not None:
-            self.trace_func(self,TRACE_REPLY,fmt=hdr,path=path);
+            self.trace_func(self,TRACE_REPLY,fmt=hdr,path=path,
+                            ret=(buf,path));
         self.sendto(buf,path);
 
     def send_reply(self,ofmt,payload,path,attributeModifier=0,
@@ -453,7 +721,8 @@ class MADTransactor(object):
 
         path.reverse();
         if self.trace_func is not None:
-            self.trace_func(self,TRACE_REPLY,fmt=fmt,path=path);
+            self.trace_func(self,TRACE_REPLY,fmt=fmt,path=path,
+                            ret=(buf,path));
         self.sendto(buf,path);
 
     def send_rmpp_reply(self,ofmt,attrClass,payload,path,attributeModifier=0,
@@ -494,7 +763,8 @@ class MADTransactor(object):
 
         path.reverse();
         if self.trace_func is not None:
-            self.trace_func(self,TRACE_REPLY,fmt=fmt,path=path);
+            self.trace_func(self,TRACE_REPLY,fmt=fmt,path=path,
+                            ret=(buf,path));
         self.sendto(buf,path);
 
     def do_async(self,op):
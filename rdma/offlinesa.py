@@ -0,0 +1,282 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import copy;
+import rdma;
+import rdma.satransactor;
+import rdma.IBA as IBA;
+
+#: The components of each supported record type that are indexed. The first
+#: indexed component present in the query's component mask is used to find
+#: the candidate records, the remaining components are then compared.
+INDEXES = {
+    IBA.SANodeRecord: ("LID","nodeInfo.nodeGUID","nodeInfo.portGUID"),
+    IBA.SAPortInfoRecord: ("endportLID",),
+    IBA.SALinkRecord: ("fromLID","toLID"),
+    IBA.SASwitchInfoRecord: ("LID",),
+    IBA.SALinearForwardingTableRecord: ("LID",),
+    IBA.SAMulticastForwardingTableRecord: ("LID",),
+    IBA.SAGUIDInfoRecord: ("LID",),
+};
+
+def _getfield(obj,name):
+    """Return the value of the component *name*, which may be dotted, from
+    *obj*."""
+    for I in name.split("."):
+        obj = getattr(obj,I);
+    return obj;
+
+class OfflineSATransactor(rdma.satransactor.SATransactor):
+    """An :class:`rdma.satransactor.SATransactor` that answers `SubnAdmGet`
+    and `SubnAdmGetTable` queries from a :class:`rdma.subnet.Subnet`, usually
+    one loaded from a discovery cache, instead of sending them to the SA.
+
+    Node, PortInfo, Link, SwitchInfo, LinearForwardingTable,
+    MulticastForwardingTable and GUIDInfo records are supported. The records
+    are built from the subnet the first time they are needed and are selected
+    using :meth:`rdma.binstruct.BinStruct.component_key`. Any other query, or
+    a query for information the subnet does not have, is sent to the real SA
+    using *parent*, so for instance `SAPathRecord` queries still require a
+    working SA.
+
+    Since the data comes from a cache it may be stale, the subnet is not
+    changed by anything the caller does."""
+
+    def __init__(self,parent,sbn,sa_path=None):
+        """*parent* is the :class:`~rdma.madtransactor.MADTransactor` used for
+        queries that cannot be answered from *sbn*."""
+        rdma.satransactor.SATransactor.__init__(self,parent,sa_path);
+        self.sbn = sbn;
+        self._records = {};
+        self._indexes = {};
+
+    def with_parent(self,parent):
+        """Return a new instance that uses *parent* and shares the records
+        built by this instance."""
+        res = self.__class__(parent,self.sbn,self.sa_path);
+        res._records = self._records;
+        res._indexes = self._indexes;
+        return res;
+
+    def _node_records(self):
+        for node in self.sbn.iternodes():
+            if node.ninf is None:
+                continue;
+            for port in node.iterend_ports():
+                if port.LID is None:
+                    continue;
+                rec = IBA.SANodeRecord();
+                rec.LID = port.LID;
+                rec.nodeInfo = copy.copy(node.ninf);
+                if port.portGUID is not None:
+                    rec.nodeInfo.portGUID = port.portGUID;
+                if node.ninf.nodeType != IBA.NODE_SWITCH:
+                    rec.nodeInfo.localPortNum = port.port_id;
+                if node.desc:
+                    s = node.desc.encode("UTF-8")[:63];
+                    rec.nodeDescription.nodeString[:len(s)] = s;
+                yield rec;
+
+    def _port_info_records(self):
+        for port,idx in self.sbn.iterports():
+            ep = port.to_end_port();
+            if port.pinf is None or ep.LID is None:
+                continue;
+            rec = IBA.SAPortInfoRecord();
+            rec.endportLID = ep.LID;
+            rec.portNum = idx;
+            rec.portInfo = port.pinf;
+            yield rec;
+
+    def _link_records(self):
+        for port,peer in self.sbn.topology.iteritems():
+            ep = port.to_end_port();
+            pep = peer.to_end_port();
+            if ep.LID is None or pep.LID is None:
+                continue;
+            rec = IBA.SALinkRecord();
+            rec.fromLID = ep.LID;
+            rec.fromPort = port.port_id;
+            rec.toPort = peer.port_id;
+            rec.toLID = pep.LID;
+            yield rec;
+
+    def _switch_info_records(self):
+        for sw in self.sbn.iterswitches():
+            LID = sw.get_port(0).LID;
+            if sw.swinf is None or LID is None:
+                continue;
+            rec = IBA.SASwitchInfoRecord();
+            rec.LID = LID;
+            rec.switchInfo = sw.swinf;
+            yield rec;
+
+    def _lft_records(self):
+        for sw in self.sbn.iterswitches():
+            LID = sw.get_port(0).LID;
+            if sw.lfdb is None or LID is None:
+                continue;
+            for I in range((len(sw.lfdb) + 63)//64):
+                rec = IBA.SALinearForwardingTableRecord();
+                rec.LID = LID;
+                rec.blockNum = I;
+                block = rec.linearForwardingTable.portBlock;
+                for J,port in enumerate(sw.lfdb[I*64:I*64+64]):
+                    block[J] = 255 if port is None else port;
+                for J in range(len(sw.lfdb) - I*64,64):
+                    block[J] = 255;
+                yield rec;
+
+    def _mft_records(self):
+        for sw in self.sbn.iterswitches():
+            LID = sw.get_port(0).LID;
+            if sw.mfdb is None or LID is None:
+                continue;
+            positions = (len(sw.ports) + 15)//16;
+            for I in range((len(sw.mfdb) + 31)//32):
+                mfdb = sw.mfdb[I*32:I*32+32];
+                for pos in range(positions):
+                    block = [(J >> pos*16) & 0xFFFF for J in mfdb];
+                    if not any(block):
+                        continue;
+                    rec = IBA.SAMulticastForwardingTableRecord();
+                    rec.LID = LID;
+                    rec.position = pos;
+                    rec.blockNum = I;
+                    rec.multicastForwardingTable.portMaskBlock[:len(block)] = block;
+                    yield rec;
+
+    def _guid_info_records(self):
+        for port in self.sbn.iterend_ports():
+            if port.portGUID is None or port.LID is None:
+                continue;
+            rec = IBA.SAGUIDInfoRecord();
+            rec.LID = port.LID;
+            rec.GUIDInfo.GUIDBlock[0] = port.portGUID;
+            yield rec;
+
+    #: tuple(builder,requirement) for each supported record. The requirement
+    #: is an entry in :attr:`rdma.subnet.Subnet.loaded` or an attribute every
+    #: switch must have.
+    _builders = {
+        IBA.SANodeRecord: (_node_records,"all_NodeInfo"),
+        IBA.SAPortInfoRecord: (_port_info_records,"all_PortInfo"),
+        IBA.SALinkRecord: (_link_records,"all_topology"),
+        IBA.SASwitchInfoRecord: (_switch_info_records,"all_SwitchInfo"),
+        IBA.SALinearForwardingTableRecord: (_lft_records,"lfdb"),
+        IBA.SAMulticastForwardingTableRecord: (_mft_records,"mfdb"),
+        IBA.SAGUIDInfoRecord: (_guid_info_records,"all_NodeInfo"),
+    };
+
+    def can_answer(self,cls):
+        """Return `True` if queries for the record *cls* can be answered from
+        the subnet."""
+        ent = self._builders.get(cls);
+        if ent is None:
+            return False;
+        req = ent[1];
+        if req.startswith("all_"):
+            return req in self.sbn.loaded;
+        if "all_SwitchInfo" not in self.sbn.loaded:
+            return False;
+        return all(getattr(I,req) is not None
+                   for I in self.sbn.iterswitches());
+
+    def get_records(self,cls):
+        """Return a :class:`list` of all the records of type *cls*. The caller
+        must not change them."""
+        res = self._records.get(cls);
+        if res is None:
+            res = self._records[cls] = list(self._builders[cls][0](self));
+        return res;
+
+    def _get_index(self,cls,name):
+        idx = self._indexes.get((cls,name));
+        if idx is None:
+            idx = self._indexes[cls,name] = {};
+            for I in self.get_records(cls):
+                idx.setdefault(_getfield(I,name),[]).append(I);
+        return idx;
+
+    def select(self,payload,mask):
+        """Return a :class:`list` of the records that match *payload* using
+        the component mask *mask*. The caller must not change them."""
+        if isinstance(payload,type):
+            return self.get_records(payload);
+        cls = payload.__class__;
+        res = None;
+        for I in INDEXES[cls]:
+            if mask & (1 << cls.COMPONENT_MASK[I]):
+                res = self._get_index(cls,I).get(_getfield(payload,I),[]);
+                break;
+        if res is None:
+            res = self.get_records(cls);
+        if mask == 0:
+            return list(res);
+        key = cls.component_key(mask);
+        want = key(payload);
+        return [I for I in res if key(I) == want];
+
+    def _error(self,fmt,path,code,completer):
+        """Produce the result of a class specific error the same way
+        :meth:`rdma.madtransactor.MADTransactor._completeMAD` does."""
+        if isinstance(completer,tuple):
+            self._parent.req_fmt = fmt;
+            self._parent.req_path = path;
+            try:
+                ret = completer[1](None,code);
+                if ret is not None:
+                    ret = completer[0](ret);
+            finally:
+                self._parent.req_fmt = None;
+                self._parent.req_path = None;
+            if ret is not None:
+                return ret;
+        raise rdma.MADClassError(req=fmt,path=path,code=code,
+                                 status=code << IBA.MAD_STATUS_CLASS_SHIFT);
+
+    def _answer(self,payload,mask,path,method,completer):
+        res = [copy.copy(I) for I in self.select(payload,mask)];
+        if method == IBA.MAD_METHOD_GET:
+            if len(res) != 1:
+                fmt = IBA.SAFormat();
+                fmt.mgmtClass = fmt.MAD_CLASS;
+                fmt.classVersion = fmt.MAD_CLASS_VERSION;
+                fmt.method = method;
+                fmt.attributeID = payload.MAD_ATTRIBUTE_ID;
+                fmt.componentMask = mask;
+                if not isinstance(payload,type):
+                    payload.pack_into(fmt.data);
+                if res:
+                    code = IBA.MAD_STATUS_SA_TOO_MANY_RECORDS;
+                else:
+                    code = IBA.MAD_STATUS_SA_NO_RECORDS;
+                return self._error(fmt,path,code,completer);
+            res = res[0];
+        return self._complete_cached(res,path,completer);
+
+    def _answer_async(self,payload,mask,path,method,completer):
+        """Coroutine to answer a query."""
+        self._parent.result = self._answer(payload,mask,path,method,completer);
+        return;
+        yield None;
+
+    def _subn_adm_do(self,payload,path,attributeModifier,method,completer=None):
+        mask = 0;
+        req = payload;
+        if isinstance(req,IBA.ComponentMask):
+            mask = req.component_mask;
+            req = req.payload;
+        if isinstance(req,type):
+            cls = req;
+        else:
+            cls = req.__class__;
+        if ((method != IBA.MAD_METHOD_GET and
+             method != IBA.MAD_METHOD_GET_TABLE) or
+            attributeModifier != 0 or not self.can_answer(cls)):
+            return rdma.satransactor.SATransactor._subn_adm_do(
+                self,payload,path,attributeModifier,method,completer);
+
+        if path is None:
+            path = self.sa_path;
+        if self.is_async:
+            return self._answer_async(req,mask,path,method,completer);
+        return self._answer(req,mask,path,method,completer);
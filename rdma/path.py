@@ -1,7 +1,10 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 import os;
 import sys;
+import time;
+import collections;
 import rdma;
+import rdma.tools;
 import rdma.IBA as IBA;
 
 class Path(object):
@@ -438,6 +441,97 @@ class LazyIBPath(IBPath):
         cls._unpack_rcv(self);
         return rdma.path.IBPath.__str__(self);
 
+class PathCache(object):
+    """Cache of :class:`rdma.IBA.SAPathRecord` replies used by
+    :func:`resolve_path`. Entries are keyed by the local end port, SGID,
+    DGID or DLID and the extra query properties. They expire after
+    :attr:`ttl` seconds and the least recently used entry is dropped once
+    there are more than :attr:`max_entries`.
+
+    :meth:`rdma.devices.EndPort.sm_change` calls :meth:`invalidate` since a
+    new SM may compute different paths. Other caches of paths resolved
+    through the SA, like :attr:`rdma.subnet.Port.gmp_path`, check
+    :meth:`invalidated` to drop paths resolved before the change.
+
+    Queries in progress are shared per *mad*, a flight started by one
+    :class:`rdma.sched.MADSchedule` can only be waited on by coroutines
+    running in that scheduler."""
+    #: Seconds a path record is used for.
+    ttl = 5*60;
+    #: Maximum number of path records to keep.
+    max_entries = 4096;
+    #: Number of lookups answered from the cache.
+    hits = 0;
+    #: Number of lookups that needed a query.
+    misses = 0;
+
+    class _Flight(object):
+        """A query in progress, other coroutines wait on :attr:`ctx`."""
+        ctx = None;
+        rep = None;
+        exc = None;
+
+    def __init__(self,ttl=None,max_entries=None):
+        if ttl is not None:
+            self.ttl = ttl;
+        if max_entries is not None:
+            self.max_entries = max_entries;
+        self._entries = collections.OrderedDict();
+        self._flights = {};
+        self._invalidated = {};
+
+    @staticmethod
+    def make_key(end_port,SGID,DGID=None,DLID=None,properties=None):
+        """Return the cache key for a path record query from *end_port*.
+        Only one of *DGID* or *DLID* should be given."""
+        if properties:
+            properties = tuple(sorted(properties.iteritems()));
+        else:
+            properties = None;
+        if DGID is not None:
+            return (end_port,SGID,DGID,None,properties);
+        return (end_port,SGID,None,DLID,properties);
+
+    def get(self,key):
+        """Return the cached path record for *key* or `None`."""
+        ent = self._entries.pop(key,None);
+        if ent is None or ent[0] <= rdma.tools.clock_monotonic():
+            self.misses = self.misses + 1;
+            return None;
+        # Re-insert to make this the most recently used entry.
+        self._entries[key] = ent;
+        self.hits = self.hits + 1;
+        return ent[1];
+
+    def add(self,key,rep):
+        """Store the path record *rep* under *key*."""
+        self._entries.pop(key,None);
+        self._entries[key] = (rdma.tools.clock_monotonic() + self.ttl,rep);
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False);
+
+    def invalidate(self,end_port=None):
+        """Drop all the entries for *end_port*, or everything if *end_port*
+        is `None`."""
+        self._invalidated[end_port] = time.time();
+        if end_port is None:
+            self._entries.clear();
+            return;
+        for I in [I for I in self._entries if I[0] is end_port]:
+            del self._entries[I];
+
+    def invalidated(self,end_port):
+        """Return the :func:`time.time` of the last :meth:`invalidate` that
+        covered *end_port*, or 0."""
+        return max(self._invalidated.get(end_port,0),
+                   self._invalidated.get(None,0));
+
+    def __len__(self):
+        return len(self._entries);
+
+#: The :class:`PathCache` used by :func:`resolve_path`.
+path_cache = PathCache();
+
 def get_mad_path(mad,ep_addr,**kwargs):
     """Query the SA and return a path for *ep_addr*.
 
@@ -470,12 +564,16 @@ def get_mad_path(mad,ep_addr,**kwargs):
 
     return resolve_path(mad,path);
 
-def resolve_path(mad,path,reversible=True,properties=None):
+def resolve_path(mad,path,reversible=True,properties=None,cache=True):
     """Resolve *path* to a full path for use with a QP. *path* must have at
     least a DGID or DLID set.
 
     *properties* is a dictionary of additional PR fields to set in the query.
 
+    If *cache* is `True` then answers are kept in :data:`path_cache` and
+    reused. When *mad* is async concurrent requests for the same destination
+    share a single query.
+
     If *mad* is an async instance then this routine returns a coroutine that
     will do the resolution, otherwise the new path is returned.
 
@@ -487,10 +585,22 @@ def resolve_path(mad,path,reversible=True,properties=None):
     :raises rdma.path.SAPathNotFoundError: If *ep_addr* was not found at the SA.
     :raises rdma.MADError: If the RPC failed in some way."""
     if mad.is_async:
-        return _resolve_path_async(mad,path,reversible,properties);
-    return mad.do_async(_resolve_path_async(mad,path,reversible,properties));
+        return _resolve_path_async(mad,path,reversible,properties,cache);
+    return mad.do_async(_resolve_path_async(mad,path,reversible,properties,
+                                            cache));
 
-def _resolve_path_async(mad,path,reversible=False,properties=None):
+def _path_flight(mad,q,cache,key,flight):
+    """Coroutine that issues the query for a :class:`PathCache` flight.
+    Errors are stored in the flight for the waiters to raise."""
+    try:
+        flight.rep = yield mad.SubnAdmGet(q);
+        cache.add(key,flight.rep);
+    except:
+        flight.exc = sys.exc_info();
+    finally:
+        cache._flights.pop((mad,key),None);
+
+def _resolve_path_async(mad,path,reversible=False,properties=None,cache=False):
     if path.end_port is None:
         path.end_port = mad.end_port;
 
@@ -513,8 +623,30 @@ def _resolve_path_async(mad,path,reversible=False,properties=None):
         for k,v in properties.iteritems():
             setattr(q,k,v);
 
+    rep = None;
+    if cache:
+        cache = path_cache;
+        key = cache.make_key(path.end_port,q.SGID,path.DGID,path.DLID,
+                             properties);
+        rep = cache.get(key);
+    else:
+        cache = None;
     try:
-        rep = yield mad.SubnAdmGet(q);
+        if cache is None:
+            rep = yield mad.SubnAdmGet(q);
+        elif rep is None and not mad.is_async:
+            rep = yield mad.SubnAdmGet(q);
+            cache.add(key,rep);
+        elif rep is None:
+            # Coroutines asking for the same path wait for the first query.
+            flight = cache._flights.get((mad,key));
+            if flight is None:
+                flight = cache._flights[mad,key] = PathCache._Flight();
+                flight.ctx = mad.queue(_path_flight(mad,q,cache,key,flight));
+            yield flight.ctx;
+            if flight.exc is not None:
+                raise flight.exc[0],flight.exc[1],flight.exc[2];
+            rep = flight.rep;
     except rdma.MADClassError as err:
         if err.code == IBA.MAD_STATUS_SA_NO_RECORDS:
             raise SAPathNotFoundError("Failed getting path record for path %r."%(path),
@@ -525,6 +657,71 @@ def _resolve_path_async(mad,path,reversible=False,properties=None):
         err.message("Failed getting path record for path %r."%(path));
         raise
 
+    fill_path_from_pr(path,rep);
+    mad.result = path;
+
+def prefetch_paths(mad,dests=None,properties=None):
+    """Fill :data:`path_cache` with paths from the end port of *mad* using a
+    single :class:`rdma.IBA.SAPathRecord` `SubnAdmGetTable`. *dests* is an
+    iterable of destinations in any format :func:`rdma.IBA.conv_ep_addr`
+    accepts, :class:`rdma.IBA.GUID` destinations match the port GUID of the
+    DGID. If *dests* is `None` every path the SA returns is cached.
+
+    Later calls to :func:`resolve_path` for these destinations are answered
+    from the cache. If *mad* is an async instance then this routine returns
+    a coroutine.
+
+    :returns: A :class:`dict` of destination to :class:`rdma.IBA.SAPathRecord`
+        for the destinations the SA returned a path for.
+    :raises rdma.MADError: If the RPC failed in some way."""
+    if mad.is_async:
+        return _prefetch_paths_async(mad,dests,properties);
+    return mad.do_async(_prefetch_paths_async(mad,dests,properties));
+
+def _prefetch_paths_async(mad,dests,properties):
+    guids = {};
+    addrs = {};
+    if dests is not None:
+        for I in dests:
+            if isinstance(I,IBA.GUID):
+                guids[I] = I;
+            else:
+                addrs[IBA.conv_ep_addr(I)] = I;
+
+    q = IBA.ComponentMask(IBA.SAPathRecord());
+    q.SGID = mad.end_port.default_gid;
+    q.reversible = True;
+    if properties:
+        for k,v in properties.iteritems():
+            setattr(q,k,v);
+    res = yield mad.SubnAdmGetTable(q);
+
+    ret = {};
+    for rep in res:
+        if dests is None:
+            dest = rep.DGID;
+        else:
+            dest = guids.get(rep.DGID.guid());
+            if dest is None:
+                dest = addrs.get(rep.DGID);
+            if dest is None:
+                dest = addrs.get(rep.DLID);
+            if dest is None:
+                continue;
+        if dest in ret:
+            # Only keep the first path if the SA returns several.
+            continue;
+        ret[dest] = rep;
+        # resolve_path may be asked by either address.
+        path_cache.add(path_cache.make_key(mad.end_port,q.SGID,DGID=rep.DGID,
+                                           properties=properties),rep);
+        path_cache.add(path_cache.make_key(mad.end_port,q.SGID,DLID=rep.DLID,
+                                           properties=properties),rep);
+    mad.result = ret;
+
+def fill_path_from_pr(path,rep):
+    """Set the addressing fields in *path* from the
+    :class:`rdma.IBA.SAPathRecord` *rep*."""
     path.DGID = rep.DGID;
     path.SGID = rep.SGID;
     path.DLID = rep.DLID;
@@ -538,7 +735,7 @@ def _resolve_path_async(mad,path,reversible=False,properties=None):
     path.rate = rep.rate;
     path.has_grh = rep.hopLimit != 0;
     path.packet_life_time = rep.packetLifeTime;
-    mad.result = path;
+    return path;
 
 def fill_path(qp,path,max_rd_atomic=255):
     """Fill in fields in path assuming *path* will be used with a QP. The
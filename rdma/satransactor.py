@@ -1,10 +1,140 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 import sys;
+import itertools;
 import rdma;
 import rdma.path;
+import rdma.tools;
 import rdma.madtransactor;
 import rdma.IBA as IBA;
 
+class SACache(object):
+    """Read-through cache of SA query replies used by :class:`SATransactor`.
+    Replies to `SubnAdmGet` and `SubnAdmGetTable` are keyed by the method,
+    the packed request attribute, the component mask and the attribute
+    modifier and are kept for :attr:`ttl` seconds.
+
+    The result of a `SubnAdmGetTable` with an empty component mask is the
+    entire table. Later queries for the same attribute are answered by
+    selecting from it using component mask matching. A `SubnAdmGet` is only
+    answered this way if exactly one record matches.
+
+    A `SubnAdmGetTable` that matches nothing in a full table gets an empty
+    result without asking the SA.
+
+    Any other SA method, like `SubnAdmSet`, empties the cache. Records are
+    kept packed and only the records in a result are decoded, so callers
+    can change them."""
+    #: Number of queries answered from the cache.
+    hits = 0;
+    #: Number of queries sent to the SA.
+    misses = 0;
+
+    def __init__(self,ttl=60):
+        """*ttl* is the number of seconds a reply is used for."""
+        self.ttl = ttl;
+        self._entries = {};
+        self._tables = {};
+
+    def clear(self):
+        """Drop everything in the cache."""
+        self._entries.clear();
+        self._tables.clear();
+
+    @staticmethod
+    def make_key(payload,attributeModifier,method):
+        """Return the cache key for a query. This must be computed when the
+        query is issued since callers often reuse the request object."""
+        mask = 0;
+        if isinstance(payload,IBA.ComponentMask):
+            mask = payload.component_mask;
+            payload = payload.payload;
+        if isinstance(payload,type):
+            cls = payload;
+        else:
+            cls = payload.__class__;
+        packed = None;
+        if mask != 0:
+            buf = bytearray(cls.MAD_LENGTH);
+            payload.pack_into(buf);
+            packed = bytes(buf);
+        return (method,cls,attributeModifier,mask,packed);
+
+    @staticmethod
+    def _packed(rpayload):
+        """Return a :class:`list` of the records in the reply *rpayload*
+        packed into :class:`bytes`."""
+        if isinstance(rpayload,rdma.madtransactor.RecordTable):
+            rpayload = list(rpayload.records());
+        elif not isinstance(rpayload,list):
+            rpayload = [rpayload];
+        res = [];
+        for I in rpayload:
+            buf = bytearray(I.MAD_LENGTH);
+            I.pack_into(buf);
+            res.append(bytes(buf));
+        return res;
+
+    def _select(self,key,payload):
+        """Answer the query from a cached full table, if possible. Return the
+        packed records that match or `None`."""
+        method,cls,attributeModifier,mask,packed = key;
+        ent = self._tables.get(cls);
+        if ent is None or attributeModifier != 0:
+            return None;
+        if ent[0] <= rdma.tools.clock_monotonic():
+            del self._tables[cls];
+            return None;
+        if mask == 0:
+            res = ent[2];
+        else:
+            key = cls.component_key(mask);
+            want = key(payload.payload);
+            packed = ent[3];
+            res = [packed[id(I)] for I in ent[1] if key(I) == want];
+        # No match is a valid table answer, but a Get needs exactly one.
+        if method == IBA.MAD_METHOD_GET and len(res) != 1:
+            return None;
+        return res;
+
+    def get(self,key,payload):
+        """Return a copy of the cached reply for *key*, the query *payload*,
+        or `None`."""
+        ent = self._entries.get(key);
+        if ent is not None and ent[0] <= rdma.tools.clock_monotonic():
+            del self._entries[key];
+            ent = None;
+        if ent is not None:
+            res = ent[1];
+        else:
+            res = None;
+            cls = key[1];
+            if not any(I.endswith("Selector") for I in cls.COMPONENT_MASK):
+                # The selector fields can't be matched against a table.
+                res = self._select(key,payload);
+        if res is None:
+            self.misses = self.misses + 1;
+            return None;
+        self.hits = self.hits + 1;
+        cls = key[1];
+        if key[0] == IBA.MAD_METHOD_GET:
+            return cls(res[0]);
+        return [cls(I) for I in res];
+
+    def add(self,key,rpayload):
+        """Store the reply *rpayload* for *key*."""
+        method,cls,attributeModifier,mask,packed = key;
+        expire = rdma.tools.clock_monotonic() + self.ttl;
+        res = self._packed(rpayload);
+        if (method == IBA.MAD_METHOD_GET_TABLE and mask == 0 and
+            attributeModifier == 0):
+            # The decoded records are only used for matching, they are never
+            # returned. The last item maps them to their packed form.
+            recs = [cls(I) for I in res];
+            self._tables[cls] = (expire,recs,res,
+                                 dict(itertools.izip(map(id,recs),res)));
+        else:
+            self._entries[key] = (expire,res);
+
 class SATransactor(rdma.madtransactor.MADTransactor):
     """This class wrappers another MADTransactor and transparently changes SMP
     queries into corrisponding SA queries. It is useful to write applications
@@ -21,16 +151,22 @@ class SATransactor(rdma.madtransactor.MADTransactor):
     the DR path to a LID through the SA.
 
     The class will collect and cache information in the path to try and work
-    around some of these issues.
+    around some of these issues. An :class:`SACache` can be used to avoid
+    repeating SA queries.
 
     It is also a context manager that wrappers the *parent*'s :meth:`close`."""
 
-    def __init__(self,parent,sa_path=None):
+    #: The :class:`SACache` used for SA queries, or `None`.
+    cache = None;
+
+    def __init__(self,parent,sa_path=None,cache=None):
         """*parent* is the :class:`~rdma.madtransactor.MADTransactor` we are
-        wrappering."""
+        wrappering. *cache* is an :class:`SACache`, it may be shared with
+        other instances."""
         self._parent = parent;
         self.end_port = parent.end_port;
         self.sa_path = sa_path or self.end_port.sa_path;
+        self.cache = cache;
 
     def get_path_lid(self,path):
         """Resolve *path* to a LID. This is only does something if *path*
@@ -75,7 +211,7 @@ class SATransactor(rdma.madtransactor.MADTransactor):
         for I in path.drPath[1:]:
             req.fromLID = start_lid;
             req.fromPort = ord(I);
-            rep = yield self._parent.SubnAdmGet(req);
+            rep = yield self.SubnAdmGet(req);
             start_lid = rep.toLID;
         path._cached_resolved_dlid = start_lid;
         self._parent.result = start_lid;
@@ -116,9 +252,54 @@ class SATransactor(rdma.madtransactor.MADTransactor):
         self.req_path._cached_node_type = rpayload.nodeInfo.nodeType;
         return rpayload.nodeInfo;
 
+    def _cache_completer(self,key,completer):
+        """Wrapper *completer* so that successful replies are stored in the
+        cache under *key*."""
+        def store(rpayload):
+            status = self._parent.reply_fmt.status;
+            if (status >> IBA.MAD_STATUS_CLASS_SHIFT) & IBA.MAD_STATUS_CLASS_MASK == 0:
+                self.cache.add(key,rpayload);
+            if completer is None:
+                return rpayload;
+            if isinstance(completer,tuple):
+                return completer[0](rpayload);
+            return completer(rpayload);
+        if isinstance(completer,tuple):
+            return (store,completer[1]);
+        return store;
+
+    def _complete_cached(self,rpayload,path,completer):
+        if completer is None:
+            return rpayload;
+        if isinstance(completer,tuple):
+            completer = completer[0];
+        self._parent.req_path = path;
+        try:
+            return completer(rpayload);
+        finally:
+            self._parent.req_path = None;
+
+    def _cached_async(self,rpayload,path,completer):
+        """Coroutine to return a cached reply."""
+        self._parent.result = self._complete_cached(rpayload,path,completer);
+        return;
+        yield None;
+
     def _subn_adm_do(self,payload,path,attributeModifier,method,completer=None):
         if path is None:
             path = self.sa_path
+        if self.cache is not None:
+            if (method != IBA.MAD_METHOD_GET and
+                method != IBA.MAD_METHOD_GET_TABLE):
+                self.cache.clear();
+            else:
+                key = self.cache.make_key(payload,attributeModifier,method);
+                rpayload = self.cache.get(key,payload);
+                if rpayload is not None:
+                    if self.is_async:
+                        return self._cached_async(rpayload,path,completer);
+                    return self._complete_cached(rpayload,path,completer);
+                completer = self._cache_completer(key,completer);
         return rdma.madtransactor.MADTransactor._subn_adm_do(self,payload,path,attributeModifier,method,completer)
 
     def SubnGet(self,payload,path,attributeModifier=0):
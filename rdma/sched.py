@@ -10,6 +10,9 @@ class Context(object):
     _work = None;
     _retries = 0;
     _first = False;
+    _busy = 0;
+    _redirects = 0;
+    _delayed = False;
 
     def __init__(self,op,gengen,parent=None):
         self._opstack = collections.deque();
@@ -47,6 +50,7 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
         self.end_port = umad.end_port;
         self._umad = umad;
         self.trace_func = umad.trace_func
+        self.stats = umad.stats;
         self._keys = {};
         self._timeouts = []
         self._mqueue = collections.deque();
@@ -60,12 +64,15 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
         if rep:
             self._replyqueue.append(rep);
 
-        itm = (path.mad_timeout + rdma.tools.clock_monotonic(),ctx);
+        now = rdma.tools.clock_monotonic();
+        ctx._rmatch = rmatch = self._get_reply_match_key(buf);
+        if self.stats is not None:
+            self.stats.start(rmatch,now);
+        itm = (path.mad_timeout + now,ctx);
         ctx._work = work;
         ctx._retries = path.retries;
         bisect.insort(self._timeouts,itm);
 
-        ctx._rmatch = rmatch = self._get_reply_match_key(buf);
         assert(rmatch not in self._keys);
         self._keys[rmatch] = itm;
 
@@ -150,6 +157,8 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
                     ctx._op = work;
                 continue;
 
+            ctx._busy = 0;
+            ctx._redirects = 0;
             try:
                 self._sendMAD(ctx,work);
             except:
@@ -226,19 +235,50 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
             if res:
                 del self._keys[rmatch];
                 self._timeouts.remove(res);
+                ctx = res[1];
+                ctx._delayed = False;
+                work = ctx._work
                 try:
-                    work = res[1]._work
-                    res[1]._result = self._completeMAD(ret,work.fmt,
-                                                       work.path,
-                                                       work.newer,
-                                                       work.completer);
+                    ctx._result = self._completeMAD(ret,work.fmt,
+                                                    work.path,
+                                                    work.newer,
+                                                    work.completer,
+                                                    rmatch);
+                except rdma.MADBusyError:
+                    delay = self._get_busy_delay(ctx._busy);
+                    if delay is not None:
+                        ctx._busy = ctx._busy + 1;
+                        self._delay_resend(ctx,delay);
+                        continue;
+                    ctx._exc = sys.exc_info();
+                except rdma.MADRedirectError, err:
+                    path = self._follow_redirect(err,ctx._redirects);
+                    if path is None:
+                        ctx._exc = sys.exc_info();
+                    else:
+                        ctx._redirects = ctx._redirects + 1;
+                        try:
+                            self._sendMAD(ctx,work._replace(path=path));
+                            continue;
+                        except:
+                            ctx._exc = sys.exc_info();
                 except:
-                    res[1]._exc = sys.exc_info();
-                self._step(res[1]);
+                    ctx._exc = sys.exc_info();
+                self._step(ctx);
             else:
                 if self.trace_func is not None:
                     self.trace_func(self,rdma.madtransactor.TRACE_UNEXPECTED,
                                     ret=ret);
+                if self.stats is not None:
+                    self.stats.unexpected += 1;
+
+    def _delay_resend(self,ctx,delay):
+        """Resend the MAD for *ctx* after *delay* seconds. Until then it
+        counts as outstanding, but other work continues."""
+        itm = (rdma.tools.clock_monotonic() + delay,ctx);
+        ctx._delayed = True;
+        bisect.insort(self._timeouts,itm);
+        self._keys[ctx._rmatch] = itm;
 
     def _do_timeout(self,res):
         """The timeout list entry *res* has timed out - either error it
@@ -246,12 +286,20 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
         ctx = res[1]
         work = ctx._work;
         del self._keys[ctx._rmatch];
+        if ctx._delayed:
+            ctx._delayed = False;
+            try:
+                self._sendMAD(ctx,work);
+            except:
+                ctx._exc = sys.exc_info();
+                self._step(ctx);
+            return;
         if ctx._retries == 0:
             # Pass the timeout back into MADTransactor and capture the
             # result
             try:
                 self._completeMAD(None,work.fmt,work.path,
-                                  work.newer,work.completer);
+                                  work.newer,work.completer,ctx._rmatch);
             except:
                 ctx._exc = sys.exc_info();
                 self._step(ctx);
@@ -264,6 +312,8 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
         if self.trace_func is not None:
             self.trace_func(self,rdma.madtransactor.TRACE_RECEIVE,
                             fmt=work.fmt,path=work.path);
+        if self.stats is not None:
+            self.stats.retry(work.buf,work.path);
         rep = self._umad._execute(work.buf,work.path,sendOnly=True);
         if rep:
             self._replyqueue.append(rep);
@@ -274,6 +324,7 @@ class MADSchedule(rdma.madtransactor.MADTransactor):
     # Implement the MADTransactor interface. This is the asynchronous use model,
     # where the RPC functions return the work to do, not the result.
     def _doMAD(self,fmt,payload,path,attributeModifier,method,completer=None):
+        path = self._get_redirect(fmt.MAD_CLASS,path);
         buf = self._prepareMAD(fmt,payload,attributeModifier,method,path);
         newer = payload if isinstance(payload,type) else payload.__class__;
         return self.Work(buf,fmt,path,newer,completer);
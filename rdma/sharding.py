@@ -0,0 +1,238 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+"""Split per node fabric sweeps across several processes."""
+import multiprocessing;
+import sys;
+import traceback;
+import rdma;
+import rdma.sched;
+import rdma.subnet;
+import rdma.IBA as IBA;
+
+class ShardTask(object):
+    """Describe a piece of per item work for :func:`run_sharded`. The
+    coroutine :meth:`fetch` runs in a worker process against the worker's
+    copy of the :class:`rdma.subnet.Subnet`, :meth:`pack` turns the result
+    into a small picklable record that is sent to the parent, where
+    :meth:`merge` stores it into the parent's subnet. Records are sent
+    through a pipe and merged serially, so they should be compact and cheap
+    to merge. MAD attributes are sent as their packed :class:`bytes` and
+    decoded by the parent only when they are used, anything the worker can
+    work out from them is sent along with them."""
+    #: The local :class:`rdma.devices.EndPort`, set by :func:`run_sharded`
+    end_port = None;
+
+    def items(self,sbn):
+        """Return a :class:`list` of the items to work on."""
+        raise NotImplementedError();
+
+    def fetch(self,sched,sbn,item):
+        """Coroutine to fetch the data for *item*."""
+        raise NotImplementedError();
+
+    def pack(self,sbn,item):
+        """Return the picklable record for *item* after :meth:`fetch`."""
+        raise NotImplementedError();
+
+    def merge(self,sbn,item,rec):
+        """Store the record *rec* for *item* into *sbn*."""
+        raise NotImplementedError();
+
+def _packed(obj):
+    """Return *obj*, a :class:`rdma.binstruct.BinStruct`, as :class:`bytes`."""
+    if obj is None:
+        return None;
+    buf = bytearray(obj.MAD_LENGTH);
+    obj.pack_into(buf);
+    return bytes(buf);
+
+class PortInfoTask(ShardTask):
+    """Fetch :class:`rdma.IBA.SMPPortInfo` for every port that does not have
+    it, like the `all_PortInfo` item of :func:`rdma.discovery.load`. The
+    worker sends the LID and LMC to record for the end port along with the
+    packed PortInfo, which the parent stores in a
+    :class:`rdma.subnet.LazyPort`."""
+    def items(self,sbn):
+        return [I for I in sbn.iterports() if I[0].pinf is None];
+
+    def fetch(self,sched,sbn,item):
+        path = sbn.get_path_smp(sched,item[0].to_end_port());
+        item[0].pinf = yield sched.SubnGet(IBA.SMPPortInfo,path,item[1]);
+
+    def pack(self,sbn,item):
+        # Same test as rdma.subnet.Subnet.get_port_pinf
+        pinf = item[0].pinf;
+        if pinf.LID != 0 and pinf.LID < IBA.LID_MULTICAST:
+            return (_packed(pinf),pinf.LID,pinf.LMC);
+        return (_packed(pinf),None,None);
+
+    def merge(self,sbn,item,rec):
+        port = item[0];
+        if rec[1] is not None:
+            sbn.link_end_port(port.to_end_port(),LID=rec[1],LMC=rec[2]);
+        port.set_packed_pinf(rec[0]);
+
+class SwitchFDBTask(ShardTask):
+    """Fetch the linear and/or multicast forwarding tables of every switch
+    using :meth:`rdma.subnet.Switch.get_switch_fdb`. SwitchInfo is fetched
+    for switches that do not have it. The LFDB is sent back as a string of
+    port numbers, SwitchInfo is only sent if the worker fetched it."""
+    def __init__(self,do_lfdb=True,do_mfdb=False):
+        self.do_lfdb = do_lfdb;
+        self.do_mfdb = do_mfdb;
+        self.new_swinf = set();
+
+    def items(self,sbn):
+        return list(sbn.iterswitches());
+
+    def fetch(self,sched,sbn,item):
+        path = sbn.get_path_smp(sched,item.get_port(0));
+        if item.swinf is None:
+            yield item.get_switch_inf(sched,path);
+            self.new_swinf.add(item);
+        yield item.get_switch_fdb(sched,self.do_lfdb,self.do_mfdb,path);
+
+    def pack(self,sbn,item):
+        lfdb = item.lfdb;
+        if lfdb is not None and None not in lfdb:
+            lfdb = bytes(bytearray(lfdb));
+        return (_packed(item.swinf) if item in self.new_swinf else None,
+                lfdb,item.mfdb);
+
+    def merge(self,sbn,item,rec):
+        if rec[0] is not None:
+            item.swinf = IBA.SMPSwitchInfo(rec[0]);
+        if isinstance(rec[1],bytes):
+            item.lfdb = list(bytearray(rec[1]));
+        elif rec[1] is not None:
+            item.lfdb = rec[1];
+        if rec[2] is not None:
+            item.mfdb = rec[2];
+
+class PortCountersTask(ShardTask):
+    """Fetch :class:`rdma.IBA.PMPortCounters` for every port that has a LID,
+    using the GMP path of its end port. The results are stored in
+    :attr:`counters`, GMP paths resolved by the workers are stored in the
+    ports. Paths the worker already had are not sent back."""
+    def __init__(self):
+        #: :class:`dict` of tuple(:class:`rdma.subnet.Port`,portIdx) to
+        #: :class:`rdma.IBA.PMPortCounters`
+        self.counters = {};
+        self.new_paths = set();
+
+    def items(self,sbn):
+        return [I for I in sbn.iterports()
+                if I[0].to_end_port().LID is not None and
+                (I[1] != 0 or not isinstance(I[0].parent,rdma.subnet.Switch))];
+
+    def fetch(self,sched,sbn,item):
+        ep = item[0].to_end_port();
+        old = ep.gmp_path;
+        path = yield sbn.get_gmp_path(sched,ep);
+        if ep.gmp_path is not old:
+            self.new_paths.add(ep);
+        req = IBA.PMPortCounters();
+        req.portSelect = item[1];
+        self.counters[item] = yield sched.PerformanceGet(req,path);
+
+    def pack(self,sbn,item):
+        ep = item[0].to_end_port();
+        if ep in self.new_paths:
+            return (_packed(self.counters[item]),ep.gmp_path,
+                    ep.gmp_path_time);
+        return (_packed(self.counters[item]),);
+
+    def merge(self,sbn,item,rec):
+        self.counters[item] = IBA.PMPortCounters(rec[0]);
+        if len(rec) > 1:
+            ep = item[0].to_end_port();
+            ep.gmp_path,ep.gmp_path_time = rec[1:];
+            sbn.cache_dirty = True;
+
+def _run_shard(umad,sbn,task,items,indexes,max_outstanding,errors):
+    """Run *task* on the *indexes* of *items*, return the packed records."""
+    sched = rdma.sched.MADSchedule(umad);
+    if max_outstanding is not None:
+        sched.max_outstanding = max_outstanding;
+    res = [];
+    def do(idx):
+        try:
+            yield task.fetch(sched,sbn,items[idx]);
+        except rdma.MADError,e:
+            errors.append("%s: %s"%(items[idx],e));
+            return;
+        res.append((idx,task.pack(sbn,items[idx])));
+    sched.run(mqueue=(do(I) for I in indexes));
+    return res;
+
+def _worker(conn,index,nworkers,get_umad,sbn,task,items,max_outstanding):
+    try:
+        with get_umad(task.end_port) as umad:
+            # Give every worker a disjoint range of transaction IDs
+            umad._tid = (index << 32)//nworkers;
+            errors = [];
+            res = _run_shard(umad,sbn,task,items,
+                             range(index,len(items),nworkers),
+                             max_outstanding,errors);
+        conn.send((res,errors,None));
+    except:
+        conn.send(([],[],"".join(traceback.format_exception(*sys.exc_info()))));
+    conn.close();
+
+def run_sharded(end_port,sbn,task,workers=None,get_umad=rdma.get_umad,
+                max_outstanding=None):
+    """Run *task*, a :class:`ShardTask`, over the items it selects from *sbn*
+    using *workers* processes, which defaults to the number of CPUs. Each
+    worker is forked with a copy of *sbn*, opens its own UMAD on *end_port*
+    with *get_umad*, takes every *workers*'th item and runs them with a
+    :class:`rdma.sched.MADSchedule`. The records returned by the workers
+    are merged into *sbn* in this process. This spreads the MAD encode,
+    decode and bookkeeping of large sweeps over several CPUs.
+
+    If *workers* is 1 the task runs in this process.
+
+    :returns: A :class:`list` of error strings for items that failed with a
+       :exc:`rdma.MADError`.
+    :raises rdma.RDMAError: If a worker failed."""
+    task.end_port = end_port;
+    items = task.items(sbn);
+    if workers is None:
+        workers = multiprocessing.cpu_count();
+    workers = max(1,min(workers,len(items)));
+    errors = [];
+
+    if workers == 1:
+        with get_umad(end_port) as umad:
+            res = _run_shard(umad,sbn,task,items,range(len(items)),
+                             max_outstanding,errors);
+        for idx,rec in res:
+            task.merge(sbn,items[idx],rec);
+        return errors;
+
+    procs = [];
+    for I in range(workers):
+        rconn,wconn = multiprocessing.Pipe(False);
+        proc = multiprocessing.Process(
+            target=_worker,
+            args=(wconn,I,workers,get_umad,sbn,task,items,max_outstanding));
+        proc.daemon = True;
+        proc.start();
+        wconn.close();
+        procs.append((proc,rconn));
+
+    failed = None;
+    for proc,rconn in procs:
+        try:
+            res,werrors,exc = rconn.recv();
+        except EOFError:
+            res,werrors,exc = [],[],"Worker process %u exited"%(proc.pid);
+        rconn.close();
+        proc.join();
+        if exc is not None:
+            failed = exc;
+            continue;
+        errors.extend(werrors);
+        for idx,rec in res:
+            task.merge(sbn,items[idx],rec);
+    if failed is not None:
+        raise rdma.RDMAError("Sharded sweep worker failed:\n%s"%(failed));
+    return errors;
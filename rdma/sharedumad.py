@@ -0,0 +1,328 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+"""Share a single :class:`rdma.umad.UMAD` between threads."""
+import heapq;
+import itertools;
+import sys;
+import threading;
+import rdma;
+import rdma.madtransactor;
+import rdma.tools;
+
+try:
+    from concurrent.futures import Future as MADFuture;
+except ImportError:
+    class MADFuture(object):
+        """A minimal version of :class:`concurrent.futures.Future`, used if
+        the :mod:`concurrent.futures` module is not available."""
+        _result = None;
+        _exc_info = None;
+
+        def __init__(self):
+            self._event = threading.Event();
+            self._callbacks = [];
+            self._lock = threading.Lock();
+
+        def done(self):
+            return self._event.is_set();
+
+        def cancel(self):
+            return False;
+
+        def cancelled(self):
+            return False;
+
+        def running(self):
+            return not self.done();
+
+        def result(self,timeout=None):
+            if not self._event.wait(timeout):
+                raise rdma.RDMAError("Timed out waiting for the MAD future.");
+            if self._exc_info is not None:
+                raise self._exc_info[0],self._exc_info[1],self._exc_info[2];
+            return self._result;
+
+        def exception(self,timeout=None):
+            if not self._event.wait(timeout):
+                raise rdma.RDMAError("Timed out waiting for the MAD future.");
+            if self._exc_info is not None:
+                return self._exc_info[1];
+            return None;
+
+        def add_done_callback(self,fn):
+            with self._lock:
+                if not self._event.is_set():
+                    self._callbacks.append(fn);
+                    return;
+            fn(self);
+
+        def _finish(self):
+            with self._lock:
+                self._event.set();
+                callbacks = self._callbacks;
+                self._callbacks = None;
+            for I in callbacks:
+                I(self);
+
+        def set_result(self,result):
+            self._result = result;
+            self._finish();
+
+        def set_exception(self,exc):
+            self._exc_info = (exc.__class__,exc,None);
+            self._finish();
+
+        def set_exception_info(self,exc,tb):
+            self._exc_info = (exc.__class__,exc,tb);
+            self._finish();
+
+class _Request(object):
+    """An outstanding MAD."""
+    __slots__ = ("buf","fmt","path","newer","completer","future","rmatch",
+                 "retries","expire","busy","redirects","delayed");
+
+class SharedUMAD(rdma.madtransactor.MADTransactor):
+    """A :class:`~rdma.madtransactor.MADTransactor` that lets any number of
+    threads issue MADs through one :class:`rdma.umad.UMAD`. Every RPC method
+    returns immediately with a :class:`MADFuture`, which is a
+    :class:`concurrent.futures.Future` if that module is available, so
+    :func:`concurrent.futures.wait` and :func:`concurrent.futures.as_completed`
+    can be used with them. Call `result()` on the future to get the decoded
+    reply or the exception.
+
+    A dedicated receive thread reads every reply, matches it to the request
+    using :meth:`~rdma.madtransactor.MADTransactor._get_match_key` and handles
+    resends, timeouts, BUSY replies and redirects. Transaction IDs are
+    allocated without locking. The decode of a reply and any completer run
+    with an internal lock held, usually on the receive thread, so they must
+    not wait for other futures.
+
+    If reading from *umad* fails the instance closes itself, every outstanding
+    future fails with that exception and new requests raise
+    :exc:`rdma.RDMAError`.
+
+    This class owns *umad* while it is open, it must not be used directly by
+    anything else. The helpers in :mod:`rdma.path` and
+    :class:`rdma.satransactor.SATransactor` expect an immediate result and
+    cannot be used with this class. This class supports the context manager
+    protocol."""
+
+    #: Longest time in seconds the receive thread sleeps before checking
+    #: for :meth:`close`
+    poll_interval = 0.1;
+
+    def __init__(self,umad):
+        """*umad* is the :class:`rdma.umad.UMAD` to use."""
+        rdma.madtransactor.MADTransactor.__init__(self);
+        self._umad = umad;
+        self.end_port = umad.end_port;
+        self.trace_func = umad.trace_func;
+        self.stats = umad.stats;
+        self._tids = itertools.count(umad._get_new_TID());
+
+        # _lock protects _pending and _timeouts, _send_lock the UMAD send
+        # path and _complete_lock the reply decode.
+        self._lock = threading.Lock();
+        self._send_lock = threading.Lock();
+        self._complete_lock = threading.Lock();
+        self._pending = {};
+        self._timeouts = [];
+        self._closing = False;
+        # sys.exc_info() of the failure that stopped the receive thread
+        self._error = None;
+
+        self._thread = threading.Thread(target=self._receiver,
+                                        name="SharedUMAD %s"%(self.end_port));
+        self._thread.daemon = True;
+        self._thread.start();
+
+    def _get_new_TID(self):
+        return next(self._tids) & 0xFFFFFFFF;
+
+    @property
+    def outstanding(self):
+        """The number of outstanding requests."""
+        return len(self._pending);
+
+    def _add_timer(self,req,expire):
+        req.expire = expire;
+        heapq.heappush(self._timeouts,(expire,req.rmatch,req));
+
+    def _closed_error(self):
+        if self._error is not None:
+            return rdma.RDMAError("SharedUMAD %s failed: %s"%(
+                self.end_port,self._error[1]));
+        return rdma.RDMAError("SharedUMAD %s is closed"%(self.end_port));
+
+    def _send(self,req):
+        """Send *req*, which must not be pending."""
+        req.retries = req.path.retries;
+        req.delayed = False;
+        now = rdma.tools.clock_monotonic();
+        with self._lock:
+            if self._closing:
+                req.future.set_exception(self._closed_error());
+                return;
+            if req.rmatch in self._pending:
+                raise rdma.RDMAError("Duplicate transaction ID for %s"%(
+                    req.fmt.describe()));
+            if self.stats is not None:
+                self.stats.start(req.rmatch,now);
+            self._pending[req.rmatch] = req;
+            self._add_timer(req,req.path.mad_timeout + now);
+        self._resend(req);
+
+    def _resend(self,req):
+        try:
+            with self._send_lock:
+                rep = self._umad._execute(req.buf,req.path,sendOnly=True);
+        except:
+            with self._lock:
+                self._pending.pop(req.rmatch,None);
+            if self.stats is not None:
+                self.stats.discard(req.rmatch);
+            req.future.set_exception_info(*sys.exc_info()[1:]);
+            return;
+        if rep:
+            self._dispatch(rep);
+
+    def _doMAD(self,fmt,payload,path,attributeModifier,method,completer=None):
+        if self._closing:
+            raise self._closed_error();
+        req = _Request();
+        req.path = self._get_redirect(fmt.MAD_CLASS,path);
+        req.buf = self._prepareMAD(fmt,payload,attributeModifier,method,
+                                   req.path);
+        req.fmt = fmt;
+        req.newer = payload if isinstance(payload,type) else payload.__class__;
+        req.completer = completer;
+        req.future = MADFuture();
+        req.rmatch = self._get_reply_match_key(req.buf);
+        req.busy = 0;
+        req.redirects = 0;
+        self._send(req);
+        return req.future;
+
+    def _finish(self,req,ret):
+        """Complete *req* with the reply *ret*, or `None` for a timeout."""
+        try:
+            with self._complete_lock:
+                res = self._completeMAD(ret,req.fmt,req.path,req.newer,
+                                        req.completer,req.rmatch);
+        except rdma.MADBusyError:
+            delay = self._get_busy_delay(req.busy);
+            if delay is not None:
+                req.busy = req.busy + 1;
+                req.delayed = True;
+                with self._lock:
+                    self._pending[req.rmatch] = req;
+                    self._add_timer(req,delay + rdma.tools.clock_monotonic());
+                return;
+            req.future.set_exception_info(*sys.exc_info()[1:]);
+        except rdma.MADRedirectError, err:
+            path = self._follow_redirect(err,req.redirects);
+            if path is not None:
+                req.redirects = req.redirects + 1;
+                req.path = path;
+                self._send(req);
+                return;
+            req.future.set_exception_info(*sys.exc_info()[1:]);
+        except:
+            req.future.set_exception_info(*sys.exc_info()[1:]);
+        else:
+            req.future.set_result(res);
+
+    def _dispatch(self,ret):
+        rmatch = self._get_match_key(ret[0]);
+        with self._lock:
+            req = self._pending.pop(rmatch,None);
+        if req is None:
+            if self.trace_func is not None:
+                self.trace_func(self,rdma.madtransactor.TRACE_UNEXPECTED,
+                                ret=ret);
+            if self.stats is not None:
+                self.stats.unexpected += 1;
+            return;
+        self._finish(req,ret);
+
+    def _do_timeouts(self):
+        now = rdma.tools.clock_monotonic();
+        while True:
+            with self._lock:
+                if not self._timeouts or self._timeouts[0][0] > now:
+                    return;
+                expire,rmatch,req = heapq.heappop(self._timeouts);
+                # Entries for requests that completed or were rescheduled
+                # are skipped.
+                if self._pending.get(rmatch) is not req or req.expire != expire:
+                    continue;
+                resend = not req.delayed and req.retries != 0;
+                if resend:
+                    req.retries = req.retries - 1;
+                    self._add_timer(req,req.path.mad_timeout + now);
+                else:
+                    del self._pending[rmatch];
+            if resend:
+                if self.trace_func is not None:
+                    self.trace_func(self,rdma.madtransactor.TRACE_RECEIVE,
+                                    fmt=req.fmt,path=req.path);
+                if self.stats is not None:
+                    self.stats.retry(req.buf,req.path);
+                self._resend(req);
+            elif req.delayed:
+                self._send(req);
+            else:
+                self._finish(req,None);
+
+    def _receiver(self):
+        try:
+            while not self._closing:
+                wakeat = rdma.tools.clock_monotonic() + self.poll_interval;
+                with self._lock:
+                    if self._timeouts and self._timeouts[0][0] < wakeat:
+                        wakeat = self._timeouts[0][0];
+                ret = self._umad.recvfrom(wakeat);
+                if ret is not None:
+                    self._dispatch(ret);
+                # A steady stream of replies must not starve the timers.
+                with self._lock:
+                    expired = (self._timeouts and self._timeouts[0][0] <=
+                               rdma.tools.clock_monotonic());
+                if expired:
+                    self._do_timeouts();
+        except:
+            self._fail(sys.exc_info());
+
+    def _fail(self,exc_info):
+        """The receive thread cannot continue, fail everything with
+        *exc_info*."""
+        with self._lock:
+            self._error = exc_info;
+            self._closing = True;
+            reqs = self._pending.values();
+            self._pending.clear();
+            del self._timeouts[:];
+        for I in reqs:
+            if self.stats is not None:
+                self.stats.discard(I.rmatch);
+            I.future.set_exception_info(*exc_info[1:]);
+
+    def close(self):
+        """Stop the receive thread. Outstanding requests fail with
+        :exc:`rdma.MADTimeoutError`. *umad* is not closed."""
+        if self._closing:
+            return;
+        self._closing = True;
+        if self._thread is not threading.current_thread():
+            self._thread.join();
+        with self._lock:
+            reqs = self._pending.values();
+            self._pending.clear();
+            del self._timeouts[:];
+        for I in reqs:
+            self._finish(I,None);
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        self.close();
@@ -1,5 +1,6 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 import collections;
+import time;
 import rdma;
 import rdma.path;
 import rdma.satransactor;
@@ -19,6 +20,11 @@ class Node(object):
     desc = None;
     #: Array of :class`Port`. Note: CA port 1 is stored in index 1.
     ports = None;
+    #: Instance of :class:`rdma.IBA.MADClassPortInfo` from the node's PMA,
+    #: see :meth:`Subnet.get_pma_cpinf`.
+    pma_cpinf = None;
+    #: :func:`time.time` when :attr:`pma_cpinf` was fetched.
+    pma_cpinf_time = None;
 
     def get_port_nc(self,portIdx):
         """Return the port for index *portIdx*, or `None` if it does not
@@ -113,6 +119,11 @@ class Port(object):
     portGUID = None;
     #: Base LID if it is an end port
     LID = None;
+    #: :class:`rdma.path.IBPath` for GMPs to this end port, see
+    #: :meth:`Subnet.get_gmp_path`.
+    gmp_path = None;
+    #: :func:`time.time` when :attr:`gmp_path` was resolved.
+    gmp_path_time = None;
 
     def __init__(self,parent):
         if parent is not None:
@@ -123,6 +134,13 @@ class Port(object):
         For switches this returns port 0, otherwise it returns itself."""
         return self.parent.to_end_port(self);
 
+    def set_packed_pinf(self,buf):
+        """Store the packed :class:`rdma.IBA.SMPPortInfo` *buf* as
+        :attr:`pinf`, it is unpacked the first time it is used. See
+        :class:`LazyPort`."""
+        self.pinf = buf;
+        self.__class__ = LazyPort;
+
     @property
     def port_id(self):
         """The port number for this port."""
@@ -133,6 +151,17 @@ class Port(object):
         return "<Port #%u %s %s 0x%x>"%(self.port_id,
                                         ep.portGUID,ep.LID,id(self))
 
+class LazyPort(Port):
+    """Similar to :class:`Port` but :attr:`pinf` is still the packed
+    :class:`rdma.IBA.SMPPortInfo`, it is unpacked and the instance becomes a
+    :class:`Port` the first time :attr:`pinf` is requested."""
+    def __getattribute__(self,name):
+        if name == "pinf":
+            object.__setattr__(self,"__class__",Port);
+            d = object.__getattribute__(self,"__dict__");
+            d["pinf"] = IBA.SMPPortInfo(d["pinf"]);
+        return object.__getattribute__(self,name);
+
 class CA(Node):
     """Hold onto information about a single CA node in the network."""
 
@@ -285,6 +314,12 @@ class Subnet(object):
     loaded = None;
     #: `True` if routes are done via LID not DR
     lid_routed = True;
+    #: Number of seconds that cached PMA information and GMP paths are used
+    #: before they are fetched again.
+    cache_ttl = 15*60;
+    #: `True` if the cached PMA information or GMP paths have changed. This
+    #: is not saved when pickling.
+    cache_dirty = False;
 
     def __init__(self):
         self.nodes = {};
@@ -368,6 +403,84 @@ class Subnet(object):
             self.paths[end_port] = path;
         return path;
 
+    def _cache_valid(self,when):
+        return when is not None and time.time() - when < self.cache_ttl;
+
+    def _cached_gmp_path(self,sched,end_port):
+        """Return the cached GMP path to *end_port* if it can be used from
+        the local end port of *sched*."""
+        path = end_port.gmp_path;
+        if path is None or not self._cache_valid(end_port.gmp_path_time):
+            return None;
+        # The SM changed since the path was resolved.
+        if (end_port.gmp_path_time <=
+            rdma.path.path_cache.invalidated(sched.end_port)):
+            return None;
+        if path.SGID != sched.end_port.default_gid:
+            return None;
+        if path.end_port is None:
+            # The end port is not pickled.
+            path.end_port = sched.end_port;
+        return path;
+
+    def get_gmp_path(self,sched,end_port):
+        """Coroutine to return a GMP path to the PMA and other QP1 agents of
+        *end_port*. The path is resolved with the SA and kept in the port
+        for :attr:`cache_ttl` seconds.
+
+        :rtype: :class:`rdma.path.IBPath`"""
+        assert(end_port == end_port.to_end_port());
+        path = self._cached_gmp_path(sched,end_port);
+        if path is None:
+            path = yield rdma.path.get_mad_path(sched,end_port.portGUID,
+                                                dqpn=1,
+                                                qkey=IBA.IB_DEFAULT_QP1_QKEY);
+            end_port.gmp_path = path;
+            end_port.gmp_path_time = time.time();
+            self.cache_dirty = True;
+        sched.result = path;
+
+    def prefetch_gmp_paths(self,sched,end_ports):
+        """Coroutine to resolve GMP paths for all the end ports in *end_ports*
+        that do not have a valid cached path with a single
+        :class:`rdma.IBA.SAPathRecord` `SubnAdmGetTable`. End ports the SA
+        does not return a path for are left for :meth:`get_gmp_path`."""
+        todo = {};
+        for I in end_ports:
+            if (I.portGUID is not None and
+                self._cached_gmp_path(sched,I) is None):
+                todo[I.portGUID] = I;
+        if not todo:
+            return;
+
+        try:
+            res = yield rdma.path.prefetch_paths(sched,todo.keys());
+        except rdma.MADError:
+            # The caller will fall back to resolving one port at a time.
+            return;
+
+        now = time.time();
+        for guid,rep in res.iteritems():
+            port = todo[guid];
+            port.gmp_path = rdma.path.fill_path_from_pr(
+                rdma.path.IBPath(sched.end_port,dqpn=1,
+                                 qkey=IBA.IB_DEFAULT_QP1_QKEY),rep);
+            port.gmp_path_time = now;
+            self.cache_dirty = True;
+
+    def get_pma_cpinf(self,sched,node,path):
+        """Coroutine to return the :class:`rdma.IBA.MADClassPortInfo` for the
+        PMA of *node*, using *path* to fetch it if the cached copy is older
+        than :attr:`cache_ttl`. The response time of *path* is updated."""
+        cpinf = node.pma_cpinf;
+        if cpinf is None or not self._cache_valid(node.pma_cpinf_time):
+            cpinf = yield sched.PerformanceGet(IBA.MADClassPortInfo,path);
+            node.pma_cpinf = cpinf;
+            node.pma_cpinf_time = time.time();
+            self.cache_dirty = True;
+        path.resp_time = cpinf.respTimeValue;
+        sched.result = cpinf;
+
     def advance_dr(self,path,portIdx):
         """Create a new :class:`~rdma.path.IBDRPath` that goes to the
         device connected to *port_idx* of *path*."""
@@ -6,6 +6,10 @@ import rdma.IBA as IBA;
 import fcntl,struct,copy,errno,os,select;
 from socket import htonl as cpu_to_be32;
 from socket import htons as cpu_to_be16;
+try:
+    import rdma._umadfast as _umadfast;
+except ImportError:
+    _umadfast = None;
 
 SYS_INFINIBAND_MAD = "/sys/class/infiniband_mad/";
 
@@ -103,11 +107,15 @@ class UMAD(rdma.tools.SysFSDevice,rdma.madtransactor.MADTransactor):
             raise rdma.RDMAError("UMAD ABI is not compatible, we need PKey support.");
 
         self.sbuf = bytearray(320);
+        # Reused for every receive, it grows to hold the largest RMPP reply
+        # seen so far.
+        self._rbuf = bytearray(320);
 
-        fcntl.fcntl(self.dev.fileno(),fcntl.F_SETFL,
-                    fcntl.fcntl(self.dev.fileno(), fcntl.F_GETFL) | os.O_NONBLOCK);
+        self._fd = self.dev.fileno();
+        fcntl.fcntl(self._fd,fcntl.F_SETFL,
+                    fcntl.fcntl(self._fd, fcntl.F_GETFL) | os.O_NONBLOCK);
         self._poll = select.poll();
-        self._poll.register(self.dev.fileno(),select.POLLIN);
+        self._poll.register(self._fd,select.POLLIN);
 
         self._agent_cache = {};
         self._agent_id_dqpn = {};
@@ -241,35 +249,62 @@ class UMAD(rdma.tools.SysFSDevice,rdma.madtransactor.MADTransactor):
 
         if agent_id is None:
             agent_id = path.umad_agent_id;
+        timeout_ms = max(500,int(path.mad_timeout*1000)-500);
+        if _umadfast is not None:
+            _umadfast.send(self._fd,agent_id,timeout_ms,addr,buf);
+            return;
         self.ib_user_mad_t.pack_into(self.sbuf,0,
-                                     agent_id,0,
-                                     max(500,int(path.mad_timeout*1000)-500),0,
+                                     agent_id,0,timeout_ms,0,
                                      len(buf),
                                      addr);
         del self.sbuf[64:];
         self.sbuf.extend(buf);
         self.dev.write(self.sbuf);
 
-    def recvfrom(self,wakeat):
-        '''Receive a MAD packet. If the value of
-        :func:`rdma.tools.clock_monotonic()` exceeds *wakeat* then :class:`None`
-        is returned.
+    def _read(self):
+        """Read one MAD from the kernel, this is the pure Python version of
+        :func:`rdma._umadfast.recv`.
 
-        :returns: tuple(buf,path)'''
-        buf = bytearray(320);
-        first = True;
+        :returns: `None` if nothing is pending or
+           tuple(buf,agent_id,status,addr)"""
+        buf = self._rbuf;
         while True:
             try:
                 rc = self.dev.readinto(buf);
             except IOError as err:
                 if err.errno == errno.ENOSPC:
-                    # Hmm.. Must be RMPP.. Resize the buffer accordingly.
-                    rmpp_data2 = struct.unpack_from(">L",bytes(buf),32);
-                    buf = bytearray(min(len(buf)*2,rmpp_data2));
+                    # Hmm.. Must be RMPP.. The kernel returns the header with
+                    # the length of the reassembled MAD, resize the buffer
+                    # to fit it.
+                    length = self.ib_user_mad_t.unpack_from(bytes(buf[:64]),0)[4];
+                    if length <= len(buf):
+                        length = len(buf)*2;
+                    buf = bytearray(length);
+                    self._rbuf = buf;
                     continue;
                 raise;
-
             if rc is None:
+                return None;
+
+            (agent_id,status,timeout_ms,retries,length,
+             addr) = self.ib_user_mad_t.unpack_from(bytes(buf[:64]),0);
+            # The slice copies the reply out of the shared buffer.
+            return (buf[64:rc],agent_id,status,addr);
+
+    def recvfrom(self,wakeat):
+        '''Receive a MAD packet. If the value of
+        :func:`rdma.tools.clock_monotonic()` exceeds *wakeat* then :class:`None`
+        is returned.
+
+        :returns: tuple(buf,path)'''
+        first = True;
+        while True:
+            if _umadfast is not None:
+                ret = _umadfast.recv(self._fd,self._rbuf);
+            else:
+                ret = self._read();
+
+            if ret is None:
                 if not first:
                     raise IOError(errno.EAGAIN,"Invalid read after poll");
                 if wakeat is None:
@@ -282,10 +317,11 @@ class UMAD(rdma.tools.SysFSDevice,rdma.madtransactor.MADTransactor):
                 first = False;
                 continue;
 
+            buf,agent_id,status,addr = ret;
             path = rdma.path.IBPath(self.parent);
-            (path.umad_agent_id,status,timeout_ms,retries,length,
-             path._cached_umad_ah) = self.ib_user_mad_t.unpack_from(bytes(buf),0);
-            path.dqpn = self._agent_id_dqpn.get(path.umad_agent_id,0);
+            path.umad_agent_id = agent_id;
+            path._cached_umad_ah = addr;
+            path.dqpn = self._agent_id_dqpn.get(agent_id,0);
             path.__class__ = LazyIBPath;
 
             if status != 0:
@@ -293,7 +329,7 @@ class UMAD(rdma.tools.SysFSDevice,rdma.madtransactor.MADTransactor):
                     first = True;
                     continue;
                 raise rdma.RDMAError("umad send failure code=%d for %s"%(status,repr(buf)));
-            return (buf[64:rc],path);
+            return (buf,path);
 
     def _gen_error(self,buf,path):
         """Sadly the kernel can return EINVAL if it could not process the MAD,
@@ -352,6 +388,8 @@ class UMAD(rdma.tools.SysFSDevice,rdma.madtransactor.MADTransactor):
                 if retries == 0:
                     return None;
                 retries = retries - 1;
+                if self.stats is not None:
+                    self.stats.retry(buf,path);
                 self._execute(buf,path,True);
 
                 expire = path.mad_timeout + rdma.tools.clock_monotonic();
@@ -362,6 +400,8 @@ class UMAD(rdma.tools.SysFSDevice,rdma.madtransactor.MADTransactor):
                 if self.trace_func is not None:
                     self.trace_func(self,rdma.madtransactor.TRACE_UNEXPECTED,
                                     path=path,ret=ret);
+                if self.stats is not None:
+                    self.stats.unexpected += 1;
     def __repr__(self):
         return "<%s.%s object for %s at 0x%x>"%\
                (self.__class__.__module__,
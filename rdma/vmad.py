@@ -4,6 +4,7 @@ from __future__ import with_statement;
 import collections;
 import os;
 import rdma;
+import rdma.binstruct;
 import rdma.devices;
 import rdma.IBA as IBA;
 import rdma.ibverbs as ibv;
@@ -20,30 +21,25 @@ class VMAD(rdma.madtransactor.MADTransactor):
     _cq = None;
     _ctx = None;
     _allocated_ctx = False;
+    _loan = None;
+    _send_cqs = ();
 
     def __init__(self,parent,path,depth=16):
         """*path* is used to set the PKey and QKey for all MADs sent through
         this interface."""
         rdma.madtransactor.MADTransactor.__init__(self);
-        self._tid = int(os.urandom(8).encode("hex"),16);
-
-        if isinstance(parent,rdma.devices.EndPort):
-            self._ctx = rdma.get_verbs(parent);
-            self._allocated_ctx = True;
-        elif isinstance(parent,ibv.Context):
-            self._ctx = parent;
-        self.end_port = path.end_port;
-        if path.end_port.parent != self._ctx.node:
-            raise rdma.RDMAError("Cannot connect path %r to verbs %r"%(self._ctx,path))
+        self._open_ctx(parent,path);
 
         self._cc = self._ctx.comp_channel();
         self._cq = self._ctx.cq(2*depth,self._cc);
         self._poller = rdma.vtools.CQPoller(self._cq);
+        self._wcs = ibv.WCList(2*depth);
 
         self._pd = self._ctx.pd();
         self._pool = rdma.vtools.BufferPool(self._pd,2*depth,256+40);
         self._qp = self._pd.qp(ibv.IBV_QPT_UD,depth,self._cq,
                                depth,self._cq);
+        self._rq = self._qp;
         self._pool.post_recvs(self._qp,min(self._qp.max_recv_wr,depth));
         self._recvs = collections.deque();
 
@@ -56,9 +52,43 @@ class VMAD(rdma.madtransactor.MADTransactor):
         self.qkey = path.qkey;
         self.pkey = path.pkey;
 
+    def _open_ctx(self,parent,path):
+        self._tid = int(os.urandom(8).encode("hex"),16);
+        if isinstance(parent,rdma.devices.EndPort):
+            self._ctx = rdma.get_verbs(parent);
+            self._allocated_ctx = True;
+        elif isinstance(parent,ibv.Context):
+            self._ctx = parent;
+        self.end_port = path.end_port;
+        if path.end_port.parent != self._ctx.node:
+            raise rdma.RDMAError("Cannot connect path %r to verbs %r"%(self._ctx,path))
+
+    def _send_buf(self,buf,buf_idx):
+        """Place the MAD *buf* in the send buffer *buf_idx*. A
+        :class:`rdma.binstruct.BinStruct` is packed directly into the
+        registered memory.
+
+        :returns: The length of the MAD."""
+        if isinstance(buf,rdma.binstruct.BinStruct):
+            return self._pool.pack_into(buf,buf_idx);
+        self._pool.copy_to(buf,buf_idx);
+        return len(buf);
+
+    def _prepareMAD(self,fmt,payload,attributeModifier,method,path):
+        """Unless the raw MAD is needed for tracing or statistics the
+        request is kept as *fmt*, :meth:`sendto` packs it straight into the
+        send buffer."""
+        if self.trace_func is not None or self.stats is not None:
+            return rdma.madtransactor.MADTransactor._prepareMAD(
+                self,fmt,payload,attributeModifier,method,path);
+        self._fillMAD(fmt,payload,attributeModifier,method);
+        return fmt;
+
     def sendto(self,buf,path):
         '''Send a MAD packet. *buf* is the raw MAD to send, starting with the first
-        byte of :class:`rdma.IBA.MADHeader`. *path* is the destination.'''
+        byte of :class:`rdma.IBA.MADHeader`, or a
+        :class:`rdma.binstruct.BinStruct` MAD format to pack. *path* is the
+        destination.'''
         while not self._pool._buffers:
             self._cq_drain();
             if not self._pool._buffers:
@@ -68,36 +98,43 @@ class VMAD(rdma.madtransactor.MADTransactor):
             raise rdma.RDMAError("Destination %r does not match the qkey or pkey of this VMAD instance."%(path));
 
         buf_idx = self._pool.pop();
-        self._pool.copy_to(buf,buf_idx);
-        self._qp.post_send(self._pool.make_send_wr(buf_idx,len(buf),path));
+        length = self._send_buf(buf,buf_idx);
+        self._qp.post_send(self._pool.make_send_wr(buf_idx,length,path));
 
     def _cq_drain(self):
         """Empty the CQ and return and send buffers back to the pool. receive
         buffers are queued onto :attr:`_recvs` for later retrieval."""
-        wcs = self._cq.poll();
-        for I,wc in enumerate(wcs):
-            if wc.opcode == ibv.IBV_WC_RECV and wc.status == ibv.IBV_WC_SUCCESS:
-                wcs[I] = None;
-                self._recvs.appendleft(wc);
-        self._pool.finish_wcs(self._qp,wcs);
+        wcs = self._wcs;
+        while self._cq.poll_batch(wcs):
+            for I in xrange(len(wcs)):
+                if (wcs.opcode(I) == ibv.IBV_WC_RECV and
+                    wcs.status(I) == ibv.IBV_WC_SUCCESS):
+                    self._recvs.appendleft(wcs.wc(I));
+            self._pool.finish_wcs(self._rq,wcs,skip_recvs=True);
+            if len(wcs) < wcs.size:
+                break;
 
     def recvfrom(self,wakeat):
         '''Receive a MAD packet. If the value of
         :func:`rdma.tools.clock_monotonic()` exceeds *wakeat* then :class:`None`
         is returned.
 
+        *buf* is a :class:`memoryview` of the receive buffer, it is only valid
+        until the next call to this method, which re-posts the buffer.
+
         :returns: tuple(buf,path)'''
         pool = self._pool
+        self._loan = None;
         while True:
             if self._recvs:
                 wc = self._recvs.pop();
-                buf = pool.copy_from(wc.wr_id,40,wc.byte_len);
-                pool.finish_wcs(self._qp,wc);
-                return (buf,ibv.WCPath(self.end_port,wc,
-                                       pool._mem,
-                                       (wc.wr_id & pool.BUF_ID_MASK)*pool.size,
-                                       pkey=self.pkey,
-                                       qkey=self.qkey));
+                self._loan = pool.loan(self._rq,wc,40);
+                return (self._loan.buf,
+                        ibv.WCPath(self.end_port,wc,
+                                   pool._mem,
+                                   (wc.wr_id & pool.BUF_ID_MASK)*pool.size,
+                                   pkey=self.pkey,
+                                   qkey=self.qkey));
 
             self._cq.req_notify();
             self._cq_drain();
@@ -112,7 +149,10 @@ class VMAD(rdma.madtransactor.MADTransactor):
         self.sendto(buf,path);
         if sendOnly:
             return None;
-        rmatch = self._get_reply_match_key(buf);
+        if isinstance(buf,rdma.binstruct.BinStruct):
+            rmatch = (buf.mgmtClass << 32) | (buf.transactionID & 0xFFFFFFFF);
+        else:
+            rmatch = self._get_reply_match_key(buf);
         expire = path.mad_timeout + rdma.tools.clock_monotonic();
         retries = path.retries;
         while True:
@@ -121,6 +161,8 @@ class VMAD(rdma.madtransactor.MADTransactor):
                 if retries == 0:
                     return None;
                 retries = retries - 1;
+                if self.stats is not None:
+                    self.stats.retry(buf,path);
                 self._execute(buf,path,True);
 
                 expire = path.mad_timeout + rdma.tools.clock_monotonic();
@@ -131,6 +173,8 @@ class VMAD(rdma.madtransactor.MADTransactor):
                 if self.trace_func is not None:
                     self.trace_func(self,rdma.madtransactor.TRACE_UNEXPECTED,
                                     path=path,ret=ret);
+                if self.stats is not None:
+                    self.stats.unexpected += 1;
 
     def __enter__(self):
         return self;
@@ -140,12 +184,15 @@ class VMAD(rdma.madtransactor.MADTransactor):
 
     def close(self):
         """Free the resources held by the object."""
+        self._loan = None;
         if self._pool is not None:
             self._pool.close();
         if self._pd is not None:
             self._pd.close();
         if self._cq is not None:
             self._cq.close();
+        for I in self._send_cqs:
+            I.close();
         if self._cc is not None:
             self._cc.close();
         if self._allocated_ctx and self._ctx is not None:
@@ -162,3 +209,107 @@ class VMAD(rdma.madtransactor.MADTransactor):
                 self.end_port,
                 id(self));
 
+
+class SRQVMAD(VMAD):
+    '''A :class:`VMAD` for a large number of outstanding GMPs, eg performance
+    counter sweeps run with :class:`rdma.sched.MADSchedule`. Several UD QPs
+    share the receive buffers posted to one :class:`rdma.ibverbs.SRQ` and
+    one receive CQ, each QP has its own send CQ. Sends are spread over the
+    QPs by a credit scheduler, every QP has one credit per send queue entry,
+    a credit is taken when a MAD is posted and returned when its send
+    completes. :meth:`sendto` only blocks when every QP is out of credits.
+
+    Replies are matched by TID, so it does not matter which QP a request
+    was sent from. Set :attr:`rdma.sched.MADSchedule.max_outstanding` to at
+    most :attr:`depth`, UD drops replies that arrive when no receive buffer
+    is posted.'''
+    #: Number of receive buffers posted to the SRQ.
+    depth = 0;
+
+    def __init__(self,parent,path,depth=1024,num_qps=4):
+        """*path* is used to set the PKey and QKey for all MADs sent through
+        this interface. *depth* is the number of receive buffers and the
+        total number of send queue entries, it is reduced to fit the limits
+        reported by :meth:`rdma.ibverbs.Context.query_device`. *num_qps* is
+        the number of UD QPs to create."""
+        rdma.madtransactor.MADTransactor.__init__(self);
+        self._open_ctx(parent,path);
+
+        attr = self._ctx.query_device();
+        num_qps = max(1,min(num_qps,attr.max_qp));
+        self.depth = min(depth,attr.max_srq_wr,attr.max_cqe);
+        sdepth = min(max(1,depth//num_qps),attr.max_qp_wr,attr.max_cqe);
+
+        self._cc = self._ctx.comp_channel();
+        self._cq = self._ctx.cq(self.depth,self._cc);
+        self._poller = rdma.vtools.CQPoller(self._cq);
+        self._wcs = ibv.WCList(min(self.depth,256));
+
+        self._pd = self._ctx.pd();
+        self._srq = self._pd.srq(self.depth,1);
+        self._rq = self._srq;
+        self._send_cqs = [];
+        self._qps = [];
+        for I in range(num_qps):
+            cq = self._ctx.cq(sdepth,self._cc);
+            self._send_cqs.append(cq);
+            self._qps.append(self._pd.qp(ibv.IBV_QPT_UD,sdepth,cq,
+                                         1,self._cq,srq=self._srq));
+        self._qp = self._qps[0];
+        self._credits = [sdepth]*num_qps;
+        self._next_qp = 0;
+
+        # Every send credit and every receive has its own buffer
+        self._pool = rdma.vtools.BufferPool(self._pd,self.depth + sdepth*num_qps,
+                                            256+40);
+        self._pool.post_recvs(self._srq,self.depth);
+        self._recvs = collections.deque();
+
+        for qp in self._qps:
+            qp.establish(path.copy(sqpn=qp.qp_num,sqpsn=self._tid&0xFFFFFF));
+        self.qkey = path.qkey;
+        self.pkey = path.pkey;
+
+    def _get_credit(self):
+        """Take a send credit and return the index of the QP to use, waiting
+        for sends to complete if there are no credits."""
+        credits = self._credits;
+        num = len(credits);
+        while True:
+            for I in xrange(num):
+                idx = (self._next_qp + I) % num;
+                if credits[idx]:
+                    credits[idx] = credits[idx] - 1;
+                    self._next_qp = (idx + 1) % num;
+                    return idx;
+
+            for I in self._send_cqs:
+                I.req_notify();
+            self._cq_drain();
+            if not any(credits):
+                self._poller.sleep(None);
+
+    def sendto(self,buf,path):
+        '''Send a MAD packet. *buf* is the raw MAD to send, starting with the first
+        byte of :class:`rdma.IBA.MADHeader`, or a
+        :class:`rdma.binstruct.BinStruct` MAD format to pack. *path* is the
+        destination.'''
+        if path.qkey != self.qkey or path.pkey != self.pkey:
+            raise rdma.RDMAError("Destination %r does not match the qkey or pkey of this VMAD instance."%(path));
+
+        qp = self._qps[self._get_credit()];
+        buf_idx = self._pool.pop();
+        length = self._send_buf(buf,buf_idx);
+        qp.post_send(self._pool.make_send_wr(buf_idx,length,path));
+
+    def _cq_drain(self):
+        """Empty the receive CQ like :meth:`VMAD._cq_drain` and return the
+        credits and buffers of completed sends."""
+        VMAD._cq_drain(self);
+        wcs = self._wcs;
+        for I,cq in enumerate(self._send_cqs):
+            while cq.poll_batch(wcs):
+                self._credits[I] = self._credits[I] + len(wcs);
+                self._pool.finish_wcs(self._qps[I],wcs);
+                if len(wcs) < wcs.size:
+                    break;
@@ -2,12 +2,155 @@
 from __future__ import with_statement;
 
 import collections;
+import ctypes;
+import ctypes.util;
 import mmap;
 import math
 import select;
 import rdma.tools;
 import rdma.ibverbs as ibv;
 
+#: :func:`mmap.mmap` flag for anonymous memory from the hugetlbfs pool
+MAP_HUGETLB = 0x40000;
+MADV_HUGEPAGE = 14;
+MPOL_PREFERRED = 1;
+_libc = None;
+_libnuma = None;
+
+def _read_file(fn):
+    try:
+        with open(fn) as F:
+            return F.read();
+    except IOError:
+        return None;
+
+def hugetlb_page_size():
+    """Return the default hugetlbfs page size in bytes, or `None` if the
+    kernel does not support hugetlbfs."""
+    meminfo = _read_file("/proc/meminfo");
+    if meminfo is None:
+        return None;
+    for I in meminfo.splitlines():
+        if I.startswith("Hugepagesize:"):
+            return int(I.split()[1])*1024;
+    return None;
+
+def thp_page_size():
+    """Return the transparent hugepage size in bytes, or `None` if
+    transparent hugepages are not available."""
+    enabled = _read_file("/sys/kernel/mm/transparent_hugepage/enabled");
+    if enabled is None or "[never]" in enabled:
+        return None;
+    size = _read_file("/sys/kernel/mm/transparent_hugepage/hpage_pmd_size");
+    if size is None:
+        return 2*1024*1024;
+    return int(size);
+
+def _mem_addr(mem):
+    return ctypes.addressof(ctypes.c_char.from_buffer(mem));
+
+def _madvise_huge(mem):
+    global _libc;
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"),use_errno=True);
+        _libc.madvise.argtypes = [ctypes.c_void_p,ctypes.c_size_t,ctypes.c_int];
+    return _libc.madvise(_mem_addr(mem),len(mem),MADV_HUGEPAGE) == 0;
+
+def _bind_node(mem,node):
+    """Set a preferred NUMA node policy on *mem*, this must be done before
+    the memory is touched."""
+    global _libnuma;
+    if _libnuma is None:
+        _libnuma = False;
+        name = ctypes.util.find_library("numa");
+        if name is not None:
+            lib = ctypes.CDLL(name,use_errno=True);
+            if lib.numa_available() >= 0:
+                lib.mbind.argtypes = [ctypes.c_void_p,ctypes.c_ulong,
+                                      ctypes.c_int,
+                                      ctypes.POINTER(ctypes.c_ulong),
+                                      ctypes.c_ulong,ctypes.c_uint];
+                _libnuma = lib;
+    if _libnuma is False:
+        return False;
+    bits = 8*ctypes.sizeof(ctypes.c_ulong);
+    mask = (ctypes.c_ulong*(node//bits + 1))();
+    mask[node//bits] = 1 << (node % bits);
+    return _libnuma.mbind(_mem_addr(mem),len(mem),MPOL_PREFERRED,mask,
+                          len(mask)*bits + 1,0) == 0;
+
+def alloc_mem(length,hugepages=False,numa_node=None):
+    """Return an anonymous :class:`mmap.mmap` of at least *length* bytes
+    suitable for registering as a MR.
+
+    If *hugepages* is `True` and *length* is at least one huge page then the
+    memory is taken from the hugetlbfs pool, with the length rounded up to a
+    multiple of the huge page size. If that pool is empty the mapping is
+    advised to use transparent hugepages instead, and if those are not
+    available normal pages are used.
+
+    If *numa_node* is not `None` the memory prefers to be allocated on that
+    NUMA node, eg the :attr:`rdma.devices.RDMADevice.numa_node` of the HCA.
+    This requires `libnuma` and is skipped without it.
+
+    :returns: tuple(mem,page_size,numa_node) where *page_size* is the page
+       size the mapping was set up with and *numa_node* is `None` if the
+       memory was not bound."""
+    mem = None;
+    page_size = mmap.PAGESIZE;
+    if hugepages:
+        size = hugetlb_page_size();
+        if size is not None and length >= size:
+            try:
+                mem = mmap.mmap(-1,(length + size - 1)//size*size,
+                                mmap.MAP_SHARED | MAP_HUGETLB);
+                page_size = size;
+            except EnvironmentError:
+                pass;
+    if mem is None:
+        mem = mmap.mmap(-1,length);
+        size = thp_page_size() if hugepages else None;
+        if size is not None and length >= size and _madvise_huge(mem):
+            page_size = size;
+
+    if numa_node is not None and not _bind_node(mem,numa_node):
+        numa_node = None;
+    return (mem,page_size,numa_node);
+
+class BufferLoan(object):
+    """A completed receive buffer loaned out by
+    :meth:`BufferPool.loan`. :attr:`buf` is a :class:`memoryview` of the
+    registered memory, it must not be used after :meth:`release`, which
+    gives the buffer back to the pool and re-posts it. Release happens
+    automatically when the loan is dropped, or at the end of a `with`
+    block."""
+    __slots__ = ("buf","wc","_pool","_qp");
+
+    def __init__(self,pool,qp,wc,buf):
+        #: :class:`memoryview` of the received data
+        self.buf = buf;
+        #: The :class:`rdma.ibverbs.wc` for the receive
+        self.wc = wc;
+        self._pool = pool;
+        self._qp = qp;
+
+    def release(self):
+        """Return the buffer to the pool."""
+        pool = self._pool;
+        if pool is not None:
+            self._pool = None;
+            self.buf = None;
+            pool.finish_wcs(self._qp,self.wc);
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        self.release();
+
+    def __del__(self):
+        self.release();
+
 class BufferPool(object):
     """Hold onto a block of fixed size buffers and provide some helpers for
     using them as send and receive buffers with a QP.
@@ -23,19 +166,29 @@ class BufferPool(object):
     BUF_ID_MASK = 0;
     _mr = None;
     _mem = None;
+    _view = None;
+    _recv_wrs = None;
     #: `deque` of buffer indexes.
     _buffers = None;
     #: Size of a single buffer.
     size = 0;
     #: Number of buffers.
     count = 0;
+    #: Page size of the buffer memory, see :func:`alloc_mem`.
+    page_size = mmap.PAGESIZE;
+    #: NUMA node the buffer memory is bound to or `None`.
+    numa_node = None;
 
-    def __init__(self,pd,count,size):
+    def __init__(self,pd,count,size,hugepages=False,numa_local=False):
         """A :class:`rdma.ibverbs.MR` is created in *pd* with *count* buffers of
-        *size* bytes."""
+        *size* bytes. The memory comes from :func:`alloc_mem`, *hugepages*
+        requests huge pages and if *numa_local* is `True` the memory is
+        bound to the NUMA node of the RDMA device."""
         self.count = count;
         self.size = size;
-        self._mem = mmap.mmap(-1,count*size);
+        node = pd.ctx.node.numa_node if numa_local else None;
+        self._mem,self.page_size,self.numa_node = alloc_mem(count*size,
+                                                            hugepages,node);
         self._mr = pd.mr(self._mem,ibv.IBV_ACCESS_LOCAL_WRITE |
                          ibv.IBV_ACCESS_LOCAL_WRITE);
         self._buffers = collections.deque(xrange(count),count);
@@ -44,6 +197,7 @@ class BufferPool(object):
 
     def close(self):
         """Close held objects"""
+        self._view = None;
         if self._mr is not None:
             self._mr.close();
             self._mr = None;
@@ -61,22 +215,34 @@ class BufferPool(object):
         if count == 0:
             return;
 
-        wr = [];
+        # The recv WRs are prepared once, only the wr_id and address change.
+        wrs = self._recv_wrs;
+        if wrs is None:
+            wrs = self._recv_wrs = ibv.PreparedRecvWR(
+                [ibv.recv_wr(sg_list=self.make_sge(0,self.size))
+                 for I in range(self.count)]);
+        addr = self._mr.addr;
         for I in range(count):
             buf_idx = self._buffers.pop();
-            wr.append(ibv.recv_wr(wr_id=buf_idx | self.RECV_FLAG,
-                                  sg_list=self.make_sge(buf_idx,self.size)));
-        qp.post_recv(wr);
+            wrs.set_wr_id(I,buf_idx | self.RECV_FLAG);
+            wrs.set_addr(I,addr + buf_idx*self.size);
+        wrs.count = count;
+        qp.post_recv(wrs);
 
-    def finish_wcs(self,qp,wcs):
+    def finish_wcs(self,qp,wcs,skip_recvs=False):
         """Process work completion list *wcs* to recover buffers attached to
         completed work and re-post recv buffers to qp. Every work request with
         an attached buffer must have a signaled completion to recover the
         buffer.
 
-        *wcs* may be a single wc.
+        *wcs* may be a single wc or a :class:`rdma.ibverbs.WCList`, which is
+        processed without creating a :class:`rdma.ibverbs.wc` for each
+        entry. If *skip_recvs* is `True` then successful receive completions
+        are left alone, the caller must pass them to this method later.
 
         :raises rdma.ibverbs.WCError: For WC's marked as error."""
+        if isinstance(wcs,ibv.WCList):
+            return self._finish_wclist(qp,wcs,skip_recvs);
         new_recvs = 0;
         err = None;
         if isinstance(wcs,ibv.wc):
@@ -88,6 +254,9 @@ class BufferPool(object):
             # Note, we cannot rely on the opcode here to determine
             # RQ/SQ for the buffer, so it is encoded in the wr_id.
             if wc.wr_id != self.NO_WR_ID:
+                if (skip_recvs and wc.wr_id & self.RECV_FLAG and
+                    wc.status == ibv.IBV_WC_SUCCESS):
+                    continue;
                 self._buffers.append(wc.wr_id & self.BUF_ID_MASK);
                 if wc.wr_id & self.RECV_FLAG:
                     new_recvs = new_recvs + 1;
@@ -97,10 +266,32 @@ class BufferPool(object):
         self.post_recvs(qp,new_recvs);
 
         if err is not None:
-            rq = None
-            if wc.wr_id != self.NO_WR_ID:
-                rq = wc.wr_id & self.RECV_FLAG;
-            raise ibv.WCError(err,None,obj=qp,is_rq=rq);
+            self._raise_wc(qp,err);
+
+    def _finish_wclist(self,qp,wcs,skip_recvs):
+        new_recvs = 0;
+        err = None;
+        for I in xrange(len(wcs)):
+            wr_id = wcs.wr_id(I);
+            ok = wcs.status(I) == ibv.IBV_WC_SUCCESS;
+            if wr_id != self.NO_WR_ID:
+                if skip_recvs and ok and wr_id & self.RECV_FLAG:
+                    continue;
+                self._buffers.append(wr_id & self.BUF_ID_MASK);
+                if wr_id & self.RECV_FLAG:
+                    new_recvs = new_recvs + 1;
+            if not ok and err is None:
+                err = wcs.wc(I);
+        self.post_recvs(qp,new_recvs);
+
+        if err is not None:
+            self._raise_wc(qp,err);
+
+    def _raise_wc(self,qp,wc):
+        rq = None
+        if wc.wr_id != self.NO_WR_ID:
+            rq = wc.wr_id & self.RECV_FLAG;
+        raise ibv.WCError(wc,None,obj=qp,is_rq=rq);
 
     def make_send_wr(self,buf_idx,buf_len,path=None):
         """Return a :class:`rdma.ibverbs.send_wr` for *buf_idx* and path.
@@ -124,27 +315,47 @@ class BufferPool(object):
         """Return a :class:`rdma.ibverbs.SGE` for *buf_idx*."""
         return self._mr.sge(buf_len,buf_idx*self.size);
 
+    def view(self,buf_idx,offset=0,length=0xFFFFFFFF):
+        """Return a writable :class:`memoryview` of buffer *buf_idx*, which
+        may be a *wr_id*. Nothing is copied, the view refers to the registered
+        memory."""
+        if self._view is None:
+            self._view = memoryview((ctypes.c_char*len(self._mem)).from_buffer(
+                self._mem));
+        buf_idx = buf_idx & self.BUF_ID_MASK;
+        length = min(length,self.size - offset);
+        start = buf_idx*self.size + offset;
+        return self._view[start:start + length];
+
+    def loan(self,qp,wc,offset=0):
+        """Return a :class:`BufferLoan` for the successful receive
+        completion *wc*. The loaned view starts at *offset*, eg 40 to skip
+        the GRH of a UD receive, and ends at `wc.byte_len`. The buffer is
+        returned to the pool and re-posted to *qp* when the loan is
+        released."""
+        return BufferLoan(self,qp,wc,
+                          self.view(wc.wr_id,offset,wc.byte_len - offset));
+
+    def pack_into(self,obj,buf_idx,offset=0):
+        """Pack the :class:`rdma.binstruct.BinStruct` *obj* directly into
+        buffer *buf_idx*.
+
+        :returns: The number of bytes packed."""
+        obj.pack_into(self.view(buf_idx,offset,obj.MAD_LENGTH));
+        return obj.MAD_LENGTH;
+
     def copy_from(self,buf_idx,offset=0,length=0xFFFFFFFF):
         """Return a copy of buffer *buf_idx*. *buf_idx* may be a *wr_id*.
 
         :rtype: :class:`bytearray`"""
-        buf_idx = buf_idx & self.BUF_ID_MASK;
-        length = min(length,self.size - offset)
-        return bytearray(self._mem[buf_idx*self.size + offset:
-                                   buf_idx*self.size + offset + length]);
+        return bytearray(self.view(buf_idx,offset,length));
 
     def copy_to(self,buf,buf_idx,offset=0,length=0xFFFFFFFF):
         """Copy *buf* into the buffer *buf_idx*"""
-        blen = len(buf)
-        length = min(length,self.size - offset,blen)
-        if isinstance(buf,bytearray):
-            buf = bytes(buf);
-        if blen > length:
-            self._mem[buf_idx*self.size + offset:
-                      buf_idx*self.size + offset + length] = buf[:blen];
-        else:
-            self._mem[buf_idx*self.size + offset:
-                      buf_idx*self.size + offset + length] = buf;
+        length = min(length,self.size - offset,len(buf));
+        if length != len(buf):
+            buf = buf[:length];
+        self.view(buf_idx,offset,length)[:] = buf;
 
 class CQPoller(object):
     """Simple wrapper for a :class:`rdma.ibverbs.CQ` and
@@ -159,16 +370,41 @@ class CQPoller(object):
     #: Value of :func:`rdma.tools.clock_monotonic` to stop iterating. This can
     #: be altered while iterating.
     wakeat = None
+    #: Seconds to busy poll the CQ before arming it and sleeping.
+    spin_time = 0
+    #: Upper limit for :attr:`spin_time` when it is adaptive.
+    spin_max = 0
+    #: Average time in seconds from finding the CQ empty until the next
+    #: completion, used to adapt :attr:`spin_time`.
+    gap = None
+    #: Number of empty polls while busy polling.
+    spins = 0
+    #: Number of times the CQ was armed and the completion channel slept on.
+    sleeps = 0
+    #: Number of times the completion channel woke up.
+    wakeups = 0
 
-    def __init__(self,cq,async_events=True,solicited_only=False):
+    def __init__(self,cq,async_events=True,solicited_only=False,
+                 spin_time=0,adaptive=False):
         """*cq* is the completion queue to read work completions from.
         If the *cq* does not have a completion channel then this will
         spin loop on *cq* otherwise it sleeps on the completion channel.
 
         If *async_events* is `True` then the async event queue will be
-        monitored while sleeping."""
+        monitored while sleeping.
+
+        If *spin_time* is not 0 then an empty CQ is busy polled for that
+        many seconds before arming it and sleeping, which avoids the system
+        calls of the completion channel when completions follow each other
+        closely. If *adaptive* is `True` then *spin_time* is the upper limit
+        and the spin time used is twice the average observed gap between
+        the CQ going empty and the next completion, or 0 when that gap is
+        longer than the limit."""
         self._cq = cq;
         self._solicited_only = solicited_only
+        self.spin_time = spin_time;
+        if adaptive:
+            self.spin_max = spin_time;
         cc = cq.comp_chan;
         if cc is not None:
             self._cc = cc;
@@ -215,6 +451,58 @@ class CQPoller(object):
                     ev = self._ctx.get_async_event()
                     self._ctx.handle_async_event(ev);
 
+    def _wait(self,poll,arg):
+        """Return the first non empty result of `poll(arg)`, busy polling
+        for :attr:`spin_time` then sleeping on the completion channel. If
+        :attr:`wakeat` passes :attr:`timedout` is set and `None` is
+        returned."""
+        ret = poll(arg);
+        if ret:
+            return ret;
+
+        start = rdma.tools.clock_monotonic();
+        if self.spin_time:
+            end = start + self.spin_time;
+            if self.wakeat is not None and self.wakeat < end:
+                end = self.wakeat;
+            while True:
+                ret = poll(arg);
+                if ret:
+                    self._adapt(start);
+                    return ret;
+                self.spins = self.spins + 1;
+                if rdma.tools.clock_monotonic() >= end:
+                    break;
+
+        while True:
+            self._cq.req_notify(self._solicited_only);
+            ret = poll(arg);
+            if ret:
+                break;
+            self.sleeps = self.sleeps + 1;
+            if self.sleep(self.wakeat) is None:
+                self.timedout = True;
+                return None;
+            self.wakeups = self.wakeups + 1;
+            ret = poll(arg);
+            if ret:
+                break;
+        self._adapt(start);
+        return ret;
+
+    def _adapt(self,start):
+        if not self.spin_max:
+            return;
+        gap = rdma.tools.clock_monotonic() - start;
+        if self.gap is None:
+            self.gap = gap;
+        else:
+            self.gap = self.gap + (gap - self.gap)/8;
+        if 2*self.gap <= self.spin_max:
+            self.spin_time = 2*self.gap;
+        else:
+            self.spin_time = 0;
+
     def iterwc(self,count=None,timeout=None,wakeat=None):
         """Generator that returns work completions from the CQ. If not `None`
         at most *count* wcs will be returned. *timeout* is the number of
@@ -232,14 +520,31 @@ class CQPoller(object):
         while True:
             if limit == 0:
                 return
-            ret = self._cq.poll(1);
-            while not ret:
-                self._cq.req_notify(self._solicited_only);
-                ret = self._cq.poll(1);
-                if not ret and self.sleep(self.wakeat) is None:
-                    self.timedout = True;
-                    return
+            # One at a time so nothing is lost if the caller stops early
+            ret = self._wait(self._cq.poll,1);
+            if ret is None:
+                return
             for I in ret:
                 yield I;
                 if limit > 0:
                     limit = limit - 1;
+
+    def iterbatch(self,wcs=None,timeout=None,wakeat=None):
+        """Generator that fills the :class:`rdma.ibverbs.WCList` *wcs* using
+        :meth:`rdma.ibverbs.CQ.poll_batch` and yields it each time it holds
+        at least one completion. The caller must finish with the entries
+        before advancing the generator, the next batch overwrites them. If
+        *wcs* is `None` a 64 entry list is allocated. *timeout* and *wakeat*
+        are the same as for :meth:`iterwc`.
+
+        :rtype: :class:`rdma.ibverbs.WCList`"""
+        if wcs is None:
+            wcs = ibv.WCList(64);
+        self.timedout = False;
+        self.wakeat = wakeat;
+        if timeout is not None:
+            self.wakeat = rdma.tools.clock_monotonic() + timeout;
+        while True:
+            if self._wait(self._cq.poll_batch,wcs) is None:
+                return
+            yield wcs;
@@ -65,6 +65,8 @@ ibverbs_module = Extension('rdma.ibverbs', ['rdma/ibverbs.pyx'],
                            libraries=['ibverbs'],
                            depends=['rdma/libibverbs.pxd',
                                     'rdma/libibverbs.pxi'])
+# Optional, rdma.umad falls back to pure Python without it
+umadfast_module = Extension('rdma._umadfast', ['rdma/_umadfast.pyx'])
 
 # From PyCA
 class sphinx_build(Command):
@@ -160,7 +162,7 @@ version = imp.load_source('__tmp__','rdma/__init__.py').__version__;
 setup(name='rdma',
       version=version,
       description='RDMA functionality for python',
-      ext_modules=[ibverbs_module],
+      ext_modules=[ibverbs_module,umadfast_module],
       packages=['rdma','libibtool'],
       scripts=['ibtool'],
       cmdclass={'build_ext': build_ext,
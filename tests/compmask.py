@@ -34,5 +34,37 @@ class compmask_test(unittest.TestCase):
 
         self.assertEquals(cm.component_mask,1<<3);
 
+    def test_build(self):
+        cm = IBA.ComponentMask.build(IBA.SANodeRecord(),
+                                     {"LID":1,"nodeInfo.portGUID":IBA.GUID(2)});
+        self.assertEquals(cm.component_mask,(1<<0) | (1<<8));
+        self.assertEquals(cm.payload.nodeInfo.portGUID,IBA.GUID(2));
+
+        cm = IBA.ComponentMask.build(IBA.SAServiceRecord(),
+                                     [("serviceData8_1",3)]);
+        self.assertEquals(cm.payload.serviceData8[1],3);
+        self.assertEquals(cm.component_mask,
+                          1<<IBA.SAServiceRecord.COMPONENT_MASK["serviceData8_1"]);
+
+    def test_compare(self):
+        obj = IBA.SANodeRecord();
+        obj.LID = 1;
+        obj.nodeInfo.portGUID = IBA.GUID(2);
+        cm = IBA.ComponentMask(IBA.SANodeRecord());
+        cm.nodeInfo.portGUID = IBA.GUID(2);
+        self.assertEquals(cm.payload.compare(obj,cm.component_mask),0);
+        cm.LID = 2;
+        self.assertNotEquals(cm.payload.compare(obj,cm.component_mask),0);
+
+        # Reserved components are never compared
+        cm.unmask("LID");
+        cm.reserved_16 = 1;
+        self.assertEquals(cm.payload.compare(obj,cm.component_mask),0);
+        self.assert_(IBA.SANodeRecord.get_comparator(cm.component_mask) is
+                     obj.get_comparator(cm.component_mask));
+
+        key = IBA.SANodeRecord.component_key(cm.component_mask);
+        self.assertEquals(key(obj),key(cm.payload));
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,45 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import array
+from libibtool.congestion import CongestionMap,normalise;
+
+class FakeSubnet(object):
+    def iterswitches(self):
+        return [];
+
+class FakePort(object):
+    def __init__(self,parent):
+        self.parent = parent;
+
+class congestion_test(unittest.TestCase):
+    def get_map(self,nports):
+        cmap = CongestionMap(FakeSubnet());
+        cmap.ports = [(FakePort("sw"),None) for I in range(nports)];
+        cmap.bps = array.array('d',[32.0]*nports);
+        cmap.cur_wait = array.array('d',[0]*nports);
+        cmap.cur_data = array.array('d',[0]*nports);
+        cmap.cur_vl = [None]*nports;
+        cmap.errors = [None]*nports;
+        cmap.ext = [False]*nports;
+        return cmap;
+
+    def test_normalise(self):
+        """Saturated counters and ports without a rate have no value."""
+        wait,util = normalise(1.0,[5,-1,5],[10,10,-1],[32.0,32.0,0]);
+        self.assertEquals(list(wait),[1.0,-1,-1]);
+        self.assertEquals(list(util),[1.0,1.0,-1]);
+
+    def test_saturated(self):
+        """Ports with a saturated XmitWait are not ranked or counted as
+        hot."""
+        cmap = self.get_map(3);
+        cmap.update(0);
+        cmap.cur_wait[0] = 0.5;
+        cmap.cur_wait[1] = 0xFFFFFFFF;
+        cmap.update(1);
+        self.assertEquals(cmap.ranked(),[0,2]);
+        self.assertEquals(cmap.saturated_ports(),[1]);
+        self.assertEquals(cmap.switch_summary(0.1),[("sw",2,0.5,0.25,1)]);
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import os
+import tempfile
+import rdma.IBA as IBA;
+from libibtool.counterstore import CounterStore,counter_fields;
+
+class counterstore_test(unittest.TestCase):
+    guid = IBA.GUID(0x0002c90300001491);
+
+    def setUp(self):
+        fd,self.fn = tempfile.mkstemp();
+        os.close(fd);
+        os.unlink(self.fn);
+
+    def tearDown(self):
+        if os.path.exists(self.fn):
+            os.unlink(self.fn);
+
+    def test_delta(self):
+        """Deltas, saturation and resets for PMPortCounters"""
+        cnts = IBA.PMPortCounters();
+        cnts.portXmitData = 100;
+        cnts.symbolErrorCounter = 0xFFFF;
+        with CounterStore(self.fn) as st:
+            d = st.update(self.guid,1,cnts,now=1.0);
+            self.assertEquals(d.first,True);
+            self.assertEquals(d.portXmitData,100);
+            self.assertEquals(d.saturated,set(["symbolErrorCounter"]));
+
+        st = CounterStore(self.fn);
+        cnts.portXmitData = 150;
+        d = st.update(self.guid,1,cnts,now=3.0);
+        self.assertEquals(d.first,False);
+        self.assertEquals(d.elapsed,2.0);
+        self.assertEquals(d.portXmitData,50);
+
+        cnts.portXmitData = 10;
+        d = st.update(self.guid,1,cnts,now=4.0);
+        self.assertEquals(d.portXmitData,10);
+        self.assertEquals(d.reset,set(["portXmitData"]));
+
+    def test_wrap(self):
+        """64 bit PMPortCountersExt counters wrap"""
+        st = CounterStore();
+        cnts = IBA.PMPortCountersExt();
+        cnts.portXmitData = (1 << 64) - 10;
+        st.update(self.guid,1,cnts);
+        cnts.portXmitData = 5;
+        d = st.update(self.guid,1,cnts);
+        self.assertEquals(d.portXmitData,15);
+        self.assertEquals(d.wrapped,set(["portXmitData"]));
+
+    def test_compact(self):
+        """The file is rewritten once it has too many stale records"""
+        cnts = IBA.PMPortCounters();
+        st = CounterStore(self.fn);
+        for I in range(200):
+            cnts.portXmitData = I;
+            st.update(self.guid,1,cnts);
+            st.save();
+        self.assert_(st._records < 100);
+        st = CounterStore(self.fn);
+        names = [J[0] for J in counter_fields(IBA.PMPortCounters)];
+        values = st.get(self.guid,1,IBA.PMPortCounters)[1];
+        self.assertEquals(values[names.index("portXmitData")],199);
+
+    def test_truncated(self):
+        """A partial record left by a crashed writer is not appended to"""
+        cnts = IBA.PMPortCounters();
+        names = [J[0] for J in counter_fields(IBA.PMPortCounters)];
+        with CounterStore(self.fn) as st:
+            for I in range(1,4):
+                cnts.portXmitData = I;
+                st.update(self.guid,I,cnts);
+        with open(self.fn,"r+b") as F:
+            F.truncate(os.path.getsize(self.fn) - 5);
+
+        with CounterStore(self.fn) as st:
+            self.assertEquals(st.get(self.guid,3,IBA.PMPortCounters),None);
+            cnts.portXmitData = 10;
+            st.update(self.guid,1,cnts);
+        st = CounterStore(self.fn);
+        self.assertEquals(st._records,2);
+        for port,value in ((1,10),(2,2)):
+            values = st.get(self.guid,port,IBA.PMPortCounters)[1];
+            self.assertEquals(values[names.index("portXmitData")],value);
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+"""Stand ins for an end port and a umad that the MAD layer tests share."""
+import Queue
+import rdma
+import rdma.IBA as IBA
+import rdma.madtransactor
+import rdma.path
+import rdma.tools
+
+class FakeEndPort(object):
+    """An end port without a device. Keyword arguments override the class
+    attributes."""
+    lid = 1;
+    subnet_timeout = 18;
+    pkeys = [0xFFFF];
+    sa_path = rdma.path.IBPath(None,DLID=1,SLID=2);
+
+    def __init__(self,**kwargs):
+        self.__dict__.update(kwargs);
+
+class FakeTransactor(rdma.madtransactor.MADTransactor):
+    """A umad that answers each sent MAD with :meth:`reply`. Synchronous
+    sends get the reply back from :meth:`_execute`, replies to *sendOnly*
+    sends are queued for :meth:`recvfrom`. *sends* counts the MADs sent."""
+    end_port = FakeEndPort();
+
+    def __init__(self,end_port=None):
+        if end_port is not None:
+            self.end_port = end_port;
+        self.sends = 0;
+        self._tid = 0;
+        self._replies = Queue.Queue();
+
+    def __enter__(self):
+        return self;
+
+    def __exit__(self,*exc_info):
+        pass;
+
+    def reply(self,buf,path):
+        """Override in derived classes. Return tuple(buf,path) of the reply
+        to the MAD in *buf* or `None` to drop it."""
+        return None;
+
+    @staticmethod
+    def make_reply(fmt,rep,path):
+        """Return the GET_RESP for the request *fmt* carrying the attribute
+        *rep*, sent back along *path*."""
+        fmt.method = IBA.MAD_METHOD_GET_RESP;
+        if rep is not None:
+            rep.pack_into(fmt.data);
+        rbuf = bytearray(fmt.MAD_LENGTH);
+        fmt.pack_into(rbuf);
+        path = path.copy();
+        path.reverse();
+        return (rbuf,path);
+
+    def _get_new_TID(self):
+        self._tid = (self._tid + 1) % (1 << 32);
+        return self._tid;
+
+    def _execute(self,buf,path,sendOnly=False):
+        self.sends = self.sends + 1;
+        ret = self.reply(buf,path);
+        if not sendOnly:
+            return ret;
+        if ret is not None:
+            self._replies.put(ret);
+        return None;
+
+    def recvfrom(self,wakeat):
+        timeout = wakeat - rdma.tools.clock_monotonic();
+        try:
+            return self._replies.get(True,max(timeout,0));
+        except Queue.Empty:
+            return None;
+
+class FakeSMA(FakeTransactor):
+    """Reply to NodeInfo requests with the DLID as the portGUID, other
+    requests are dropped."""
+    def reply(self,buf,path):
+        if ((buf[16] << 8) | buf[17]) != IBA.SMPNodeInfo.MAD_ATTRIBUTE_ID:
+            return None;
+        ninf = IBA.SMPNodeInfo();
+        ninf.portGUID = IBA.GUID(path.DLID);
+        return self.make_reply(IBA.SMPFormat(bytes(buf)),ninf,path);
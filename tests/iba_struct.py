@@ -44,6 +44,19 @@ class structs_test(unittest.TestCase):
             attr.pack_into(test);
             self.assertEqual(raw[0:I.MAD_LENGTH], test[0:I.MAD_LENGTH]);
 
+    def test_struct_memoryview(self):
+        """Structs unpack from and pack into memoryviews."""
+        raw = bytearray(os.urandom(512));
+        view = memoryview(raw);
+        test = bytearray(512);
+        for I in structs:
+            attr = I(view);
+            attr.pack_into(test);
+            self.assertEqual(raw[0:I.MAD_LENGTH], test[0:I.MAD_LENGTH]);
+            out = bytearray(512);
+            attr.pack_into(memoryview(out));
+            self.assertEqual(out[0:I.MAD_LENGTH], test[0:I.MAD_LENGTH]);
+
     def test_struct_printer_dump(self):
         """Checking printer dump style"""
         for I in structs:
@@ -3,6 +3,7 @@ import unittest
 import os.path
 import sys
 import imp
+import time
 from contextlib import contextmanager;
 import rdma;
 import rdma.IBA as IBA;
@@ -130,6 +131,8 @@ class ibtool_cmds_test(unittest.TestCase):
         self.cmd("ibroute","-D",self.peer_dr,"-M");
         self.cmd("dump_lfts");
         self.cmd("dump_mfts");
+        self.cmd("dump_lfts","--shards","2");
+        self.cmd("dump_mfts","--shards","2");
 
         self.cmd("smpquery","si","-D",self.peer_dr);
 
@@ -198,6 +201,9 @@ class ibtool_cmds_test(unittest.TestCase):
                   "ibidsverify"):
             self.cmd(I);
             self.cmd(I,"-v");
+            self.cmd(I,"--json");
+        self.cmd("iblinkhealth","-n2","-p0.05");
+        self.cmd("ibcongestion","-p0.05","--vl");
 
     def test_with_link_no_sa(self):
         self.assertEquals(self.end_port.state,IBA.PORT_STATE_ACTIVE);
@@ -212,5 +218,26 @@ class ibtool_cmds_test(unittest.TestCase):
         self.extra_opts = ("--discovery=DR",);
         self.test_discovery();
 
+    def test_rdma_bw(self):
+        """Run rdma_bw against a server on this host, soft-RoCE works."""
+        import multiprocessing;
+        for I in (("-T","write","-a","-s","65536"),
+                  ("-T","read","-q","4","--threads","2"),
+                  ("-T","send","-I","64","-s","64","-l","--histogram"),
+                  ("-T","fetch_add","-l"),
+                  ("-T","cmp_swap","-b"),
+                  ("-T","write","-q","2","--procs","2"),
+                  ("-T","write","-s","4194304","--hugepages")):
+            server = multiprocessing.Process(target=self.cmd,
+                                             args=("rdma_bw","-p","4445"));
+            server.start();
+            try:
+                # Give the server time to listen
+                time.sleep(1);
+                self.cmd("rdma_bw","127.0.0.1","-p","4445","-n","100",*I);
+            finally:
+                server.join(30);
+            self.assertEquals(server.exitcode,0);
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import os
+import tempfile
+import rdma
+import rdma.IBA as IBA
+import rdma.madcapture
+import rdma.path
+import rdma.sched
+from tests.fakes import FakeEndPort,FakeSMA
+
+class madcapture_test(unittest.TestCase):
+    def setUp(self):
+        fd,self.fn = tempfile.mkstemp();
+        os.close(fd);
+
+    def tearDown(self):
+        os.unlink(self.fn);
+
+    def test_replay(self):
+        """Captured replies are returned by the replay transactor."""
+        umad = FakeSMA();
+        with rdma.madcapture.MADCapture(self.fn) as cap:
+            umad.trace_func = cap;
+            for I in range(1,4):
+                umad.SubnGet(IBA.SMPNodeInfo,rdma.path.IBPath(None,DLID=I));
+            self.assertRaises(rdma.MADTimeoutError,umad.SubnGet,
+                              IBA.SMPPortInfo,rdma.path.IBPath(None,DLID=1));
+            self.assertEquals(cap.records,8);
+
+        recs = list(rdma.madcapture.read_capture(self.fn));
+        self.assertEquals([I.direction for I in recs],
+                          [rdma.madcapture.CAPTURE_SEND,
+                           rdma.madcapture.CAPTURE_RECV]*3 +
+                          [rdma.madcapture.CAPTURE_SEND,
+                           rdma.madcapture.CAPTURE_TIMEOUT]);
+        self.assertEquals(rdma.madcapture.addr_lid(recs[2].addr),2);
+        fmt = rdma.madcapture.decode_record(recs[1]);
+        self.assertEquals(fmt.method,IBA.MAD_METHOD_GET_RESP);
+
+        rumad = rdma.madcapture.ReplayTransactor(FakeEndPort(),recs);
+        rumad._tid = 100;
+        path = rdma.path.IBPath(None,DLID=3,retries=0);
+        self.assertEquals(rumad.SubnGet(IBA.SMPNodeInfo,path).portGUID,
+                          IBA.GUID(3));
+        self.assertRaises(rdma.MADTimeoutError,rumad.SubnGet,
+                          IBA.SMPPortInfo,rdma.path.IBPath(None,DLID=1));
+        self.assertRaises(rdma.MADTimeoutError,rumad.SubnGet,
+                          IBA.SMPNodeInfo,rdma.path.IBPath(None,DLID=4));
+
+        # The scheduler gets the replies from _execute
+        sched = rdma.sched.MADSchedule(rumad);
+        res = [];
+        def get(lid):
+            ninf = yield sched.SubnGet(IBA.SMPNodeInfo,
+                                       rdma.path.IBPath(rumad.end_port,DLID=lid));
+            res.append(ninf.portGUID);
+        sched.run(mqueue=(get(I) for I in range(1,4)));
+        self.assertEquals(sorted(res),[IBA.GUID(I) for I in range(1,4)]);
+
+    def test_ring(self):
+        """The oldest records are overwritten when the ring is full."""
+        with rdma.madcapture.MADCapture(self.fn,size=4096) as cap:
+            for I in range(100):
+                cap.write(rdma.madcapture.CAPTURE_UNEXPECTED,"\0"*44,
+                          chr(I)*(50 + I % 7));
+        recs = list(rdma.madcapture.read_capture(self.fn));
+        self.assert_(0 < len(recs) < 100);
+        self.assertEquals([ord(I.mad[0]) for I in recs],
+                          range(100 - len(recs),100));
+        for I in recs:
+            self.assertEquals(len(I.mad),50 + ord(I.mad[0]) % 7);
+
+    def test_flush(self):
+        """The header is only updated every sync_every records and by flush."""
+        with rdma.madcapture.MADCapture(self.fn) as cap:
+            cap.sync_every = 4;
+            for I in range(6):
+                cap.write(rdma.madcapture.CAPTURE_UNEXPECTED,"\0"*44,
+                          bytearray(chr(I)*256));
+            self.assertEquals(
+                len(list(rdma.madcapture.read_capture(self.fn))),4);
+            cap.flush();
+            self.assertEquals(
+                [ord(I.mad[0]) for I in
+                 rdma.madcapture.read_capture(self.fn)],range(6));
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import rdma
+import rdma.IBA as IBA
+import rdma.madtransactor
+import rdma.path
+import rdma.sched
+from tests.fakes import FakeEndPort,FakeTransactor
+
+class FakePMA(FakeTransactor):
+    """A PMA at LID 2 that is BUSY for the first *busy* requests and redirects
+    everything not sent to QP 5 at LID 3."""
+    busy_delay = 0.001;
+
+    def __init__(self,busy=0):
+        FakeTransactor.__init__(self);
+        self.busy = busy;
+        self.dead = False;
+        self.sent = [];
+        self.paths = [];
+
+    def reply(self,buf,path):
+        self.sent.append((path.DLID,path.dqpn));
+        self.paths.append(path);
+        if self.dead and path.dqpn == 5:
+            return None;
+        fmt = IBA.PMFormat(bytes(buf));
+        if self.busy:
+            self.busy = self.busy - 1;
+            fmt.status = IBA.MAD_STATUS_BUSY;
+            rep = None;
+        elif path.dqpn != 5:
+            fmt.status = IBA.MAD_STATUS_REDIRECT;
+            rep = IBA.MADClassPortInfo();
+            rep.redirectLID = 3;
+            rep.redirectQP = 5;
+            rep.redirectQKey = IBA.IB_DEFAULT_QP1_QKEY;
+        else:
+            rep = IBA.PMPortCounters();
+            rep.portSelect = 1;
+            rep.symbolErrorCounter = path.DLID;
+        return self.make_reply(fmt,rep,path);
+
+class madretry_test(unittest.TestCase):
+    def setUp(self):
+        rdma.madtransactor.invalidate_redirects();
+
+    def get_path(self):
+        return rdma.path.IBPath(FakeEndPort(),DLID=2,dqpn=1,
+                                qkey=IBA.IB_DEFAULT_QP1_QKEY);
+
+    def test_sync(self):
+        """BUSY replies are resent and redirects are followed and cached."""
+        pma = FakePMA(busy=2);
+        pc = pma.PerformanceGet(IBA.PMPortCounters,self.get_path());
+        self.assertEquals(pc.symbolErrorCounter,3);
+        self.assertEquals(pma.sent,[(2,1)]*3 + [(3,5)]);
+        pma.PerformanceGet(IBA.PMPortCounters,self.get_path());
+        self.assertEquals(pma.sent[4:],[(3,5)]);
+
+        pma = FakePMA(busy=20);
+        pma.busy_retries = 2;
+        self.assertRaises(rdma.MADBusyError,pma.PerformanceGet,
+                          IBA.PMPortCounters,self.get_path());
+        self.assertEquals(len(pma.sent),3);
+
+        rdma.madtransactor.invalidate_redirects(pma.end_port);
+        pma = FakePMA();
+        pma.max_redirects = 0;
+        self.assertRaises(rdma.MADRedirectError,pma.PerformanceGet,
+                          IBA.PMPortCounters,self.get_path());
+
+    def test_sched(self):
+        """The scheduler resends BUSY MADs from its timer."""
+        pma = FakePMA(busy=3);
+        sched = rdma.sched.MADSchedule(pma);
+        res = [];
+        def get():
+            pc = yield sched.PerformanceGet(IBA.PMPortCounters,self.get_path());
+            res.append(pc.symbolErrorCounter);
+        sched.run(mqueue=(get() for I in range(2)));
+        self.assertEquals(res,[3,3]);
+        self.assertEquals(pma.sent.count((2,1)),5);
+        self.assertEquals(pma._redirects.keys(),
+                          [(IBA.MAD_PERFORMANCE,2,None)]);
+
+    def test_redirect_path(self):
+        """A cached redirect keeps the other fields of the caller's path and
+        is specific to the DGID."""
+        pma = FakePMA();
+        pma.PerformanceGet(IBA.PMPortCounters,self.get_path());
+        path = self.get_path();
+        path.retries = 5;
+        path.SLID = 7;
+        pma.PerformanceGet(IBA.PMPortCounters,path);
+        self.assertEquals(pma.sent[2:],[(3,5)]);
+        self.assertEquals((pma.paths[2].retries,pma.paths[2].SLID),(5,7));
+        self.assertEquals((path.DLID,path.dqpn),(2,1));
+
+        path = self.get_path();
+        path.has_grh = True;
+        path.DGID = IBA.GID("fe80::1");
+        pma.PerformanceGet(IBA.PMPortCounters,path);
+        self.assertEquals(pma.sent[3:],[(2,1),(3,5)]);
+        self.assertEquals(len(pma._redirects),2);
+
+    def test_redirect_timeout(self):
+        """A redirect is forgotten when the redirected agent stops
+        answering."""
+        pma = FakePMA();
+        path = self.get_path();
+        path.retries = 0;
+        pma.PerformanceGet(IBA.PMPortCounters,path);
+        self.assertEquals(pma.sent,[(2,1),(3,5)]);
+        pma.dead = True;
+        self.assertRaises(rdma.MADTimeoutError,pma.PerformanceGet,
+                          IBA.PMPortCounters,path);
+        self.assertEquals(pma._redirects,{});
+        pma.dead = False;
+        pma.PerformanceGet(IBA.PMPortCounters,path);
+        self.assertEquals(pma.sent[2:],[(3,5),(2,1),(3,5)]);
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import StringIO
+import rdma
+import rdma.IBA as IBA
+import rdma.madstats
+import rdma.path
+from tests.fakes import FakeTransactor
+
+class FakeUMAD(FakeTransactor):
+    """Reply to every MAD with *status*, never reply if it is `None` or fail
+    the send if it is `error`."""
+    def __init__(self):
+        FakeTransactor.__init__(self);
+        self.status = 0;
+        self.view = False;
+
+    def reply(self,buf,path):
+        if self.status == "error":
+            raise rdma.RDMAError("Send failed");
+        if self.status is None:
+            if self.stats is not None:
+                self.stats.retry(buf,path);
+            return None;
+        rbuf = bytearray(buf);
+        rbuf[3] = IBA.MAD_METHOD_GET_RESP;
+        rbuf[4] = (self.status >> 8) & 0xFF;
+        rbuf[5] = self.status & 0xFF;
+        if self.view:
+            return (memoryview(rbuf),path);
+        return (rbuf,path);
+
+class madstats_test(unittest.TestCase):
+    def test_stats(self):
+        """Replies, timeouts and errors are counted per destination."""
+        umad = FakeUMAD();
+        stats = umad.stats = rdma.madstats.MADStats();
+        path1 = rdma.path.IBPath(None,DLID=1);
+        path2 = rdma.path.IBPath(None,DLID=2);
+        for I in range(10):
+            umad.SubnGet(IBA.SMPNodeInfo,path1);
+        umad.PerformanceGet(IBA.PMPortCounters,path2);
+
+        umad.status = None;
+        self.assertRaises(rdma.MADTimeoutError,umad.SubnGet,
+                          IBA.SMPNodeInfo,path1);
+        umad.status = IBA.MAD_STATUS_UNSUP_METHOD_ATTR_COMBO;
+        self.assertRaises(rdma.MADError,umad.SubnGet,
+                          IBA.SMPPortInfo,path2);
+
+        ent = stats.entries[(IBA.MAD_SUBNET,IBA.SMPNodeInfo.MAD_ATTRIBUTE_ID,1)];
+        self.assertEquals((ent.count,ent.retries,ent.timeouts,ent.errors),
+                          (10,1,1,0));
+        self.assertEquals(sum(ent.hist),10);
+        self.assert_(ent.rtt_min <= ent.rtt_mean <= ent.rtt_max);
+        self.assert_(ent.percentile(99) >= ent.rtt_min);
+        ent = stats.entries[(IBA.MAD_SUBNET,IBA.SMPPortInfo.MAD_ATTRIBUTE_ID,2)];
+        self.assertEquals((ent.count,ent.errors),(1,1));
+        self.assertEquals(len(stats.entries),3);
+        self.assertEquals(stats._pending,{});
+
+        tot = stats.totals();
+        self.assertEquals((tot.count,tot.retries,tot.timeouts,tot.errors),
+                          (12,1,1,1));
+        F = StringIO.StringIO();
+        stats.dump(F);
+        self.assert_("SMPNodeInfo" in F.getvalue());
+        self.assert_("PMPortCounters" in F.getvalue());
+
+        snap = stats.snapshot(reset=True);
+        self.assertEquals(len(snap),3);
+        self.assertEquals(stats.entries,{});
+        umad.status = 0;
+        umad.SubnGet(IBA.SMPNodeInfo,path1);
+        self.assertEquals(snap[(IBA.MAD_SUBNET,
+                                IBA.SMPNodeInfo.MAD_ATTRIBUTE_ID,1)].count,10);
+
+    def test_memoryview(self):
+        """Replies that are memoryviews of the receive buffer are decoded."""
+        umad = FakeUMAD();
+        umad.view = True;
+        stats = umad.stats = rdma.madstats.MADStats();
+        path = rdma.path.IBPath(None,DLID=1);
+        self.assert_(isinstance(umad.SubnGet(IBA.SMPNodeInfo,path),
+                                IBA.SMPNodeInfo));
+        umad.status = IBA.MAD_STATUS_UNSUP_METHOD_ATTR_COMBO;
+        try:
+            umad.SubnGet(IBA.SMPPortInfo,path);
+        except rdma.MADError,err:
+            self.assert_(isinstance(err.rep_buf,bytearray));
+        else:
+            self.fail("MADError not raised");
+        tot = stats.totals();
+        self.assertEquals((tot.count,tot.errors),(2,1));
+
+    def test_execute_error(self):
+        """A request that fails to send is not left pending."""
+        umad = FakeUMAD();
+        stats = umad.stats = rdma.madstats.MADStats();
+        umad.status = "error";
+        self.assertRaises(rdma.RDMAError,umad.SubnGet,IBA.SMPNodeInfo,
+                          rdma.path.IBPath(None,DLID=1));
+        self.assertEquals(stats._pending,{});
+        self.assertEquals(stats.entries,{});
+
+if __name__ == '__main__':
+    unittest.main()
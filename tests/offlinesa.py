@@ -0,0 +1,109 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import rdma
+import rdma.IBA as IBA
+import rdma.offlinesa
+import rdma.path
+import rdma.subnet
+from tests.fakes import FakeTransactor
+
+class FakeParent(FakeTransactor):
+    """Count the queries that are sent to the SA."""
+    def __init__(self):
+        FakeTransactor.__init__(self);
+        self.queries = [];
+
+    def _doMAD(self,fmt,payload,path,attributeModifier,method,completer=None):
+        self.queries.append(payload);
+        return [];
+
+class offlinesa_test(unittest.TestCase):
+    def get_subnet(self):
+        """A switch at LID 1 with CAs at LID 2 and 3 on ports 1 and 2."""
+        sbn = rdma.subnet.Subnet();
+        ninf = IBA.SMPNodeInfo();
+        ninf.nodeType = IBA.NODE_SWITCH;
+        ninf.numPorts = 4;
+        ninf.nodeGUID = IBA.GUID(0x100);
+        ninf.portGUID = IBA.GUID(0x100);
+        sw,swport = sbn.get_node_ninf(ninf,LID=1);
+        sw.set_desc(bytearray("switch".ljust(64,"\0")));
+        sw.swinf = IBA.SMPSwitchInfo();
+        sw.lfdb = [None,0,1,2];
+        for I in range(2,4):
+            ninf = IBA.SMPNodeInfo();
+            ninf.nodeType = IBA.NODE_CA;
+            ninf.numPorts = 1;
+            ninf.localPortNum = 1;
+            ninf.nodeGUID = IBA.GUID(0x200 + I);
+            ninf.portGUID = IBA.GUID(0x300 + I);
+            ca,caport = sbn.get_node_ninf(ninf,LID=I);
+            caport.pinf = IBA.SMPPortInfo();
+            caport.pinf.LID = I;
+            sbn.topology[sw.get_port(I - 1)] = caport;
+            sbn.topology[caport] = sw.get_port(I - 1);
+        sbn.loaded.update(("all_NodeInfo","all_topology","all_PortInfo",
+                           "all_SwitchInfo"));
+        return sbn;
+
+    def test_records(self):
+        """Records are served from the subnet."""
+        parent = FakeParent();
+        sat = rdma.offlinesa.OfflineSATransactor(parent,self.get_subnet());
+        self.assertEquals(len(sat.SubnAdmGetTable(IBA.SANodeRecord)),3);
+        self.assertEquals(len(sat.SubnAdmGetTable(IBA.SALinkRecord)),4);
+        self.assertEquals([len(I) for I in
+                           sat.SubnAdmGetTableIter(IBA.SALinkRecord)],[4]);
+
+        req = IBA.ComponentMask(IBA.SANodeRecord());
+        req.nodeInfo.portGUID = IBA.GUID(0x303);
+        rec = sat.SubnAdmGet(req);
+        self.assertEquals((rec.LID,rec.nodeInfo.localPortNum),(3,1));
+
+        ninf = sat.SubnGet(IBA.SMPNodeInfo,rdma.path.IBPath(None,DLID=1));
+        self.assertEquals(ninf.nodeGUID,IBA.GUID(0x100));
+        desc = sat.SubnGet(IBA.SMPNodeDescription,rdma.path.IBPath(None,DLID=1));
+        self.assertEquals(str(desc.nodeString[:7]),"switch\0");
+
+        req = IBA.ComponentMask(IBA.SALinkRecord());
+        req.fromLID = 1;
+        req.fromPort = 2;
+        self.assertEquals(sat.SubnAdmGet(req).toLID,3);
+
+        pinf = sat.SubnGet(IBA.SMPPortInfo,rdma.path.IBPath(None,DLID=2),1);
+        self.assertEquals(pinf.LID,2);
+
+        lft = sat.SubnGet(IBA.SMPLinearForwardingTable,
+                          rdma.path.IBPath(None,DLID=1));
+        self.assertEquals(list(lft.portBlock[:5]),[255,0,1,2,255]);
+        self.assertEquals(parent.queries,[]);
+
+    def test_errors(self):
+        """Bad gets fail like the SA and unknown queries are forwarded."""
+        parent = FakeParent();
+        sbn = self.get_subnet();
+        sat = rdma.offlinesa.OfflineSATransactor(parent,sbn);
+        req = IBA.ComponentMask(IBA.SANodeRecord());
+        req.LID = 10;
+        try:
+            sat.SubnAdmGet(req);
+            self.fail("Expected MADClassError");
+        except rdma.MADClassError, e:
+            self.assertEquals(e.code,IBA.MAD_STATUS_SA_NO_RECORDS);
+        req = IBA.ComponentMask(IBA.SANodeRecord());
+        req.nodeInfo.nodeType = IBA.NODE_CA;
+        try:
+            sat.SubnAdmGet(req);
+            self.fail("Expected MADClassError");
+        except rdma.MADClassError, e:
+            self.assertEquals(e.code,IBA.MAD_STATUS_SA_TOO_MANY_RECORDS);
+        self.assertEquals(parent.queries,[]);
+
+        sat.SubnAdmGetTable(IBA.SAPathRecord);
+        sbn.loaded.discard("all_PortInfo");
+        sat.SubnAdmGetTable(IBA.SAPortInfoRecord);
+        self.assertEquals(parent.queries,[IBA.SAPathRecord,
+                                          IBA.SAPortInfoRecord]);
+
+if __name__ == '__main__':
+    unittest.main()
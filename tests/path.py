@@ -1,8 +1,12 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 import unittest
+import time
 import rdma
 import rdma.IBA as IBA;
 import rdma.path
+import rdma.madtransactor
+import rdma.sched
+import rdma.subnet
 
 class path_test(unittest.TestCase):
     def check_path(self,end_port,cls=rdma.path.IBPath,**kwargs):
@@ -53,5 +57,110 @@ class path_test(unittest.TestCase):
         self.assertRaises(ValueError,from_string,"IBPath(DLID=1 , x)");
         self.assertRaises(ValueError,from_string,"IBPath(DLID=1 , SLID=)");
 
+    def test_path_cache(self):
+        """Check that :func:`rdma.path.resolve_path` uses the path cache."""
+        class FakeEndPort(object):
+            default_gid = IBA.GID("fe80::2");
+        class FakeSA(object):
+            is_async = False;
+            end_port = FakeEndPort();
+            do_async = rdma.madtransactor.MADTransactor.do_async.im_func;
+            queries = 0;
+            def SubnAdmGet(self,q):
+                self.queries = self.queries + 1;
+                rep = IBA.SAPathRecord();
+                rep.SGID = q.SGID;
+                rep.DGID = IBA.GID("fe80::1");
+                rep.DLID = 12;
+                rep.SL = 3;
+                return rep;
+            def SubnAdmGetTable(self,q):
+                return [self.SubnAdmGet(q)];
+
+        sa = FakeSA();
+        cache = rdma.path.path_cache;
+        cache.invalidate();
+        path = rdma.path.resolve_path(sa,rdma.path.IBPath(sa.end_port,DLID=12));
+        self.assertEquals(path.SL,3);
+        path = rdma.path.resolve_path(sa,rdma.path.IBPath(sa.end_port,DLID=12));
+        self.assertEquals(path.DGID,IBA.GID("fe80::1"));
+        self.assertEquals(sa.queries,1);
+        rdma.path.resolve_path(sa,rdma.path.IBPath(sa.end_port,DLID=12),
+                               cache=False);
+        self.assertEquals(sa.queries,2);
+
+        cache.invalidate(sa.end_port);
+        self.assertEquals(len(cache),0);
+        res = rdma.path.prefetch_paths(sa,[IBA.GUID(1)]);
+        self.assertEquals(res.keys(),[IBA.GUID(1)]);
+        rdma.path.resolve_path(sa,rdma.path.IBPath(sa.end_port,
+                                                   DGID=IBA.GID("fe80::1")));
+        rdma.path.resolve_path(sa,rdma.path.IBPath(sa.end_port,DLID=12));
+        self.assertEquals(sa.queries,3);
+
+        old = cache.max_entries;
+        try:
+            cache.max_entries = 1;
+            rdma.path.resolve_path(sa,rdma.path.IBPath(sa.end_port,DLID=13));
+            self.assertEquals(len(cache),1);
+        finally:
+            cache.max_entries = old;
+            cache.invalidate();
+
+    def test_path_flight(self):
+        """Concurrent lookups in a scheduler share one query and all see
+        its error, whatever the exception is."""
+        class FakeEndPort(object):
+            default_gid = IBA.GID("fe80::2");
+            subnet_timeout = 10;
+            def __init__(self):
+                self.sa_path = rdma.path.IBPath(self,DLID=1,dqpn=1);
+        class FakeUMAD(rdma.madtransactor.MADTransactor):
+            end_port = FakeEndPort();
+            sends = 0;
+            def _get_new_TID(self):
+                self.sends = self.sends + 1;
+                return self.sends;
+            def _execute(self,buf,path,sendOnly=False):
+                self.replies.append((buf,path));
+            def recvfrom(self,wakeat):
+                return self.replies.pop();
+        class FakeSched(rdma.sched.MADSchedule):
+            def _completeMAD(self,*args):
+                raise ValueError("Bad reply");
+
+        umad = FakeUMAD();
+        umad.replies = [];
+        sched = FakeSched(umad);
+        errors = [];
+        def get():
+            try:
+                yield rdma.path.resolve_path(
+                    sched,rdma.path.IBPath(umad.end_port,DLID=12));
+            except Exception as err:
+                errors.append(err);
+        sched.run(mqueue=(get() for I in range(3)));
+        self.assertEquals((umad.sends,len(errors)),(1,3));
+        self.assert_(isinstance(errors[0],ValueError));
+        self.assert_(errors[0] is errors[1] is errors[2]);
+        self.assertEquals(rdma.path.path_cache._flights,{});
+
+    def test_gmp_path_invalidate(self):
+        """Cached GMP paths in the subnet are dropped when the SM changes."""
+        class FakeEndPort(object):
+            default_gid = IBA.GID("fe80::2");
+        class FakeSched(object):
+            end_port = FakeEndPort();
+        sched = FakeSched();
+        sbn = rdma.subnet.Subnet();
+        port = rdma.subnet.Port(None);
+        port.gmp_path = rdma.path.IBPath(sched.end_port,
+                                         SGID=sched.end_port.default_gid,
+                                         DLID=12);
+        port.gmp_path_time = time.time() - 1;
+        self.assert_(sbn._cached_gmp_path(sched,port) is port.gmp_path);
+        rdma.path.path_cache.invalidate(sched.end_port);
+        self.assertEquals(sbn._cached_gmp_path(sched,port),None);
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,13 @@
 # Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
 import unittest;
+import time;
 try:
     import cPickle as pickle
 except ImportError:
     import pickle;
 import rdma.IBA as IBA;
 import rdma.binstruct;
+import rdma.path;
 import rdma.subnet;
 
 class pickle_test(unittest.TestCase):
@@ -37,5 +39,34 @@ class pickle_test(unittest.TestCase):
         self.assertEquals(sorted(sbn.nodes.keys()),sorted(tmp2.nodes.keys()));
         self.assertEquals(sorted(sbn.ports.keys()),sorted(tmp2.ports.keys()));
 
+    def test_subnet_cache(self):
+        "Pickling the cached PMA ClassPortInfo and GMP paths"
+        sbn = rdma.subnet.Subnet();
+        pinf = IBA.SMPPortInfo()
+        pinf.LID = 1;
+        port = sbn.get_port_pinf(pinf,portIdx=0,LID=1);
+        port.portGUID = IBA.GUID(0xDEADBEEF0001);
+        sbn.ports[port.portGUID] = port;
+        sgid = IBA.GID(prefix=IBA.GID_DEFAULT_PREFIX,guid=IBA.GUID(0xDEADBEEF0002));
+        port.gmp_path = rdma.path.IBPath(None,DLID=1,SGID=sgid,dqpn=1,
+                                         qkey=IBA.IB_DEFAULT_QP1_QKEY);
+        port.gmp_path_time = time.time();
+        port.parent.pma_cpinf = IBA.MADClassPortInfo();
+        port.parent.pma_cpinf.capabilityMask = IBA.allPortSelect;
+        port.parent.pma_cpinf_time = time.time();
+
+        tmp2 = pickle.loads(pickle.dumps(sbn));
+        port2 = tmp2.ports[port.portGUID];
+        self.assertEquals(port2.gmp_path.DLID,1);
+        self.assertEquals(port2.parent.pma_cpinf.capabilityMask,IBA.allPortSelect);
+
+        class FakeEndPort(object):
+            default_gid = sgid;
+        class FakeSched(object):
+            end_port = FakeEndPort();
+        self.assert_(tmp2._cached_gmp_path(FakeSched(),port2) is not None);
+        port2.gmp_path_time = time.time() - 2*tmp2.cache_ttl;
+        self.assertEquals(tmp2._cached_gmp_path(FakeSched(),port2),None);
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,57 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import rdma
+import rdma.IBA as IBA
+import rdma.madtransactor
+import rdma.path
+from tests.fakes import FakeTransactor
+
+class FakeSA(FakeTransactor):
+    """Answer every SA query with an RMPP reply holding *records*."""
+    def __init__(self,records):
+        FakeTransactor.__init__(self);
+        self.records = records;
+
+    def sendto(self,buf,path):
+        self.rmpp_reply = buf;
+
+    def reply(self,buf,path):
+        fmt = IBA.SAFormat(bytes(buf));
+        path = path.copy();
+        self.send_rmpp_reply(fmt,IBA.SANodeRecord,self.records,path);
+        return (self.rmpp_reply,path);
+
+class rmpptable_test(unittest.TestCase):
+    def get_records(self,count):
+        res = [];
+        for I in range(count):
+            rec = IBA.SANodeRecord();
+            rec.LID = I + 1;
+            rec.nodeInfo.portGUID = IBA.GUID(I + 1);
+            res.append(rec);
+        return res;
+
+    def test_iter(self):
+        """Records are decoded in batches from the RMPP reply."""
+        sa = FakeSA(self.get_records(150));
+        res = sa.SubnAdmGetTableIter(IBA.SANodeRecord);
+        self.assert_(isinstance(res,rdma.madtransactor.RecordTable));
+        self.assertEquals(len(res),150);
+        self.assertEquals([len(I) for I in res],[64,64,22]);
+        res.batch = 100;
+        self.assertEquals([len(I) for I in res],[100,50]);
+        self.assertEquals([I.LID for I in res.records()],range(1,151));
+
+        # The normal API returns the same records
+        lst = sa.SubnAdmGetTable(IBA.SANodeRecord);
+        self.assertEquals([I.nodeInfo.portGUID for I in lst],
+                          [I.nodeInfo.portGUID for I in res.records()]);
+
+    def test_empty(self):
+        sa = FakeSA([]);
+        res = sa.SubnAdmGetTableIter(IBA.SANodeRecord);
+        self.assertEquals(list(res),[]);
+        self.assertEquals(sa.SubnAdmGetTable(IBA.SANodeRecord),[]);
+
+if __name__ == '__main__':
+    unittest.main()
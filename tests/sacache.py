@@ -0,0 +1,122 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import rdma
+import rdma.IBA as IBA
+import rdma.path
+import rdma.satransactor
+from tests.fakes import FakeTransactor
+
+class FakeParent(FakeTransactor):
+    """Answer SA queries from a list of SANodeRecords without sending
+    anything."""
+    def __init__(self,records):
+        FakeTransactor.__init__(self);
+        self.records = records;
+        self.queries = 0;
+
+    def _doMAD(self,fmt,payload,path,attributeModifier,method,completer=None):
+        self.queries = self.queries + 1;
+        self.reply_fmt = IBA.SAFormat();
+        if isinstance(payload,type):
+            res = list(self.records);
+        else:
+            res = [I for I in self.records
+                   if payload.compare(I,fmt.componentMask) == 0];
+        if method == IBA.MAD_METHOD_GET:
+            res = res[0];
+        if completer is None:
+            return res;
+        self.req_path = path;
+        if isinstance(completer,tuple):
+            return completer[0](res);
+        return completer(res);
+
+class sacache_test(unittest.TestCase):
+    def get_records(self):
+        res = [];
+        for I in range(1,5):
+            rec = IBA.SANodeRecord();
+            rec.LID = I;
+            rec.nodeInfo.nodeType = IBA.NODE_CA;
+            rec.nodeInfo.portGUID = IBA.GUID(I);
+            res.append(rec);
+        return res;
+
+    def test_get(self):
+        """Repeated queries are answered from the cache."""
+        parent = FakeParent(self.get_records());
+        cache = rdma.satransactor.SACache();
+        sat = rdma.satransactor.SATransactor(parent,cache=cache);
+        req = IBA.ComponentMask(IBA.SANodeRecord());
+        req.LID = 2;
+        self.assertEquals(sat.SubnAdmGet(req).nodeInfo.portGUID,IBA.GUID(2));
+        ninf = sat.SubnGet(IBA.SMPNodeInfo,rdma.path.IBPath(None,DLID=2));
+        self.assertEquals(ninf.portGUID,IBA.GUID(2));
+        self.assertEquals(parent.queries,1);
+        self.assertEquals((cache.hits,cache.misses),(1,1));
+
+        # Results are copies
+        ninf.portGUID = IBA.GUID(10);
+        self.assertEquals(sat.SubnAdmGet(req).nodeInfo.portGUID,IBA.GUID(2));
+
+        cache.clear();
+        sat.SubnAdmGet(req);
+        self.assertEquals(parent.queries,2);
+
+    def test_table(self):
+        """A full table answers single record gets."""
+        parent = FakeParent(self.get_records());
+        cache = rdma.satransactor.SACache();
+        sat = rdma.satransactor.SATransactor(parent,cache=cache);
+        self.assertEquals(len(sat.SubnAdmGetTable(IBA.SANodeRecord)),4);
+        for I in range(1,5):
+            req = IBA.ComponentMask(IBA.SANodeRecord());
+            req.nodeInfo.portGUID = IBA.GUID(I);
+            self.assertEquals(sat.SubnAdmGet(req).LID,I);
+        req = IBA.ComponentMask(IBA.SANodeRecord());
+        req.nodeInfo.nodeType = IBA.NODE_CA;
+        self.assertEquals(len(sat.SubnAdmGetTable(req)),4);
+        self.assertEquals(parent.queries,1);
+
+        # No match is a valid table answer.
+        req.nodeInfo.nodeType = IBA.NODE_SWITCH;
+        self.assertEquals(sat.SubnAdmGetTable(req),[]);
+        self.assertEquals(parent.queries,1);
+
+        # Only the result is decoded, changing it does not change the cache.
+        res = sat.SubnAdmGetTable(IBA.SANodeRecord);
+        res[0].LID = 10;
+        self.assert_(res[0] is not sat.SubnAdmGetTable(IBA.SANodeRecord)[0]);
+        self.assertEquals(sat.SubnAdmGetTable(IBA.SANodeRecord)[0].LID,1);
+        self.assertEquals(len(sat.SubnAdmGetTableIter(IBA.SANodeRecord)),4);
+        self.assertEquals(parent.queries,1);
+
+        # More than one match is not a valid Get, so ask the SA.
+        req.nodeInfo.nodeType = IBA.NODE_CA;
+        sat.SubnAdmGet(req);
+        self.assertEquals(parent.queries,2);
+
+    def test_table_get(self):
+        """A Get without a component mask is only answered from a full table
+        holding exactly one record."""
+        parent = FakeParent(self.get_records());
+        sat = rdma.satransactor.SATransactor(
+            parent,cache=rdma.satransactor.SACache());
+        sat.SubnAdmGetTable(IBA.SANodeRecord);
+        sat.SubnAdmGet(IBA.SANodeRecord);
+        self.assertEquals(parent.queries,2);
+
+        cache = rdma.satransactor.SACache();
+        cache.add(cache.make_key(IBA.SANodeRecord,0,
+                                 IBA.MAD_METHOD_GET_TABLE),[]);
+        key = cache.make_key(IBA.SANodeRecord,0,IBA.MAD_METHOD_GET);
+        self.assertEquals(cache.get(key,IBA.SANodeRecord),None);
+        key = cache.make_key(IBA.SANodeRecord,0,IBA.MAD_METHOD_GET_TABLE);
+        self.assertEquals(cache.get(key,IBA.SANodeRecord),[]);
+
+        cache.add(key,self.get_records()[:1]);
+        key = cache.make_key(IBA.SANodeRecord,0,IBA.MAD_METHOD_GET);
+        self.assertEquals(cache.get(key,IBA.SANodeRecord).LID,1);
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import cPickle as pickle
+import multiprocessing
+import sys
+import time
+import rdma
+import rdma.IBA as IBA
+import rdma.sharding
+import rdma.subnet
+from tests.fakes import FakeEndPort,FakeTransactor
+
+class FakeUMAD(FakeTransactor):
+    """An SMA for every LID. PortInfo returns the DLID as the LID, the LFT
+    forwards every LID to port LID % 4."""
+    def reply(self,buf,path):
+        fmt = IBA.SMPFormat(bytes(buf));
+        if fmt.attributeID == IBA.SMPPortInfo.MAD_ATTRIBUTE_ID:
+            rep = IBA.SMPPortInfo();
+            rep.LID = path.DLID;
+            rep.localPortNum = fmt.attributeModifier or 1;
+        elif fmt.attributeID == IBA.SMPSwitchInfo.MAD_ATTRIBUTE_ID:
+            rep = IBA.SMPSwitchInfo();
+            rep.linearFDBCap = 64;
+            rep.linearFDBTop = 3;
+        else:
+            rep = IBA.SMPLinearForwardingTable();
+            rep.portBlock = [I % 4 for I in range(64)];
+        return self.make_reply(fmt,rep,path);
+
+def failed_umad(end_port):
+    raise rdma.RDMAError("No UMAD");
+
+class sharding_test(unittest.TestCase):
+    def get_subnet(self,switches=1,cas=2,ports=4):
+        """*switches* switches starting at LID 1, each with *cas* CAs on
+        ports 1 and up. With the defaults the CAs are at LID 2 and 3."""
+        sbn = rdma.subnet.Subnet();
+        lid = 1;
+        for J in range(switches):
+            ninf = IBA.SMPNodeInfo();
+            ninf.nodeType = IBA.NODE_SWITCH;
+            ninf.numPorts = ports;
+            ninf.nodeGUID = IBA.GUID(0x100000 + lid);
+            ninf.portGUID = IBA.GUID(0x100000 + lid);
+            sw,swport = sbn.get_node_ninf(ninf,LID=lid);
+            for I in range(1,cas + 1):
+                ninf = IBA.SMPNodeInfo();
+                ninf.nodeType = IBA.NODE_CA;
+                ninf.numPorts = 1;
+                ninf.localPortNum = 1;
+                ninf.nodeGUID = IBA.GUID(0x200000 + lid + I);
+                ninf.portGUID = IBA.GUID(0x300000 + lid + I);
+                ca,caport = sbn.get_node_ninf(ninf,LID=lid + I);
+                sbn.topology[sw.get_port(I)] = caport;
+                sbn.topology[caport] = sw.get_port(I);
+            lid = lid + cas + 1;
+        return sbn;
+
+    def check_sweep(self,workers):
+        sbn = self.get_subnet();
+        task = rdma.sharding.PortInfoTask();
+        self.assertEquals(len(task.items(sbn)),7);
+        errors = rdma.sharding.run_sharded(FakeEndPort(),sbn,task,
+                                           workers=workers,get_umad=FakeUMAD);
+        self.assertEquals(errors,[]);
+        self.assertEquals(task.items(sbn),[]);
+        self.assertEquals(sorted(I.pinf.LID for I,idx in sbn.iterports()),
+                          [1]*5 + [2,3]);
+
+        task = rdma.sharding.SwitchFDBTask();
+        rdma.sharding.run_sharded(FakeEndPort(),sbn,task,workers=workers,
+                                  get_umad=FakeUMAD);
+        sw = list(sbn.iterswitches())[0];
+        self.assertEquals(sw.swinf.linearFDBTop,3);
+        self.assertEquals(sw.lfdb,[I % 4 for I in range(64)]);
+
+    def test_workers(self):
+        """Results from the worker processes are merged into the subnet."""
+        self.check_sweep(3);
+
+    def test_inline(self):
+        """A single worker runs in this process."""
+        self.check_sweep(1);
+
+    def test_lazy(self):
+        """PortInfo is unpacked in the parent when it is first used."""
+        sbn = self.get_subnet();
+        rdma.sharding.run_sharded(FakeEndPort(),sbn,
+                                  rdma.sharding.PortInfoTask(),workers=2,
+                                  get_umad=FakeUMAD);
+        ports = [I for I,idx in sbn.iterports()];
+        for I in ports:
+            self.assertEquals(type(I),rdma.subnet.LazyPort);
+        self.assertEquals(sorted(I.LID for I in sbn.iterend_ports()),[1,2,3]);
+
+        sbn2 = pickle.loads(pickle.dumps(sbn,-1));
+        port = ports[0];
+        self.assert_(isinstance(port.pinf,IBA.SMPPortInfo));
+        self.assertEquals(type(port),rdma.subnet.Port);
+        self.assertEquals(sorted(I.pinf.LID for I,idx in sbn2.iterports()),
+                          [1]*5 + [2,3]);
+
+    def test_benchmark(self):
+        """Report the parent's cost to receive and merge PortInfo records
+        sent as BinStructs and as packed records, and the sweep time."""
+        sbn = self.get_subnet(switches=64,cas=32,ports=36);
+        task = rdma.sharding.PortInfoTask();
+        task.end_port = FakeEndPort();
+        items = task.items(sbn);
+        pinfs = [];
+        for I,item in enumerate(items):
+            pinf = IBA.SMPPortInfo();
+            pinf.LID = item[0].to_end_port().LID;
+            pinf.localPortNum = item[1];
+            pinfs.append(pinf);
+
+        data = pickle.dumps(list(enumerate(pinfs)),-1);
+        start = time.clock();
+        for idx,rec in pickle.loads(data):
+            item = items[idx];
+            sbn.get_port_pinf(rec,port_select=item[1],
+                              path=sbn.get_path_smp(task,item[0].to_end_port()));
+        old = time.clock() - start;
+
+        for I,item in enumerate(items):
+            item[0].pinf = pinfs[I];
+        data = pickle.dumps([(I,task.pack(sbn,item))
+                             for I,item in enumerate(items)],-1);
+        start = time.clock();
+        for idx,rec in pickle.loads(data):
+            task.merge(sbn,items[idx],rec);
+        new = time.clock() - start;
+        print >> sys.stderr, "parent merge of %u records: BinStruct %.2f usec, packed %.2f usec per record"%(
+            len(items),old*1000000/len(items),new*1000000/len(items));
+
+        for workers in (1,4):
+            sbn = self.get_subnet(switches=64,cas=32,ports=36);
+            start = time.time();
+            rdma.sharding.run_sharded(FakeEndPort(),sbn,
+                                      rdma.sharding.PortInfoTask(),
+                                      workers=workers,get_umad=FakeUMAD);
+            print >> sys.stderr, "%u workers on %u CPUs: %.2f sec"%(
+                workers,multiprocessing.cpu_count(),time.time() - start);
+
+    def test_failure(self):
+        """A worker failure raises in the parent."""
+        self.assertRaises(rdma.RDMAError,rdma.sharding.run_sharded,
+                          FakeEndPort(),self.get_subnet(),
+                          rdma.sharding.PortInfoTask(),workers=2,
+                          get_umad=failed_umad);
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import threading
+import rdma
+import rdma.IBA as IBA
+import rdma.path
+import rdma.sharedumad
+from tests.fakes import FakeEndPort,FakeSMA
+
+class sharedumad_test(unittest.TestCase):
+    def get_path(self,lid,packet_life_time=10):
+        return rdma.path.IBPath(FakeEndPort(subnet_timeout=10),DLID=lid,retries=1,
+                                packet_life_time=packet_life_time,
+                                resp_time=10);
+
+    def test_threads(self):
+        """Many threads share one UMAD."""
+        umad = FakeSMA();
+        with rdma.sharedumad.SharedUMAD(umad) as sumad:
+            errors = [];
+            def worker(base):
+                futs = [(I,sumad.SubnGet(IBA.SMPNodeInfo,self.get_path(I,18)))
+                        for I in range(base,base + 50)];
+                for I,fut in futs:
+                    if fut.result().portGUID != IBA.GUID(I):
+                        errors.append(I);
+            threads = [threading.Thread(target=worker,args=(I*100,))
+                       for I in range(8)];
+            for I in threads:
+                I.start();
+            for I in threads:
+                I.join();
+            self.assertEquals(errors,[]);
+            self.assertEquals(umad.sends,400);
+            self.assertEquals(sumad.outstanding,0);
+
+    def test_timeout(self):
+        """Requests without a reply are resent then time out."""
+        umad = FakeSMA();
+        with rdma.sharedumad.SharedUMAD(umad) as sumad:
+            fut = sumad.SubnGet(IBA.SMPPortInfo,self.get_path(1));
+            ok = sumad.SubnGet(IBA.SMPNodeInfo,self.get_path(2));
+            self.assertRaises(rdma.MADTimeoutError,fut.result,5);
+            self.assert_(isinstance(fut.exception(),rdma.MADTimeoutError));
+            self.assertEquals(ok.result(5).portGUID,IBA.GUID(2));
+            self.assertEquals(umad.sends,3);
+
+            done = [];
+            fut.add_done_callback(done.append);
+            self.assertEquals(done,[fut]);
+
+    def test_busy_timeout(self):
+        """Requests time out while other MADs keep arriving."""
+        umad = FakeSMA();
+        noise = (bytearray(IBA.SMPFormat.MAD_LENGTH),self.get_path(3));
+        for I in range(50000):
+            umad._replies.put(noise);
+        with rdma.sharedumad.SharedUMAD(umad) as sumad:
+            fut = sumad.SubnGet(IBA.SMPPortInfo,self.get_path(1));
+            self.assertRaises(rdma.MADTimeoutError,fut.result,30);
+            self.assert_(umad._replies.qsize() > 0);
+
+    def test_receive_error(self):
+        """A failed receive fails the outstanding futures and closes the
+        instance."""
+        umad = FakeSMA();
+        fail = threading.Event();
+        def recvfrom(wakeat):
+            fail.wait(5);
+            raise rdma.RDMAError("Receive failed");
+        umad.recvfrom = recvfrom;
+        with rdma.sharedumad.SharedUMAD(umad) as sumad:
+            fut = sumad.SubnGet(IBA.SMPPortInfo,self.get_path(1,18));
+            fail.set();
+            self.assertRaises(rdma.RDMAError,fut.result,5);
+            self.assertEquals(str(fut.exception()),"Receive failed");
+            sumad._thread.join(5);
+            self.assert_(not sumad._thread.is_alive());
+            self.assertEquals(sumad.outstanding,0);
+            self.assertRaises(rdma.RDMAError,sumad.SubnGet,
+                              IBA.SMPPortInfo,self.get_path(1));
+
+if __name__ == '__main__':
+    unittest.main()
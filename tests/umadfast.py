@@ -0,0 +1,163 @@
+# Copyright 2011 Obsidian Research Corp. GPLv2, see COPYING.
+import unittest
+import errno
+import io
+import select
+import socket
+import sys
+import time
+import rdma.madtransactor
+import rdma.tools
+import rdma.umad
+import rdma.IBA as IBA
+from tests.fakes import FakeEndPort
+
+_umadfast = rdma.umad._umadfast;
+
+def make_umad(fd):
+    """A UMAD that talks to *fd* instead of a umad device."""
+    umad = rdma.umad.UMAD.__new__(rdma.umad.UMAD);
+    rdma.madtransactor.MADTransactor.__init__(umad);
+    umad.parent = FakeEndPort();
+    umad.dev = io.FileIO(fd,"r+",closefd=False);
+    umad._fd = fd;
+    umad.sbuf = bytearray(320);
+    umad._rbuf = bytearray(320);
+    umad._poll = select.poll();
+    umad._poll.register(fd,select.POLLIN);
+    umad._agent_id_dqpn = {3:1};
+    return umad;
+
+def py_match_key(buf):
+    """The pure Python MADTransactor._get_match_key"""
+    return ((buf[1] << 32) | (buf[12] << 24) | (buf[13] << 16) |
+            (buf[14] << 8) | (buf[15] << 0));
+
+def make_mad(tid):
+    fmt = IBA.SMPFormat();
+    fmt.baseVersion = IBA.MAD_BASE_VERSION;
+    fmt.mgmtClass = IBA.MAD_SUBNET;
+    fmt.classVersion = 1;
+    fmt.method = IBA.MAD_METHOD_GET;
+    fmt.transactionID = tid;
+    fmt.attributeID = IBA.SMPNodeInfo.MAD_ATTRIBUTE_ID;
+    buf = bytearray(fmt.MAD_LENGTH);
+    fmt.pack_into(buf);
+    return buf;
+
+class umadfast_test(unittest.TestCase):
+    addr = rdma.umad.UMAD.ib_mad_addr_local_t.pack(
+        socket.htonl(1),socket.htonl(IBA.IB_DEFAULT_QP1_QKEY),
+        socket.htons(5),0,0,0);
+
+    def setUp(self):
+        self.sock,self.peer = socket.socketpair(socket.AF_UNIX,
+                                                socket.SOCK_SEQPACKET);
+        self.sock.setblocking(False);
+        self.umad = make_umad(self.sock.fileno());
+        self.path = rdma.path.IBPath(FakeEndPort(),umad_agent_id=3,
+                                     _cached_umad_ah=self.addr);
+        self.saved = rdma.umad._umadfast;
+
+    def tearDown(self):
+        rdma.umad._umadfast = self.saved;
+        self.sock.close();
+        self.peer.close();
+
+    def implementations(self):
+        """Run the test body with the pure Python and compiled versions."""
+        rdma.umad._umadfast = None;
+        yield "python";
+        if _umadfast is not None:
+            rdma.umad._umadfast = _umadfast;
+            yield "compiled";
+
+    def test_sendto(self):
+        """sendto writes the umad header followed by the MAD."""
+        mad = make_mad(0x12345678);
+        for I in self.implementations():
+            self.umad.sendto(mad,self.path);
+            res = self.peer.recv(4096);
+            self.assertEquals(res[:64],
+                              rdma.umad.UMAD.ib_user_mad_t.pack(
+                                  3,0,max(500,int(self.path.mad_timeout*1000)-500),
+                                  0,len(mad),self.addr));
+            self.assertEquals(res[64:],bytes(mad));
+
+    def test_recvfrom(self):
+        """recvfrom splits the header, skips timeouts and honours wakeat."""
+        mad = make_mad(0x12345678);
+        hdr = rdma.umad.UMAD.ib_user_mad_t;
+        for I in self.implementations():
+            self.peer.send(hdr.pack(3,errno.ETIMEDOUT,0,0,len(mad),self.addr) +
+                           bytes(mad));
+            self.peer.send(hdr.pack(3,0,0,0,len(mad),self.addr) + bytes(mad));
+            buf,path = self.umad.recvfrom(None);
+            self.assertEquals(buf,mad);
+            self.assert_(isinstance(buf,bytearray));
+            self.assertEquals(path._cached_umad_ah,self.addr);
+            self.assertEquals(path.umad_agent_id,3);
+            self.assertEquals(path.dqpn,1);
+            self.assertEquals(path.SLID,5);
+            self.assertEquals(self.umad._get_match_key(buf),
+                              py_match_key(mad));
+            self.assertEquals(self.umad.recvfrom(rdma.tools.clock_monotonic()),
+                              None);
+
+            self.peer.send(hdr.pack(3,errno.EIO,0,0,len(mad),self.addr) +
+                           bytes(mad));
+            self.assertRaises(rdma.RDMAError,self.umad.recvfrom,None);
+
+    def test_match_key(self):
+        """The match keys agree with the Python versions for every buffer type."""
+        mad = make_mad(0xdeadbeef);
+        mad[1] = IBA.MAD_SUBNET_ADMIN;
+        mad[37:40] = b"\x00\x14\x05";
+        vmad = make_mad(1);
+        vmad[1] = 0x30;
+        vmad[37:40] = b"\x00\x14\x05";
+        for buf in (mad,vmad):
+            key = py_match_key(buf);
+            req = rdma.madtransactor.MADTransactor.get_request_match_key(buf);
+            for I in (buf,bytes(buf),memoryview(buf)):
+                self.assertEquals(
+                    rdma.madtransactor.MADTransactor._get_match_key(I),key);
+                self.assertEquals(
+                    rdma.madtransactor.MADTransactor.get_request_match_key(I),
+                    req);
+        self.assertEquals(
+            rdma.madtransactor.MADTransactor.get_request_match_key(vmad)[0],
+            (0x1405 << 8) | 0x30);
+
+    @unittest.skipIf(_umadfast is None,"rdma._umadfast is not built")
+    def test_short(self):
+        """Short MADs raise IndexError like the Python versions."""
+        self.assertRaises(IndexError,_umadfast.get_match_key,b"\x01"*15);
+        self.assertRaises(IndexError,_umadfast.get_request_match_key,
+                          b"\x01\x30" + b"\x00"*30);
+        self.assertRaises(TypeError,_umadfast.get_match_key,1);
+
+    def test_benchmark(self):
+        """Report the CPU time per MAD for a send and a matched receive."""
+        count = 20000;
+        mad = make_mad(0x12345678);
+        reply = rdma.umad.UMAD.ib_user_mad_t.pack(3,0,0,0,len(mad),
+                                                  self.addr) + bytes(mad);
+        for I in self.implementations():
+            if I == "python":
+                get_match_key = py_match_key;
+            else:
+                get_match_key = _umadfast.get_match_key;
+            rmatch = get_match_key(mad);
+            start = time.clock();
+            for J in range(count):
+                self.umad.sendto(mad,self.path);
+                self.peer.recv(4096);
+                self.peer.send(reply);
+                ret = self.umad.recvfrom(None);
+                self.assertEquals(rmatch,get_match_key(ret[0]));
+            print >> sys.stderr, "%s: %.2f usec per MAD"%(
+                I,(time.clock() - start)*1000000/count);
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,10 +6,12 @@ import errno;
 import select;
 import rdma;
 import rdma.vmad;
+import rdma.sched;
 import rdma.IBA as IBA;
 import rdma.ibverbs as ibv;
 import rdma.satransactor;
 import rdma.path;
+import rdma.tools;
 
 class umad_self_test(unittest.TestCase):
     umad = None;
@@ -156,6 +158,80 @@ class umad_self_test(unittest.TestCase):
     def test_uc_loop(self):
         self._do_loop_test("UC");
 
+    def test_batch_poll(self):
+        """Test polling completions into a WCList."""
+        with self.ctx.pd() as pd:
+            path_a,qp_a,path_b,qp_b,poller,srq,pool = \
+                    self._get_loop(pd,ibv.IBV_QPT_UD);
+            for I in range(4):
+                qp_b.post_send(pool.make_send_wr(pool.pop(),256,path_b));
+
+            recvs = 0;
+            sends = 0;
+            wcs = ibv.WCList(3);
+            self.assertRaises(IndexError,wcs.status,0);
+            for wcs in poller.iterbatch(wcs,timeout=0.5):
+                self.assert_(0 < len(wcs) <= 3);
+                for I in range(len(wcs)):
+                    self.assertEquals(wcs.status(I),ibv.IBV_WC_SUCCESS);
+                    self.assertEquals(wcs.wc(I).wr_id,wcs.wr_id(I));
+                    if wcs.opcode(I) & ibv.IBV_WC_RECV:
+                        recvs = recvs + 1;
+                    if wcs.opcode(I) == ibv.IBV_WC_SEND:
+                        sends = sends + 1;
+                pool.finish_wcs(srq,wcs);
+                if recvs + sends == 8:
+                    break;
+            self.assertFalse(poller.timedout);
+            self.assertEquals((recvs,sends),(4,4));
+
+    def test_spin_poll(self):
+        """Test busy polling the CQ before sleeping."""
+        with self.ctx.pd() as pd:
+            path_a,qp_a,path_b,qp_b,poller,srq,pool = \
+                    self._get_loop(pd,ibv.IBV_QPT_UD);
+            poller = rdma.vtools.CQPoller(poller._cq,spin_time=0.001,
+                                          adaptive=True);
+            recvs = 0;
+            for I in range(20):
+                qp_b.post_send(pool.make_send_wr(pool.pop(),256,path_b));
+                for wc in poller.iterwc(count=2,timeout=0.5):
+                    self.assertEquals(wc.status,ibv.IBV_WC_SUCCESS);
+                    if wc.opcode & ibv.IBV_WC_RECV:
+                        recvs = recvs + 1;
+                    pool.finish_wcs(srq,wc);
+                self.assertFalse(poller.timedout);
+            self.assertEquals(recvs,20);
+            self.assert_(poller.gap is not None);
+            self.assert_(poller.spin_time <= poller.spin_max);
+            print "spins",poller.spins,"sleeps",poller.sleeps,"wakeups",poller.wakeups;
+
+    def test_prepared_wr(self):
+        """Test posting a PreparedSendWR many times."""
+        with self.ctx.pd() as pd:
+            path_a,qp_a,path_b,qp_b,poller,srq,pool = \
+                    self._get_loop(pd,ibv.IBV_QPT_UD);
+            buf_idx = pool.pop();
+            pwr = ibv.PreparedSendWR(pool.make_send_wr(buf_idx,256,path_b));
+            self.assertRaises(IndexError,pwr.set_length,0,10,1);
+            self.assertRaises(TypeError,qp_b.post_send,
+                              ibv.PreparedSendWR(pool.make_send_wr(buf_idx,256)));
+            for I in range(4):
+                pwr.set_wr_id(0,buf_idx);
+                pwr.set_addr(0,pool._mr.addr + buf_idx*pool.size);
+                qp_b.post_send(pwr);
+                buf_idx = pool.pop();
+            pool._buffers.append(buf_idx);
+
+            recvs = 0;
+            for wc in poller.iterwc(count=8,timeout=0.5):
+                self.assertEquals(wc.status,ibv.IBV_WC_SUCCESS);
+                if wc.opcode & ibv.IBV_WC_RECV:
+                    recvs = recvs + 1;
+                pool.finish_wcs(srq,wc);
+            self.assertFalse(poller.timedout);
+            self.assertEquals(recvs,4);
+
     def test_vmad(self):
         with rdma.vmad.VMAD(self.ctx,self.end_port.sa_path) as vmad:
             ret = vmad.SubnAdmGet(IBA.MADClassPortInfo);
@@ -187,6 +263,93 @@ class umad_self_test(unittest.TestCase):
                                                      hop_limit=255));
             print "Got peer reply path grh",repr(vmad.reply_path);
 
+    def test_ah_cache(self):
+        """Paths to the same destination share one AH."""
+        with self.ctx.pd(ah_cache_size=2) as pd:
+            path = rdma.path.IBPath(self.end_port,DLID=self.end_port.lid,
+                                    SLID=self.end_port.lid);
+            ah = pd.ah(path);
+            self.assert_(pd.ah(path.copy()) is ah);
+            self.assert_(pd.ah(path.copy(SL=1)) is not ah);
+
+            # Fill the cache, the LRU entry for path is evicted
+            pd.ah(path.copy(SLID_bits=1));
+            self.assert_(pd.ah(path.copy()) is not ah);
+
+            ah = pd.ah(path);
+            pd.invalidate_ah(path);
+            self.assert_(pd.ah(path) is not ah);
+            pd.invalidate_ah();
+            self.assert_(pd.ah(path.copy()) is not ah);
+
+    def test_mr_cache(self):
+        """Repeated registrations of the same memory reuse one MR."""
+        access = ibv.IBV_ACCESS_LOCAL_WRITE|ibv.IBV_ACCESS_REMOTE_WRITE;
+        with self.ctx.pd(mr_cache_bytes=4*1024*1024) as pd:
+            mem = mmap.mmap(-1,1024*1024);
+            with pd.cached_mr(mem,access) as mr:
+                mr2 = pd.cached_mr(buffer(mem,4096,8192));
+                self.assertEquals(mr2.lkey,mr.lkey);
+                self.assertEquals(mr2.addr,mr.addr + 4096);
+                self.assertEquals(mr2.length,8192);
+                mr2.close();
+            self.assertEquals(pd.mr_cache_misses,1);
+            self.assertEquals(pd.mr_cache_pinned,len(mem));
+
+            # A closed mmap is not reused
+            mem.close();
+            mem = mmap.mmap(-1,1024*1024);
+            pd.cached_mr(mem,access).close();
+            self.assertEquals(pd.mr_cache_misses,2);
+
+            # Idle registrations are dropped to stay in the budget
+            for I in range(8):
+                pd.cached_mr(bytearray(1024*1024),access).close();
+            self.assert_(pd.mr_cache_pinned <= pd.mr_cache_bytes);
+            pd.invalidate_mr();
+            self.assertEquals(pd.mr_cache_pinned,0);
+
+            count = 1000;
+            start = rdma.tools.clock_monotonic();
+            for I in range(count):
+                pd.mr(mem,access).close();
+            mid = rdma.tools.clock_monotonic();
+            for I in range(count):
+                pd.cached_mr(mem,access).close();
+            end = rdma.tools.clock_monotonic();
+            print "1MiB registration: %.2f usec, cached %.2f usec"%(
+                (mid - start)*1000000/count,(end - mid)*1000000/count);
+
+    def test_hugepage_pool(self):
+        """A BufferPool backed by huge pages on the HCA's NUMA node."""
+        with self.ctx.pd() as pd:
+            pool = rdma.vtools.BufferPool(pd,64,64*1024,hugepages=True,
+                                          numa_local=True);
+            print "page size %u, NUMA node %s"%(pool.page_size,pool.numa_node);
+            self.assert_(pool.page_size >= mmap.PAGESIZE);
+            self.assertEquals(pool.numa_node,self.ctx.node.numa_node);
+            self.assertEquals(len(pool._mem) % pool.page_size,0);
+            with pd.srq(32) as srq:
+                pool.post_recvs(srq,32);
+            pool.close();
+
+    def test_srq_vmad(self):
+        with rdma.vmad.SRQVMAD(self.ctx,self.end_port.sa_path,
+                               depth=256,num_qps=4) as vmad:
+            ret = vmad.SubnAdmGet(IBA.MADClassPortInfo);
+
+            # Keep many GMPs in flight to our own PMA
+            path = rdma.path.get_mad_path(vmad,self.end_port.lid,
+                                          dqpn=1,qkey=IBA.IB_DEFAULT_QP1_QKEY);
+            sched = rdma.sched.MADSchedule(vmad);
+            sched.max_outstanding = vmad.depth;
+            res = [];
+            def get(I):
+                res.append((yield sched.PerformanceGet(IBA.MADClassPortInfo,
+                                                       path)));
+            sched.run(mqueue=(get(I) for I in range(2000)));
+            self.assertEquals(len(res),2000);
+
     def test_wr_error(self):
         "Test failing post_send"
         with self.ctx.pd() as pd: